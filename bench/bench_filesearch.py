@@ -94,7 +94,7 @@ class FileSearchBenchmark(BenchmarkFramework):
     def after_benchmark(self, config):
         self.end_time = time()
         if config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP:
-            self.cache_ext_policy.stop()
+            self.record_result("cache_ext_stats", self.cache_ext_policy.stop())
         enable_smt()
 
     def parse_results(self, stdout: str) -> BenchResults:
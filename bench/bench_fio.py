@@ -1,8 +1,11 @@
 import argparse
+import gzip
 import json
 import logging
-from typing import Dict, List
+from time import strftime
+from typing import Dict, List, Union
 
+import numpy as np
 import psutil
 from yanniszark_common.cmdutils import check_output
 
@@ -71,6 +74,127 @@ def ensure_random_file(path: str, size_in_bytes=10 * GiB):
     check_output(cmd)
 
 
+# fio's default completion latency percentiles
+FIO_CLAT_PERCENTILES = [
+    1.0, 5.0, 10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0,
+    90.0, 95.0, 99.0, 99.5, 99.9, 99.95, 99.99,
+]  # fmt: skip
+# Upper edges (in ns) of fio's latency_{ns,us,ms} histogram buckets. The last
+# bucket (">=2000" ms) is open-ended.
+FIO_LAT_BUCKETS = [2, 4, 10, 20, 50, 100, 250, 500, 750, 1000]
+FIO_LAT_HIST_EDGES_NS = (
+    list(FIO_LAT_BUCKETS)
+    + [b * 10**3 for b in FIO_LAT_BUCKETS]
+    + [b * 10**6 for b in FIO_LAT_BUCKETS + [2000]]
+    + [float("inf")]
+)
+FIO_DIRECTIONS = ["read", "write"]
+FIO_WORKLOADS = ["randread", "create"]
+# Files per job of the create workload, recreated on every loop, so that the
+# run is dominated by file creations (vfs_open with O_CREAT).
+CREATE_NR_FILES = 1024
+CREATE_DIR_NAME = "fio_create"
+# BPF program of dir_watcher.bpf.h run on every file open
+OPEN_HOOK_PROG = "vfs_open_exit"
+# Substring of the names of the struct_ops programs run on folio events
+FOLIO_HOOK_PROG_MARKER = "folio_"
+
+
+def fio_latency_histogram(job: Dict) -> np.ndarray:
+    """Percentage of IOs in each FIO_LAT_HIST_EDGES_NS bucket."""
+    hist = []
+    for unit in ["latency_ns", "latency_us"]:
+        hist += [job.get(unit, {}).get(str(b), 0) for b in FIO_LAT_BUCKETS]
+    hist += [job.get("latency_ms", {}).get(str(b), 0) for b in FIO_LAT_BUCKETS + [2000]]
+    hist.append(job.get("latency_ms", {}).get(">=2000", 0))
+    return np.array(hist, dtype=np.float64)
+
+
+def normalize_fio_results(fio_results: Dict) -> Dict:
+    """Reduce fio's JSON output to fixed-size per-direction arrays.
+
+    For each direction, IOPS and bandwidth are summed over jobs, and the clat
+    percentiles (FIO_CLAT_PERCENTILES, in ns) and the latency histogram
+    (FIO_LAT_HIST_EDGES_NS) are IO-weighted averages over jobs. Arrays are
+    stored as lists, so that they can be stacked across runs with np.array().
+    """
+    jobs = fio_results["jobs"]
+    job_ios = np.array(
+        [sum(job[d]["total_ios"] for d in FIO_DIRECTIONS) for job in jobs],
+        dtype=np.float64,
+    )
+    results = {
+        "fio_version": fio_results.get("fio version", ""),
+        "nr_jobs": len(jobs),
+        "latency_hist_pct": np.average(
+            [fio_latency_histogram(job) for job in jobs],
+            axis=0,
+            weights=job_ios if job_ios.sum() > 0 else None,
+        ).tolist(),
+    }
+    for direction in FIO_DIRECTIONS:
+        stats = [job[direction] for job in jobs]
+        ios = np.array([s["total_ios"] for s in stats], dtype=np.float64)
+        weights = ios if ios.sum() > 0 else None
+        percentiles = np.array(
+            [
+                [
+                    s["clat_ns"].get("percentile", {}).get("%f" % p, 0)
+                    for p in FIO_CLAT_PERCENTILES
+                ]
+                for s in stats
+            ],
+            dtype=np.float64,
+        )
+        results[direction + "_iops"] = float(sum(s["iops"] for s in stats))
+        results[direction + "_bw_bytes"] = float(sum(s["bw_bytes"] for s in stats))
+        results[direction + "_total_ios"] = int(ios.sum())
+        results[direction + "_clat_mean_ns"] = float(
+            np.average([s["clat_ns"]["mean"] for s in stats], weights=weights)
+        )
+        results[direction + "_clat_percentiles_ns"] = np.average(
+            percentiles, axis=0, weights=weights
+        ).tolist()
+    return results
+
+
+def watch_scope_overhead(prog_stats: Dict) -> Dict:
+    """Average cost of the watch_dir matching hooks from bpf_prog_stats_delta():
+    the per-open vfs_open fexit program, and the per-folio struct_ops programs
+    (all of which check whether the folio is watched first)."""
+    open_stats = prog_stats.get(OPEN_HOOK_PROG, {"run_cnt": 0, "run_time_ns": 0})
+    folio_stats = [
+        stats for name, stats in prog_stats.items() if FOLIO_HOOK_PROG_MARKER in name
+    ]
+    folio_runs = sum(stats["run_cnt"] for stats in folio_stats)
+    folio_time_ns = sum(stats["run_time_ns"] for stats in folio_stats)
+    return {
+        "open_hook_runs": open_stats["run_cnt"],
+        "open_hook_avg_ns": (
+            open_stats["run_time_ns"] / open_stats["run_cnt"]
+            if open_stats["run_cnt"]
+            else 0.0
+        ),
+        "folio_hook_runs": folio_runs,
+        "folio_hook_avg_ns": folio_time_ns / folio_runs if folio_runs else 0.0,
+    }
+
+
+def archive_fio_output(raw_dir: str, stdout: str) -> str:
+    """Save fio's raw JSON output, gzipped. Returns the archive path."""
+    os.makedirs(raw_dir, exist_ok=True)
+    path = os.path.join(raw_dir, "fio_%s.json.gz" % strftime("%Y%m%d-%H%M%S"))
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(
+            raw_dir, "fio_%s_%d.json.gz" % (strftime("%Y%m%d-%H%M%S"), suffix)
+        )
+        suffix += 1
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(stdout)
+    return path
+
+
 class FioBenchmark(BenchmarkFramework):
     def __init__(self, benchresults_cls=BenchResults, cli_args=None):
         super().__init__("fio_benchmark", benchresults_cls, cli_args)
@@ -84,6 +208,20 @@ class FioBenchmark(BenchmarkFramework):
             CLEANUP_TASKS.append(lambda: self.cache_ext_policy.stop())
         target_file = os.path.join(target_dir, "fio_benchfile")
         ensure_random_file(target_file)
+        # --policy-param-sweep runs all the values of the parameter in a
+        # single policy session, see benchmark_prepare
+        self.sweep_param = ""
+        self.sweep_values = []
+        if self.args.policy_param_sweep:
+            self.sweep_param, _, values = self.args.policy_param_sweep.partition("=")
+            self.sweep_values = [
+                parse_policy_params(["%s=%s" % (self.sweep_param, value)])[
+                    self.sweep_param
+                ]
+                for value in parse_strings_string(values)
+            ]
+        self.policy_session = None
+        self.policy_session_runs = 0
 
     def add_arguments(self, parser: argparse.ArgumentParser):
         parser.add_argument(
@@ -95,12 +233,46 @@ class FioBenchmark(BenchmarkFramework):
             default="",
             help="Specify the path to the policy loader binary. If empty, no policy will be used.",
         )
+        parser.add_argument(
+            "--fio-raw-dir",
+            type=str,
+            default="",
+            help="Directory for the gzipped raw fio JSON output of each run."
+            " Default is <results file name>_fio_raw next to the results file.",
+        )
+        parser.add_argument(
+            "--workloads",
+            type=str,
+            default="randread",
+            help="Comma-separated fio workloads: %s. create measures the cost of"
+            " file creations, i.e. of tracking new files in watch_dir."
+            % ", ".join(FIO_WORKLOADS),
+        )
+        parser.add_argument(
+            "--watch-scopes",
+            type=str,
+            default="",
+            help="Comma-separated watch scopes (%s) to compare the cache_ext runs"
+            " with. Default is --watch-scope only." % ", ".join(WATCH_SCOPES),
+        )
+        parser.add_argument(
+            "--policy-param-sweep",
+            type=str,
+            default="",
+            help="Run the cache_ext configs once per value of a policy parameter,"
+            " e.g. sample_size=8,16,32, updating it between the runs of a single"
+            " attached policy. Other parameters come from --policy-param.",
+        )
 
     def generate_configs(self, configs: List[Dict]) -> List[Dict]:
         configs = add_config_option(
             "iteration", list(range(1, self.args.iterations + 1)), configs
         )
-        configs = add_config_option("workload", ["randread"], configs)
+        workloads = parse_strings_string(self.args.workloads)
+        for workload in workloads:
+            if workload not in FIO_WORKLOADS:
+                raise Exception("Unknown fio workload: %s" % workload)
+        configs = add_config_option("workload", workloads, configs)
         configs = add_config_option("runtime_seconds", [60], configs)
         configs = add_config_option("nr_threads", [8], configs)
         configs = add_config_option(
@@ -122,11 +294,69 @@ class FioBenchmark(BenchmarkFramework):
                 policy_loader_name = os.path.basename(self.cache_ext_policy.loader_path)
                 config["policy_loader"] = policy_loader_name
 
+        # Only record the scope when it is not the default, so that the
+        # configs of earlier results still match
+        scopes = [self.args.watch_scope]
+        if self.args.watch_scopes:
+            scopes = parse_strings_string(self.args.watch_scopes)
+        if scopes != [DEFAULT_WATCH_SCOPE]:
+            scoped_configs = []
+            for config in configs:
+                if config["cgroup_name"] != DEFAULT_CACHE_EXT_CGROUP:
+                    scoped_configs.append(config)
+                    continue
+                for scope in scopes:
+                    if scope not in WATCH_SCOPES:
+                        raise Exception("Unknown watch scope: %s" % scope)
+                    scoped_configs.append(dict(config, watch_scope=scope))
+            configs = scoped_configs
+
+        # The sweep values must stay the innermost option, so that the runs
+        # of a policy session are consecutive
+        if self.sweep_param:
+            swept_configs = []
+            for config in configs:
+                if config["cgroup_name"] != DEFAULT_CACHE_EXT_CGROUP:
+                    swept_configs.append(config)
+                    continue
+                for value in self.sweep_values:
+                    params = dict(CacheExtPolicy.params, **{self.sweep_param: value})
+                    swept_configs.append(dict(config, policy_params=params))
+            configs = swept_configs
+
         return configs
 
+    def policy_session_key(self, config) -> Union[Dict, None]:
+        """Configs with the same key run in a single policy session: they only
+        differ in the value of the --policy-param-sweep parameter."""
+        if not self.sweep_param or config["cgroup_name"] != DEFAULT_CACHE_EXT_CGROUP:
+            return None
+        return {k: v for k, v in config.items() if k != "policy_params"}
+
+    def stop_policy_session(self) -> Dict[str, int]:
+        stats = self.cache_ext_policy.stop()
+        log.info(
+            "Stopped policy session after %d runs: %s",
+            self.policy_session_runs,
+            self.policy_session,
+        )
+        self.policy_session = None
+        self.policy_session_runs = 0
+        return stats
+
     def benchmark_prepare(self, config):
         log.info("Dropping page cache")
         drop_page_cache()
+        session = self.policy_session_key(config)
+        if self.cache_ext_policy.has_started:
+            if session is not None and session == self.policy_session:
+                # Keep the attached policy and its cgroup, only update the
+                # swept parameter
+                self.cache_ext_policy.set_params(config["policy_params"])
+                self.policy_session_runs += 1
+                return
+            # A session whose last runs were skipped (--reuse-results)
+            self.stop_policy_session()
         log.info(
             "Setting up cgroup %s with size %s",
             config["cgroup_name"],
@@ -134,11 +364,16 @@ class FioBenchmark(BenchmarkFramework):
         )
         if config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP:
             recreate_cache_ext_cgroup(limit_in_bytes=config["cgroup_size"])
-            policy_loader_name = os.path.basename(self.cache_ext_policy.loader_path)
-            if policy_loader_name == "cache_ext_s3fifo.out":
+            self.cache_ext_policy.watch_scope = config.get(
+                "watch_scope", self.args.watch_scope
+            )
+            self.cache_ext_policy.params = config.get(
+                "policy_params", CacheExtPolicy.params
+            )
+            if self.cache_ext_policy.loader_path:
                 self.cache_ext_policy.start(cgroup_size=config["cgroup_size"])
-            elif policy_loader_name:
-                self.cache_ext_policy.start()
+                self.policy_session = session
+                self.policy_session_runs = 1
         else:
             recreate_baseline_cgroup(limit_in_bytes=config["cgroup_size"])
 
@@ -150,6 +385,25 @@ class FioBenchmark(BenchmarkFramework):
     def benchmark_cmd(self, config):
         target_dir = self.args.target_dir
         target_file = os.path.join(target_dir, "fio_benchfile")
+        if config["workload"] == "create":
+            create_dir = os.path.join(target_dir, CREATE_DIR_NAME)
+            os.makedirs(create_dir, exist_ok=True)
+            target_args = [
+                f"--directory={create_dir}",
+                "--rw=write",
+                f"--nrfiles={CREATE_NR_FILES}",
+                "--filesize=4k",
+                "--openfiles=1",
+                "--file_service_type=sequential",
+                "--create_on_open=1",
+                "--unlink_each_loop=1",
+                "--unlink=1",
+            ]
+        else:
+            target_args = [
+                f"--filename={target_file}",
+                f"--rw={config['workload']}",
+            ]
         cmd = [
             "sudo",
             "cgexec",
@@ -158,8 +412,7 @@ class FioBenchmark(BenchmarkFramework):
             "fio",
             "--direct=0",
             "--name=test",
-            f"--filename={target_file}",
-            f"--rw={config['workload']}",
+            *target_args,
             "--time_based",
             f"--runtime={config['runtime_seconds']}",
             f"--numjobs={config['nr_threads']}",
@@ -172,20 +425,39 @@ class FioBenchmark(BenchmarkFramework):
     def after_benchmark(self, config):
         log.info("Stopping CPU usage measurement")
         self.cpu_usage = sum(psutil.cpu_percent(percpu=True)[: config["cpus"]])
+        if self.args.bpf_prog_stats:
+            for key, value in watch_scope_overhead(self.current_prog_stats).items():
+                self.record_result(key, value)
         if (
             config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP
             and self.cache_ext_policy.loader_path
         ):
-            self.cache_ext_policy.stop()
+            if self.policy_session is not None:
+                self.record_result("policy_session_run", self.policy_session_runs)
+                value = config["policy_params"][self.sweep_param]
+                if value != self.sweep_values[-1]:
+                    # The next config continues the session
+                    enable_smt()
+                    return
+                # The stats of the whole session, not of this run
+                self.record_result(
+                    "cache_ext_session_stats", self.stop_policy_session()
+                )
+            else:
+                self.record_result("cache_ext_stats", self.cache_ext_policy.stop())
         log.info("Deleting cgroup %s", config["cgroup_name"])
         delete_cgroup(config["cgroup_name"])
         enable_smt()
 
     def parse_results(self, stdout: str) -> BenchResults:
         # parse fio output
-        fio_results = json.loads(stdout)
-        fio_results["cpu_usage"] = self.cpu_usage
-        return BenchResults(fio_results)
+        results = normalize_fio_results(json.loads(stdout))
+        results["cpu_usage"] = self.cpu_usage
+        raw_dir = self.args.fio_raw_dir
+        if not raw_dir:
+            raw_dir = os.path.splitext(self.args.results_file)[0] + "_fio_raw"
+        results["fio_raw_file"] = archive_fio_output(raw_dir, stdout)
+        return BenchResults(results)
 
 
 def main():
@@ -194,6 +466,10 @@ def main():
 
     fio_bench = FioBenchmark()
     fio_bench.benchmark()
+    if fio_bench.cache_ext_policy.has_started:
+        # The last runs of a policy session were skipped (--reuse-results)
+        fio_bench.stop_policy_session()
+        delete_cgroup(DEFAULT_CACHE_EXT_CGROUP)
 
 
 if __name__ == "__main__":
@@ -2,10 +2,18 @@ import argparse
 import logging
 import os
 import re
+import shutil
+from contextlib import suppress
 from time import sleep
 from typing import Dict, List
 
 from bench_lib import *
+from latency_histogram import (
+    LATENCY_HISTOGRAM_WINDOW_SEC,
+    add_latency_histogram_results,
+    add_open_loop_results,
+    set_open_loop_workload,
+)
 
 
 log = logging.getLogger(__name__)
@@ -13,13 +21,6 @@ GiB = 2**30
 CLEANUP_TASKS = []
 
 
-def reset_database(db_dir: str, temp_db_dir: str):
-    # rsync -avpl --delete /mydata/leveldb_db_orig/ /mydata/leveldb_db/
-    if not db_dir.endswith("/"):
-        db_dir += "/"
-    run(["rsync", "-avpl", "--delete", db_dir, temp_db_dir])
-
-
 def parse_leveldb_bench_results(stdout: str) -> Dict:
     # Uniform: calculating overall performance metrics... (might take a while)
     # Uniform overall: UPDATE throughput 0.00 ops/sec, INSERT throughput 0.00 ops/sec, READ throughput 9038.24 ops/sec, SCAN throughput 0.00 ops/sec, READ_MODIFY_WRITE throughput 0.00 ops/sec, total throughput 9038.24 ops/sec
@@ -98,6 +99,7 @@ def parse_leveldb_bench_results(stdout: str) -> Dict:
                     results["read_modify_write_latency_p99"] = float(match[1])
                 else:
                     raise Exception("Unknown latency metric: " + match[0])
+    add_latency_histogram_results(results, stdout)
     if not all(
         key in results for key in ["throughput_avg", "latency_avg", "latency_p99"]
     ):
@@ -106,6 +108,8 @@ def parse_leveldb_bench_results(stdout: str) -> Dict:
 
 
 class LevelDBBenchmark(BenchmarkFramework):
+    supports_parallel_slots = True
+
     def __init__(self, benchresults_cls=BenchResults, cli_args=None):
         super().__init__("leveldb_benchmark", benchresults_cls, cli_args)
         if self.args.leveldb_temp_db is None:
@@ -113,7 +117,32 @@ class LevelDBBenchmark(BenchmarkFramework):
         self.cache_ext_policy = CacheExtPolicy(
             DEFAULT_CACHE_EXT_CGROUP, self.args.policy_loader, self.args.leveldb_temp_db
         )
-        CLEANUP_TASKS.append(lambda: self.cache_ext_policy.stop())
+        # Policies of isolated slots, by slot index
+        self.slot_policies = {}
+        CLEANUP_TASKS.append(self.stop_policies)
+
+    def stop_policies(self):
+        for policy in [self.cache_ext_policy] + list(self.slot_policies.values()):
+            if policy.has_started:
+                policy.stop()
+
+    def slot_temp_db(self) -> str:
+        return self.current_slot.path(self.args.leveldb_temp_db)
+
+    def slot_policy(self) -> CacheExtPolicy:
+        slot = self.current_slot
+        if not slot.isolated:
+            return self.cache_ext_policy
+        if slot.index not in self.slot_policies:
+            self.slot_policies[slot.index] = CacheExtPolicy(
+                slot.cgroup_name(DEFAULT_CACHE_EXT_CGROUP),
+                self.args.policy_loader,
+                self.slot_temp_db(),
+            )
+        return self.slot_policies[slot.index]
+
+    def hitrate_watch_dir(self, config):
+        return self.slot_temp_db()
 
     def add_arguments(self, parser: argparse.ArgumentParser):
         parser.add_argument(
@@ -134,6 +163,13 @@ class LevelDBBenchmark(BenchmarkFramework):
             required=True,
             help="Specify the path to the policy loader binary",
         )
+        parser.add_argument(
+            "--snapshot-backend",
+            type=str,
+            default="rsync",
+            choices=list(SNAPSHOT_BACKENDS.keys()),
+            help="How to reset the temporary DB from the original DB before each run",
+        )
         parser.add_argument(
             "--bench-binary-dir",
             type=str,
@@ -152,15 +188,38 @@ class LevelDBBenchmark(BenchmarkFramework):
             default="",
             help="Specify the fadvise hints to use for the baseline cgroup, e.g., ',SEQUENTIAL,NOREUSE,DONTNEED'",
         )
+        parser.add_argument(
+            "--target-rate",
+            type=str,
+            default="0",
+            help="Comma-separated list of request rates (ops/sec) to run My-YCSB"
+            " at as an open loop, with latencies corrected for coordinated"
+            " omission (see latency_histogram.py). 0 runs a closed loop.",
+        )
 
     def generate_configs(self, configs: List[Dict]) -> List[Dict]:
         configs = add_config_option("enable_mmap", [False], configs)
-        configs = add_config_option("runtime_seconds", [240], configs)
-        configs = add_config_option("warmup_runtime_seconds", [45], configs)
+        if self.args.adaptive_runtime:
+            # Runs stop once their throughput converges; the warmup is
+            # detected from the throughput samples instead
+            configs = add_config_option(
+                "runtime_seconds", [self.args.adaptive_max_runtime], configs
+            )
+            configs = add_config_option("warmup_runtime_seconds", [0], configs)
+            configs = add_config_option("adaptive_runtime", [True], configs)
+        else:
+            configs = add_config_option("runtime_seconds", [240], configs)
+            configs = add_config_option("warmup_runtime_seconds", [45], configs)
         configs = add_config_option(
             "benchmark", parse_strings_string(self.args.benchmark), configs
         )
         configs = add_config_option("cgroup_size", [10 * GiB], configs)
+        target_rates = [
+            int(rate) for rate in parse_strings_string(self.args.target_rate)
+        ]
+        # Closed-loop configs keep no target_rate, so earlier results still match
+        if target_rates != [0]:
+            configs = add_config_option("target_rate", target_rates, configs)
         if self.args.default_only:
             configs = add_config_option(
                 "cgroup_name", [DEFAULT_BASELINE_CGROUP], configs
@@ -193,41 +252,86 @@ class LevelDBBenchmark(BenchmarkFramework):
         )
         return configs
 
+    def benchmark_parallel(self, configs_to_run: List[Dict], *args, **kwargs):
+        if self.cache_ext_policy.policy_name in SINGLE_INSTANCE_POLICIES and any(
+            config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP
+            for config in configs_to_run
+        ):
+            raise Exception(
+                "%s cannot run in parallel slots, it pins a single map for all"
+                " of them" % self.cache_ext_policy.policy_name
+            )
+        super().benchmark_parallel(configs_to_run, *args, **kwargs)
+
     def benchmark_prepare(self, config):
-        reset_database(self.args.leveldb_db, self.args.leveldb_temp_db)
-        drop_page_cache()
-        disable_swap()
-        disable_smt()
+        slot = self.current_slot
+        temp_db = self.slot_temp_db()
+        reset_sec = reset_database_snapshot(
+            self.args.snapshot_backend, self.args.leveldb_db, temp_db
+        )
+        self.record_result("db_reset_sec", reset_sec)
+        if self.parallel:
+            # SMT is disabled once for all slots, and only the slot's own
+            # files are evicted so that concurrent runs are not disturbed.
+            drop_dir_page_cache(temp_db)
+        else:
+            drop_page_cache()
+            disable_swap()
+            disable_smt()
+        cgroup = slot.cgroup_name(config["cgroup_name"])
         if config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP:
-            recreate_cache_ext_cgroup(limit_in_bytes=config["cgroup_size"])
+            recreate_cache_ext_cgroup(cgroup, limit_in_bytes=config["cgroup_size"])
 
-            policy_loader_name = os.path.basename(self.cache_ext_policy.loader_path)
-            if policy_loader_name == "cache_ext_s3fifo.out":
-                self.cache_ext_policy.start(cgroup_size=config["cgroup_size"])
-            else:
-                self.cache_ext_policy.start()
+            self.slot_policy().start(cgroup_size=config["cgroup_size"])
         else:
-            recreate_baseline_cgroup(limit_in_bytes=config["cgroup_size"])
+            recreate_baseline_cgroup(cgroup, limit_in_bytes=config["cgroup_size"])
+
+    def slot_bench_file(self, config) -> str:
+        """The copy of the My-YCSB config edited by an isolated slot, next to
+        the original."""
+        return os.path.abspath(
+            os.path.join(
+                self.args.bench_binary_dir,
+                "../leveldb/config/%s_slot%d.yaml"
+                % (config["benchmark"], self.current_slot.index),
+            )
+        )
+
+    def remove_slot_bench_file(self, config):
+        if self.current_slot.isolated:
+            with suppress(FileNotFoundError):
+                os.remove(self.slot_bench_file(config))
 
     def benchmark_cmd(self, config):
+        slot = self.current_slot
         bench_binary_dir = self.args.bench_binary_dir
-        leveldb_temp_db_dir = self.args.leveldb_temp_db
+        leveldb_temp_db_dir = self.slot_temp_db()
         bench_binary = os.path.join(bench_binary_dir, "run_leveldb")
         bench_file = "../leveldb/config/%s.yaml" % config["benchmark"]
         bench_file = os.path.abspath(os.path.join(bench_binary_dir, bench_file))
         if not os.path.exists(bench_file):
             raise Exception("Benchmark file not found: %s" % bench_file)
+        if slot.isolated:
+            # Each slot edits its own copy of the benchmark config, removed
+            # after the run
+            slot_bench_file = self.slot_bench_file(config)
+            shutil.copyfile(bench_file, slot_bench_file)
+            bench_file = slot_bench_file
         with edit_yaml_file(bench_file) as bench_config:
             bench_config["leveldb"]["data_dir"] = leveldb_temp_db_dir
             bench_config["workload"]["runtime_seconds"] = config["runtime_seconds"]
             bench_config["workload"]["warmup_runtime_seconds"] = config[
                 "warmup_runtime_seconds"
             ]
+            bench_config["workload"][
+                "latency_histogram_window_seconds"
+            ] = LATENCY_HISTOGRAM_WINDOW_SEC
+            set_open_loop_workload(bench_config, config.get("target_rate", 0))
         cmd = [
             "sudo",
             "cgexec",
             "-g",
-            "memory:%s" % config["cgroup_name"],
+            "memory:%s" % slot.cgroup_name(config["cgroup_name"]),
             bench_binary,
             bench_file,
         ]
@@ -247,13 +351,20 @@ class LevelDBBenchmark(BenchmarkFramework):
         return extra_envs
 
     def after_benchmark(self, config):
+        self.remove_slot_bench_file(config)
         if config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP:
-            self.cache_ext_policy.stop()
+            self.record_result("cache_ext_stats", self.slot_policy().stop())
         sleep(2)
-        enable_smt()
+        if not self.parallel:
+            enable_smt()
+
+    def benchmark_failed(self, config):
+        self.remove_slot_bench_file(config)
 
     def parse_results(self, stdout: str) -> BenchResults:
         results = parse_leveldb_bench_results(stdout)
+        if self.current_config.get("target_rate"):
+            add_open_loop_results(results, self.current_config["target_rate"])
         return BenchResults(results)
 
 
@@ -277,7 +388,14 @@ def main():
         )
     log.info("LevelDB DB directory: %s", leveldb_bench.args.leveldb_db)
     log.info("LevelDB temp DB directory: %s", leveldb_bench.args.leveldb_temp_db)
+    if leveldb_bench.parallel:
+        # Slots are partitioned over the CPUs that remain online
+        disable_swap()
+        disable_smt()
+        CLEANUP_TASKS.append(enable_smt)
     leveldb_bench.benchmark()
+    if leveldb_bench.parallel:
+        enable_smt()
 
     # Reset to default
     set_sysctl("vm.dirty_background_ratio", 10)
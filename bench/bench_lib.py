@@ -1,44 +1,211 @@
 import argparse
+import codecs
 import json
 import logging
 import os
+import re
 import resource
-import select
+import selectors
+import signal
+import socket
+import sqlite3
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
 from abc import ABC, abstractmethod
+from collections import deque
 from contextlib import contextmanager, suppress
 from subprocess import CalledProcessError
-from time import sleep
-from typing import Dict, List, Union
+from time import sleep, strftime, time
+from typing import Callable, Dict, Iterable, List, Union
 
+import numpy as np
 from ruamel.yaml import YAML
 
+from bench_stats import CI_METHODS, SteadyStateDetector, summarize_samples
+from page_trace import PAGE_TRACE_SUFFIX
+
 GiB = 2**30
 log = logging.getLogger(__name__)
 
 DEFAULT_CACHE_EXT_CGROUP = "cache_ext_test"
 DEFAULT_BASELINE_CGROUP = "baseline_test"
 
+POLICY_STATS_PREFIX = "cache_ext_stats: "
+# Printed by dir_watcher.h once the inode watchlist is populated
+WATCH_DIR_STATS_PREFIX = "watch_dir_stats: "
+# Printed by cache_ext_metadata.h once the policy is loaded
+FOLIO_METADATA_STATS_PREFIX = "folio_metadata_stats: "
+# Printed by cache_ext_trace.h once the page trace is written
+PAGE_TRACE_STATS_PREFIX = "page_trace_stats: "
+# Printed by cache_ext_regret.h on exit: the refault distance histograms
+EVICTION_REGRET_STATS_PREFIX = "eviction_regret_stats: "
+# Loader stats lines merged into the policy stats, with a key prefix
+POLICY_EXTRA_STATS_PREFIXES = {
+    WATCH_DIR_STATS_PREFIX: "watch_dir_",
+    FOLIO_METADATA_STATS_PREFIX: "folio_metadata_",
+    PAGE_TRACE_STATS_PREFIX: "page_trace_",
+    EVICTION_REGRET_STATS_PREFIX: "regret_",
+}
+# Printed by cache_ext_params.h: the map index and value of each parameter
+POLICY_PARAMS_PREFIX = "cache_ext_params: "
+
+
+def parse_policy_stats(output: str, prefix: str = POLICY_STATS_PREFIX) -> Dict:
+    """Parse the stats line printed by a policy loader on exit. Empty if the
+    loader did not print one (e.g. it was killed)."""
+    for line in reversed(output.splitlines()):
+        if line.startswith(prefix):
+            with suppress(ValueError):
+                return json.loads(line[len(prefix) :])
+    return {}
+
+
+POLICY_READY_LINE = "cache_ext: attached"
+POLICY_READY_TIMEOUT_SEC = 300
+DEFAULT_POLICY_DAEMON_SOCKET = "/run/cache_ext_policyd.sock"
+# Loaders that only watch the top level of watch_dir
+NON_RECURSIVE_WATCH_DIR_POLICIES = [
+    "cache_ext_get_scan",
+    "cache_ext_lhd",
+    "cache_ext_mglru",
+]
+# Loaders that pin a map at a fixed path, which My-YCSB looks up by that path
+# (scan_pids, see cache_ext_get_scan.c), so only one of them can run at a time
+SINGLE_INSTANCE_POLICIES = ["cache_ext_get_scan"]
+# Loaders that take --cgroup_size, to size their folio metadata map
+CGROUP_SIZE_POLICIES = [
+    "cache_ext_get_scan",
+    "cache_ext_lhd",
+    "cache_ext_mglru",
+    "cache_ext_s3fifo",
+    "cache_ext_sampling",
+]
+# How loaders match the files of watch_dir (--watch_scope, see dir_watcher.h)
+WATCH_SCOPES = ["path", "sb", "mount", "dir"]
+DEFAULT_WATCH_SCOPE = "path"
+CACHE_EXT_BPFFS_DIR = "/sys/fs/bpf/cache_ext"
+
+
+def parse_policy_params(params: List[str]) -> Dict[str, int]:
+    """Parse NAME=VALUE policy parameters, e.g. from --policy-param."""
+    parsed = {}
+    for param in params:
+        name, sep, value = param.partition("=")
+        if not sep or not name:
+            raise Exception("Invalid policy parameter, expected NAME=VALUE: %s" % param)
+        parsed[name] = int(value, 0)
+    return parsed
+
+
+def policy_daemon_request(socket_path: str, request: str) -> str:
+    """Send a request to cache_ext_policyd and return its reply after "OK"."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(request.encode("utf-8") + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = sock.recv(4096)
+            if not data:
+                break
+            reply += data
+    reply = reply.decode("utf-8").strip()
+    if not reply.startswith("OK"):
+        raise Exception("Policy daemon request %s failed: %s" % (request, reply))
+    return reply[len("OK") :].strip()
+
 
 class CacheExtPolicy:
+    """A cache_ext policy attached to a cgroup while a benchmark runs.
+
+    By default, start() runs the policy loader and waits for it to report that
+    the policy is attached. If daemon_socket is set (--policy-daemon-socket),
+    the policy is attached by cache_ext_policyd instead, without a loader
+    process per run."""
+
+    # Set by BenchmarkFramework from --policy-daemon-socket
+    daemon_socket = None
+    # Set by BenchmarkFramework from --watch-scope
+    watch_scope = DEFAULT_WATCH_SCOPE
+    # Set by BenchmarkFramework from --policy-param
+    params = {}
+    # Set by BenchmarkFramework from --page-trace-dir and --page-trace-buffer-mb
+    page_trace_dir = ""
+    page_trace_buffer_mb = 0
+    # Set by BenchmarkFramework from --regret-ghost-entries and
+    # --regret-window-sec, -1 ghost entries is the number of pages in the cgroup
+    regret_ghost_entries = 0
+    regret_window_sec = 0
 
     def set_cgroup(self, cgroup: str):
         """Set the cgroup path for the policy."""
         self.cgroup_path = f"/sys/fs/cgroup/{cgroup}"
 
-    def __init__(self, cgroup: str, loader_path: str, watch_dir: str):
+    def __init__(
+        self,
+        cgroup: str,
+        loader_path: str,
+        watch_dir: str,
+        params: Union[Dict[str, int], None] = None,
+        page_trace: str = "",
+    ):
         self.set_cgroup(cgroup)
         self.loader_path = loader_path
         self.watch_dir = watch_dir
+        if params is not None:
+            self.params = dict(params)
+        # Page trace file of every run, see page_trace.py. Default is a new
+        # file in page_trace_dir per run, if set.
+        self.page_trace = page_trace
+        self.page_trace_file = ""
         self.has_started = False
         self._policy_thread = None
+        self._ready_output = b""
+        self.stats = {}
+        # Parameters of the running policy: {name: {"index": i, "value": v}}
+        self.param_indices = {}
+
+    @property
+    def policy_name(self) -> str:
+        return os.path.splitext(os.path.basename(self.loader_path))[0]
 
     def start(self, cgroup_size: int = 0):
         if self.has_started:
             raise Exception("Policy already started")
 
         self.has_started = True
+        if self.daemon_socket:
+            request = "ATTACH policy=%s cgroup=%s watch_dir=%s recursive=%d" % (
+                self.policy_name,
+                self.cgroup_path,
+                os.path.abspath(self.watch_dir),
+                self.policy_name not in NON_RECURSIVE_WATCH_DIR_POLICIES,
+            )
+            if cgroup_size:
+                request += " cgroup_size=%d" % cgroup_size
+            if self.watch_scope != DEFAULT_WATCH_SCOPE:
+                request += " scope=%s" % self.watch_scope
+            if (
+                self.params
+                or self.page_trace
+                or self.page_trace_dir
+                or self.regret_ghost_entries
+            ):
+                self.has_started = False
+                raise Exception(
+                    "Policy parameters, page traces and eviction regret are only"
+                    " supported by the policy loaders"
+                )
+            log.info("Attaching policy through %s: %s", self.daemon_socket, request)
+            try:
+                policy_daemon_request(self.daemon_socket, request)
+            except Exception:
+                self.has_started = False
+                raise
+            return
+
         cmd = [
             "sudo",
             self.loader_path,
@@ -48,36 +215,182 @@ class CacheExtPolicy:
             self.cgroup_path,
         ]
 
-        if cgroup_size:
+        if cgroup_size and self.policy_name in CGROUP_SIZE_POLICIES:
             cmd += ["--cgroup_size", str(cgroup_size)]
+        if self.watch_scope != DEFAULT_WATCH_SCOPE:
+            cmd += ["--watch_scope", self.watch_scope]
+        for name, value in self.params.items():
+            cmd += ["--param", "%s=%d" % (name, value)]
+        self.page_trace_file = self._page_trace_file()
+        if self.page_trace_file:
+            cmd += ["--page_trace", self.page_trace_file]
+            if self.page_trace_buffer_mb:
+                cmd += ["--page_trace_buffer", str(self.page_trace_buffer_mb)]
+        ghost_entries = self.regret_ghost_entries
+        if ghost_entries < 0:
+            if not cgroup_size:
+                self.has_started = False
+                raise Exception("Eviction regret needs the cgroup size")
+            ghost_entries = cgroup_size // resource.getpagesize()
+        if ghost_entries:
+            cmd += ["--regret_ghost_entries", str(ghost_entries)]
+            if self.regret_window_sec:
+                cmd += ["--regret_window_sec", str(self.regret_window_sec)]
 
         log.info("Starting policy thread: %s", cmd)
         self._policy_thread = subprocess.Popen(
             cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
-        sleep(10)
+        self._wait_ready()
 
         # For some reason, running a command with `sudo` messes up the terminal.
         # This is a workaround to fix it.
         # run(["stty", "sane"])
-        if self._policy_thread.poll() is not None:
-            raise Exception(
-                "Policy thread exited unexpectedly: %s"
-                % self._policy_thread.stderr.read().decode("utf-8")
+
+    def _page_trace_file(self) -> str:
+        if self.page_trace:
+            return os.path.abspath(self.page_trace)
+        if not self.page_trace_dir:
+            return ""
+        os.makedirs(self.page_trace_dir, exist_ok=True)
+        return os.path.abspath(
+            os.path.join(
+                self.page_trace_dir,
+                "%s_%s_%s%s"
+                % (
+                    self.policy_name,
+                    os.path.basename(self.cgroup_path),
+                    strftime("%Y%m%d_%H%M%S"),
+                    PAGE_TRACE_SUFFIX,
+                ),
+            )
+        )
+
+    def _wait_ready(self, timeout: float = POLICY_READY_TIMEOUT_SEC):
+        """Wait until the loader prints POLICY_READY_LINE, i.e. the policy is
+        attached. The output read so far is kept for stop()."""
+        fd = self._policy_thread.stdout.fileno()
+        deadline = time() + timeout
+        self._ready_output = b""
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+        try:
+            while POLICY_READY_LINE.encode() not in self._ready_output:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise Exception(
+                        "Policy %s not attached after %ds" % (self.loader_path, timeout)
+                    )
+                if not sel.select(remaining):
+                    continue
+                data = os.read(fd, OUTPUT_CHUNK_SIZE)
+                if not data:
+                    self._policy_thread.wait()
+                    raise Exception(
+                        "Policy thread exited unexpectedly: %s"
+                        % self._policy_thread.stderr.read().decode("utf-8")
+                    )
+                self._ready_output += data
+        finally:
+            sel.close()
+        watch_dir_stats = parse_policy_stats(
+            self._ready_output.decode("utf-8", "replace"), WATCH_DIR_STATS_PREFIX
+        )
+        if watch_dir_stats:
+            log.info(
+                "Watchlist of %s: %d inodes in %d dirs, walk %.3fs, update %.3fs",
+                self.loader_path,
+                watch_dir_stats["inodes"],
+                watch_dir_stats["dirs"],
+                watch_dir_stats["walk_sec"],
+                watch_dir_stats["update_sec"],
+            )
+        self.param_indices = parse_policy_stats(
+            self._ready_output.decode("utf-8", "replace"), POLICY_PARAMS_PREFIX
+        )
+        if self.param_indices:
+            log.info(
+                "Parameters of %s: %s",
+                self.loader_path,
+                {name: param["value"] for name, param in self.param_indices.items()},
             )
 
-    def stop(self):
+    def set_params(self, params: Dict[str, int]):
+        """Update parameters of the running policy through its pinned params
+        map (see cache_ext_params.h), without reattaching it."""
+        if not self.has_started or self.daemon_socket:
+            raise Exception("Policy parameters can only be set on a running loader")
+        pin_path = os.path.join(
+            CACHE_EXT_BPFFS_DIR, "params_%s" % os.path.basename(self.cgroup_path)
+        )
+        for name, value in params.items():
+            if name not in self.param_indices:
+                raise Exception(
+                    "Policy %s has no parameter %s" % (self.policy_name, name)
+                )
+            if value <= 0:
+                raise Exception("Invalid value for parameter %s: %d" % (name, value))
+            key = struct.pack("<I", self.param_indices[name]["index"])
+            cmd = ["sudo", "bpftool", "map", "update", "pinned", pin_path]
+            cmd += ["key", "hex"] + ["%02x" % b for b in key]
+            cmd += ["value", "hex"] + ["%02x" % b for b in struct.pack("<Q", value)]
+            run(cmd)
+            self.param_indices[name]["value"] = value
+            self.params = dict(self.params, **{name: value})
+            log.info("Set parameter %s of %s to %d", name, self.policy_name, value)
+
+    def stop(self) -> Dict[str, int]:
+        """Stop the policy and return the stats counters it printed on exit."""
         if not self.has_started:
             raise Exception("Policy not started")
+        if self.daemon_socket:
+            reply = policy_daemon_request(
+                self.daemon_socket, "DETACH cgroup=%s" % self.cgroup_path
+            )
+            self.has_started = False
+            self.stats = parse_policy_stats(reply)
+            return self.stats
         cmd = ["sudo", "kill", "-2", str(self._policy_thread.pid)]
         run(cmd)
         out, err = self._policy_thread.communicate()
-        with suppress(subprocess.CalledProcessError):
-            run(["sudo", "rm", "/sys/fs/bpf/cache_ext/scan_pids"])
-        log.info("Policy thread stdout: %s", out.decode("utf-8"))
+        if self.policy_name in SINGLE_INSTANCE_POLICIES:
+            with suppress(subprocess.CalledProcessError):
+                run(["sudo", "rm", "/sys/fs/bpf/cache_ext/scan_pids"])
+        out = (self._ready_output + out).decode("utf-8")
+        log.info("Policy thread stdout: %s", out)
         log.info("Policy thread stderr: %s", err.decode("utf-8"))
+        self.stats = parse_policy_stats(out)
+        if not self.stats:
+            log.warning("Policy %s did not report stats", self.loader_path)
+        for prefix, key_prefix in POLICY_EXTRA_STATS_PREFIXES.items():
+            for key, value in parse_policy_stats(out, prefix).items():
+                self.stats[key_prefix + key] = value
+        if self.stats.get("metadata_lookup_samples"):
+            self.stats["metadata_lookup_avg_ns"] = (
+                self.stats["metadata_lookup_ns"] / self.stats["metadata_lookup_samples"]
+            )
+        if self.stats.get("refaults") and self.stats.get("evictions"):
+            self.stats["refault_ratio"] = (
+                self.stats["refaults"] / self.stats["evictions"]
+            )
+        if self.page_trace_file:
+            self.stats["page_trace_file"] = self.page_trace_file
+            drops = self.stats.get("trace_drops", 0)
+            recorded = self.stats.get("page_trace_events", 0)
+            self.stats["page_trace_drop_ratio"] = (
+                drops / (drops + recorded) if drops + recorded else 0.0
+            )
+            if drops:
+                log.warning(
+                    "Page trace %s dropped %d events (%.2f%%), increase"
+                    " --page-trace-buffer-mb",
+                    self.page_trace_file,
+                    drops,
+                    100 * self.stats["page_trace_drop_ratio"],
+                )
         self.has_started = False
         self._policy_thread = None
+        return self.stats
 
 
 def ulimit(num_open_files: int):
@@ -127,14 +440,62 @@ def edit_yaml_file(file_path):
         yaml.dump(data, file)
 
 
-def run_command_with_live_output(command, **kwargs):
+OUTPUT_CHUNK_SIZE = 1 << 16
+# After a partial read, wait a little so that output accumulates into larger
+# chunks instead of waking up the harness for every write of the benchmark.
+OUTPUT_COALESCE_SEC = 0.01
+# Periodic throughput lines of My-YCSB, e.g.
+# "Uniform: UPDATE throughput 0.00 ops/sec, ..., total throughput 9038.24 ops/sec"
+DEFAULT_ADAPTIVE_SAMPLE_REGEX = r"total throughput (\d+(?:\.\d+)?) ops/sec"
+DEFAULT_MAX_OUTPUT_BYTES = 16 * 2**20
+
+
+class OutputRing:
+    """Bounded in-memory buffer that keeps the tail of a command's output."""
+
+    def __init__(self, max_bytes: Union[int, None] = None):
+        self.max_bytes = max_bytes
+        self.chunks = deque()
+        self.size = 0
+        self.dropped = 0
+
+    def append(self, data: str):
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.max_bytes is None:
+            return
+        while self.size > self.max_bytes and len(self.chunks) > 1:
+            chunk = self.chunks.popleft()
+            self.size -= len(chunk)
+            self.dropped += len(chunk)
+
+    def getvalue(self) -> str:
+        value = "".join(self.chunks)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            value = value[-self.max_bytes :]
+        return value
+
+
+def run_command_with_live_output(
+    command,
+    log_file: Union[str, None] = None,
+    line_callback: Union[Callable[[str], Union[bool, None]], None] = None,
+    echo: bool = True,
+    max_output_bytes: Union[int, None] = None,
+    **kwargs,
+):
+    """Run a command and capture its output as it is produced.
+
+    Output is read in large chunks without a polling timeout. It is
+    optionally spooled to log_file, echoed to the terminal and passed line
+    by line to line_callback, so results can be parsed incrementally. Only
+    the last max_output_bytes of each stream are kept in memory (all of it
+    if None). If line_callback returns True, the command is stopped early
+    with SIGINT and its exit code is ignored. Returns the captured stdout."""
     # Default kwargs for Popen
     popen_kwargs = {
         "stdout": subprocess.PIPE,
         "stderr": subprocess.PIPE,
-        "text": True,
-        "bufsize": 1,
-        "universal_newlines": True,
     }
 
     # Update with any user-provided kwargs
@@ -142,53 +503,83 @@ def run_command_with_live_output(command, **kwargs):
 
     process = subprocess.Popen(command, **popen_kwargs)
 
-    stdout_output = []
-    stderr_output = []
-
-    # Set stdout and stderr to non-blocking mode
-    for pipe in [process.stdout, process.stderr]:
-        if pipe:
-            os.set_blocking(pipe.fileno(), False)
-
-    while True:
-        ready_to_read, _, _ = select.select(
-            [process.stdout, process.stderr], [], [], 0.1
-        )
-
-        for pipe in ready_to_read:
-            if pipe == process.stdout:
-                line = process.stdout.readline()
-                if line:
-                    print(line.strip())
-                    stdout_output.append(line)
-            elif pipe == process.stderr:
-                line = process.stderr.readline()
-                if line:
-                    print(line.strip(), file=sys.stderr)
-                    stderr_output.append(line)
-
-        if process.poll() is not None:
-            break
-
-    # Read any remaining output
-    for pipe in [process.stdout, process.stderr]:
+    stdout_output = OutputRing(max_output_bytes)
+    stderr_output = OutputRing(max_output_bytes)
+    spool = open(log_file, "ab") if log_file else None
+    partial_line = ""
+    interrupted = False
+
+    def handle_line(line: str):
+        nonlocal interrupted
+        if line_callback(line) and not interrupted:
+            log.info("Stopping the command early")
+            process.send_signal(signal.SIGINT)
+            interrupted = True
+
+    streams = {}
+    sel = selectors.DefaultSelector()
+    for pipe, output, terminal in [
+        (process.stdout, stdout_output, sys.stdout),
+        (process.stderr, stderr_output, sys.stderr),
+    ]:
         if pipe:
-            remaining_output = pipe.read()
-            if remaining_output:
-                print(
-                    remaining_output.strip(),
-                    file=sys.stderr if pipe == process.stderr else sys.stdout,
-                )
-                (stderr_output if pipe == process.stderr else stdout_output).append(
-                    remaining_output
-                )
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            streams[pipe.fileno()] = (decoder, output, terminal)
+            sel.register(pipe.fileno(), selectors.EVENT_READ)
+
+    try:
+        while streams:
+            partial_read = False
+            for key, _ in sel.select():
+                fd = key.fd
+                decoder, output, terminal = streams[fd]
+                data = os.read(fd, OUTPUT_CHUNK_SIZE)
+                partial_read |= 0 < len(data) < OUTPUT_CHUNK_SIZE
+                if not data:
+                    sel.unregister(fd)
+                    del streams[fd]
+                    text = decoder.decode(b"", final=True)
+                else:
+                    if spool:
+                        spool.write(data)
+                    text = decoder.decode(data)
+                if not text:
+                    continue
+                output.append(text)
+                if echo:
+                    terminal.write(text)
+                    terminal.flush()
+                if line_callback and output is stdout_output:
+                    lines = (partial_line + text).split("\n")
+                    partial_line = lines.pop()
+                    for line in lines:
+                        handle_line(line)
+            if partial_read:
+                sleep(OUTPUT_COALESCE_SEC)
+        if line_callback and partial_line:
+            handle_line(partial_line)
+        process.wait()
+    finally:
+        sel.close()
+        if spool:
+            spool.close()
+
+    if stdout_output.dropped:
+        log.info(
+            "Kept the last %s of stdout in memory (%s dropped)",
+            format_bytes_str(stdout_output.size),
+            format_bytes_str(stdout_output.dropped),
+        )
 
-    if process.returncode != 0:
+    if process.returncode != 0 and not interrupted:
         raise subprocess.CalledProcessError(
-            process.returncode, command, "".join(stdout_output), "".join(stderr_output)
+            process.returncode,
+            command,
+            stdout_output.getvalue(),
+            stderr_output.getvalue(),
         )
 
-    return "".join(stdout_output)
+    return stdout_output.getvalue()
 
 
 def run(cmd, *args, **kwargs):
@@ -198,6 +589,23 @@ def run(cmd, *args, **kwargs):
     return subprocess.run(cmd, *args, **kwargs)
 
 
+def stop_process(proc: subprocess.Popen, timeout: float = 10):
+    """Terminate a process that may run as root (e.g. through sudo) and wait
+    for it, killing it if it does not exit within timeout seconds."""
+    if proc.poll() is not None:
+        return
+    log.info("Terminating process %d: %s", proc.pid, proc.args)
+    # The process may exit in the meantime
+    with suppress(CalledProcessError):
+        run(["sudo", "kill", "-TERM", str(proc.pid)])
+    try:
+        proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        with suppress(CalledProcessError):
+            run(["sudo", "kill", "-KILL", str(proc.pid)])
+        proc.wait()
+
+
 def check_output(cmd, *args, **kwargs):
     log.info("Running command: %s" % cmd)
     return subprocess.check_output(cmd, *args, **kwargs)
@@ -268,6 +676,19 @@ def drop_page_cache():
     run(["sudo", "sh", "-c", "echo 1 > /proc/sys/vm/drop_caches"])
 
 
+def drop_dir_page_cache(path: str):
+    """Drop the cached pages of the files under path only, leaving the page
+    cache of other concurrently running benchmarks alone."""
+    run(["sudo", "sync", "-f", path])
+    for root, _, files in os.walk(path):
+        for name in files:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
 def set_sysctl(key: str, value: Union[int, str]):
     run(["sudo", "sysctl", "-w", f"{key}={value}"])
 
@@ -284,6 +705,83 @@ def enable_smt():
     run(["sudo", "sh", "-c", "echo on > /sys/devices/system/cpu/smt/control"])
 
 
+def enable_bpf_stats():
+    """Make the kernel count the run time and runs of every BPF program, for
+    bpf_prog_stats(). This adds two clock reads to each program run."""
+    set_sysctl("kernel.bpf_stats_enabled", 1)
+
+
+def disable_bpf_stats():
+    set_sysctl("kernel.bpf_stats_enabled", 0)
+
+
+def bpf_prog_stats(exclude_ids: Iterable[int] = ()) -> Dict[str, Dict[str, int]]:
+    """Cumulative run_time_ns and run_cnt of the loaded BPF programs, by
+    program name (summed over programs with the same name). They only advance
+    while BPF stats are enabled.
+
+    Programs in exclude_ids are skipped, e.g. those of the hit rate monitor,
+    whose dir_watcher program has the same name as the policies' one."""
+    out = check_output(["sudo", "bpftool", "prog", "show", "--json"])
+    exclude_ids = set(exclude_ids)
+    stats = {}
+    for prog in json.loads(out):
+        name = prog.get("name", "")
+        if not name or prog.get("id") in exclude_ids:
+            continue
+        prog_stats = stats.setdefault(name, {"run_time_ns": 0, "run_cnt": 0})
+        prog_stats["run_time_ns"] += prog.get("run_time_ns", 0)
+        prog_stats["run_cnt"] += prog.get("run_cnt", 0)
+    return stats
+
+
+def bpf_prog_stats_delta(before: Dict, after: Dict) -> Dict[str, Dict]:
+    """Runs, run time and average ns per run of each program that ran between
+    two bpf_prog_stats() snapshots."""
+    delta = {}
+    for name, prog_stats in after.items():
+        prev = before.get(name, {"run_time_ns": 0, "run_cnt": 0})
+        run_cnt = prog_stats["run_cnt"] - prev["run_cnt"]
+        run_time_ns = prog_stats["run_time_ns"] - prev["run_time_ns"]
+        if run_cnt <= 0:
+            continue
+        delta[name] = {
+            "run_cnt": run_cnt,
+            "run_time_ns": run_time_ns,
+            "avg_ns": run_time_ns / run_cnt,
+        }
+    return delta
+
+
+# Callbacks of the policies' BPF programs, which are named <policy>_<callback>
+POLICY_CALLBACKS = [
+    "folio_added",
+    "folio_accessed",
+    "folio_evicted",
+    "evict_folios",
+    "vfs_open_exit",
+]
+
+
+def bpf_callback_stats(prog_stats: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Runs, run time and average ns per run of each policy callback in a
+    bpf_prog_stats_delta(), summed over the programs implementing it (e.g.
+    fifo_folio_added and lhd_folio_added)."""
+    stats = {}
+    for name, prog in prog_stats.items():
+        callback = next((c for c in POLICY_CALLBACKS if name.endswith(c)), None)
+        if callback is None:
+            continue
+        callback_stats = stats.setdefault(callback, {"run_cnt": 0, "run_time_ns": 0})
+        callback_stats["run_cnt"] += prog["run_cnt"]
+        callback_stats["run_time_ns"] += prog["run_time_ns"]
+    for callback_stats in stats.values():
+        callback_stats["avg_ns"] = (
+            callback_stats["run_time_ns"] / callback_stats["run_cnt"]
+        )
+    return stats
+
+
 def rsync_folder(source_dir: str, dest_dir: str):
     # rsync -avpl --delete /mydata/leveldb_db_orig/ /mydata/leveldb_db/
     if not source_dir.endswith("/"):
@@ -291,6 +789,187 @@ def rsync_folder(source_dir: str, dest_dir: str):
     run(["rsync", "-avpl", "--delete", source_dir, dest_dir])
 
 
+def _file_signatures(root: str) -> Dict[str, tuple]:
+    signatures = {}
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            signatures[os.path.relpath(path, root)] = (st.st_size, int(st.st_mtime))
+    return signatures
+
+
+# LevelDB tables are immutable and file numbers are never reused, so a table
+# with the same name and size in both trees is the same file.
+LEVELDB_TABLE_SUFFIXES = (".ldb", ".sst")
+
+
+def changed_files(source_dir: str, dest_dir: str):
+    """Return the files of source_dir that are missing or differ in dest_dir
+    and the files of dest_dir that do not exist in source_dir."""
+    source = _file_signatures(source_dir)
+    dest = _file_signatures(dest_dir) if os.path.exists(dest_dir) else {}
+    changed = []
+    for rel, (size, mtime) in source.items():
+        if rel not in dest:
+            changed.append(rel)
+        elif rel.endswith(LEVELDB_TABLE_SUFFIXES):
+            if dest[rel][0] != size:
+                changed.append(rel)
+        elif dest[rel] != (size, mtime):
+            changed.append(rel)
+    removed = [rel for rel in dest if rel not in source]
+    return changed, removed
+
+
+class DatabaseSnapshot(ABC):
+    """Resets a working copy (dest_dir) of a pristine database (source_dir)
+    before each run."""
+
+    name = None
+
+    def __init__(self, source_dir: str, dest_dir: str):
+        self.source_dir = source_dir.rstrip("/")
+        self.dest_dir = dest_dir.rstrip("/")
+
+    @abstractmethod
+    def _reset(self):
+        raise NotImplementedError
+
+    def reset(self) -> float:
+        """Reset the working copy and return how long it took in seconds."""
+        start = time()
+        self._reset()
+        duration = time() - start
+        log.info(
+            "Reset %s from %s with %s in %.2fs",
+            self.dest_dir,
+            self.source_dir,
+            self.name,
+            duration,
+        )
+        return duration
+
+
+class RsyncSnapshot(DatabaseSnapshot):
+    """Copy with rsync, which skips files with the same size and mtime."""
+
+    name = "rsync"
+
+    def _reset(self):
+        rsync_folder(self.source_dir, self.dest_dir)
+
+
+class ReflinkSnapshot(DatabaseSnapshot):
+    """Share extents with the source (XFS, btrfs) and only re-clone the files
+    that changed since the last reset."""
+
+    name = "reflink"
+
+    def _reset(self):
+        changed, removed = changed_files(self.source_dir, self.dest_dir)
+        log.info("Reflink reset: %d changed, %d removed", len(changed), len(removed))
+        for rel in removed:
+            os.remove(os.path.join(self.dest_dir, rel))
+        for rel in changed:
+            dest = os.path.join(self.dest_dir, rel)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with suppress(FileNotFoundError):
+                os.remove(dest)
+            run(
+                [
+                    "cp",
+                    "--reflink=always",
+                    "-p",
+                    os.path.join(self.source_dir, rel),
+                    dest,
+                ]
+            )
+
+
+class OverlaySnapshot(DatabaseSnapshot):
+    """Mount dest_dir as an overlay of the read-only source and discard the
+    upper directory on reset, so only files written by a run are dropped.
+
+    The upper directory must be on the same filesystem as the source, so that
+    the inode numbers seen through the overlay match those of the page cache
+    that cache_ext policies watch."""
+
+    name = "overlay"
+
+    def __init__(self, source_dir: str, dest_dir: str):
+        super().__init__(source_dir, dest_dir)
+        self.upper_dir = self.dest_dir + ".upper"
+        self.work_dir = self.dest_dir + ".work"
+
+    def _reset(self):
+        if os.path.ismount(self.dest_dir):
+            run(["sudo", "umount", self.dest_dir])
+        run(["sudo", "rm", "-rf", self.upper_dir, self.work_dir])
+        for path in [self.dest_dir, self.upper_dir, self.work_dir]:
+            os.makedirs(path, exist_ok=True)
+        run(
+            [
+                "sudo",
+                "mount",
+                "-t",
+                "overlay",
+                "overlay",
+                "-o",
+                "lowerdir=%s,upperdir=%s,workdir=%s"
+                % (self.source_dir, self.upper_dir, self.work_dir),
+                self.dest_dir,
+            ]
+        )
+
+
+class BtrfsSnapshot(DatabaseSnapshot):
+    """Replace dest_dir with a writable snapshot of the source subvolume.
+
+    source_dir must be a btrfs subvolume. Block-level (LVM) snapshots are not
+    supported by any backend."""
+
+    name = "btrfs"
+
+    def _reset(self):
+        if os.path.exists(self.dest_dir):
+            run(["sudo", "btrfs", "subvolume", "delete", self.dest_dir])
+        run(["sudo", "btrfs", "subvolume", "snapshot", self.source_dir, self.dest_dir])
+        run(["sudo", "chown", "%d:%d" % (os.getuid(), os.getgid()), self.dest_dir])
+
+
+SNAPSHOT_BACKENDS = {
+    cls.name: cls
+    for cls in [RsyncSnapshot, ReflinkSnapshot, OverlaySnapshot, BtrfsSnapshot]
+}
+
+_db_snapshots = {}
+
+
+def reset_database_snapshot(backend: str, source_dir: str, dest_dir: str) -> float:
+    """Reset dest_dir from source_dir with the given snapshot backend.
+
+    Falls back to rsync if the backend fails on its first reset (e.g. no
+    reflink support on this filesystem). Returns the reset time in seconds."""
+    key = (source_dir, dest_dir)
+    snapshot = _db_snapshots.get(key)
+    if snapshot is None:
+        if backend not in SNAPSHOT_BACKENDS:
+            raise Exception("Unknown snapshot backend: %s" % backend)
+        snapshot = SNAPSHOT_BACKENDS[backend](source_dir, dest_dir)
+        try:
+            duration = snapshot.reset()
+        except (CalledProcessError, OSError) as e:
+            if backend == RsyncSnapshot.name:
+                raise e
+            log.warning("Snapshot backend %s failed (%s), using rsync", backend, e)
+            snapshot = RsyncSnapshot(source_dir, dest_dir)
+            duration = snapshot.reset()
+        _db_snapshots[key] = snapshot
+        return duration
+    return snapshot.reset()
+
+
 def load_json(path: str):
     with open(path, "r") as f:
         return json.load(f)
@@ -325,6 +1004,9 @@ class BenchResults:
     def __setitem__(self, key, value):
         self.__dict__[key] = value
 
+    def __contains__(self, key):
+        return key in self.__dict__
+
     def to_json(self):
         return self.__dict__
 
@@ -405,11 +1087,828 @@ def checkpoint_results(results_file: str, results: BenchRun):
     os.rename(temp_results_file, results_file)
 
 
+RESULTS_STORE_SUFFIXES = (".sqlite", ".db")
+
+
+def is_results_store(results_file: str) -> bool:
+    return results_file.endswith(RESULTS_STORE_SUFFIXES)
+
+
+def _quote_column(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+def _encode_config_value(value) -> str:
+    return json.dumps(value, cls=ToJSONEncoder, sort_keys=True)
+
+
+def config_key(config: Dict) -> str:
+    """Canonical string of a config, the unique key of its run in a results
+    store. Also used to find already run configs without a linear scan."""
+    return _encode_config_value(config)
+
+
+class ResultsStore:
+    """SQLite store of BenchRuns, a drop-in alternative to the results JSON
+    file for large result sets.
+
+    Each run is a row. Every config field is a "cfg_<field>" column holding the
+    JSON-encoded value, with an index, so that partial config matches are
+    indexed lookups instead of linear scans. Scalar result fields are also
+    flattened into "res_<field>" columns for ad-hoc SQL queries. The full
+    config and results are kept as JSON, so runs load back unchanged. Columns
+    are added as new config and result fields appear. Saving a run of a config
+    that is already stored replaces the old run.
+
+    The config_stats table holds the mean and confidence interval of a metric
+    over the iterations of each config."""
+
+    CONFIG_PREFIX = "cfg_"
+    RESULT_PREFIX = "res_"
+    CONFIG_STATS_FIELDS = [
+        "n",
+        "mean",
+        "std",
+        "ci",
+        "rel_ci",
+        "confidence",
+        "ci_method",
+    ]
+
+    def __init__(self, path: str, benchresults_cls=BenchResults):
+        self.path = path
+        self.benchresults_cls = benchresults_cls
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY,"
+            " config_key TEXT UNIQUE NOT NULL,"
+            " config TEXT NOT NULL,"
+            " results TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS config_stats ("
+            " config_key TEXT NOT NULL,"
+            " metric TEXT NOT NULL,"
+            " config TEXT NOT NULL,"
+            " n INTEGER, mean REAL, std REAL, ci REAL, rel_ci REAL,"
+            " confidence REAL, ci_method TEXT,"
+            " PRIMARY KEY (config_key, metric))"
+        )
+        self.conn.commit()
+        self.columns = set(
+            row[1] for row in self.conn.execute("PRAGMA table_info(runs)")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.runs())
+
+    def _add_column(self, column: str, indexed: bool):
+        if column in self.columns:
+            return
+        self.conn.execute("ALTER TABLE runs ADD COLUMN %s" % _quote_column(column))
+        if indexed:
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS %s ON runs (%s)"
+                % (_quote_column("idx_" + column), _quote_column(column))
+            )
+        self.columns.add(column)
+
+    def _insert(self, bench_run: BenchRun):
+        results = bench_run.results.to_json()
+        row = {
+            "config_key": config_key(bench_run.config),
+            "config": json.dumps(bench_run.config, cls=ToJSONEncoder),
+            "results": json.dumps(results, cls=ToJSONEncoder),
+        }
+        for key, value in bench_run.config.items():
+            column = self.CONFIG_PREFIX + key
+            self._add_column(column, indexed=True)
+            row[column] = _encode_config_value(value)
+        for key, value in results.items():
+            if value is None or isinstance(value, (bool, int, float, str)):
+                column = self.RESULT_PREFIX + key
+                self._add_column(column, indexed=False)
+                row[column] = value
+        self.conn.execute(
+            "INSERT OR REPLACE INTO runs (%s) VALUES (%s)"
+            % (
+                ", ".join(_quote_column(c) for c in row),
+                ", ".join("?" for _ in row),
+            ),
+            list(row.values()),
+        )
+
+    def append(self, bench_run: BenchRun):
+        """Add a run, replacing a stored run of the same config, and commit it."""
+        self._insert(bench_run)
+        self.conn.commit()
+
+    def extend(self, bench_runs: List[BenchRun]):
+        """Append runs in a single transaction."""
+        for bench_run in bench_runs:
+            self._insert(bench_run)
+        self.conn.commit()
+
+    def import_json(self, results_file: str):
+        """Import the runs of a results JSON file."""
+        self.extend(parse_results_file(results_file, self.benchresults_cls))
+
+    def _where(self, config_match: Dict):
+        clauses = []
+        params = []
+        for key, value in config_match.items():
+            column = self.CONFIG_PREFIX + key
+            if column not in self.columns:
+                return None, None
+            clauses.append("%s = ?" % _quote_column(column))
+            params.append(_encode_config_value(value))
+        return " AND ".join(clauses) or "1", params
+
+    def _to_bench_run(self, row) -> BenchRun:
+        return BenchRun(
+            json.loads(row[0]), self.benchresults_cls.from_json(json.loads(row[1]))
+        )
+
+    def select(self, config_match: Dict) -> List[BenchRun]:
+        """Runs whose config contains config_match, in insertion order."""
+        where, params = self._where(config_match)
+        if where is None:
+            return []
+        rows = self.conn.execute(
+            "SELECT config, results FROM runs WHERE %s ORDER BY id" % where, params
+        )
+        return [self._to_bench_run(row) for row in rows]
+
+    def runs(self) -> List[BenchRun]:
+        return self.select({})
+
+    def exists(self, config: Dict) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM runs WHERE config_key = ?", [config_key(config)]
+        ).fetchone()
+        return row is not None
+
+    def set_config_stats(self, config_stats: List[Dict]):
+        """Store the statistics of configs over their iterations (see
+        iteration_config_stats), replacing older ones."""
+        for stats in config_stats:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO config_stats (config_key, metric, config, %s)"
+                " VALUES (?, ?, ?, %s)"
+                % (
+                    ", ".join(self.CONFIG_STATS_FIELDS),
+                    ", ".join("?" for _ in self.CONFIG_STATS_FIELDS),
+                ),
+                [
+                    config_key(stats["config"]),
+                    stats["metric"],
+                    json.dumps(stats["config"], cls=ToJSONEncoder),
+                ]
+                + [stats[field] for field in self.CONFIG_STATS_FIELDS],
+            )
+        self.conn.commit()
+
+    def config_stats(self, metric: Union[str, None] = None) -> List[Dict]:
+        """Stored config statistics, optionally only those of a metric."""
+        query = "SELECT config, metric, %s FROM config_stats" % ", ".join(
+            self.CONFIG_STATS_FIELDS
+        )
+        params = []
+        if metric is not None:
+            query += " WHERE metric = ?"
+            params.append(metric)
+        return [
+            {
+                "config": json.loads(row[0]),
+                "metric": row[1],
+                **dict(zip(self.CONFIG_STATS_FIELDS, row[2:])),
+            }
+            for row in self.conn.execute(query, params)
+        ]
+
+    def config_combinations(
+        self, fields: List[str], config_match: Union[Dict, None] = None
+    ) -> List[Dict]:
+        """Unique combinations of the given config fields, in insertion order,
+        over the runs that have all of them (and match config_match)."""
+        columns = [self.CONFIG_PREFIX + field for field in fields]
+        if not all(column in self.columns for column in columns):
+            return []
+        where, params = self._where(config_match or {})
+        if where is None:
+            return []
+        quoted = ", ".join(_quote_column(column) for column in columns)
+        not_null = " AND ".join(
+            "%s IS NOT NULL" % _quote_column(column) for column in columns
+        )
+        rows = self.conn.execute(
+            "SELECT %s FROM runs WHERE %s AND %s GROUP BY %s ORDER BY MIN(id)"
+            % (quoted, where, not_null or "1", quoted),
+            params,
+        )
+        return [
+            {field: json.loads(value) for field, value in zip(fields, row)}
+            for row in rows
+        ]
+
+
+def load_results(results_file: str, benchresults_cls=BenchResults) -> List[BenchRun]:
+    """Load the runs of a results JSON file or results store."""
+    if is_results_store(results_file):
+        with ResultsStore(results_file, benchresults_cls) as store:
+            return store.runs()
+    return parse_results_file(results_file, benchresults_cls)
+
+
+def iteration_config_stats(
+    configs: List[Dict],
+    results: List[BenchRun],
+    metric: str,
+    confidence: float = 0.95,
+    method: str = "t",
+) -> List[Dict]:
+    """Statistics of metric over the iterations of each config, i.e. of the
+    runs whose config only differs in "iteration". Configs without an
+    iteration field or without the metric in their results are skipped."""
+    config_stats = []
+    for config in configs:
+        if "iteration" not in config:
+            continue
+        base_config = {k: v for k, v in config.items() if k != "iteration"}
+        if any(stats["config"] == base_config for stats in config_stats):
+            continue
+        samples = [
+            r.results[metric]
+            for r in results_select(results, base_config)
+            if metric in r.results
+        ]
+        if not samples:
+            continue
+        config_stats.append(
+            {
+                "config": base_config,
+                "metric": metric,
+                **summarize_samples(samples, confidence, method),
+            }
+        )
+    return config_stats
+
+
+def save_config_stats(results_file: str, config_stats: List[Dict]):
+    """Store config statistics in the results store, or next to a results
+    JSON file as <name>_stats.json."""
+    if is_results_store(results_file):
+        with ResultsStore(results_file) as store:
+            store.set_config_stats(config_stats)
+        return
+    stats_file = os.path.splitext(results_file)[0] + "_stats.json"
+    save_json(stats_file, config_stats)
+
+
+def checkpoint_run(results_file: str, results: List[BenchRun], bench_run: BenchRun):
+    """Add a run to results and persist it. A results store only appends the
+    new run; a JSON file is rewritten."""
+    results.append(bench_run)
+    if is_results_store(results_file):
+        with ResultsStore(results_file) as store:
+            store.append(bench_run)
+    else:
+        checkpoint_results(results_file, results)
+
+
+def online_cpus() -> List[int]:
+    return sorted(os.sched_getaffinity(0))
+
+
+def numa_node_cpus() -> Dict[int, List[int]]:
+    """Map each NUMA node to its CPUs. Empty if NUMA info is unavailable."""
+    nodes = {}
+    node_dir = "/sys/devices/system/node"
+    if not os.path.isdir(node_dir):
+        return nodes
+    for entry in os.listdir(node_dir):
+        match = re.fullmatch(r"node(\d+)", entry)
+        if not match:
+            continue
+        cpulist = read_file(os.path.join(node_dir, entry, "cpulist"))
+        if cpulist:
+            nodes[int(match.group(1))] = parse_numbers_string(cpulist)
+    return nodes
+
+
+class BenchSlot:
+    """A partition of the host (CPUs, NUMA node, data disk) that runs one
+    config at a time.
+
+    The default slot of a serial run is not isolated: it uses CPUs 0-(n-1)
+    and the cgroup names and paths of the config as is. Isolated slots get
+    their own cgroup names and data directories so that they can run
+    concurrently."""
+
+    def __init__(
+        self,
+        index: int,
+        cpus: List[int],
+        numa_node: Union[int, None] = None,
+        data_dir: Union[str, None] = None,
+        isolated: bool = True,
+    ):
+        self.index = index
+        self.cpus = cpus
+        self.numa_node = numa_node
+        self.data_dir = data_dir
+        self.isolated = isolated
+
+    def __repr__(self) -> str:
+        return "BenchSlot(%d, cpus=%s, numa_node=%s, data_dir=%s)" % (
+            self.index,
+            self.cpus,
+            self.numa_node,
+            self.data_dir,
+        )
+
+    def cpu_list(self, nr_cpus: int) -> str:
+        if not self.isolated:
+            return "0-%s" % str(nr_cpus - 1)
+        if nr_cpus > len(self.cpus):
+            raise Exception(
+                "Slot %d has %d CPUs, config needs %d"
+                % (self.index, len(self.cpus), nr_cpus)
+            )
+        return ",".join(str(cpu) for cpu in self.cpus[:nr_cpus])
+
+    def cgroup_name(self, cgroup: str) -> str:
+        if not self.isolated:
+            return cgroup
+        return "%s_slot%d" % (cgroup, self.index)
+
+    def path(self, path: str) -> str:
+        """Slot-private variant of a path (e.g. a temporary DB directory)."""
+        if not self.isolated:
+            return path
+        path = path.rstrip("/")
+        if self.data_dir:
+            return os.path.join(
+                self.data_dir, "%s_slot%d" % (os.path.basename(path), self.index)
+            )
+        return "%s_slot%d" % (path, self.index)
+
+
+def partition_slots(
+    nr_slots: int,
+    cpus_per_slot: int,
+    slot_cpus: str = "",
+    data_dirs: Union[List[str], None] = None,
+    numa: bool = False,
+) -> List[BenchSlot]:
+    """Partition the host into nr_slots slots.
+
+    CPUs are given explicitly with slot_cpus ("0-3;4-7"), or allocated in
+    contiguous chunks of cpus_per_slot. With numa, slots are spread
+    round-robin across NUMA nodes and only take CPUs of their node. Data
+    directories are assigned round-robin."""
+    data_dirs = data_dirs or []
+    if slot_cpus:
+        cpu_sets = [parse_numbers_string(s) for s in slot_cpus.split(";")]
+        if len(cpu_sets) != nr_slots:
+            raise Exception(
+                "Expected %d CPU sets in %s, got %d"
+                % (nr_slots, slot_cpus, len(cpu_sets))
+            )
+        numa_nodes = [None] * nr_slots
+    else:
+        nodes = numa_node_cpus() if numa else {}
+        online = set(online_cpus())
+        if nodes:
+            pools = [
+                [cpu for cpu in nodes[node] if cpu in online] for node in sorted(nodes)
+            ]
+            node_ids = sorted(nodes)
+        else:
+            pools = [sorted(online)]
+            node_ids = [None]
+        cpu_sets = []
+        numa_nodes = []
+        for idx in range(nr_slots):
+            pool = pools[idx % len(pools)]
+            if len(pool) < cpus_per_slot:
+                raise Exception(
+                    "Not enough CPUs for %d slots of %d CPUs"
+                    % (nr_slots, cpus_per_slot)
+                )
+            cpu_sets.append(pool[:cpus_per_slot])
+            del pool[:cpus_per_slot]
+            numa_nodes.append(node_ids[idx % len(pools)])
+    slots = []
+    for idx in range(nr_slots):
+        data_dir = data_dirs[idx % len(data_dirs)] if data_dirs else None
+        slots.append(BenchSlot(idx, cpu_sets[idx], numa_nodes[idx], data_dir))
+    return slots
+
+
+CGROUP_TELEMETRY_STATS = [
+    "file",
+    "active_file",
+    "inactive_file",
+    "workingset_refault_file",
+]
+VMSTAT_TELEMETRY_FIELDS = [
+    "nr_file_pages",
+    "pgpgin",
+    "pgmajfault",
+    "pgscan_kswapd",
+    "pgscan_direct",
+    "pgsteal_kswapd",
+    "pgsteal_direct",
+    "workingset_refault_file",
+    "workingset_activate_file",
+]
+DEFAULT_TELEMETRY_INTERVAL = 1.0
+
+
+def _read_key_values(path: str) -> Dict[str, int]:
+    values = {}
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2:
+                values[fields[0]] = int(fields[1])
+    return values
+
+
+def _read_pressure(path: str) -> Dict[str, float]:
+    """Parse a PSI file into {"some_avg10": ..., "some_total": ..., ...}."""
+    values = {}
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.split()
+            for field in fields[1:]:
+                key, value = field.split("=")
+                values["%s_%s" % (fields[0], key)] = float(value)
+    return values
+
+
+def _read_cpu_times() -> Dict[int, tuple]:
+    """Return (busy, total) jiffies of each CPU from /proc/stat."""
+    times = {}
+    with open("/proc/stat", "r") as f:
+        for line in f:
+            match = re.match(r"cpu(\d+) ", line)
+            if not match:
+                continue
+            values = [int(v) for v in line.split()[1:]]
+            # idle and iowait are the 4th and 5th fields
+            idle = values[3] + values[4]
+            times[int(match.group(1))] = (sum(values) - idle, sum(values))
+    return times
+
+
+class TelemetrySampler:
+    """Samples cgroup memory stats, /proc/vmstat and per-CPU utilization at a
+    fixed interval in a background thread.
+
+    Samples are written as a compressed columnar .npz file with one array per
+    metric, all indexed by the "time" column (seconds since start). Counters
+    (vmstat, workingset_refault_file, PSI totals) are stored raw, so rates are
+    np.diff(column) / np.diff(time). Metrics that cannot be read (e.g. the
+    cgroup does not exist) are NaN."""
+
+    def __init__(
+        self,
+        output_file: str,
+        cgroup: Union[str, None] = None,
+        interval: float = DEFAULT_TELEMETRY_INTERVAL,
+    ):
+        self.output_file = output_file
+        self.cgroup_path = f"/sys/fs/cgroup/{cgroup}" if cgroup else None
+        self.interval = interval
+        self.columns = {}
+        self.nr_samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._cpu_times = None
+        self.start_time = time()
+
+    def _append(self, sample: Dict[str, float]):
+        for key, value in sample.items():
+            if key not in self.columns:
+                self.columns[key] = [float("nan")] * self.nr_samples
+            self.columns[key].append(value)
+        self.nr_samples += 1
+        for column in self.columns.values():
+            if len(column) < self.nr_samples:
+                column.append(float("nan"))
+
+    def _sample_cgroup(self, sample: Dict[str, float]):
+        if not self.cgroup_path:
+            return
+        with suppress(OSError, ValueError):
+            stat = _read_key_values(os.path.join(self.cgroup_path, "memory.stat"))
+            for key in CGROUP_TELEMETRY_STATS:
+                if key in stat:
+                    sample["cgroup_" + key] = stat[key]
+        with suppress(OSError, ValueError):
+            sample["cgroup_memory_current"] = int(
+                read_file(os.path.join(self.cgroup_path, "memory.current"))
+            )
+        with suppress(OSError, ValueError):
+            pressure = _read_pressure(os.path.join(self.cgroup_path, "memory.pressure"))
+            for key, value in pressure.items():
+                sample["cgroup_pressure_" + key] = value
+
+    def _sample_cpus(self, sample: Dict[str, float]):
+        cpu_times = _read_cpu_times()
+        if self._cpu_times is not None:
+            for cpu, (busy, total) in cpu_times.items():
+                prev_busy, prev_total = self._cpu_times.get(cpu, (busy, total))
+                elapsed = total - prev_total
+                sample["cpu%d_util" % cpu] = (
+                    (busy - prev_busy) / elapsed if elapsed > 0 else 0.0
+                )
+        self._cpu_times = cpu_times
+
+    def sample(self):
+        sample = {"time": time() - self.start_time}
+        self._sample_cgroup(sample)
+        with suppress(OSError, ValueError):
+            vmstat = _read_key_values("/proc/vmstat")
+            for key in VMSTAT_TELEMETRY_FIELDS:
+                if key in vmstat:
+                    sample["vmstat_" + key] = vmstat[key]
+        self._sample_cpus(sample)
+        self._append(sample)
+
+    def _run(self):
+        next_sample = time()
+        while not self._stop_event.is_set():
+            self.sample()
+            next_sample += self.interval
+            self._stop_event.wait(max(0, next_sample - time()))
+
+    def start(self):
+        if self._thread is not None:
+            raise Exception("Telemetry sampler already started")
+        self.start_time = time()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def _stop_sampling(self):
+        if self._thread is None:
+            raise Exception("Telemetry sampler not started")
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.sample()
+
+    def stop(self) -> str:
+        """Stop sampling and write the samples. Returns the output file."""
+        self._stop_sampling()
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_file)), exist_ok=True)
+        np.savez_compressed(
+            self.output_file,
+            **{key: np.array(values) for key, values in self.columns.items()},
+        )
+        log.info("Wrote %d telemetry samples to %s", self.nr_samples, self.output_file)
+        return self.output_file
+
+
+class CgroupOccupancySampler(TelemetrySampler):
+    """Samples the page cache occupancy of several cgroups, e.g. one per
+    tenant. stop() returns the samples instead of writing them:
+    {"time": [...], "<label>_file": [...], "<label>_memory_current": [...],
+    "<label>_workingset_refault_file": [...]}."""
+
+    def __init__(
+        self, cgroups: Dict[str, str], interval: float = DEFAULT_TELEMETRY_INTERVAL
+    ):
+        super().__init__(None, interval=interval)
+        self.cgroup_paths = {
+            label: f"/sys/fs/cgroup/{cgroup}" for label, cgroup in cgroups.items()
+        }
+
+    def sample(self):
+        sample = {"time": time() - self.start_time}
+        for label, cgroup_path in self.cgroup_paths.items():
+            with suppress(OSError, ValueError):
+                stat = _read_key_values(os.path.join(cgroup_path, "memory.stat"))
+                sample[label + "_file"] = stat["file"]
+                sample[label + "_workingset_refault_file"] = stat[
+                    "workingset_refault_file"
+                ]
+            with suppress(OSError, ValueError):
+                sample[label + "_memory_current"] = int(
+                    read_file(os.path.join(cgroup_path, "memory.current"))
+                )
+        self._append(sample)
+
+    def stop(self) -> Dict[str, List[float]]:
+        self._stop_sampling()
+        return self.columns
+
+
+def load_telemetry(path: str) -> Dict[str, np.ndarray]:
+    """Load a telemetry file written by TelemetrySampler as a dict of columns."""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+# Printed by policies/cache_ext_hitrate.c every interval, and on exit
+HITRATE_SAMPLE_PREFIX = "cache_ext_hitrate: "
+HITRATE_STATS_PREFIX = "cache_ext_hitrate_stats: "
+HITRATE_PROGS_PREFIX = "cache_ext_hitrate_progs: "
+# Built by policies/Makefile
+DEFAULT_HITRATE_MONITOR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "policies",
+    "cache_ext_hitrate.out",
+)
+
+
+class HitRateMonitor:
+    """Counts the page cache hits and misses of a cgroup on the files of a
+    directory during a run, with the cache_ext_hitrate BPF monitor (see
+    policies/cache_ext_hitrate.h). It does not need a policy, so baseline and
+    cache_ext runs are measured the same way.
+
+    stop() returns the totals and the per-interval counts of the run:
+    {"page_cache_hits": ..., "page_cache_misses": ..., "page_cache_hit_ratio":
+    ..., "page_cache_accesses": ..., "page_cache_hits_clamped": ...,
+    "page_cache_hit_series": {"time": [...], "hits": [...], "misses":
+    [...]}}.
+
+    Hits are accesses - misses, which undercounts them (see the header). When
+    readahead makes the misses of the run or of an interval exceed its
+    accesses, its hits are reported as 0, page_cache_hits_clamped counts those
+    totals and intervals, and a warning is logged.
+
+    Its BPF programs run on every page cache access, so leave it off for runs
+    that measure the CPU overhead of the policies. prog_ids lists them once
+    started, to exclude them from bpf_prog_stats()."""
+
+    def __init__(
+        self,
+        monitor_path: str,
+        cgroup: str,
+        watch_dir: str,
+        interval: float = DEFAULT_TELEMETRY_INTERVAL,
+    ):
+        self.monitor_path = monitor_path
+        self.cgroup_path = f"/sys/fs/cgroup/{cgroup}"
+        self.watch_dir = watch_dir
+        self.interval = interval
+        self.samples = []
+        self.totals = {}
+        self.prog_ids = []
+        self._proc = None
+        self._thread = None
+        # Set once the monitor printed its ready line, or exited without it
+        self._ready = threading.Event()
+        self._attached = False
+
+    def _read_output(self):
+        for line in self._proc.stdout:
+            line = line.decode("utf-8", "replace")
+            if line.startswith(POLICY_READY_LINE):
+                self._attached = True
+                self._ready.set()
+            elif line.startswith(HITRATE_PROGS_PREFIX):
+                with suppress(ValueError):
+                    self.prog_ids = json.loads(line[len(HITRATE_PROGS_PREFIX) :])
+            elif line.startswith(HITRATE_SAMPLE_PREFIX):
+                with suppress(ValueError):
+                    self.samples.append(json.loads(line[len(HITRATE_SAMPLE_PREFIX) :]))
+            elif line.startswith(HITRATE_STATS_PREFIX):
+                with suppress(ValueError):
+                    self.totals = json.loads(line[len(HITRATE_STATS_PREFIX) :])
+        # Do not leave start() waiting if the monitor exits before attaching
+        self._ready.set()
+
+    def start(self):
+        if self._proc is not None:
+            raise Exception("Hit rate monitor already started")
+        cmd = [
+            "sudo",
+            self.monitor_path,
+            "--watch_dir",
+            self.watch_dir,
+            "--cgroup_path",
+            self.cgroup_path,
+            "--interval_ms",
+            str(max(1, int(self.interval * 1000))),
+        ]
+        if CacheExtPolicy.watch_scope != DEFAULT_WATCH_SCOPE:
+            cmd += ["--watch_scope", CacheExtPolicy.watch_scope]
+        log.info("Starting hit rate monitor: %s", cmd)
+        self._proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._thread = threading.Thread(
+            target=self._read_output, name="hitrate", daemon=True
+        )
+        self._thread.start()
+        if not self._ready.wait(POLICY_READY_TIMEOUT_SEC):
+            self._abort()
+            raise Exception(
+                "Hit rate monitor not attached after %ds" % POLICY_READY_TIMEOUT_SEC
+            )
+        if not self._attached or self._proc.poll() is not None:
+            err = self._abort()
+            raise Exception(
+                "Hit rate monitor exited %s: %s"
+                % ("unexpectedly" if self._attached else "before attaching", err)
+            )
+
+    def _abort(self) -> str:
+        """Stop the monitor without reading its counters, returns its
+        stderr."""
+        stop_process(self._proc)
+        self._thread.join()
+        err = self._proc.stderr.read().decode("utf-8")
+        self._proc = None
+        return err
+
+    def stop(self) -> Dict:
+        if self._proc is None:
+            raise Exception("Hit rate monitor not started")
+        # SIGINT makes the monitor print its totals. It may have exited
+        # already, then report what it printed before.
+        if self._proc.poll() is None:
+            with suppress(CalledProcessError):
+                run(["sudo", "kill", "-2", str(self._proc.pid)])
+        try:
+            self._proc.wait(10)
+        except subprocess.TimeoutExpired:
+            log.warning("Hit rate monitor did not exit on SIGINT, killing it")
+            stop_process(self._proc)
+        self._thread.join()
+        err = self._proc.stderr.read().decode("utf-8")
+        self._proc = None
+        totals = self.totals or (self.samples[-1] if self.samples else {})
+        if not totals:
+            log.warning("Hit rate monitor did not report its counters: %s", err)
+            return {}
+
+        times, hits, misses = [], [], []
+        clamped = 0
+        prev = {"accesses": 0, "misses": 0}
+        for sample in self.samples:
+            sample_misses = sample["misses"] - prev["misses"]
+            sample_hits = sample["accesses"] - prev["accesses"] - sample_misses
+            times.append(sample["time_ms"] / 1000)
+            # Readahead misses are not always accessed
+            if sample_hits < 0:
+                clamped += 1
+            hits.append(max(sample_hits, 0))
+            misses.append(sample_misses)
+            prev = sample
+        total_hits = totals["accesses"] - totals["misses"]
+        if total_hits < 0:
+            clamped += 1
+        if clamped:
+            log.warning(
+                "Hit rate monitor counted more misses than accesses %d times"
+                " (run totals: %d misses, %d accesses), reporting 0 hits for"
+                " them",
+                clamped,
+                totals["misses"],
+                totals["accesses"],
+            )
+        total_hits = max(total_hits, 0)
+        requests = total_hits + totals["misses"]
+        return {
+            "page_cache_hits": total_hits,
+            "page_cache_misses": totals["misses"],
+            "page_cache_hit_ratio": total_hits / requests if requests else 0.0,
+            "page_cache_accesses": totals["accesses"],
+            "page_cache_hits_clamped": clamped,
+            "page_cache_hit_series": {"time": times, "hits": hits, "misses": misses},
+        }
+
+
 class BenchmarkFramework(ABC):
     """Simple benchmarking framework.
 
     Subclass it to implement a benchmark. You need to implement the abstract
-    methods."""
+    methods.
+
+    Benchmarks that set supports_parallel_slots can run independent configs
+    concurrently (--parallel-slots). Their hooks must then only touch the
+    resources of self.current_slot (cgroup names, temporary directories)."""
+
+    supports_parallel_slots = False
 
     def __init__(self, name: str, benchresults_cls=BenchResults, cli_args=None):
         self.name = name
@@ -418,8 +1917,50 @@ class BenchmarkFramework(ABC):
             self.args = cli_args
         else:
             self.args = self.parse_args()
+        if getattr(self.args, "policy_daemon_socket", ""):
+            CacheExtPolicy.daemon_socket = self.args.policy_daemon_socket
+        CacheExtPolicy.watch_scope = getattr(
+            self.args, "watch_scope", DEFAULT_WATCH_SCOPE
+        )
+        CacheExtPolicy.params = parse_policy_params(
+            getattr(self.args, "policy_param", None) or []
+        )
+        CacheExtPolicy.page_trace_dir = getattr(self.args, "page_trace_dir", "")
+        CacheExtPolicy.page_trace_buffer_mb = getattr(
+            self.args, "page_trace_buffer_mb", 0
+        )
+        CacheExtPolicy.regret_ghost_entries = getattr(
+            self.args, "regret_ghost_entries", 0
+        )
+        CacheExtPolicy.regret_window_sec = getattr(self.args, "regret_window_sec", 0)
+        self.hitrate_monitor = getattr(self.args, "hitrate_monitor", "")
+        if self.hitrate_monitor and not os.path.exists(self.hitrate_monitor):
+            raise Exception("Hit rate monitor not found: %s" % self.hitrate_monitor)
 
         self.second_command = False
+        self.default_slot = BenchSlot(0, [], isolated=False)
+        self._slot_local = threading.local()
+
+    @property
+    def parallel(self) -> bool:
+        return self.args.parallel_slots > 1
+
+    @property
+    def current_slot(self) -> BenchSlot:
+        """The slot running the config of the calling thread."""
+        return getattr(self._slot_local, "slot", self.default_slot)
+
+    @property
+    def current_config(self) -> Dict:
+        """The config run by the calling thread, e.g. for parse_results."""
+        return getattr(self._slot_local, "config", {})
+
+    @property
+    def current_prog_stats(self) -> Dict[str, Dict]:
+        """bpf_prog_stats_delta() of the benchmark command of the calling
+        thread, with --bpf-prog-stats. Set before after_benchmark, while the
+        policy programs are still loaded."""
+        return getattr(self._slot_local, "prog_stats", {})
 
     def benchmark_prepare(self, config):
         pass
@@ -431,6 +1972,11 @@ class BenchmarkFramework(ABC):
     def second_benchmark_cmd(self, config):
         return []
 
+    def extra_benchmark_cmds(self, config) -> Dict[str, List[str]]:
+        """Commands to run concurrently with benchmark_cmd, by name. Their
+        outputs are passed to parse_results as extra_outputs."""
+        return {}
+
     def cmd_extra_envs(self, config):
         return {}
 
@@ -440,6 +1986,45 @@ class BenchmarkFramework(ABC):
     def after_benchmark(self, config):
         pass
 
+    def benchmark_failed(self, config):
+        """Called instead of after_benchmark when the run fails, to release
+        what before_benchmark set up."""
+        pass
+
+    def telemetry_cgroup(self, config) -> Union[str, None]:
+        """The cgroup whose memory stats are sampled by --telemetry-dir."""
+        if "cgroup_name" not in config:
+            return None
+        return self.current_slot.cgroup_name(config["cgroup_name"])
+
+    def hitrate_watch_dir(self, config) -> Union[str, None]:
+        """The directory whose files the page cache hit ratio of each run is
+        measured on (--hitrate-monitor), None to not measure it. Defaults to
+        the watch_dir of the benchmark's cache_ext policy."""
+        policy = getattr(self, "cache_ext_policy", None)
+        return policy.watch_dir if policy else None
+
+    def start_hitrate_monitor(self, config) -> Union[HitRateMonitor, None]:
+        if not self.hitrate_monitor:
+            return None
+        cgroup = self.telemetry_cgroup(config)
+        watch_dir = self.hitrate_watch_dir(config)
+        if not cgroup or not watch_dir:
+            return None
+        monitor = HitRateMonitor(
+            self.hitrate_monitor,
+            cgroup,
+            watch_dir,
+            interval=self.args.telemetry_interval,
+        )
+        monitor.start()
+        return monitor
+
+    def output_line_callback(self, config) -> Union[Callable[[str], None], None]:
+        """Return a callable that is passed each line of the benchmark's
+        stdout as it is produced, to parse results incrementally."""
+        return None
+
     @abstractmethod
     def parse_results(self, stdout: str) -> BenchResults:
         raise NotImplementedError
@@ -468,7 +2053,8 @@ class BenchmarkFramework(ABC):
             "--results-file",
             type=str,
             default="results.json",
-            help="Path to results file (JSON format)",
+            help="Path to results file (JSON format, or a SQLite results store if"
+            " it ends in .sqlite or .db)",
         )
         # parser.add_argument("--runtime", type=int, default=60,
         #                     help="Runtime in seconds for each benchmark")
@@ -496,9 +2082,569 @@ class BenchmarkFramework(ABC):
             default=1,
             help="Number of iterations to run for each config",
         )
+        parser.add_argument(
+            "--ci-target",
+            type=float,
+            default=0,
+            help="Run extra iterations of configs until the confidence interval"
+            " half width of --ci-metric is at most this fraction of its mean."
+            " 0 disables extra iterations.",
+        )
+        parser.add_argument(
+            "--max-iterations",
+            type=int,
+            default=10,
+            help="Maximum number of iterations of a config with --ci-target",
+        )
+        parser.add_argument(
+            "--ci-metric",
+            type=str,
+            default="throughput_avg",
+            help="Result field whose confidence interval decides on extra"
+            " iterations",
+        )
+        parser.add_argument(
+            "--ci-method",
+            type=str,
+            default="t",
+            choices=list(CI_METHODS),
+            help="Confidence interval of the mean over iterations: Student-t or"
+            " bootstrap",
+        )
+        parser.add_argument(
+            "--ci-confidence",
+            type=float,
+            default=0.95,
+            help="Confidence level of the iteration confidence intervals",
+        )
+        parser.add_argument(
+            "--output-log-dir",
+            type=str,
+            default="",
+            help="Spool the output of each run to a log file in this directory",
+        )
+        parser.add_argument(
+            "--max-output-bytes",
+            type=int,
+            default=DEFAULT_MAX_OUTPUT_BYTES,
+            help="Only keep the last N bytes of each run's output in memory",
+        )
+        parser.add_argument(
+            "--quiet-output",
+            action="store_true",
+            default=False,
+            help="Do not echo the benchmark output to the terminal",
+        )
+        parser.add_argument(
+            "--telemetry-dir",
+            type=str,
+            default="",
+            help="Sample cgroup memory stats, vmstat and CPU usage during each"
+            " run and write them to a .npz file in this directory",
+        )
+        parser.add_argument(
+            "--telemetry-interval",
+            type=float,
+            default=DEFAULT_TELEMETRY_INTERVAL,
+            help="Telemetry and page cache hit ratio sampling interval in seconds",
+        )
+        parser.add_argument(
+            "--hitrate-monitor",
+            type=str,
+            nargs="?",
+            const=DEFAULT_HITRATE_MONITOR,
+            default="",
+            help="Record the page cache hits and misses of the benchmark cgroup"
+            " on the watched files during each run, baseline and cache_ext alike,"
+            " with this cache_ext_hitrate loader (policies/cache_ext_hitrate.out"
+            " if no path is given). Its BPF programs add to the CPU usage of"
+            " the run.",
+        )
+        parser.add_argument(
+            "--parallel-slots",
+            type=int,
+            default=1,
+            help="Number of configs to run concurrently, each in its own slot"
+            " of CPUs, cgroup and data directory",
+        )
+        parser.add_argument(
+            "--slot-cpus",
+            type=str,
+            default="",
+            help="Semicolon-separated CPU lists, one per slot (e.g. 0-7;8-15)."
+            " Default is to split the online CPUs into contiguous chunks.",
+        )
+        parser.add_argument(
+            "--slot-data-dirs",
+            type=str,
+            default="",
+            help="Comma-separated data directories (e.g. one per disk),"
+            " assigned round-robin to slots",
+        )
+        parser.add_argument(
+            "--slot-numa",
+            action="store_true",
+            default=False,
+            help="Spread slots across NUMA nodes and bind their memory",
+        )
+        parser.add_argument(
+            "--policy-daemon-socket",
+            type=str,
+            default="",
+            help="Attach cache_ext policies through the cache_ext_policyd socket"
+            " (e.g. %s) instead of running their loaders"
+            % DEFAULT_POLICY_DAEMON_SOCKET,
+        )
+        parser.add_argument(
+            "--watch-scope",
+            type=str,
+            choices=WATCH_SCOPES,
+            default=DEFAULT_WATCH_SCOPE,
+            help="How policies match the files of their watch_dir: by path prefix,"
+            " by filesystem (sb), by mount, or by ancestor directory inode (dir)",
+        )
+        parser.add_argument(
+            "--policy-param",
+            type=str,
+            action="append",
+            default=[],
+            help="Set a policy parameter, e.g. sample_size=32 (repeatable). See"
+            " policies/cache_ext_params.h for the parameters of each policy.",
+        )
+        parser.add_argument(
+            "--page-trace-dir",
+            type=str,
+            default="",
+            help="Record the page cache accesses of each cache_ext run into a"
+            " trace file in this directory (see page_trace.py)",
+        )
+        parser.add_argument(
+            "--page-trace-buffer-mb",
+            type=int,
+            default=0,
+            help="Page trace ring buffer size in MiB, a power of 2. Increase it"
+            " if the results report page_trace_drop_ratio > 0. Default is the"
+            " loaders' default.",
+        )
+        parser.add_argument(
+            "--bpf-prog-stats",
+            action="store_true",
+            default=False,
+            help="Enable kernel.bpf_stats_enabled and record the run count and"
+            " average run time of each BPF program (bpf_prog_stats) and policy"
+            " callback (bpf_callback_stats) during each run. This slightly"
+            " increases the measured CPU usage.",
+        )
+        parser.add_argument(
+            "--regret-ghost-entries",
+            type=int,
+            default=0,
+            help="Track refaults of the last N pages evicted by cache_ext policies"
+            " and record their reuse distance histograms (see"
+            " policies/cache_ext_regret.h). -1 for the number of pages in the"
+            " cgroup, 0 to disable.",
+        )
+        parser.add_argument(
+            "--regret-window-sec",
+            type=int,
+            default=0,
+            help="Count refaults within this many seconds of the eviction in"
+            " refaults_time_window. Default is the loaders' default.",
+        )
+        parser.add_argument(
+            "--adaptive-runtime",
+            action="store_true",
+            default=False,
+            help="Stop each run once its steady-state throughput has converged"
+            " instead of after a fixed runtime",
+        )
+        parser.add_argument(
+            "--adaptive-ci-target",
+            type=float,
+            default=0.02,
+            help="Stop once the confidence interval half width of the"
+            " steady-state throughput is at most this fraction of its mean",
+        )
+        parser.add_argument(
+            "--adaptive-confidence",
+            type=float,
+            default=0.95,
+            help="Confidence level of the adaptive runtime interval",
+        )
+        parser.add_argument(
+            "--adaptive-min-samples",
+            type=int,
+            default=20,
+            help="Minimum number of steady-state throughput samples",
+        )
+        parser.add_argument(
+            "--adaptive-max-runtime",
+            type=int,
+            default=600,
+            help="Runtime in seconds of runs that never converge",
+        )
+        parser.add_argument(
+            "--adaptive-sample-regex",
+            type=str,
+            default=DEFAULT_ADAPTIVE_SAMPLE_REGEX,
+            help="Regex matching a periodic throughput sample in the benchmark"
+            " output. Its first group is the sample.",
+        )
         self.add_arguments(parser)
         return parser.parse_args()
 
+    def record_result(self, key: str, value):
+        """Record an extra result of the running config. It is merged into
+        the BenchResults returned by parse_results."""
+        self._slot_local.extra_results[key] = value
+
+    def adaptive_line_callback(
+        self, detector: SteadyStateDetector, line_callback
+    ) -> Callable[[str], bool]:
+        """Wrap line_callback to feed throughput samples to detector. Returns
+        True, i.e. stop the benchmark, once they have converged."""
+        sample_re = re.compile(self.args.adaptive_sample_regex)
+
+        def callback(line: str) -> bool:
+            if line_callback:
+                line_callback(line)
+            if "Warm-Up" in line or "overall" in line:
+                return False
+            match = sample_re.search(line)
+            if match is None:
+                return False
+            return detector.add(float(match.group(1)))
+
+        return callback
+
+    def run_config(self, config: Dict, slot: BenchSlot) -> BenchRun:
+        """Run a single config in the given slot."""
+        self._slot_local.slot = slot
+        self._slot_local.config = config
+        self._slot_local.extra_results = {}
+        self._slot_local.prog_stats = {}
+        log.info("Running benchmark for %s with config %s" % (config["name"], config))
+
+        # Prepare environment for benchmarking
+        self.benchmark_prepare(config)
+
+        # Run benchmark
+        cmd = self.benchmark_cmd(config)
+
+        # Limit CPUs
+        cmd = ["taskset", "-c", slot.cpu_list(config["cpus"])] + cmd
+        if slot.numa_node is not None and self.args.slot_numa:
+            cmd = ["numactl", "--membind=%d" % slot.numa_node] + cmd
+
+        env = dict(os.environ)
+        if self.args.debug_segfault:
+            env["SEGFAULT_SIGNALS"] = "abrt segv"
+            env["LD_PRELOAD"] = "/usr/lib/x86_64-linux-gnu/libSegFault.so"
+        extra_envs = self.cmd_extra_envs(config)
+        if extra_envs:
+            log.info("Adding extra envs: %s" % extra_envs)
+        env.update(extra_envs)
+        self.before_benchmark(config)
+        telemetry = None
+        hitrate = None
+        extra_procs = {}
+        succeeded = False
+        second_proc = None
+        try:
+            if self.second_command:
+                second_cmd = self.second_benchmark_cmd(config)
+                log.info("Running second command: %s" % second_cmd)
+                second_proc = subprocess.Popen(second_cmd, stdout=subprocess.PIPE)
+
+            for name, extra_cmd in self.extra_benchmark_cmds(config).items():
+                log.info("Running %s command: %s", name, extra_cmd)
+                # Buffer the output in a file, so that chatty commands cannot
+                # block on a full pipe while the benchmark runs
+                extra_output = tempfile.TemporaryFile()
+                extra_procs[name] = (
+                    subprocess.Popen(extra_cmd, stdout=extra_output, env=env),
+                    extra_output,
+                )
+
+            log_file = None
+            if self.args.output_log_dir:
+                os.makedirs(self.args.output_log_dir, exist_ok=True)
+                log_file = os.path.join(
+                    self.args.output_log_dir,
+                    "%s_%s_slot%d.log"
+                    % (self.name, strftime("%Y%m%d-%H%M%S"), slot.index),
+                )
+                self.record_result("output_log", log_file)
+
+            if self.args.telemetry_dir:
+                telemetry = TelemetrySampler(
+                    os.path.join(
+                        self.args.telemetry_dir,
+                        "%s_%s_slot%d.npz"
+                        % (self.name, strftime("%Y%m%d-%H%M%S"), slot.index),
+                    ),
+                    cgroup=self.telemetry_cgroup(config),
+                    interval=self.args.telemetry_interval,
+                )
+                telemetry.start()
+
+            hitrate = self.start_hitrate_monitor(config)
+
+            line_callback = self.output_line_callback(config)
+            detector = None
+            if self.args.adaptive_runtime:
+                detector = SteadyStateDetector(
+                    ci_target=self.args.adaptive_ci_target,
+                    confidence=self.args.adaptive_confidence,
+                    min_samples=self.args.adaptive_min_samples,
+                )
+                line_callback = self.adaptive_line_callback(detector, line_callback)
+
+            log.info("Running command: %s" % cmd)
+            if self.args.bpf_prog_stats:
+                hitrate_prog_ids = hitrate.prog_ids if hitrate else []
+                prog_stats_before = bpf_prog_stats(hitrate_prog_ids)
+            usage_before = resource.getrusage(resource.RUSAGE_THREAD)
+            stdout = run_command_with_live_output(
+                cmd,
+                env=env,
+                log_file=log_file,
+                line_callback=line_callback,
+                echo=not self.args.quiet_output,
+                max_output_bytes=self.args.max_output_bytes,
+            )
+            usage_after = resource.getrusage(resource.RUSAGE_THREAD)
+            if self.args.bpf_prog_stats:
+                self._slot_local.prog_stats = bpf_prog_stats_delta(
+                    prog_stats_before, bpf_prog_stats(hitrate_prog_ids)
+                )
+                self.record_result("bpf_prog_stats", self._slot_local.prog_stats)
+                self.record_result(
+                    "bpf_callback_stats",
+                    bpf_callback_stats(self._slot_local.prog_stats),
+                )
+            if telemetry:
+                self.record_result("telemetry_file", telemetry.stop())
+                telemetry = None
+            if hitrate:
+                for key, value in hitrate.stop().items():
+                    self.record_result(key, value)
+                hitrate = None
+            # stdout = check_output(cmd, encoding="utf-8", env=env)
+            self.record_result(
+                "harness_cpu_sec",
+                usage_after.ru_utime
+                - usage_before.ru_utime
+                + usage_after.ru_stime
+                - usage_before.ru_stime,
+            )
+            if detector:
+                # Its steady-state average replaces the benchmark's below
+                if not detector.samples:
+                    raise Exception(
+                        "No throughput samples in the output of an adaptive run,"
+                        " check --adaptive-sample-regex: %s"
+                        % self.args.adaptive_sample_regex
+                    )
+                for key, value in detector.summary().items():
+                    self.record_result(key, value)
+
+            if self.second_command:
+                ret_code = second_proc.wait()
+                if ret_code != 0:
+                    log.error("Second benchmark failed with error code %s" % ret_code)
+                    raise CalledProcessError(
+                        ret_code, self.second_benchmark_cmd(config)
+                    )
+                second_proc_output = second_proc.stdout.read().decode("utf-8")
+
+            extra_outputs = {}
+            for name, (extra_proc, extra_output) in extra_procs.items():
+                ret_code = extra_proc.wait()
+                if ret_code != 0:
+                    log.error("%s command failed with error code %s", name, ret_code)
+                    raise CalledProcessError(ret_code, extra_proc.args)
+                extra_output.seek(0)
+                extra_outputs[name] = extra_output.read().decode("utf-8")
+            succeeded = True
+        except CalledProcessError as e:
+            log.error("Benchmark failed with error code %s" % e.returncode)
+            log.error("Output was: %s" % e.output)
+            raise e
+        finally:
+            # Do not let the other commands run on into the next config
+            for extra_proc, extra_output in extra_procs.values():
+                stop_process(extra_proc)
+                extra_output.close()
+            if not succeeded:
+                if second_proc is not None:
+                    stop_process(second_proc)
+                if telemetry:
+                    telemetry.stop()
+                if hitrate:
+                    hitrate.stop()
+                self.benchmark_failed(config)
+
+        self.after_benchmark(config)
+        # Save results
+        log.info("Parsing results...")
+        if self.second_command:
+            bench_run_results = self.parse_results(
+                stdout, second_output=second_proc_output
+            )
+        elif extra_procs:
+            bench_run_results = self.parse_results(stdout, extra_outputs=extra_outputs)
+        elif detector and detector.converged:
+            # A run stopped early may not have printed its final results
+            try:
+                bench_run_results = self.parse_results(stdout)
+            except Exception as e:
+                log.warning("No final results after stopping early: %s", e)
+                bench_run_results = self.benchresults_cls({})
+        else:
+            bench_run_results = self.parse_results(stdout)
+        for key, value in self._slot_local.extra_results.items():
+            bench_run_results[key] = value
+        if detector:
+            # Adaptive runs have no fixed warmup, so the average printed by
+            # the benchmark includes it. Use the steady-state one instead.
+            if "throughput_avg" in bench_run_results:
+                bench_run_results["benchmark_throughput_avg"] = bench_run_results[
+                    "throughput_avg"
+                ]
+            bench_run_results["throughput_avg"] = bench_run_results[
+                "adaptive_throughput_avg"
+            ]
+        return BenchRun(config, bench_run_results)
+
+    def benchmark_parallel(
+        self,
+        configs_to_run: List[Dict],
+        results: List[BenchRun],
+        results_file: str,
+        cpus_per_slot: int,
+    ):
+        """Run configs concurrently, one per slot, merging their results into
+        the same results file."""
+        if not self.supports_parallel_slots:
+            raise Exception("Benchmark %s does not support parallel slots" % self.name)
+        if self.second_command:
+            raise Exception("Parallel slots do not support a second command")
+        slots = partition_slots(
+            self.args.parallel_slots,
+            cpus_per_slot,
+            slot_cpus=self.args.slot_cpus,
+            data_dirs=(
+                parse_strings_string(self.args.slot_data_dirs)
+                if self.args.slot_data_dirs
+                else []
+            ),
+            numa=self.args.slot_numa,
+        )
+        for slot in slots:
+            log.info("Using %s", slot)
+
+        pending = list(configs_to_run)
+        lock = threading.Lock()
+        errors = []
+        completed = []
+
+        def slot_worker(slot: BenchSlot):
+            while True:
+                with lock:
+                    if not pending or errors:
+                        return
+                    config = pending.pop(0)
+                try:
+                    bench_run = self.run_config(config, slot)
+                except Exception as e:
+                    log.error("Slot %d failed on config %s: %s", slot.index, config, e)
+                    with lock:
+                        errors.append(e)
+                    return
+                with lock:
+                    checkpoint_run(results_file, results, bench_run)
+                    completed.append(config)
+                    done = len(completed)
+                    log.info(
+                        "Progress: %.1f%% (%s/%s)"
+                        % (done / len(configs_to_run) * 100, done, len(configs_to_run))
+                    )
+                sleep(5)
+
+        threads = [
+            threading.Thread(target=slot_worker, args=(slot,), name="slot%d" % idx)
+            for idx, slot in enumerate(slots)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def run_configs(
+        self,
+        configs_to_run: List[Dict],
+        results: List[BenchRun],
+        results_file: str,
+        cpus_per_slot: int,
+    ):
+        if self.parallel:
+            self.benchmark_parallel(
+                configs_to_run, results, results_file, cpus_per_slot
+            )
+            return
+        for idx, config in enumerate(configs_to_run):
+            log.info(
+                "Progress: %.1f%% (%s/%s)"
+                % (
+                    (idx + 1) / len(configs_to_run) * 100,
+                    idx + 1,
+                    len(configs_to_run),
+                )
+            )
+            checkpoint_run(
+                results_file, results, self.run_config(config, self.default_slot)
+            )
+            sleep(5)
+
+    def extra_iteration_configs(
+        self, configs: List[Dict], results: List[BenchRun]
+    ) -> List[Dict]:
+        """One more iteration of every config whose --ci-metric is still too
+        noisy (relative CI above --ci-target), up to --max-iterations."""
+        extra_configs = []
+        config_stats = iteration_config_stats(
+            configs,
+            results,
+            self.args.ci_metric,
+            self.args.ci_confidence,
+            self.args.ci_method,
+        )
+        for stats in config_stats:
+            if stats["rel_ci"] <= self.args.ci_target:
+                continue
+            iterations = [
+                r.config["iteration"] for r in results_select(results, stats["config"])
+            ]
+            if len(iterations) >= self.args.max_iterations:
+                log.warning(
+                    "Config %s did not converge after %d iterations (CI %.1f%%)",
+                    stats["config"],
+                    len(iterations),
+                    stats["rel_ci"] * 100,
+                )
+                continue
+            log.info(
+                "Config %s has a CI of %.1f%% after %d iterations",
+                stats["config"],
+                stats["rel_ci"] * 100,
+                len(iterations),
+            )
+            extra_configs.append({**stats["config"], "iteration": max(iterations) + 1})
+        return extra_configs
+
     def benchmark(self):
         results_file = self.args.results_file
         reuse_results = not self.args.no_reuse_results
@@ -515,7 +2661,7 @@ class BenchmarkFramework(ABC):
         while os.path.exists(results_file):
             if reuse_results:
                 log.info("Will reuse existing results file %s" % results_file)
-                results = parse_results_file(results_file, self.benchresults_cls)
+                results = load_results(results_file, self.benchresults_cls)
                 break
             log.info("Not reusing results file %s" % results_file)
             if "." in results_file:
@@ -535,79 +2681,54 @@ class BenchmarkFramework(ABC):
             ]
             new_configs = self.generate_configs(new_configs)
             all_configs.extend(new_configs)
+        # Only record parameters when they are set, so that the configs of
+        # earlier results still match
+        if CacheExtPolicy.params:
+            for config in all_configs:
+                if "policy_loader" in config:
+                    config.setdefault("policy_params", dict(CacheExtPolicy.params))
 
         configs_to_run = []
+        existing_keys = set(config_key(r.config) for r in results)
         for config in all_configs:
-            if reuse_results and exists_config_in_results(results, config):
+            if reuse_results and config_key(config) in existing_keys:
                 log.info("Skipping config %s" % config)
             else:
                 configs_to_run.append(config)
 
-        for idx, config in enumerate(configs_to_run):
-            log.info(
-                "Progress: %.1f%% (%s/%s)"
-                % ((idx + 1) / len(configs_to_run) * 100, idx + 1, len(configs_to_run))
-            )
-            log.info(
-                "Running benchmark for %s with config %s" % (config["name"], config)
-            )
-
-            # Prepare environment for benchmarking
-            self.benchmark_prepare(config)
-
-            # Run benchmark
-            cmd = self.benchmark_cmd(config)
-
-            # Limit CPUs
-            cmd = ["taskset", "-c", "0-%s" % str(config["cpus"] - 1)] + cmd
-
-            env = os.environ
-            if self.args.debug_segfault:
-                env["SEGFAULT_SIGNALS"] = "abrt segv"
-                env["LD_PRELOAD"] = "/usr/lib/x86_64-linux-gnu/libSegFault.so"
-            extra_envs = self.cmd_extra_envs(config)
-            if extra_envs:
-                log.info("Adding extra envs: %s" % extra_envs)
-            env.update(extra_envs)
-            self.before_benchmark(config)
-            try:
-                if self.second_command:
-                    second_cmd = self.second_benchmark_cmd(config)
-                    log.info("Running second command: %s" % second_cmd)
-                    second_proc = subprocess.Popen(second_cmd, stdout=subprocess.PIPE)
-
-                log.info("Running command: %s" % cmd)
-                stdout = run_command_with_live_output(cmd, env=env)
-                # stdout = check_output(cmd, encoding="utf-8", env=env)
-
-                if self.second_command:
-                    ret_code = second_proc.wait()
-                    if ret_code != 0:
-                        log.error(
-                            "Second benchmark failed with error code %s" % ret_code
-                        )
-                        raise CalledProcessError(
-                            ret_code, self.second_benchmark_cmd(config)
-                        )
-                    second_proc_output = second_proc.stdout.read().decode("utf-8")
-            except CalledProcessError as e:
-                log.error("Benchmark failed with error code %s" % e.returncode)
-                log.error("Output was: %s" % e.output)
-                raise e
-
-            self.after_benchmark(config)
-            # Save results
-            log.info("Parsing results...")
-            if self.second_command:
-                bench_run_results = self.parse_results(
-                    stdout, second_output=second_proc_output
+        if self.args.bpf_prog_stats:
+            if self.parallel:
+                log.warning(
+                    "BPF program stats are system-wide, the runs of concurrent"
+                    " slots count each other's callbacks"
                 )
-            else:
-                bench_run_results = self.parse_results(stdout)
-            bench_run = BenchRun(config, bench_run_results)
-            results.append(bench_run)
-            checkpoint_results(results_file, results)
-            sleep(5)
+            enable_bpf_stats()
+        try:
+            self.run_configs(configs_to_run, results, results_file, max(cpu_amounts))
+            if self.args.ci_target > 0:
+                while True:
+                    extra_configs = self.extra_iteration_configs(all_configs, results)
+                    if not extra_configs:
+                        break
+                    log.info("Running %d extra iterations", len(extra_configs))
+                    all_configs.extend(extra_configs)
+                    self.run_configs(
+                        extra_configs, results, results_file, max(cpu_amounts)
+                    )
+        finally:
+            if self.args.bpf_prog_stats:
+                disable_bpf_stats()
+        if self.args.ci_target > 0 or self.args.iterations > 1:
+            save_config_stats(
+                results_file,
+                iteration_config_stats(
+                    all_configs,
+                    results,
+                    self.args.ci_metric,
+                    self.args.ci_confidence,
+                    self.args.ci_method,
+                ),
+            )
         all_results = []
         for config in all_configs:
             all_results.append(single_result_select(results, config))
@@ -640,4 +2761,19 @@ def parse_cpu_string(cpu_string: str):
     return parse_numbers_string(cpu_string)
 
 
+BYTES_SUFFIXES = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_bytes_string(bytes_string: str) -> List[int]:
+    """Parse a string of comma-separated sizes (e.g. 512M,2G) into bytes."""
+    sizes = []
+    for part in parse_strings_string(bytes_string):
+        part = part.upper().rstrip("IB")
+        if part and part[-1] in BYTES_SUFFIXES:
+            sizes.append(int(float(part[:-1]) * BYTES_SUFFIXES[part[-1]]))
+        else:
+            sizes.append(int(part))
+    return sizes
+
+
 prev_cpu_stats = {"idle": 0.0, "iowait": 0.0, "total": 0.0}
@@ -0,0 +1,266 @@
+"""Co-locate N tenants, each in its own cgroup with its own memory.max and
+(optionally) its own cache_ext policy, and run all their workloads
+concurrently.
+
+Tenants are listed in a YAML file:
+
+    - name: ycsb
+      cmd: ~/My-YCSB/build/run_leveldb ~/My-YCSB/leveldb/config/ycsb_c.yaml
+      cgroup_size: 10G
+      policy_loader: ~/cache_ext/policies/cache_ext_sampling.out
+      watch_dir: /mydata/leveldb_temp
+      cpus: 0-7
+      output: leveldb
+    - name: search
+      cmd: for i in $(seq 1 10); do rg write /mydata/linux > /dev/null; done; echo 10
+      cgroup_size: 1G
+      output: count
+
+cmd runs under /bin/bash -c in the tenant's cgroup. output selects how its
+stdout is parsed: "leveldb" (My-YCSB results), "count" (the last line is an
+integer, e.g. a number of iterations) or "none". Tenants without a
+policy_loader use the default kernel policy. With --default, no tenant uses a
+cache_ext policy.
+
+Results hold per-tenant results, cache_ext stats, runtimes and page cache
+occupancy over time (see CgroupOccupancySampler).
+"""
+
+import logging
+import os
+from time import time
+from typing import Dict, List
+
+from ruamel.yaml import YAML
+
+from bench_lib import *
+from bench_leveldb import parse_leveldb_bench_results
+
+log = logging.getLogger(__name__)
+
+TENANT_OUTPUT_PARSERS = ["leveldb", "count", "none"]
+
+# These only run on error
+CLEANUP_TASKS = []
+
+
+def load_tenants(tenants_file: str) -> List[Dict]:
+    """Load and validate the tenants of a YAML file (see the module
+    docstring)."""
+    with open(tenants_file, "r") as f:
+        tenants = YAML(typ="safe").load(f)
+    if not tenants:
+        raise Exception("No tenants in %s" % tenants_file)
+    names = set()
+    for tenant in tenants:
+        for key in ["name", "cmd", "cgroup_size"]:
+            if key not in tenant:
+                raise Exception("Tenant %s is missing %s" % (tenant, key))
+        if tenant["name"] in names:
+            raise Exception("Duplicate tenant name: %s" % tenant["name"])
+        names.add(tenant["name"])
+        tenant["cgroup_size"] = parse_bytes_string(str(tenant["cgroup_size"]))[0]
+        tenant.setdefault("policy_loader", "")
+        tenant.setdefault("watch_dir", "")
+        tenant.setdefault("cpus", "")
+        tenant.setdefault("output", "none")
+        if tenant["policy_loader"]:
+            tenant["policy_loader"] = os.path.expanduser(tenant["policy_loader"])
+            if not tenant["watch_dir"]:
+                raise Exception("Tenant %s needs a watch_dir" % tenant["name"])
+            tenant["watch_dir"] = os.path.expanduser(tenant["watch_dir"])
+        if tenant["output"] not in TENANT_OUTPUT_PARSERS:
+            raise Exception(
+                "Unknown output %s of tenant %s" % (tenant["output"], tenant["name"])
+            )
+    return tenants
+
+
+def parse_tenant_output(output: str, parser: str) -> Dict:
+    if parser == "leveldb":
+        return parse_leveldb_bench_results(output)
+    elif parser == "count":
+        lines = [line for line in output.splitlines() if line.strip()]
+        if not lines:
+            raise Exception("Tenant printed no count")
+        return {"count": int(lines[-1])}
+    return {}
+
+
+class MultiTenantBenchmark(BenchmarkFramework):
+    def __init__(self, benchresults_cls=BenchResults, cli_args=None):
+        super().__init__("multi_tenant_benchmark", benchresults_cls, cli_args)
+        self.tenants = load_tenants(self.args.tenants_file)
+        # One policy per tenant, created once so that they can be reused
+        self.policies = {}
+        for tenant in self.tenants:
+            if tenant["policy_loader"]:
+                policy = CacheExtPolicy(
+                    self.tenant_cgroup(tenant, True),
+                    tenant["policy_loader"],
+                    tenant["watch_dir"],
+                )
+                self.policies[tenant["name"]] = policy
+        CLEANUP_TASKS.append(self.stop_policies)
+        self.occupancy = None
+        self.tenant_start_time = 0
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--tenants-file",
+            type=str,
+            required=True,
+            help="YAML file listing the tenants (see bench_multi_tenant.py)",
+        )
+        parser.add_argument(
+            "--default",
+            action="store_true",
+            help="Run every tenant with the default kernel policy",
+        )
+        parser.add_argument(
+            "--occupancy-interval",
+            type=float,
+            default=DEFAULT_TELEMETRY_INTERVAL,
+            help="Seconds between page cache occupancy samples of the tenants",
+        )
+
+    def tenant_cgroup(self, tenant: Dict, cache_ext: bool) -> str:
+        if cache_ext and tenant["policy_loader"]:
+            return "%s_%s" % (DEFAULT_CACHE_EXT_CGROUP, tenant["name"])
+        return "%s_%s" % (DEFAULT_BASELINE_CGROUP, tenant["name"])
+
+    def generate_configs(self, configs: List[Dict]) -> List[Dict]:
+        configs = add_config_option(
+            "benchmark", [os.path.basename(self.args.tenants_file)], configs
+        )
+        # The tenants are part of the config, so that results of different
+        # tenant lists are never mixed up
+        tenants = [
+            {k: v for k, v in tenant.items() if k != "policy_loader"}
+            for tenant in self.tenants
+        ]
+        for tenant, config_tenant in zip(self.tenants, tenants):
+            config_tenant["policy"] = os.path.basename(tenant["policy_loader"])
+        configs = add_config_option("tenants", [tenants], configs)
+        configs = add_config_option("cache_ext", [not self.args.default], configs)
+        configs = add_config_option(
+            "iteration", list(range(1, self.args.iterations + 1)), configs
+        )
+        return configs
+
+    def benchmark_prepare(self, config):
+        drop_page_cache()
+        disable_swap()
+        disable_smt()
+        # Create and attach every cgroup before any workload starts
+        for tenant in self.tenants:
+            cgroup = self.tenant_cgroup(tenant, config["cache_ext"])
+            if config["cache_ext"] and tenant["policy_loader"]:
+                recreate_cache_ext_cgroup(cgroup, limit_in_bytes=tenant["cgroup_size"])
+            else:
+                recreate_baseline_cgroup(cgroup, limit_in_bytes=tenant["cgroup_size"])
+        if config["cache_ext"]:
+            for tenant in self.tenants:
+                if tenant["name"] not in self.policies:
+                    continue
+                self.policies[tenant["name"]].start(cgroup_size=tenant["cgroup_size"])
+
+    def tenant_cmd(self, tenant: Dict, config) -> List[str]:
+        cmd = [
+            "sudo",
+            "cgexec",
+            "-g",
+            "memory:%s" % self.tenant_cgroup(tenant, config["cache_ext"]),
+            "/bin/bash",
+            "-c",
+            tenant["cmd"],
+        ]
+        if tenant["cpus"]:
+            cmd = ["taskset", "-c", str(tenant["cpus"])] + cmd
+        return cmd
+
+    def benchmark_cmd(self, config):
+        return self.tenant_cmd(self.tenants[0], config)
+
+    def extra_benchmark_cmds(self, config) -> Dict[str, List[str]]:
+        return {
+            tenant["name"]: self.tenant_cmd(tenant, config)
+            for tenant in self.tenants[1:]
+        }
+
+    def before_benchmark(self, config):
+        self.occupancy = CgroupOccupancySampler(
+            {
+                tenant["name"]: self.tenant_cgroup(tenant, config["cache_ext"])
+                for tenant in self.tenants
+            },
+            interval=self.args.occupancy_interval,
+        )
+        self.occupancy.start()
+        self.tenant_start_time = time()
+
+    def stop_policies(self) -> Dict[str, Dict[str, int]]:
+        stats = {}
+        for name, policy in self.policies.items():
+            if policy.has_started:
+                stats[name] = policy.stop()
+        return stats
+
+    def after_benchmark(self, config):
+        # All tenants have exited when this runs
+        self.record_result("runtime_sec", time() - self.tenant_start_time)
+        self.record_result("occupancy", self.occupancy.stop())
+        self.occupancy = None
+        if config["cache_ext"]:
+            self.record_result("cache_ext_stats", self.stop_policies())
+        enable_smt()
+
+    def benchmark_failed(self, config):
+        if self.occupancy:
+            self.occupancy.stop()
+            self.occupancy = None
+
+    def parse_results(self, stdout: str, extra_outputs: Dict = None) -> BenchResults:
+        outputs = {self.tenants[0]["name"]: stdout, **(extra_outputs or {})}
+        tenant_results = {}
+        for tenant in self.tenants:
+            tenant_results[tenant["name"]] = parse_tenant_output(
+                outputs[tenant["name"]], tenant["output"]
+            )
+        results = {"tenants": tenant_results}
+        throughputs = [
+            r["throughput_avg"]
+            for r in tenant_results.values()
+            if "throughput_avg" in r
+        ]
+        if throughputs:
+            results["throughput_avg"] = sum(throughputs)
+        return BenchResults(results)
+
+
+def main():
+    global log
+    logging.basicConfig(level=logging.DEBUG)
+    multi_tenant_bench = MultiTenantBenchmark()
+    for tenant in multi_tenant_bench.tenants:
+        log.info(
+            "Tenant %s: %s in %s, policy %s",
+            tenant["name"],
+            tenant["cmd"],
+            format_bytes_str(tenant["cgroup_size"]),
+            tenant["policy_loader"] or "default",
+        )
+    multi_tenant_bench.benchmark()
+
+
+if __name__ == "__main__":
+    try:
+        logging.basicConfig(level=logging.INFO)
+        main()
+    except Exception as e:
+        log.error("Error in main: %s", e)
+        log.info("Cleaning up")
+        for task in CLEANUP_TASKS:
+            task()
+        log.error("Re-raising exception")
+        raise e
@@ -6,6 +6,10 @@ from time import sleep
 from typing import Dict, List
 
 from bench_lib import *
+from latency_histogram import (
+    LATENCY_HISTOGRAM_WINDOW_SEC,
+    add_latency_histogram_results,
+)
 
 
 log = logging.getLogger(__name__)
@@ -15,13 +19,6 @@ GiB = 2**30
 CLEANUP_TASKS = []
 
 
-def reset_database(db_dir: str, temp_db_dir: str):
-    # rsync -avpl --delete /mydata/leveldb_db_orig/ /mydata/leveldb_db/
-    if not db_dir.endswith("/"):
-        db_dir += "/"
-    run(["rsync", "-avpl", "--delete", db_dir, temp_db_dir])
-
-
 def parse_leveldb_bench_results(stdout: str) -> Dict:
     # Uniform: calculating overall performance metrics... (might take a while)
     # Uniform overall: UPDATE throughput 0.00 ops/sec, INSERT throughput 0.00 ops/sec, READ throughput 9038.24 ops/sec, SCAN throughput 0.00 ops/sec, READ_MODIFY_WRITE throughput 0.00 ops/sec, total throughput 9038.24 ops/sec
@@ -100,6 +97,7 @@ def parse_leveldb_bench_results(stdout: str) -> Dict:
                     results["read_modify_write_latency_p99"] = float(match[1])
                 else:
                     raise Exception("Unknown latency metric: " + match[0])
+    add_latency_histogram_results(results, stdout)
     if not all(
         key in results for key in ["throughput_avg", "latency_avg", "latency_p99"]
     ):
@@ -194,6 +192,13 @@ class PerCgroupBenchmark(BenchmarkFramework):
         super().__init__("percgroup_benchmark", benchresults_cls, cli_args)
         if self.args.leveldb_temp_db is None:
             self.args.leveldb_temp_db = self.args.leveldb_db + "_temp"
+        if self.args.search_path is None:
+            self.args.search_path = os.path.commonpath(
+                [
+                    os.path.abspath(self.args.leveldb_temp_db),
+                    os.path.abspath(self.args.data_dir),
+                ]
+            )
 
         # Validate arguments based on cache_ext mode
         if not self.args.default:
@@ -208,16 +213,18 @@ class PerCgroupBenchmark(BenchmarkFramework):
 
         # Only initialize cache_ext policies if not using default mode
         if not self.args.default:
-            # TODO: set the watch dirs more precisely to avoid needing recursive
-            # watch dir initialization.
+            # With split cgroups, each policy only watches the files of its
+            # own workload (see before_benchmark)
             self.cache_ext_policy = CacheExtPolicy(
-                DEFAULT_CACHE_EXT_CGROUP, self.args.policy_loader, self.args.search_path
+                DEFAULT_CACHE_EXT_CGROUP,
+                self.args.policy_loader,
+                self.args.leveldb_temp_db,
             )
 
             self.second_cache_ext_policy = CacheExtPolicy(
                 DEFAULT_CACHE_EXT_CGROUP,
                 self.args.second_policy_loader,
-                self.args.search_path,
+                self.args.data_dir,
             )
             CLEANUP_TASKS.append(lambda: self.cache_ext_policy.stop())
             CLEANUP_TASKS.append(lambda: self.second_cache_ext_policy.stop())
@@ -234,8 +241,10 @@ class PerCgroupBenchmark(BenchmarkFramework):
         parser.add_argument(
             "--search-path",
             type=str,
-            required=True,
-            help="Watch directory",
+            default=None,
+            help="Watch directory of a policy shared by both workloads, i.e. when"
+            " they run in the same cgroup (default: the common parent of"
+            " --leveldb-temp-db and --data-dir)",
         )
         parser.add_argument(
             "--data-dir",
@@ -265,6 +274,13 @@ class PerCgroupBenchmark(BenchmarkFramework):
             default=None,
             help="Specify the temporary directory for LevelDB benchmarking. Default is <leveldb-db>_temp",
         )
+        parser.add_argument(
+            "--snapshot-backend",
+            type=str,
+            default="rsync",
+            choices=list(SNAPSHOT_BACKENDS.keys()),
+            help="How to reset the temporary DB from the original DB before each run",
+        )
         parser.add_argument(
             "--bench-binary-dir",
             type=str,
@@ -294,7 +310,12 @@ class PerCgroupBenchmark(BenchmarkFramework):
         return configs
 
     def before_benchmark(self, config):
-        reset_database(self.args.leveldb_db, self.args.leveldb_temp_db)
+        reset_sec = reset_database_snapshot(
+            self.args.snapshot_backend,
+            self.args.leveldb_db,
+            self.args.leveldb_temp_db,
+        )
+        self.record_result("db_reset_sec", reset_sec)
         drop_page_cache()
         disable_swap()
         disable_smt()
@@ -311,6 +332,8 @@ class PerCgroupBenchmark(BenchmarkFramework):
                 )
                 self.cache_ext_policy.set_cgroup(f"{DEFAULT_CACHE_EXT_CGROUP}_1")
                 self.second_cache_ext_policy.set_cgroup(f"{DEFAULT_CACHE_EXT_CGROUP}_2")
+                self.cache_ext_policy.watch_dir = self.args.leveldb_temp_db
+                self.second_cache_ext_policy.watch_dir = self.args.data_dir
 
                 self.cache_ext_policy.start()
                 self.second_cache_ext_policy.start()
@@ -324,12 +347,15 @@ class PerCgroupBenchmark(BenchmarkFramework):
                         cgroup=f"{DEFAULT_CACHE_EXT_CGROUP}_1", limit_in_bytes=size
                     )
                     self.cache_ext_policy.set_cgroup(f"{DEFAULT_CACHE_EXT_CGROUP}_1")
+                    # The policy manages the files of both workloads
+                    self.cache_ext_policy.watch_dir = self.args.search_path
                     self.cache_ext_policy.start()
                 else:
                     recreate_cache_ext_cgroup(
                         cgroup=f"{DEFAULT_CACHE_EXT_CGROUP}_2", limit_in_bytes=size
                     )
                     self.second_cache_ext_policy.set_cgroup(f"{DEFAULT_CACHE_EXT_CGROUP}_2")
+                    self.second_cache_ext_policy.watch_dir = self.args.search_path
                     self.second_cache_ext_policy.start()
         else:
             if config["cgroup_config"].split_cgroups:
@@ -364,6 +390,9 @@ class PerCgroupBenchmark(BenchmarkFramework):
             bench_config["workload"]["warmup_runtime_seconds"] = config[
                 "warmup_runtime_seconds"
             ]
+            bench_config["workload"][
+                "latency_histogram_window_seconds"
+            ] = LATENCY_HISTOGRAM_WINDOW_SEC
 
         cgroup_name = cgroup_name_from_config(config["cgroup_config"], 1)
 
@@ -401,13 +430,17 @@ class PerCgroupBenchmark(BenchmarkFramework):
     def after_benchmark(self, config):
         if config["cgroup_config"].cache_ext:
             if config["cgroup_config"].split_cgroups:
-                self.cache_ext_policy.stop()
-                self.second_cache_ext_policy.stop()
+                self.record_result("cache_ext_stats", self.cache_ext_policy.stop())
+                self.record_result(
+                    "second_cache_ext_stats", self.second_cache_ext_policy.stop()
+                )
             else:
                 if config["cgroup_config"].which_policy == 1:
-                    self.cache_ext_policy.stop()
+                    self.record_result("cache_ext_stats", self.cache_ext_policy.stop())
                 else:
-                    self.second_cache_ext_policy.stop()
+                    self.record_result(
+                        "cache_ext_stats", self.second_cache_ext_policy.stop()
+                    )
         sleep(2)
         enable_smt()
 
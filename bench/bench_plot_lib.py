@@ -11,36 +11,49 @@ from bench_lib import (
     BenchRun,
     DEFAULT_BASELINE_CGROUP,
     DEFAULT_CACHE_EXT_CGROUP,
+    POLICY_CALLBACKS,
+    ResultsStore,
 )
+from bench_stats import mean_confidence_interval
+from latency_histogram import LatencyHistogram, merge_histograms
 
 
 log = logging.getLogger(__name__)
 
 
-def exists_config_in_results(results: List[BenchRun], config: Dict) -> bool:
+Results = Union[List[BenchRun], ResultsStore]
+
+
+def matching_runs(results: Results, config_match: Dict) -> List[BenchRun]:
+    """Runs whose config contains config_match. Uses the config indexes of a
+    ResultsStore, or a linear scan of a list of runs."""
+    if isinstance(results, ResultsStore):
+        return results.select(config_match)
+    return [r for r in results if config_match.items() <= r.config.items()]
+
+
+def exists_config_in_results(results: Results, config: Dict) -> bool:
+    if isinstance(results, ResultsStore):
+        return results.exists(config)
     for r in results:
         if r.config == config:
             return True
     return False
 
 
-def configs_select(results: List[BenchRun], config_match: Dict) -> List[Dict]:
-    return [r.config for r in results if config_match.items() <= r.config.items()]
+def configs_select(results: Results, config_match: Dict) -> List[Dict]:
+    return [r.config for r in matching_runs(results, config_match)]
 
 
 def results_select(
-    results: List[BenchRun], config_match: Dict, select_fn: Callable
+    results: Results, config_match: Dict, select_fn: Callable
 ) -> List[BenchRun]:
     # Select results based on partial config match
-    return [
-        select_fn(r.results)
-        for r in results
-        if config_match.items() <= r.config.items()
-    ]
+    return [select_fn(r.results) for r in matching_runs(results, config_match)]
 
 
 def single_result_select(
-    results: List[BenchRun], config_match: Dict, select_fn: Callable
+    results: Results, config_match: Dict, select_fn: Callable
 ) -> BenchRun:
     # Select results based on partial config match
     results = results_select(results, config_match, select_fn)
@@ -49,8 +62,10 @@ def single_result_select(
     return results[0]
 
 
-def config_combinations(results: List[BenchRun], fields: List[str]) -> List[Dict]:
+def config_combinations(results: Results, fields: List[str]) -> List[Dict]:
     """Get all unique config combinations for the given fields."""
+    if isinstance(results, ResultsStore):
+        return results.config_combinations(fields)
     # Get all unique config combinations
     configs = []
     for r in results:
@@ -64,6 +79,89 @@ def config_combinations(results: List[BenchRun], fields: List[str]) -> List[Dict
     return configs
 
 
+def fio_iops_select_fn(r, direction="read"):
+    """IOPS of a fio run, for both normalized results (see
+    normalize_fio_results) and older results holding the raw fio JSON."""
+    if direction + "_iops" in r:
+        return r[direction + "_iops"]
+    return r["jobs"][0][direction]["iops"]
+
+
+def fio_clat_percentiles_select(
+    results: Results, config_match: Dict, direction="read"
+) -> np.ndarray:
+    """Stack the clat percentile vectors (in ns) of all matching fio runs into
+    a (runs x percentiles) array, e.g. to average over iterations with
+    .mean(axis=0)."""
+    return np.array(
+        results_select(
+            results, config_match, lambda r: r[direction + "_clat_percentiles_ns"]
+        ),
+        dtype=np.float64,
+    )
+
+
+def merged_latency_histogram(
+    results: Results, config_match: Dict, op="read"
+) -> LatencyHistogram:
+    """Sum the overall latency histograms of an op over all matching runs
+    (e.g. all iterations of a config). Percentiles of the merged histogram are
+    the true cross-iteration percentiles."""
+    return merge_histograms(
+        LatencyHistogram.from_json(h)
+        for h in results_select(
+            results,
+            config_match,
+            lambda r: r["latency_histograms"][op]["overall"],
+        )
+    )
+
+
+def merged_refault_histogram(
+    results: Results, config_match: Dict, hist="request_distance_hist"
+) -> np.ndarray:
+    """Sum the log2 refault distance histograms of the cache_ext runs matching
+    config_match (see --regret-ghost-entries). Bucket i counts the refaults at
+    distance [2^i, 2^(i + 1)), in page requests or in microseconds."""
+    histograms = [
+        np.array(h)
+        for h in results_select(
+            results,
+            config_match,
+            lambda r: r.get("cache_ext_stats", {}).get("regret_" + hist),
+        )
+        if h
+    ]
+    if not histograms:
+        return np.zeros(0, dtype=np.int64)
+    return np.sum(histograms, axis=0)
+
+
+def latency_percentiles_select(
+    results: Results, config_match: Dict, percentiles: List[float], op="read"
+) -> np.ndarray:
+    return merged_latency_histogram(results, config_match, op).percentiles(percentiles)
+
+
+def latency_window_percentiles_select(
+    results: Results, config_match: Dict, percentile: float, op="read"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(window start in seconds, percentile) over time, merging the windows
+    that start at the same time in all matching runs."""
+    windows = {}
+    for op_histograms in results_select(
+        results, config_match, lambda r: r["latency_histograms"][op]
+    ):
+        for w in op_histograms["windows"]:
+            windows.setdefault(w["start_sec"], LatencyHistogram()).merge(
+                LatencyHistogram.from_json(w)
+            )
+    starts = sorted(windows)
+    return np.array(starts), np.array(
+        [windows[start].percentile(percentile) for start in starts]
+    )
+
+
 def filter_lists(l1: List, l2: List, f: callable) -> Tuple[List, List]:
     """Filter two lists based on a filter function."""
     good_idxs = []
@@ -83,11 +181,14 @@ class GrouppedBarPlot(object):
         groups: List[str],
         colors: List[str],
         y_label=None,
+        y_errors: Union[List[List], None] = None,
     ) -> None:
         assert len(names) == len(y_values)
         assert len(y_values) > 0
+        assert y_errors is None or len(y_errors) == len(y_values)
         self.names = names
         self.y_values = y_values
+        self.y_errors = y_errors
         self.groups = groups
         self.num_bars = len(y_values)
         self.colors = colors
@@ -134,6 +235,8 @@ def plot_groupped_bars(
             width=bar_width,
             label=gpplot.names[i],
             color=gpplot.colors[i],
+            yerr=gpplot.y_errors[i] if gpplot.y_errors else None,
+            capsize=3,
         )
         if show_measurements:
             for j, v in enumerate(xticks + offsets[i]):
@@ -210,7 +313,7 @@ def assert_only_differs_in_fields(configs: List[Dict], fields: List[str]):
 
 def leveldb_plot_ycsb_results(
     config_matches: List[Dict],
-    results: List[BenchRun],
+    results: Results,
     colors=["salmon", "maroon", "peru"],
     filename="leveldb_ycsb.pdf",
     name_func=make_name,
@@ -237,6 +340,7 @@ def leveldb_plot_ycsb_results(
     label_fontsize=None,
     legend_loc="best",
     text_center_list=None,
+    error_bars=False,
 ):
     bench_type_to_group = {
         "uniform": "Unif.\n(100/0)",
@@ -273,12 +377,13 @@ def leveldb_plot_ycsb_results(
         label_fontsize=label_fontsize,
         legend_loc=legend_loc,
         text_center_list=text_center_list,
+        error_bars=error_bars,
     )
 
 
 def bench_plot_groupped_results(
     config_matches: List[Dict],
-    results: List[BenchRun],
+    results: Results,
     colors=["salmon", "maroon", "peru"],
     filename="leveldb_ycsb.pdf",
     name_func=make_name,
@@ -307,8 +412,11 @@ def bench_plot_groupped_results(
     legend_loc="best",
     normalize_per_group=False,
     text_center_list=None,
+    error_bars=False,
+    confidence=0.95,
 ):
-    """Plot bench results.
+    """Plot bench results. Bars are the mean over iterations; with error_bars,
+    they show its Student-t confidence interval.
 
     Config match dicts should look like this:
         {
@@ -328,15 +436,18 @@ def bench_plot_groupped_results(
     groups = [bench_type_to_group[bench_type] for bench_type in bench_types]
     names = []
     y_values = []
+    y_errors = []
 
     for config_match in config_matches:
         names.append(name_func(config_match))
         ys = []
+        errs = []
 
         for bench_type in bench_types:
             config_match["benchmark"] = bench_type
-            y_res = results_select(results, config_match, result_select_fn)
-            cm_res = configs_select(results, config_match)
+            runs = matching_runs(results, config_match)
+            y_res = [result_select_fn(r.results) for r in runs]
+            cm_res = [r.config for r in runs]
             print(config_match)
             print(y_res)
             # If len(y_res) > 1, assert they only differ in the "iteration" field
@@ -344,23 +455,36 @@ def bench_plot_groupped_results(
                 # print("More than 1 result for ", config_match)
                 # print("Configs: ", cm_res)
                 assert_only_differs_in_fields(cm_res, ["iteration"])
-                y_res = [np.mean(y_res)]
+                y_mean, y_err = mean_confidence_interval(y_res, confidence)
+                y_res = [y_mean]
             elif len(y_res) == 0:
                 raise Exception(f"No results for {config_match}")
+            else:
+                y_err = 0
             assert len(y_res) == 1, "len(y_res) = %d" % len(y_res)
             ys.append(y_res[0])
+            errs.append(y_err)
         assert len(ys) == len(groups), "len(ys) = %d" % len(ys)
         y_values.append(ys)
+        y_errors.append(errs)
 
     print(y_values)
     if normalize_per_group:
         for idx in range(len(y_values[0])):
             max_value_for_idx = max([ys[idx] for ys in y_values])
-            for ys in y_values:
+            for ys, errs in zip(y_values, y_errors):
                 ys[idx] = ys[idx] / max_value_for_idx * 100
+                errs[idx] = errs[idx] / max_value_for_idx * 100
         print("Normalized y_values: ", y_values)
 
-    gpplot = GrouppedBarPlot(names, y_values, groups, colors, y_label=y_label)
+    gpplot = GrouppedBarPlot(
+        names,
+        y_values,
+        groups,
+        colors,
+        y_label=y_label,
+        y_errors=y_errors if error_bars else None,
+    )
     assert gpplot.num_bars == len(colors), "gpplot.num_bars = %d, len(colors) = %d" % (
         gpplot.num_bars,
         len(colors),
@@ -382,3 +506,366 @@ def bench_plot_groupped_results(
         legend_loc=legend_loc,
         text_center_list=text_center_list,
     )
+
+
+def plot_mrc_with_results(
+    mrc: Dict,
+    config_matches: List[Dict],
+    results: Results,
+    colors=["salmon", "maroon", "peru"],
+    filename="mrc.pdf",
+    name_func=make_name,
+    result_select_fn=lambda r: r["throughput_avg"],
+    y_label="Throughput (ops/sec)",
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Overlay the predicted LRU miss-ratio curve of a trace (see trace_mrc.py)
+    on the measured results for each cgroup_size_pct."""
+    fig, mrc_ax = plt.subplots()
+    mrc_ax.plot(
+        mrc["cache_size_pct"],
+        mrc["miss_ratio"],
+        color="gray",
+        linestyle="--",
+        label="LRU MRC (predicted)",
+    )
+    mrc_ax.set_xlabel("Cache size (% of footprint)", fontsize=fontsize)
+    mrc_ax.set_ylabel("Miss ratio", fontsize=fontsize)
+    mrc_ax.set_xlim(0, 100)
+    mrc_ax.set_ylim(0, 1)
+
+    results_ax = mrc_ax.twinx()
+    for config_match, color in zip(config_matches, colors):
+        pcts = sorted(
+            set(c["cgroup_size_pct"] for c in configs_select(results, config_match))
+        )
+        ys = []
+        for pct in pcts:
+            y_res = results_select(
+                results, {**config_match, "cgroup_size_pct": pct}, result_select_fn
+            )
+            ys.append(np.mean(y_res))
+        results_ax.plot(
+            pcts, ys, marker="o", color=color, label=name_func(config_match)
+        )
+    results_ax.set_ylabel(y_label, fontsize=fontsize)
+
+    handles, labels = mrc_ax.get_legend_handles_labels()
+    results_handles, results_labels = results_ax.get_legend_handles_labels()
+    results_ax.legend(
+        handles + results_handles, labels + results_labels, fontsize=legend_fontsize
+    )
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def plot_latency_cdf(
+    results: Results,
+    config_matches: List[Dict],
+    op="read",
+    colors=["salmon", "maroon", "peru"],
+    filename="latency_cdf.pdf",
+    name_func=make_name,
+    tail=True,
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Plot the latency CDF of each config, merged over all matching runs.
+    With tail=True, plot 1 - CDF on a log scale to show p99.9 and above."""
+    fig, ax = plt.subplots()
+    for config_match, color in zip(config_matches, colors):
+        histogram = merged_latency_histogram(results, config_match, op)
+        if histogram.total_count() == 0:
+            log.warning("No %s latencies for %s", op, config_match)
+            continue
+        latencies, fractions = histogram.cdf()
+        if tail:
+            fractions = 1 - fractions
+            # The last bucket has a tail fraction of 0
+            latencies, fractions = latencies[:-1], fractions[:-1]
+        ax.step(
+            latencies / 1000,
+            fractions,
+            where="post",
+            color=color,
+            label=name_func(config_match),
+        )
+    ax.set_xscale("log")
+    ax.set_xlabel("%s latency (us)" % op.upper(), fontsize=fontsize)
+    if tail:
+        ax.set_yscale("log")
+        ax.set_ylabel("Fraction of requests slower (1 - CDF)", fontsize=fontsize)
+    else:
+        ax.set_ylim(0, 1)
+        ax.set_ylabel("CDF", fontsize=fontsize)
+    ax.legend(fontsize=legend_fontsize)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def plot_refault_distance_cdf(
+    results: Results,
+    config_matches: List[Dict],
+    hist="request_distance_hist",
+    colors=["salmon", "maroon", "peru", "olivedrab", "steelblue"],
+    filename="refault_distance_cdf.pdf",
+    name_func=make_name,
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Plot the CDF of the distance between the eviction and the refault of
+    pages, merged over all matching runs, to compare the eviction quality of
+    policies: refaults at short distances are evictions the policy regrets."""
+    fig, ax = plt.subplots()
+    for config_match, color in zip(config_matches, colors):
+        histogram = merged_refault_histogram(results, config_match, hist)
+        if not histogram.sum():
+            log.warning("No refaults for %s", config_match)
+            continue
+        # Upper bound of each log2 bucket
+        distances = 2.0 ** np.arange(1, len(histogram) + 1)
+        fractions = np.cumsum(histogram) / histogram.sum()
+        ax.step(
+            distances,
+            fractions,
+            where="post",
+            color=color,
+            label=name_func(config_match),
+        )
+    ax.set_xscale("log", base=2)
+    if hist == "time_us_hist":
+        ax.set_xlabel("Time from eviction to refault (us)", fontsize=fontsize)
+    else:
+        ax.set_xlabel("Page requests from eviction to refault", fontsize=fontsize)
+    ax.set_ylim(0, 1)
+    ax.set_ylabel("CDF of refaults", fontsize=fontsize)
+    ax.legend(fontsize=legend_fontsize)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def callback_costs_select(
+    results: Results, config_match: Dict, metric="avg_ns"
+) -> Dict[str, List[float]]:
+    """A metric of bpf_callback_stats (avg_ns, run_cnt or run_time_ns) of
+    each policy callback, over the matching runs (see --bpf-prog-stats)."""
+    costs = {}
+    for callback_stats in results_select(
+        results, config_match, lambda r: r.get("bpf_callback_stats", {})
+    ):
+        for callback, stats in callback_stats.items():
+            costs.setdefault(callback, []).append(stats[metric])
+    return costs
+
+
+def plot_callback_costs(
+    results: Results,
+    config_matches: List[Dict],
+    metric="avg_ns",
+    colors=["salmon", "maroon", "peru", "olivedrab", "steelblue"],
+    filename="callback_costs.pdf",
+    name_func=make_name,
+    bar_width=0.8,
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Plot a metric of each policy callback, one bar per config (e.g. per
+    policy), with the confidence interval over the matching runs. With
+    metric="avg_ns", this shows which hook makes a policy cost CPU."""
+    costs = [callback_costs_select(results, match, metric) for match in config_matches]
+    callbacks = [c for c in POLICY_CALLBACKS if any(c in cost for cost in costs)]
+    if not callbacks:
+        log.warning("No BPF callback stats for %s", config_matches)
+        return
+    width = bar_width / len(config_matches)
+    xticks = np.arange(len(callbacks))
+    fig, ax = plt.subplots()
+    for i, (config_match, cost, color) in enumerate(zip(config_matches, costs, colors)):
+        means, errors = zip(
+            *(mean_confidence_interval(cost.get(c, [0])) for c in callbacks)
+        )
+        ax.bar(
+            xticks + (i - (len(config_matches) - 1) / 2) * width,
+            means,
+            width=width,
+            yerr=[0 if np.isinf(e) else e for e in errors],
+            capsize=3,
+            color=color,
+            label=name_func(config_match),
+        )
+    ax.set_xticks(xticks)
+    ax.set_xticklabels(callbacks, rotation=20, fontsize=fontsize)
+    ylabels = {
+        "avg_ns": "Average run time (ns)",
+        "run_cnt": "Runs",
+        "run_time_ns": "Total run time (ns)",
+    }
+    ax.set_ylabel(ylabels.get(metric, metric), fontsize=fontsize)
+    ax.legend(fontsize=legend_fontsize)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def plot_hit_ratio_and_throughput(
+    results: Results,
+    config_matches: List[Dict],
+    throughput_select_fn=lambda r: r["throughput_avg"],
+    throughput_label="Throughput (ops/sec)",
+    colors=["salmon", "maroon", "peru", "olivedrab", "steelblue"],
+    filename="hit_ratio_throughput.pdf",
+    name_func=make_name,
+    fontsize=12,
+):
+    """Plot the page cache hit ratio (see --hitrate-monitor) next to the
+    throughput of each config, with the confidence intervals over the
+    matching runs."""
+    fig, (ax_throughput, ax_hit_ratio) = plt.subplots(1, 2, figsize=(10, 4))
+    names = [name_func(config_match) for config_match in config_matches]
+    xticks = np.arange(len(config_matches))
+    for ax, select_fn, label in [
+        (ax_throughput, throughput_select_fn, throughput_label),
+        (ax_hit_ratio, lambda r: r["page_cache_hit_ratio"], "Page cache hit ratio"),
+    ]:
+        means, errors = zip(
+            *(
+                mean_confidence_interval(results_select(results, match, select_fn))
+                for match in config_matches
+            )
+        )
+        ax.bar(
+            xticks,
+            means,
+            yerr=[0 if np.isinf(e) else e for e in errors],
+            capsize=3,
+            color=colors[: len(config_matches)],
+        )
+        ax.set_xticks(xticks)
+        ax.set_xticklabels(names, rotation=20, fontsize=fontsize)
+        ax.set_ylabel(label, fontsize=fontsize)
+    ax_hit_ratio.set_ylim(0, 1)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def plot_hit_ratio_over_time(
+    results: Results,
+    config_matches: List[Dict],
+    colors=["salmon", "maroon", "peru", "olivedrab", "steelblue"],
+    filename="hit_ratio_over_time.pdf",
+    name_func=make_name,
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Plot the page cache hit ratio of each sampling interval of a single run
+    per config (see --hitrate-monitor)."""
+    fig, ax = plt.subplots()
+    for config_match, color in zip(config_matches, colors):
+        series = single_result_select(
+            results, config_match, lambda r: r["page_cache_hit_series"]
+        )
+        hits = np.array(series["hits"], dtype=np.float64)
+        requests = hits + np.array(series["misses"], dtype=np.float64)
+        ratios = np.divide(
+            hits, requests, out=np.full_like(hits, np.nan), where=requests > 0
+        )
+        ax.plot(series["time"], ratios, color=color, label=name_func(config_match))
+    ax.set_xlabel("Time (s)", fontsize=fontsize)
+    ax.set_ylabel("Page cache hit ratio", fontsize=fontsize)
+    ax.set_ylim(0, 1)
+    ax.legend(fontsize=legend_fontsize)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def plot_latency_vs_offered_load(
+    results: Results,
+    config_matches: List[Dict],
+    latency_key="latency_p99",
+    colors=["salmon", "maroon", "peru", "olivedrab", "steelblue"],
+    filename="latency_vs_offered_load.pdf",
+    name_func=make_name,
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Plot the achieved rate and a latency result of each config against the
+    offered rate of its open-loop runs (--target-rate), averaged over the
+    runs of each rate. Saturated rates are drawn hollow."""
+    fig, (ax_rate, ax_latency) = plt.subplots(1, 2, figsize=(10, 4))
+    max_rate = 0
+    for config_match, color in zip(config_matches, colors):
+        rates = sorted(
+            {
+                config["target_rate"]
+                for config in configs_select(results, config_match)
+                if config.get("target_rate")
+            }
+        )
+        if not rates:
+            log.warning("No open-loop runs for %s", config_match)
+            continue
+        max_rate = max(max_rate, rates[-1])
+        runs = [
+            results_select(results, dict(config_match, target_rate=rate), lambda r: r)
+            for rate in rates
+        ]
+        achieved = [
+            np.mean([r["achieved_rate"] for r in rate_runs]) for rate_runs in runs
+        ]
+        latencies = [
+            np.mean([r[latency_key] for r in rate_runs]) / 1000 for rate_runs in runs
+        ]
+        saturated = np.array(
+            [any(r["saturated"] for r in rate_runs) for rate_runs in runs]
+        )
+        label = name_func(config_match)
+        for ax, values in [(ax_rate, achieved), (ax_latency, latencies)]:
+            values = np.array(values)
+            ax.plot(rates, values, color=color, label=label)
+            ax.scatter(
+                np.array(rates)[saturated],
+                values[saturated],
+                facecolors="none",
+                edgecolors=color,
+            )
+            ax.scatter(np.array(rates)[~saturated], values[~saturated], color=color)
+    ax_rate.plot([0, max_rate], [0, max_rate], color="gray", linestyle="--")
+    ax_rate.set_xlabel("Offered rate (ops/sec)", fontsize=fontsize)
+    ax_rate.set_ylabel("Achieved rate (ops/sec)", fontsize=fontsize)
+    ax_latency.set_xlabel("Offered rate (ops/sec)", fontsize=fontsize)
+    ax_latency.set_ylabel("%s (us)" % latency_key, fontsize=fontsize)
+    ax_latency.set_yscale("log")
+    ax_latency.legend(fontsize=legend_fontsize)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
+
+
+def plot_tenant_occupancy(
+    results: Results,
+    config_match: Dict,
+    filename="tenant_occupancy.pdf",
+    fontsize=12,
+    legend_fontsize=12,
+):
+    """Plot the page cache occupancy of each tenant over time for a single
+    bench_multi_tenant.py run."""
+    occupancy = single_result_select(results, config_match, lambda r: r["occupancy"])
+    times = np.array(occupancy["time"])
+    fig, ax = plt.subplots()
+    for key, values in occupancy.items():
+        if not key.endswith("_file") or key.endswith("_refault_file"):
+            continue
+        ax.plot(times, np.array(values) / 2**30, label=key[: -len("_file")])
+    ax.set_xlabel("Time (s)", fontsize=fontsize)
+    ax.set_ylabel("Page cache (GiB)", fontsize=fontsize)
+    ax.legend(fontsize=legend_fontsize)
+    fig.tight_layout()
+    fig.savefig(filename, metadata={"creationDate": None})
+    plt.close(fig)
@@ -0,0 +1,150 @@
+import argparse
+import logging
+import os
+from typing import Dict, List
+
+from bench_lib import (
+    BenchResults,
+    BenchRun,
+    DEFAULT_CACHE_EXT_CGROUP,
+    add_config_option,
+    checkpoint_run,
+    exists_config_in_results,
+    format_bytes_str,
+    load_results,
+    parse_bytes_string,
+    parse_strings_string,
+)
+from cache_sim import (
+    DEFAULT_EVICT_BATCH,
+    PAGE_SIZE,
+    POLICIES,
+    load_trace,
+    policy_loader_name,
+    simulate,
+)
+
+log = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        "Offline cache_ext policy simulator",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        required=True,
+        help="Page access trace (.npy of page keys, or text with one"
+        ' "<key>" or "<inode> <index>" per line)',
+    )
+    parser.add_argument(
+        "--policies",
+        type=str,
+        default=",".join(POLICIES.keys()),
+        help="Comma-separated list of policies to simulate",
+    )
+    parser.add_argument(
+        "--cache-sizes",
+        type=str,
+        required=True,
+        help="Comma-separated list of cache sizes (e.g. 64M,256M,1G)",
+    )
+    parser.add_argument(
+        "--evict-batch",
+        type=int,
+        default=DEFAULT_EVICT_BATCH,
+        help="Number of folios requested per evict_folios() call",
+    )
+    parser.add_argument(
+        "--results-file",
+        type=str,
+        default="sim_results.json",
+        help="Path to results file (JSON format, or a SQLite results store if it"
+        " ends in .sqlite or .db)",
+    )
+    parser.add_argument(
+        "--no-reuse-results",
+        action="store_true",
+        default=False,
+        help="Reuse existing results and only calculate missing results",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=1,
+        help="Number of iterations to run for each config. The iteration is"
+        " used as the random seed of sampling-based policies.",
+    )
+    return parser.parse_args()
+
+
+def generate_configs(args) -> List[Dict]:
+    configs = [{"name": "cache_sim", "trace": os.path.basename(args.trace)}]
+    configs = add_config_option(
+        "iteration", list(range(1, args.iterations + 1)), configs
+    )
+    configs = add_config_option("evict_batch", [args.evict_batch], configs)
+    configs = add_config_option(
+        "cgroup_size", parse_bytes_string(args.cache_sizes), configs
+    )
+    configs = add_config_option("cgroup_name", [DEFAULT_CACHE_EXT_CGROUP], configs)
+    configs = add_config_option(
+        "policy_loader",
+        [policy_loader_name(p) for p in parse_strings_string(args.policies)],
+        configs,
+    )
+    return configs
+
+
+def main():
+    args = parse_args()
+    policies = {policy_loader_name(name): cls for name, cls in POLICIES.items()}
+    configs = generate_configs(args)
+    for config in configs:
+        if config["policy_loader"] not in policies:
+            raise Exception("Unknown policy loader: %s" % config["policy_loader"])
+
+    results = []
+    reuse_results = not args.no_reuse_results
+    if reuse_results and os.path.exists(args.results_file):
+        log.info("Will reuse existing results file %s" % args.results_file)
+        results = load_results(args.results_file, BenchResults)
+    configs = [
+        c
+        for c in configs
+        if not (reuse_results and exists_config_in_results(results, c))
+    ]
+    if not configs:
+        log.info("All configs already simulated")
+        return
+
+    log.info("Loading trace %s", args.trace)
+    trace = load_trace(args.trace)
+    log.info("Loaded %d accesses", len(trace))
+
+    for idx, config in enumerate(configs):
+        log.info(
+            "Progress: %.1f%% (%s/%s)"
+            % ((idx + 1) / len(configs) * 100, idx + 1, len(configs))
+        )
+        policy = policies[config["policy_loader"]](
+            config["cgroup_size"] // PAGE_SIZE, seed=config["iteration"]
+        )
+        sim_results = simulate(policy, trace, evict_batch=config["evict_batch"])
+        log.info(
+            "%s with %s: hit ratio %.4f (%.1fs)",
+            policy.name,
+            format_bytes_str(config["cgroup_size"]),
+            sim_results["hit_ratio"],
+            sim_results["sim_runtime_sec"],
+        )
+        checkpoint_run(
+            args.results_file, results, BenchRun(config, BenchResults(sim_results))
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,272 @@
+"""Statistics helpers for deciding how long and how often to run benchmarks.
+
+Confidence intervals use Student's t distribution. Its quantiles are computed
+by inverting its closed-form CDF for integer degrees of freedom (Abramowitz
+and Stegun 26.7.3), so that scipy is not needed. Large degrees of freedom use
+the Cornish-Fisher expansion around the normal quantile (26.7.5) instead.
+"""
+
+import logging
+import math
+from statistics import NormalDist
+from time import time
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Critical value of the supremum of a Brownian bridge at 95%, i.e. of the
+# normalized CUSUM statistic of a series with a constant mean.
+CUSUM_THRESHOLD = 1.36
+MIN_CUSUM_SAMPLES = 10
+# Bounds the autocorrelation correction of long_run_sigma
+MAX_AUTOCORRELATION = 0.95
+# Warmup discarded from runs that never reached a steady state, the most that
+# detect_warmup discards
+MAX_WARMUP_FRACTION = 0.5
+NR_BATCHES = 10
+BOOTSTRAP_RESAMPLES = 10000
+
+
+# Above this, the Cornish-Fisher expansion is accurate to ~1e-6
+T_QUANTILE_EXPANSION_DOF = 100
+T_QUANTILE_ITERATIONS = 60
+
+
+def _t_abs_cdf(theta: float, dof: int) -> float:
+    """P(|T| <= t) for Student's t with dof degrees of freedom, where
+    theta = atan(t / sqrt(dof)) (Abramowitz and Stegun 26.7.3)."""
+    cos2 = math.cos(theta) ** 2
+    if dof % 2 == 0:
+        term = total = 1.0
+        for k in range(2, dof, 2):
+            term *= cos2 * (k - 1) / k
+            total += term
+        return math.sin(theta) * total
+    total = 0.0
+    if dof > 1:
+        term = total = 1.0
+        for k in range(3, dof, 2):
+            term *= cos2 * (k - 1) / k
+            total += term
+    return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * total)
+
+
+def t_quantile(confidence: float, dof: int) -> float:
+    """Two-sided Student-t critical value, e.g. ~2.26 for 95% and 9 dof."""
+    if dof < 1:
+        return float("inf")
+    if dof > T_QUANTILE_EXPANSION_DOF:
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        terms = [
+            (z**3 + z) / 4,
+            (5 * z**5 + 16 * z**3 + 3 * z) / 96,
+            (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / 384,
+            (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / 92160,
+        ]
+        return z + sum(term / dof ** (i + 1) for i, term in enumerate(terms))
+    # The CDF increases with theta in [0, pi/2), bisect it
+    low, high = 0.0, math.pi / 2
+    for _ in range(T_QUANTILE_ITERATIONS):
+        mid = (low + high) / 2
+        if _t_abs_cdf(mid, dof) < confidence:
+            low = mid
+        else:
+            high = mid
+    return math.sqrt(dof) * math.tan((low + high) / 2)
+
+
+def mean_confidence_interval(samples, confidence: float = 0.95) -> Tuple[float, float]:
+    """Return (mean, half width of the Student-t confidence interval)."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) == 0:
+        return float("nan"), float("nan")
+    if len(samples) == 1:
+        return float(samples[0]), float("inf")
+    mean = float(samples.mean())
+    stderr = float(samples.std(ddof=1)) / math.sqrt(len(samples))
+    return mean, t_quantile(confidence, len(samples) - 1) * stderr
+
+
+def bootstrap_confidence_interval(
+    samples, confidence: float = 0.95, nr_resamples: int = BOOTSTRAP_RESAMPLES
+) -> Tuple[float, float]:
+    """Return (mean, half width of the percentile bootstrap interval of the
+    mean). Makes no normality assumption, but is too narrow for very few
+    samples. The resampling is seeded, so that it is reproducible."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) < 2:
+        return mean_confidence_interval(samples, confidence)
+    mean = float(samples.mean())
+    rng = np.random.default_rng(0)
+    means = rng.choice(samples, (nr_resamples, len(samples))).mean(axis=1)
+    low, high = np.percentile(means, [50 * (1 - confidence), 50 * (1 + confidence)])
+    return mean, float(max(mean - low, high - mean))
+
+
+CI_METHODS = {
+    "t": mean_confidence_interval,
+    "bootstrap": bootstrap_confidence_interval,
+}
+
+
+def summarize_samples(samples, confidence: float = 0.95, method: str = "t") -> Dict:
+    """Mean, standard deviation and confidence interval half width (absolute
+    and relative to the mean) of samples, e.g. the iterations of a config."""
+    samples = np.asarray(samples, dtype=np.float64)
+    mean, half_width = CI_METHODS[method](samples, confidence)
+    return {
+        "n": len(samples),
+        "mean": mean,
+        "std": float(samples.std(ddof=1)) if len(samples) > 1 else 0.0,
+        "ci": half_width,
+        "rel_ci": half_width / abs(mean) if mean else float("inf"),
+        "confidence": confidence,
+        "ci_method": method,
+    }
+
+
+def batch_means(samples, nr_batches: int = NR_BATCHES) -> np.ndarray:
+    """Means of nr_batches contiguous batches. Consecutive throughput samples
+    are autocorrelated, batch means much less so, which keeps confidence
+    intervals honest."""
+    samples = np.asarray(samples, dtype=np.float64)
+    batch_size = len(samples) // nr_batches
+    if batch_size < 2:
+        return samples
+    # Drop the oldest samples that do not fill a batch
+    samples = samples[len(samples) - batch_size * nr_batches :]
+    return samples.reshape(nr_batches, batch_size).mean(axis=1)
+
+
+def long_run_sigma(residuals) -> float:
+    """Long-run standard deviation of a mean-zero series, i.e. sqrt(n) times
+    the standard error of its mean. Consecutive throughput samples are
+    positively autocorrelated, so their plain standard deviation is too small.
+    Corrects it with the lag-1 autocorrelation rho, as for an AR(1) series:
+    sigma^2 (1 + rho) / (1 - rho)."""
+    residuals = np.asarray(residuals, dtype=np.float64)
+    variance = float(np.mean(residuals**2))
+    if variance == 0 or len(residuals) < 2:
+        return math.sqrt(variance)
+    rho = float(np.mean(residuals[1:] * residuals[:-1])) / variance
+    rho = min(max(rho, 0.0), MAX_AUTOCORRELATION)
+    return math.sqrt(variance * (1 + rho) / (1 - rho))
+
+
+def cusum_change_point(samples) -> Tuple[int, float]:
+    """Most likely mean shift of a series, as (index of the first sample
+    after the shift, normalized CUSUM statistic). The statistic is compared to
+    CUSUM_THRESHOLD. The noise is the long-run deviation of the series around
+    the means before and after the shift, so that neither the shift nor the
+    autocorrelation of the samples skew it."""
+    samples = np.asarray(samples, dtype=np.float64)
+    n = len(samples)
+    if n < 3:
+        return 0, 0.0
+    cusum = np.cumsum(samples - samples.mean())
+    k = int(np.argmax(np.abs(cusum[:-1])))
+    residuals = np.concatenate(
+        [
+            samples[: k + 1] - samples[: k + 1].mean(),
+            samples[k + 1 :] - samples[k + 1 :].mean(),
+        ]
+    )
+    sigma = long_run_sigma(residuals)
+    if sigma == 0:
+        return k + 1, float("inf") if cusum[k] != 0 else 0.0
+    return k + 1, float(abs(cusum[k]) / (sigma * math.sqrt(n)))
+
+
+def detect_warmup(
+    samples, max_warmup_fraction: float = MAX_WARMUP_FRACTION
+) -> Union[int, None]:
+    """Number of warmup samples to discard, or None if the series has not
+    reached a steady state yet (it still shifts in its second half).
+
+    Repeatedly cuts the series at its most significant CUSUM change point
+    until the remainder has a constant mean."""
+    samples = np.asarray(samples, dtype=np.float64)
+    start = 0
+    while len(samples) - start >= MIN_CUSUM_SAMPLES:
+        k, statistic = cusum_change_point(samples[start:])
+        if statistic < CUSUM_THRESHOLD:
+            break
+        start += k
+        if start > max_warmup_fraction * len(samples):
+            return None
+    return start
+
+
+class SteadyStateDetector:
+    """Tracks periodic throughput samples of a running benchmark, detects the
+    end of its warmup (detect_warmup) and whether the steady-state mean is
+    known precisely enough: the relative half width of its confidence
+    interval, computed over batch means, is at most ci_target."""
+
+    def __init__(
+        self,
+        ci_target: float = 0.02,
+        confidence: float = 0.95,
+        min_samples: int = 20,
+    ):
+        self.ci_target = ci_target
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.start_time = time()
+        self.times = []
+        self.samples = []
+        self.warmup_samples = None
+        self.converged = False
+
+    def add(self, value: float, timestamp: Union[float, None] = None) -> bool:
+        """Add a sample. Returns True once the run can stop."""
+        if timestamp is None:
+            timestamp = time() - self.start_time
+        self.times.append(timestamp)
+        self.samples.append(value)
+        self.warmup_samples = detect_warmup(self.samples)
+        if self.warmup_samples is None:
+            return False
+        steady = self.samples[self.warmup_samples :]
+        if len(steady) < self.min_samples:
+            return False
+        mean, half_width = mean_confidence_interval(
+            batch_means(steady), self.confidence
+        )
+        self.converged = mean > 0 and half_width / mean <= self.ci_target
+        return self.converged
+
+    def summary(self) -> Dict:
+        """Run length and steady-state throughput, for the results. A run
+        that never reached a steady state falls back to discarding the first
+        MAX_WARMUP_FRACTION of its samples as warmup."""
+        warmup = self.warmup_samples
+        fallback = warmup is None
+        if fallback:
+            warmup = int(len(self.samples) * MAX_WARMUP_FRACTION)
+            log.warning(
+                "No steady state after %d throughput samples, discarding the"
+                " first %d as warmup",
+                len(self.samples),
+                warmup,
+            )
+        steady = self.samples[warmup:]
+        mean, half_width = mean_confidence_interval(
+            batch_means(steady), self.confidence
+        )
+        runtime = self.times[-1] if self.times else 0
+        # Time of the last warmup sample, i.e. when the steady state started
+        warmup_sec = self.times[warmup - 1] if warmup else 0
+        return {
+            "adaptive_converged": self.converged,
+            "adaptive_samples": len(self.samples),
+            "adaptive_warmup_samples": warmup,
+            "adaptive_warmup_fallback": fallback,
+            "adaptive_warmup_sec": warmup_sec,
+            "adaptive_steady_sec": runtime - warmup_sec,
+            "adaptive_runtime_sec": runtime,
+            "adaptive_throughput_avg": mean,
+            "adaptive_throughput_ci": half_width,
+        }
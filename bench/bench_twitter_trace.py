@@ -14,6 +14,7 @@ from bench_lib import (
     BenchResults,
     DEFAULT_BASELINE_CGROUP,
     DEFAULT_CACHE_EXT_CGROUP,
+    SNAPSHOT_BACKENDS,
     add_config_option,
     check_output,
     disable_smt,
@@ -22,12 +23,23 @@ from bench_lib import (
     edit_yaml_file,
     enable_smt,
     format_bytes_str,
+    parse_numbers_string,
     parse_strings_string,
     recreate_baseline_cgroup,
     recreate_cache_ext_cgroup,
+    reset_database_snapshot,
     run,
     set_sysctl,
 )
+from binary_trace import ensure_binary_trace
+from latency_histogram import (
+    LATENCY_HISTOGRAM_WINDOW_SEC,
+    add_latency_histogram_results,
+    add_open_loop_results,
+    set_open_loop_workload,
+)
+from trace_mrc import DEFAULT_SAMPLING_RATE, ensure_mrc, mrc_miss_ratio
+from trace_scale import scaled_trace_file
 
 yaml = YAML()
 log = logging.getLogger(__name__)
@@ -38,13 +50,6 @@ MiB = 2**20
 CLEANUP_TASKS = []
 
 
-def reset_database(db_dir: str, temp_db_dir: str):
-    # rsync -avpl --delete /mydata/leveldb_db_orig/ /mydata/leveldb_db/
-    if not db_dir.endswith("/"):
-        db_dir += "/"
-    run(["rsync", "-avpl", "--delete", db_dir, temp_db_dir])
-
-
 def dir_size(path: str) -> int:
     # Check that path exists and is a directory
     if not os.path.exists(path):
@@ -65,6 +70,16 @@ def file_size(path: str) -> int:
     return os.path.getsize(path)
 
 
+def twitter_trace_file(traces_dir: str, benchmark: str) -> str:
+    # Extract cluster number from benchmark name (e.g., "twitter_cluster_17_bench" -> "17")
+    cluster_match = re.search(r"cluster(\d+)", benchmark)
+    if not cluster_match:
+        raise Exception(
+            "Could not extract cluster number from benchmark name: %s" % benchmark
+        )
+    return os.path.join(traces_dir, f"cluster{cluster_match.group(1)}_bench.txt")
+
+
 def parse_leveldb_bench_results(stdout: str) -> Dict:
     # Uniform: calculating overall performance metrics... (might take a while)
     # Uniform overall: UPDATE throughput 0.00 ops/sec, INSERT throughput 0.00 ops/sec, READ throughput 9038.24 ops/sec, SCAN throughput 0.00 ops/sec, READ_MODIFY_WRITE throughput 0.00 ops/sec, total throughput 9038.24 ops/sec
@@ -143,6 +158,7 @@ def parse_leveldb_bench_results(stdout: str) -> Dict:
                     results["read_modify_write_latency_p99"] = float(match[1])
                 else:
                     raise Exception("Unknown latency metric: " + match[0])
+    add_latency_histogram_results(results, stdout)
     if not all(
         key in results for key in ["throughput_avg", "latency_avg", "latency_p99"]
     ):
@@ -179,6 +195,13 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
             required=True,
             help="Specify the path to the policy loader binary",
         )
+        parser.add_argument(
+            "--snapshot-backend",
+            type=str,
+            default="rsync",
+            choices=list(SNAPSHOT_BACKENDS.keys()),
+            help="How to reset the temporary DB from the original DB before each run",
+        )
         parser.add_argument(
             "--bench-binary-dir",
             type=str,
@@ -197,15 +220,80 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
             required=True,
             help="Specify the directory containing Twitter trace metadata files",
         )
+        parser.add_argument(
+            "--cgroup-size-pct",
+            type=str,
+            default="10",
+            help="Comma-separated list of cgroup sizes, as a percentage of the DB size",
+        )
+        parser.add_argument(
+            "--mrc",
+            action="store_true",
+            default=False,
+            help="Generate the LRU miss-ratio curve of each trace next to the"
+            " results file before benchmarking",
+        )
+        parser.add_argument(
+            "--mrc-sampling-rate",
+            type=float,
+            default=DEFAULT_SAMPLING_RATE,
+            help="SHARDS sampling rate used to generate the miss-ratio curves",
+        )
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1,
+            help="Replay the traces downscaled to this fraction of their key space"
+            " by trace_scale.py. --leveldb-db must then be the matching scaled DB"
+            " (see utils/leveldb_subset.cc), so that cgroup sizes, a percentage"
+            " of the DB size, scale with it.",
+        )
+        parser.add_argument(
+            "--binary-trace",
+            action="store_true",
+            default=False,
+            help="Convert each trace to the binary trace format once (see"
+            " binary_trace.py) and have My-YCSB mmap it instead of loading the"
+            " text trace",
+        )
+        parser.add_argument(
+            "--target-rate",
+            type=str,
+            default="0",
+            help="Comma-separated list of request rates (ops/sec) to run My-YCSB"
+            " at as an open loop, with latencies corrected for coordinated"
+            " omission (see latency_histogram.py). 0 runs a closed loop.",
+        )
 
     def generate_configs(self, configs: List[Dict]) -> List[Dict]:
         configs = add_config_option("enable_mmap", [False], configs)
-        configs = add_config_option("runtime_seconds", [240], configs)
-        configs = add_config_option("warmup_runtime_seconds", [45], configs)
+        if self.args.adaptive_runtime:
+            # Runs stop once their throughput converges; the warmup is
+            # detected from the throughput samples instead
+            configs = add_config_option(
+                "runtime_seconds", [self.args.adaptive_max_runtime], configs
+            )
+            configs = add_config_option("warmup_runtime_seconds", [0], configs)
+            configs = add_config_option("adaptive_runtime", [True], configs)
+        else:
+            configs = add_config_option("runtime_seconds", [240], configs)
+            configs = add_config_option("warmup_runtime_seconds", [45], configs)
         configs = add_config_option(
             "benchmark", parse_strings_string(self.args.benchmark), configs
         )
-        configs = add_config_option("cgroup_size_pct", [10], configs)
+        configs = add_config_option(
+            "cgroup_size_pct", parse_numbers_string(self.args.cgroup_size_pct), configs
+        )
+        if self.args.scale < 1:
+            configs = add_config_option("scale", [self.args.scale], configs)
+        if self.args.binary_trace:
+            configs = add_config_option("trace_format", ["binary"], configs)
+        target_rates = [
+            int(rate) for rate in parse_strings_string(self.args.target_rate)
+        ]
+        # Closed-loop configs keep no target_rate, so earlier results still match
+        if target_rates != [0]:
+            configs = add_config_option("target_rate", target_rates, configs)
         if self.args.default_only:
             configs = add_config_option(
                 "cgroup_name", [DEFAULT_BASELINE_CGROUP], configs
@@ -227,8 +315,43 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
         )
         return configs
 
+    def generate_mrcs(self):
+        """Generate the miss-ratio curve of each trace, once per results file."""
+        for benchmark in parse_strings_string(self.args.benchmark):
+            trace_file = twitter_trace_file(self.args.twitter_traces_dir, benchmark)
+            if self.args.scale < 1:
+                trace_file = scaled_trace_file(trace_file, self.args.scale)
+            mrc = ensure_mrc(
+                self.args.results_file, trace_file, self.args.mrc_sampling_rate
+            )
+            for pct in parse_numbers_string(self.args.cgroup_size_pct):
+                log.info(
+                    "%s: predicted LRU miss ratio at %d%% of the footprint: %.4f",
+                    benchmark,
+                    pct,
+                    mrc_miss_ratio(mrc, pct),
+                )
+
+    def trace_file(self, config) -> str:
+        trace_file = twitter_trace_file(
+            self.args.twitter_traces_dir, config["benchmark"]
+        )
+        if config.get("scale", 1) < 1:
+            trace_file = scaled_trace_file(trace_file, config["scale"])
+            if not os.path.exists(trace_file):
+                raise Exception(
+                    "Scaled trace not found: %s. Generate it with trace_scale.py."
+                    % trace_file
+                )
+        if config.get("trace_format") == "binary":
+            return ensure_binary_trace(trace_file)
+        return trace_file
+
     def benchmark_prepare(self, config):
-        reset_database(self.args.leveldb_db, self.args.leveldb_temp_db)
+        reset_sec = reset_database_snapshot(
+            self.args.snapshot_backend, self.args.leveldb_db, self.args.leveldb_temp_db
+        )
+        self.record_result("db_reset_sec", reset_sec)
         drop_page_cache()
         disable_swap()
         disable_smt()
@@ -239,26 +362,19 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
         bench_file = "../leveldb/config/%s.yaml" % config["benchmark"]
         bench_file = os.path.abspath(os.path.join(bench_binary_dir, bench_file))
 
-        # Extract cluster number from benchmark name and construct trace file path
-        cluster_match = re.search(r"cluster(\d+)", config["benchmark"])
-        if cluster_match:
-            cluster_num = cluster_match.group(1)
-            trace_file = os.path.join(
-                self.args.twitter_traces_dir, f"cluster{cluster_num}_bench.txt"
-            )
-        else:
-            raise Exception(
-                "Could not extract cluster number from benchmark name: %s"
-                % config["benchmark"]
-            )
-
+        trace_file = self.trace_file(config)
         trace_file_size = file_size(trace_file)
-        # Load the trace file in memory to charge it to another cgroup
-        cmd = ["cat", trace_file]
-        run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        # cgroup_size += int(trace_file_size * 1.5)
-        # cgroup_size *= 3
-        cgroup_size += 20 * MiB
+        if config.get("trace_format") == "binary":
+            # The mmapped trace is charged to the benchmark cgroup as it is
+            # read, so reserve room for all of it
+            cgroup_size += trace_file_size
+        else:
+            # Load the trace file in memory to charge it to another cgroup
+            cmd = ["cat", trace_file]
+            run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # cgroup_size += int(trace_file_size * 1.5)
+            # cgroup_size *= 3
+            cgroup_size += 20 * MiB
         cgroup_size = max(cgroup_size, 70 * MiB)
 
         log.info(
@@ -270,10 +386,7 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
 
         if config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP:
             recreate_cache_ext_cgroup(limit_in_bytes=cgroup_size)
-            if config["policy_loader"] == "cache_ext_s3fifo.out":
-                self.cache_ext_policy.start(cgroup_size=cgroup_size)
-            else:
-                self.cache_ext_policy.start()
+            self.cache_ext_policy.start(cgroup_size=cgroup_size)
         else:
             recreate_baseline_cgroup(limit_in_bytes=cgroup_size)
 
@@ -286,18 +399,7 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
         if not os.path.exists(bench_file):
             raise Exception("Benchmark file not found: %s" % bench_file)
 
-        # Extract cluster number from benchmark name (e.g., "twitter_cluster_17_bench" -> "17")
-        cluster_match = re.search(r"cluster(\d+)", config["benchmark"])
-        if cluster_match:
-            cluster_num = cluster_match.group(1)
-            trace_file_path = os.path.join(
-                self.args.twitter_traces_dir, f"cluster{cluster_num}_bench.txt"
-            )
-        else:
-            raise Exception(
-                "Could not extract cluster number from benchmark name: %s"
-                % config["benchmark"]
-            )
+        trace_file_path = self.trace_file(config)
 
         with edit_yaml_file(bench_file) as bench_config:
             bench_config["leveldb"]["data_dir"] = leveldb_temp_db_dir
@@ -305,7 +407,15 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
             bench_config["workload"]["warmup_runtime_seconds"] = config[
                 "warmup_runtime_seconds"
             ]
+            bench_config["workload"][
+                "latency_histogram_window_seconds"
+            ] = LATENCY_HISTOGRAM_WINDOW_SEC
+            set_open_loop_workload(bench_config, config.get("target_rate", 0))
             bench_config["workload"]["trace_file"] = trace_file_path
+            if config.get("trace_format") == "binary":
+                bench_config["workload"]["trace_format"] = "binary"
+            else:
+                bench_config["workload"].pop("trace_format", None)
         cmd = [
             "sudo",
             "cgexec",
@@ -329,12 +439,14 @@ class LevelDBTwitterTraceBenchmark(BenchmarkFramework):
 
     def after_benchmark(self, config):
         if config["cgroup_name"] == DEFAULT_CACHE_EXT_CGROUP:
-            self.cache_ext_policy.stop()
+            self.record_result("cache_ext_stats", self.cache_ext_policy.stop())
         sleep(2)
         enable_smt()
 
     def parse_results(self, stdout: str) -> BenchResults:
         results = parse_leveldb_bench_results(stdout)
+        if self.current_config.get("target_rate"):
+            add_open_loop_results(results, self.current_config["target_rate"])
         return BenchResults(results)
 
 
@@ -358,6 +470,8 @@ def main():
         )
     log.info("LevelDB DB directory: %s", leveldb_bench.args.leveldb_db)
     log.info("LevelDB temp DB directory: %s", leveldb_bench.args.leveldb_temp_db)
+    if leveldb_bench.args.mrc:
+        leveldb_bench.generate_mrcs()
     leveldb_bench.benchmark()
 
     # Reset to default
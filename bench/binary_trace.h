@@ -0,0 +1,155 @@
+#ifndef _BINARY_TRACE_H
+#define _BINARY_TRACE_H
+
+/*
+ * Binary key-value trace format written by bench/binary_trace.py, for trace
+ * replayers such as My-YCSB. Uncompressed traces are mmapped and read as an
+ * array of fixed-width records, followed by the key table. All fields are
+ * little endian.
+ *
+ * Records refer to their key by its offset in the key table, which holds the
+ * trace's own key strings (NUL-terminated). Replayers issue those keys, see
+ * binary_trace_key(), so that they hit the same DB as the text trace.
+ */
+
+#include <errno.h>
+#include <fcntl.h>
+#include <stdint.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#define BINARY_TRACE_MAGIC "CXTRACE\0"
+#define BINARY_TRACE_VERSION 2
+#define BINARY_TRACE_FLAG_COMPRESSED (1U << 0)
+
+enum binary_trace_op {
+	BINARY_TRACE_OP_GET,
+	BINARY_TRACE_OP_GETS,
+	BINARY_TRACE_OP_SET,
+	BINARY_TRACE_OP_ADD,
+	BINARY_TRACE_OP_CAS,
+	BINARY_TRACE_OP_REPLACE,
+	BINARY_TRACE_OP_APPEND,
+	BINARY_TRACE_OP_PREPEND,
+	BINARY_TRACE_OP_DELETE,
+	BINARY_TRACE_OP_INCR,
+	BINARY_TRACE_OP_DECR,
+};
+
+struct binary_trace_header {
+	char magic[8];
+	uint32_t version;
+	uint32_t flags;
+	uint32_t record_size;
+	uint32_t reserved;
+	uint64_t nr_records;
+	uint64_t start_timestamp;
+	uint64_t key_table_offset;	// From the start of the file
+	uint64_t key_table_size;
+	uint8_t padding[8];
+};
+
+struct binary_trace_record {
+	uint64_t key_offset;		// In the key table
+	uint32_t value_size;
+	uint16_t timestamp_delta;	// Seconds since the previous record
+	uint8_t key_size;
+	uint8_t op;			// enum binary_trace_op
+};
+
+_Static_assert(sizeof(struct binary_trace_header) == 64,
+	       "binary trace header must be 64 bytes");
+_Static_assert(sizeof(struct binary_trace_record) == 16,
+	       "binary trace record must be 16 bytes");
+
+struct binary_trace {
+	void *map;
+	size_t map_size;
+	const struct binary_trace_header *header;
+	const struct binary_trace_record *records;
+	uint64_t nr_records;
+	const char *key_table;
+	uint64_t key_table_size;
+};
+
+/*
+ * Map an uncompressed binary trace read-only. Returns 0 or a negative errno.
+ * Records are read sequentially, so the kernel is told to read ahead and to
+ * drop pages behind the reader.
+ */
+static inline int binary_trace_open(const char *path, struct binary_trace *trace)
+{
+	struct stat st;
+	int fd, ret = 0;
+
+	memset(trace, 0, sizeof(*trace));
+	fd = open(path, O_RDONLY);
+	if (fd < 0)
+		return -errno;
+	if (fstat(fd, &st)) {
+		ret = -errno;
+		goto out;
+	}
+	if ((size_t)st.st_size < sizeof(struct binary_trace_header)) {
+		ret = -EINVAL;
+		goto out;
+	}
+	trace->map = mmap(NULL, st.st_size, PROT_READ, MAP_SHARED, fd, 0);
+	if (trace->map == MAP_FAILED) {
+		ret = -errno;
+		trace->map = NULL;
+		goto out;
+	}
+	trace->map_size = st.st_size;
+	trace->header = trace->map;
+	if (memcmp(trace->header->magic, BINARY_TRACE_MAGIC, 8) ||
+	    trace->header->version != BINARY_TRACE_VERSION ||
+	    trace->header->record_size != sizeof(struct binary_trace_record) ||
+	    trace->header->flags & BINARY_TRACE_FLAG_COMPRESSED ||
+	    sizeof(struct binary_trace_header) +
+			    trace->header->nr_records *
+				    sizeof(struct binary_trace_record) >
+		    trace->header->key_table_offset ||
+	    trace->header->key_table_offset + trace->header->key_table_size >
+		    trace->map_size ||
+	    (trace->header->key_table_size &&
+	     ((const char *)trace->map)[trace->header->key_table_offset +
+					trace->header->key_table_size - 1])) {
+		ret = -EINVAL;
+		munmap(trace->map, trace->map_size);
+		memset(trace, 0, sizeof(*trace));
+		goto out;
+	}
+	trace->records = (const struct binary_trace_record *)(trace->header + 1);
+	trace->nr_records = trace->header->nr_records;
+	trace->key_table = (const char *)trace->map + trace->header->key_table_offset;
+	trace->key_table_size = trace->header->key_table_size;
+	madvise(trace->map, trace->map_size, MADV_SEQUENTIAL);
+out:
+	close(fd);
+	return ret;
+}
+
+/*
+ * Key of a record, or NULL if its key_offset is out of the key table. The
+ * table ends with a NUL, so the key is always terminated.
+ */
+static inline const char *
+binary_trace_key(const struct binary_trace *trace,
+		 const struct binary_trace_record *record)
+{
+	if (record->key_offset >= trace->key_table_size)
+		return NULL;
+	return trace->key_table + record->key_offset;
+}
+
+static inline void binary_trace_close(struct binary_trace *trace)
+{
+	if (trace->map)
+		munmap(trace->map, trace->map_size);
+	memset(trace, 0, sizeof(*trace));
+}
+
+#endif /* _BINARY_TRACE_H */
@@ -0,0 +1,423 @@
+"""Compact binary format for key-value traces, e.g. the Twitter traces.
+
+Text traces are converted once, in a single streaming pass, into fixed-width
+16 byte records:
+
+    key_offset       u64  offset of the key in the key table
+    value_size       u32
+    timestamp_delta  u16  seconds since the previous record (saturated)
+    key_size         u8   (saturated)
+    op               u8   index in TRACE_OPS
+
+preceded by a 64 byte header (see HEADER_FORMAT) and followed by the key
+table: the distinct keys of the trace, NUL-terminated, in the order of their
+first access. The keys are the trace's own key strings, so a replayer issues
+the same keys as with the text trace, against the same DB. All fields are
+little endian.
+
+Uncompressed traces can be mmapped, so a run only faults in the pages it
+reads and the trace footprint is 16 bytes per request plus each key once,
+instead of the full text line of every request. With --compress, the records
+and the key table are two zlib streams instead, which is smaller on disk but
+has to be read sequentially. binary_trace.h is the C version of the format
+for My-YCSB.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from time import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from bench_lib import format_bytes_str
+
+log = logging.getLogger(__name__)
+
+BINARY_TRACE_MAGIC = b"CXTRACE\0"
+BINARY_TRACE_VERSION = 2
+BINARY_TRACE_SUFFIX = ".bin"
+FLAG_COMPRESSED = 1 << 0
+
+# magic, version, flags, record size, reserved, records, start timestamp,
+# key table file offset, key table size (uncompressed)
+HEADER_FORMAT = "<8sIIIIQQQQ8x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("key_offset", "<u8"),
+        ("value_size", "<u4"),
+        ("timestamp_delta", "<u2"),
+        ("key_size", "u1"),
+        ("op", "u1"),
+    ]
+)
+
+TRACE_OPS = [
+    "get",
+    "gets",
+    "set",
+    "add",
+    "cas",
+    "replace",
+    "append",
+    "prepend",
+    "delete",
+    "incr",
+    "decr",
+]
+TRACE_OP_CODES = {op: code for code, op in enumerate(TRACE_OPS)}
+
+# Records converted and written at a time
+CHUNK_RECORDS = 1 << 20
+
+# Field indexes of the Twitter CSV format:
+#   timestamp,key,key_size,value_size,client_id,operation,ttl
+TWITTER_FIELDS = {
+    "timestamp": 0,
+    "key": 1,
+    "key_size": 2,
+    "value_size": 3,
+    "op": 5,
+}
+
+
+def _split_line(line: str) -> List[str]:
+    if "," in line:
+        return line.rstrip("\n").split(",")
+    return line.split()
+
+
+class KeyTable:
+    """The distinct keys of a trace being converted, written to out as they
+    are first seen, each NUL-terminated."""
+
+    def __init__(self, out):
+        self.out = out
+        self.offsets = {}
+        self.size = 0
+
+    def offset(self, key: str) -> int:
+        offset = self.offsets.get(key)
+        if offset is None:
+            data = key.encode() + b"\0"
+            offset = self.size
+            self.offsets[key] = offset
+            self.out.write(data)
+            self.size += len(data)
+        return offset
+
+
+def parse_records(
+    lines: List[str], fields: Dict[str, int], prev_timestamp: int, keys: KeyTable
+) -> Tuple[np.ndarray, int]:
+    """Convert trace lines into records, adding their keys to keys. Returns
+    the records and the timestamp of the last one, to delta-encode the next
+    chunk."""
+    key_offsets = []
+    value_sizes = []
+    timestamps = []
+    key_sizes = []
+    ops = []
+    for line in lines:
+        parts = _split_line(line)
+        if not parts or not parts[0]:
+            continue
+        if len(parts) <= max(fields.values()):
+            raise Exception("Unexpected trace line: %s" % line.rstrip("\n"))
+        op = parts[fields["op"]].lower()
+        if op not in TRACE_OP_CODES:
+            raise Exception("Unknown trace operation: %s" % op)
+        key_offsets.append(keys.offset(parts[fields["key"]]))
+        value_sizes.append(int(parts[fields["value_size"]]))
+        timestamps.append(int(parts[fields["timestamp"]]))
+        key_sizes.append(int(parts[fields["key_size"]]))
+        ops.append(TRACE_OP_CODES[op])
+    records = np.zeros(len(ops), dtype=RECORD_DTYPE)
+    if not ops:
+        return records, prev_timestamp
+    timestamps = np.array(timestamps, dtype=np.int64)
+    deltas = np.diff(timestamps, prepend=prev_timestamp)
+    records["key_offset"] = np.array(key_offsets, dtype=np.uint64)
+    records["value_size"] = value_sizes
+    records["timestamp_delta"] = np.clip(deltas, 0, 0xFFFF)
+    records["key_size"] = np.minimum(key_sizes, 0xFF)
+    records["op"] = ops
+    return records, int(timestamps[-1])
+
+
+def _first_timestamp(trace_path: str, fields: Dict[str, int]) -> int:
+    with open(trace_path, "r") as f:
+        for line in f:
+            parts = _split_line(line)
+            if parts and parts[0]:
+                return int(parts[fields["timestamp"]])
+    raise Exception("Empty trace: %s" % trace_path)
+
+
+def convert_trace(
+    trace_path: str,
+    output_path: str,
+    compress: bool = False,
+    fields: Dict[str, int] = TWITTER_FIELDS,
+) -> Dict:
+    """Stream a text trace into a binary trace and return its header.
+
+    Memory use is bounded by CHUNK_RECORDS and the offsets of the distinct
+    keys, independent of the number of requests. The key table is spooled to
+    a temporary file and appended after the records. The output is written
+    to a temporary file and renamed, so a partial conversion is never
+    mistaken for a complete one."""
+    start = time()
+    start_timestamp = _first_timestamp(trace_path, fields)
+    prev_timestamp = start_timestamp
+    nr_records = 0
+    compressor = zlib.compressobj() if compress else None
+    # A unique temporary file, as concurrent slots may convert the same trace
+    fd, temp_path = tempfile.mkstemp(
+        prefix=os.path.basename(output_path) + ".",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(output_path)),
+    )
+    try:
+        with os.fdopen(fd, "wb") as out, open(
+            trace_path, "r"
+        ) as trace, tempfile.TemporaryFile(dir=os.path.dirname(temp_path)) as spool:
+            keys = KeyTable(spool)
+            out.write(b"\0" * HEADER_SIZE)
+            while True:
+                # Twitter trace lines are ~64 bytes long
+                lines = trace.readlines(CHUNK_RECORDS * 64)
+                if not lines:
+                    break
+                records, prev_timestamp = parse_records(
+                    lines, fields, prev_timestamp, keys
+                )
+                data = records.tobytes()
+                out.write(compressor.compress(data) if compressor else data)
+                nr_records += len(records)
+            if compressor:
+                out.write(compressor.flush())
+            key_table_offset = out.tell()
+            spool.seek(0)
+            if compressor:
+                compressor = zlib.compressobj()
+                while True:
+                    data = spool.read(CHUNK_RECORDS)
+                    if not data:
+                        break
+                    out.write(compressor.compress(data))
+                out.write(compressor.flush())
+            else:
+                shutil.copyfileobj(spool, out)
+            header = {
+                "version": BINARY_TRACE_VERSION,
+                "flags": FLAG_COMPRESSED if compress else 0,
+                "record_size": RECORD_DTYPE.itemsize,
+                "nr_records": nr_records,
+                "start_timestamp": start_timestamp,
+                "key_table_offset": key_table_offset,
+                "key_table_size": keys.size,
+            }
+            out.seek(0)
+            out.write(
+                struct.pack(
+                    HEADER_FORMAT,
+                    BINARY_TRACE_MAGIC,
+                    header["version"],
+                    header["flags"],
+                    header["record_size"],
+                    0,
+                    header["nr_records"],
+                    header["start_timestamp"],
+                    header["key_table_offset"],
+                    header["key_table_size"],
+                )
+            )
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, output_path)
+    log.info(
+        "Converted %s (%s) to %s (%s): %d records, %d keys, %.1fs",
+        trace_path,
+        format_bytes_str(os.path.getsize(trace_path)),
+        output_path,
+        format_bytes_str(os.path.getsize(output_path)),
+        nr_records,
+        len(keys.offsets),
+        time() - start,
+    )
+    return header
+
+
+def read_header(path: str) -> Dict:
+    with open(path, "rb") as f:
+        data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise Exception("Truncated binary trace: %s" % path)
+    (
+        magic,
+        version,
+        flags,
+        record_size,
+        _,
+        nr_records,
+        start_timestamp,
+        key_table_offset,
+        key_table_size,
+    ) = struct.unpack(HEADER_FORMAT, data)
+    if magic != BINARY_TRACE_MAGIC:
+        raise Exception("Not a binary trace: %s" % path)
+    if version != BINARY_TRACE_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise Exception(
+            "Unsupported binary trace version %d (record size %d): %s"
+            % (version, record_size, path)
+        )
+    return {
+        "version": version,
+        "flags": flags,
+        "record_size": record_size,
+        "nr_records": nr_records,
+        "start_timestamp": start_timestamp,
+        "key_table_offset": key_table_offset,
+        "key_table_size": key_table_size,
+    }
+
+
+def iter_binary_trace(path: str) -> Iterator[np.ndarray]:
+    """Yield the records of a binary trace in chunks, reading compressed
+    traces incrementally."""
+    header = read_header(path)
+    if not header["flags"] & FLAG_COMPRESSED:
+        records = load_binary_trace(path)
+        for start in range(0, len(records), CHUNK_RECORDS):
+            yield records[start : start + CHUNK_RECORDS]
+        return
+    chunk_bytes = CHUNK_RECORDS * RECORD_DTYPE.itemsize
+    decompressor = zlib.decompressobj()
+    pending = b""
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        remaining = header["key_table_offset"] - HEADER_SIZE
+        while remaining:
+            data = f.read(min(chunk_bytes, remaining))
+            remaining -= len(data)
+            if not data:
+                break
+            pending += decompressor.decompress(data)
+            usable = len(pending) - len(pending) % RECORD_DTYPE.itemsize
+            if usable:
+                yield np.frombuffer(pending[:usable], dtype=RECORD_DTYPE)
+                pending = pending[usable:]
+    pending += decompressor.flush()
+    if pending:
+        yield np.frombuffer(pending, dtype=RECORD_DTYPE)
+
+
+def load_binary_trace(path: str) -> np.ndarray:
+    """Records of a binary trace. Uncompressed traces are mmapped, not read."""
+    header = read_header(path)
+    if header["flags"] & FLAG_COMPRESSED:
+        chunks = list(iter_binary_trace(path))
+        if not chunks:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.concatenate(chunks)
+    if header["nr_records"] == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(
+        path,
+        dtype=RECORD_DTYPE,
+        mode="r",
+        offset=HEADER_SIZE,
+        shape=(header["nr_records"],),
+    )
+
+
+def load_key_table(path: str) -> bytes:
+    """The key table of a binary trace, see record_key()."""
+    header = read_header(path)
+    with open(path, "rb") as f:
+        f.seek(header["key_table_offset"])
+        data = f.read()
+    if header["flags"] & FLAG_COMPRESSED:
+        data = zlib.decompress(data)
+    if len(data) != header["key_table_size"]:
+        raise Exception("Truncated binary trace key table: %s" % path)
+    return data
+
+
+def record_key(key_table: bytes, key_offset: int) -> str:
+    """The key of a record, from its key_offset."""
+    return key_table[key_offset : key_table.index(b"\0", key_offset)].decode()
+
+
+def binary_trace_file(trace_path: str) -> str:
+    return os.path.splitext(trace_path)[0] + BINARY_TRACE_SUFFIX
+
+
+def ensure_binary_trace(trace_path: str, compress: bool = False) -> str:
+    """Path of the binary version of a text trace, next to it, converting it
+    only if it is missing or older than the text trace."""
+    binary_path = binary_trace_file(trace_path)
+    if os.path.exists(binary_path) and os.path.getmtime(
+        binary_path
+    ) >= os.path.getmtime(trace_path):
+        try:
+            header = read_header(binary_path)
+        except Exception as e:
+            # E.g. written by an older version of the format
+            log.info("Converting %s again: %s", trace_path, e)
+        else:
+            if bool(header["flags"] & FLAG_COMPRESSED) == compress:
+                log.info("Reusing binary trace %s", binary_path)
+                return binary_path
+    convert_trace(trace_path, binary_path, compress)
+    return binary_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Convert a text key-value trace into a binary trace",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--trace", type=str, required=True, help="Text trace file")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="",
+        help="Binary trace file. Default is the trace with a %s suffix"
+        % BINARY_TRACE_SUFFIX,
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        default=False,
+        help="zlib-compress the records. Compressed traces cannot be mmapped.",
+    )
+    for field, idx in TWITTER_FIELDS.items():
+        parser.add_argument(
+            "--%s-field" % field.replace("_", "-"),
+            type=int,
+            default=idx,
+            help="Index of the %s in each trace line" % field.replace("_", " "),
+        )
+    args = parser.parse_args()
+    fields = {field: getattr(args, "%s_field" % field) for field in TWITTER_FIELDS}
+    convert_trace(
+        args.trace,
+        args.output or binary_trace_file(args.trace),
+        args.compress,
+        fields,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,713 @@
+"""Offline page cache simulator that mirrors the cache_ext eBPF policies.
+
+Each policy class re-implements the logic of the corresponding
+`policies/cache_ext_*.bpf.c` program on top of the same primitives the kernel
+exposes (lists with head/tail insertion, iteration from the head, random
+sampling). The simulator drives them with the same hooks the kernel calls:
+`folio_added` on a miss, `folio_accessed` on every access and `evict_folios`
+when the cgroup is full.
+
+Traces are sequences of integer page keys (see `load_trace`).
+"""
+
+import logging
+import random
+from collections import OrderedDict
+from time import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 4096
+# Kernel reclaim batch size (SWAP_CLUSTER_MAX)
+DEFAULT_EVICT_BATCH = 32
+
+
+def load_trace(path: str) -> np.ndarray:
+    """Load a page access trace as an array of uint64 page keys.
+
+    Supported formats:
+        - .npy: a 1-D array of page keys.
+        - text: one access per line, either "<key>" or "<inode> <page index>"
+          (whitespace or comma separated).
+    """
+    if path.endswith(".npy"):
+        return np.load(path).astype(np.uint64)
+    keys = []
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.replace(",", " ").split()
+            if not parts:
+                continue
+            if len(parts) == 1:
+                keys.append(int(parts[0]))
+            else:
+                keys.append((int(parts[0]) << 32) | int(parts[1]))
+    return np.array(keys, dtype=np.uint64)
+
+
+class SampledList:
+    """List supporting O(1) insertion, removal and uniform random sampling.
+
+    Models a cache_ext list that is only ever used with
+    bpf_cache_ext_list_sample(), so ordering does not matter.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, key):
+        self.index[key] = len(self.items)
+        self.items.append(key)
+
+    def remove(self, key):
+        idx = self.index.pop(key)
+        last = self.items.pop()
+        if idx < len(self.items):
+            self.items[idx] = last
+            self.index[last] = idx
+
+    def sample(self, rng: random.Random, n: int) -> List:
+        if n >= len(self.items):
+            return list(self.items)
+        return rng.sample(self.items, n)
+
+
+class CachePolicy:
+    """Base class for simulated policies. Mirrors struct cache_ext_ops."""
+
+    name = None
+
+    def __init__(self, cache_pages: int, seed: int = 0):
+        self.cache_pages = cache_pages
+        self.rng = random.Random(seed)
+
+    def folio_added(self, key):
+        raise NotImplementedError
+
+    def folio_accessed(self, key):
+        pass
+
+    def folio_evicted(self, key):
+        pass
+
+    def evict_folios(self, nr: int) -> List:
+        raise NotImplementedError
+
+    def _sample_evict(self, sampled: SampledList, nr: int, sample_size: int, score_fn):
+        """Mirror bpf_cache_ext_list_sample(): evict the lowest scores."""
+        candidates = sampled.sample(self.rng, sample_size * nr)
+        candidates.sort(key=score_fn)
+        return candidates[:nr]
+
+
+class FifoPolicy(CachePolicy):
+    """cache_ext_fifo: add to tail, evict from head."""
+
+    name = "fifo"
+
+    def __init__(self, cache_pages: int, seed: int = 0):
+        super().__init__(cache_pages, seed)
+        self.main_list = OrderedDict()
+
+    def folio_added(self, key):
+        self.main_list[key] = None
+
+    def folio_evicted(self, key):
+        del self.main_list[key]
+
+    def evict_folios(self, nr: int) -> List:
+        victims = []
+        for key in self.main_list:
+            victims.append(key)
+            if len(victims) == nr:
+                break
+        return victims
+
+
+class MruPolicy(CachePolicy):
+    """cache_ext_mru: add and move to head, evict from head."""
+
+    name = "mru"
+
+    def __init__(self, cache_pages: int, seed: int = 0):
+        super().__init__(cache_pages, seed)
+        self.mru_list = OrderedDict()
+
+    def folio_added(self, key):
+        self.mru_list[key] = None
+        self.mru_list.move_to_end(key, last=False)
+
+    def folio_accessed(self, key):
+        self.mru_list.move_to_end(key, last=False)
+
+    def folio_evicted(self, key):
+        del self.mru_list[key]
+
+    def evict_folios(self, nr: int) -> List:
+        victims = []
+        for key in self.mru_list:
+            victims.append(key)
+            if len(victims) == nr:
+                break
+        return victims
+
+
+class SamplingPolicy(CachePolicy):
+    """cache_ext_sampling: sampled LFU."""
+
+    name = "sampling"
+
+    def __init__(self, cache_pages: int, seed: int = 0, sample_size: int = 20):
+        super().__init__(cache_pages, seed)
+        self.sample_size = sample_size
+        self.sampling_list = SampledList()
+        self.accesses = {}
+
+    def folio_added(self, key):
+        self.sampling_list.add(key)
+        self.accesses[key] = 1
+
+    def folio_accessed(self, key):
+        self.accesses[key] += 1
+
+    def folio_evicted(self, key):
+        self.sampling_list.remove(key)
+        del self.accesses[key]
+
+    def evict_folios(self, nr: int) -> List:
+        return self._sample_evict(
+            self.sampling_list, nr, self.sample_size, self.accesses.__getitem__
+        )
+
+
+class S3FifoPolicy(CachePolicy):
+    """cache_ext_s3fifo: small FIFO, main FIFO with reinsertion and a ghost."""
+
+    name = "s3fifo"
+
+    def __init__(
+        self,
+        cache_pages: int,
+        seed: int = 0,
+        small_queue_divisor: int = 15,
+        max_freq: int = 3,
+    ):
+        super().__init__(cache_pages, seed)
+        self.small_queue_divisor = small_queue_divisor
+        self.max_freq = max_freq
+        self.small_list = OrderedDict()
+        self.main_list = OrderedDict()
+        # key -> [freq, in_main]
+        self.metadata = {}
+        # Sized to the cache size, like the loader does
+        self.ghost_map = OrderedDict()
+        self.small_list_size = 0
+        self.main_list_size = 0
+
+    def _ghost_insert(self, key):
+        self.ghost_map[key] = None
+        self.ghost_map.move_to_end(key)
+        if len(self.ghost_map) > self.cache_pages:
+            self.ghost_map.popitem(last=False)
+
+    def folio_added(self, key):
+        if self.ghost_map.pop(key, False) is None:
+            self.main_list[key] = None
+            self.metadata[key] = [0, True]
+            self.main_list_size += 1
+        else:
+            self.small_list[key] = None
+            self.metadata[key] = [0, False]
+            self.small_list_size += 1
+
+    def folio_accessed(self, key):
+        data = self.metadata[key]
+        data[0] += 1
+        if data[0] > self.max_freq:
+            data[0] = self.max_freq
+
+    def folio_evicted(self, key):
+        self._ghost_insert(key)
+        data = self.metadata.pop(key)
+        if data[1]:
+            self.main_list_size -= 1
+        else:
+            self.small_list_size -= 1
+
+    def _evict_small(self, nr: int) -> List:
+        victims = []
+        nr_continue = 0
+        for _ in range(len(self.small_list)):
+            if len(victims) == nr:
+                break
+            key = next(iter(self.small_list))
+            data = self.metadata[key]
+            if data[0] > 1:
+                data[1] = True
+                del self.small_list[key]
+                self.main_list[key] = None
+                nr_continue += 1
+            else:
+                del self.small_list[key]
+                victims.append(key)
+        self.small_list_size = max(self.small_list_size - nr_continue, 0)
+        self.main_list_size += nr_continue
+        return victims
+
+    def _evict_main_iter(self, nr: int) -> List:
+        victims = []
+        for threshold in range(4):
+            for _ in range(len(self.main_list)):
+                if len(victims) == nr:
+                    return victims
+                key = next(iter(self.main_list))
+                data = self.metadata[key]
+                data[0] -= 1
+                if data[0] < threshold:
+                    del self.main_list[key]
+                    victims.append(key)
+                else:
+                    self.main_list.move_to_end(key)
+            if len(victims) == nr:
+                break
+        return victims
+
+    def evict_folios(self, nr: int) -> List:
+        cache_size = self.cache_pages
+        if (
+            self.small_list_size >= cache_size // self.small_queue_divisor
+            or self.main_list_size <= 2 * self.small_list_size
+        ):
+            return self._evict_small(nr)
+        return self._evict_main_iter(nr)
+
+
+# LHD constants, see policies/cache_ext_lhd.bpf.h
+HIT_AGE_CLASSES = 16
+INITIAL_AGE_COARSENING_SHIFT = 10
+REQS_PER_RECONFIG = 1 << 20
+MAX_AGE = 1 << 14
+DEFAULT_APP_ID = 1
+HIT_SCALING_FACTOR = 1 << 20
+HIT_DENSITY_SCALING_FACTOR = 1 << 20
+NUM_OBJECTS_SCALING_FACTOR = 1 << 20
+TOTAL_EVENTS_THRESH = HIT_SCALING_FACTOR // 100000
+AGE_COARSENING_ERROR_TOLERANCE = 100
+
+
+class LhdPolicy(CachePolicy):
+    """cache_ext_lhd: Least Hit Density.
+
+    Only the classes of DEFAULT_APP_ID are modelled, as the eBPF policy never
+    assigns folios to any other app.
+    """
+
+    name = "lhd"
+
+    def __init__(
+        self,
+        cache_pages: int,
+        seed: int = 0,
+        sample_size: int = 16,
+        reqs_per_reconfig: int = REQS_PER_RECONFIG,
+    ):
+        super().__init__(cache_pages, seed)
+        self.sample_size = sample_size
+        self.reqs_per_reconfig = reqs_per_reconfig
+        self.next_reconfiguration = reqs_per_reconfig
+        self.num_reconfigurations = 0
+        self.age_coarsening_shift = INITIAL_AGE_COARSENING_SHIFT
+        self.ewma_num_objects = 0
+        self.ewma_num_objects_mass = 0
+        self.timestamp = 0
+        self.num_objects = 0
+        self.lhd_list = SampledList()
+        # key -> [last_access_time, last_hit_age, last_last_hit_age]
+        self.metadata = {}
+        self.hits = np.zeros((HIT_AGE_CLASSES, MAX_AGE), dtype=np.uint64)
+        self.evictions = np.zeros((HIT_AGE_CLASSES, MAX_AGE), dtype=np.uint64)
+        class_ids = DEFAULT_APP_ID * HIT_AGE_CLASSES + np.arange(HIT_AGE_CLASSES)
+        ages = np.arange(MAX_AGE)
+        self.hit_densities = (
+            HIT_DENSITY_SCALING_FACTOR * (class_ids[:, None] + 1) // (ages[None, :] + 1)
+        ).astype(np.uint64)
+
+    @staticmethod
+    def _hit_age_to_class(hit_age: int) -> int:
+        cls = 0
+        if hit_age == 0:
+            return 0
+        while hit_age < MAX_AGE and cls < HIT_AGE_CLASSES - 1:
+            hit_age <<= 1
+            cls += 1
+        return cls
+
+    def _get_class(self, data) -> int:
+        return self._hit_age_to_class(data[1] + data[2])
+
+    def _get_age(self, data) -> int:
+        age = (self.timestamp - data[0]) >> self.age_coarsening_shift
+        return min(age, MAX_AGE - 1)
+
+    def _get_hit_density(self, key) -> int:
+        data = self.metadata[key]
+        age = self._get_age(data)
+        if age == MAX_AGE - 1:
+            return 0
+        return int(self.hit_densities[self._get_class(data), age])
+
+    def _tick(self):
+        self.timestamp += 1
+        self.next_reconfiguration -= 1
+        if self.next_reconfiguration == 0:
+            self.next_reconfiguration = self.reqs_per_reconfig
+            self.num_reconfigurations += 1
+            self._reconfigure()
+
+    def _reconfigure(self):
+        # update_class()
+        self.hits = self.hits * 9 // 10
+        self.evictions = self.evictions * 9 // 10
+        self._adapt_age_coarsening()
+        self._model_hit_density()
+
+    def _adapt_age_coarsening(self):
+        self.ewma_num_objects = self.ewma_num_objects * 9 // 10
+        self.ewma_num_objects_mass = self.ewma_num_objects_mass * 9 // 10
+        self.ewma_num_objects += self.num_objects * NUM_OBJECTS_SCALING_FACTOR
+        self.ewma_num_objects_mass += 1
+        num_objects_coarsening = self.ewma_num_objects // self.ewma_num_objects_mass
+        optimal_age_coarsening = (
+            num_objects_coarsening * AGE_COARSENING_ERROR_TOLERANCE // MAX_AGE
+        )
+        if self.num_reconfigurations not in (5, 25):
+            return
+        log2 = 1
+        while (1 << log2) * NUM_OBJECTS_SCALING_FACTOR < optimal_age_coarsening:
+            log2 += 1
+        delta = log2 - self.age_coarsening_shift
+        self.age_coarsening_shift = log2
+        self.ewma_num_objects *= 8
+        self.ewma_num_objects_mass *= 8
+        if delta < 0:
+            self._stretch_distribution(-delta)
+        elif delta > 0:
+            self._compress_distribution(delta)
+
+    def _stretch_distribution(self, shift: int):
+        # Sequential on purpose: mirrors the in-place loop of the eBPF policy.
+        init_age = MAX_AGE >> shift
+        for cls in range(HIT_AGE_CLASSES):
+            hits = self.hits[cls]
+            evictions = self.evictions[cls]
+            hits[MAX_AGE - 1] += hits[init_age : MAX_AGE - 1].sum(dtype=np.uint64)
+            if init_age < MAX_AGE - 1:
+                evictions[MAX_AGE - 1] = evictions[MAX_AGE - 2]
+            for j in range(2, MAX_AGE + 1):
+                index = MAX_AGE - j
+                src = (j >> shift) & (MAX_AGE - 1)
+                hits[index] = hits[src] // (1 << shift)
+                evictions[index] = evictions[src] // (1 << shift)
+
+    def _compress_distribution(self, shift: int):
+        width = MAX_AGE >> shift
+        for arr in (self.hits, self.evictions):
+            arr[:, :width] = arr.reshape(HIT_AGE_CLASSES, width, 1 << shift).sum(
+                axis=2, dtype=np.uint64
+            )
+            arr[:, width : MAX_AGE - 1] = 0
+
+    def _model_hit_density(self):
+        # Accumulate from the oldest age downwards, like model_hit_density().
+        hits = self.hits[:, ::-1].astype(np.float64)
+        evictions = self.evictions[:, ::-1].astype(np.float64)
+        total_hits = np.cumsum(hits, axis=1)
+        total_events = total_hits + np.cumsum(evictions, axis=1)
+        lifetime = np.cumsum(total_events, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            density = np.floor(total_hits * HIT_DENSITY_SCALING_FACTOR / lifetime)
+        density = np.where(total_events > TOTAL_EVENTS_THRESH, density, 0)
+        # Index MAX_AGE - 1 is never assigned by the eBPF policy
+        self.hit_densities[:, : MAX_AGE - 1] = density[:, 1:][:, ::-1].astype(np.uint64)
+
+    def folio_added(self, key):
+        self.lhd_list.add(key)
+        self.metadata[key] = [self.timestamp, 0, MAX_AGE]
+        self.num_objects += 1
+        self._tick()
+
+    def folio_accessed(self, key):
+        data = self.metadata[key]
+        age = self._get_age(data)
+        cls = self._get_class(data)
+        data[2] = data[1]
+        data[1] = age
+        data[0] = self.timestamp
+        self.hits[cls, age] += HIT_SCALING_FACTOR
+        self._tick()
+
+    def folio_evicted(self, key):
+        data = self.metadata.pop(key)
+        self.lhd_list.remove(key)
+        age = self._get_age(data)
+        self.evictions[self._get_class(data), age] += HIT_SCALING_FACTOR
+        self.num_objects -= 1
+
+    def evict_folios(self, nr: int) -> List:
+        return self._sample_evict(
+            self.lhd_list, nr, self.sample_size, self._get_hit_density
+        )
+
+
+# MGLRU constants, see policies/cache_ext_mglru.bpf.c
+MAX_NR_TIERS = 4
+MIN_NR_GENS = 2
+MAX_NR_GENS = 4
+MIN_LRU_BATCH = 64
+MAX_NR_GHOST_ENTRIES = 400000
+
+
+def _lru_tier_from_refs(refs: int) -> int:
+    if refs <= 1:
+        return 0
+    elif refs <= 3:
+        return 1
+    elif refs <= 7:
+        return 2
+    return 3
+
+
+class MglruPolicy(CachePolicy):
+    """cache_ext_mglru: generations, tiers and the refault PID controller."""
+
+    name = "mglru"
+
+    def __init__(self, cache_pages: int, seed: int = 0):
+        super().__init__(cache_pages, seed)
+        self.max_seq = MIN_NR_GENS + 1
+        self.min_seq = 0
+        self.evicted = [0] * MAX_NR_TIERS
+        self.refaulted = [0] * MAX_NR_TIERS
+        self.avg_refaulted = [0] * MAX_NR_TIERS
+        self.avg_total = [0] * MAX_NR_TIERS
+        self.protected = [0] * (MAX_NR_TIERS - 1)
+        self.nr_pages = [0] * MAX_NR_GENS
+        self.lists = [OrderedDict() for _ in range(MAX_NR_GENS)]
+        # key -> [accesses, gen]
+        self.metadata = {}
+        self.ghost_map = OrderedDict()
+
+    def _nr_pages(self, gen: int) -> int:
+        return max(0, self.nr_pages[gen])
+
+    def _reset_ctrl_pos(self, carryover: bool):
+        if not carryover:
+            return
+        for tier in range(MAX_NR_TIERS):
+            self.avg_refaulted[tier] = (
+                self.avg_refaulted[tier] + self.refaulted[tier]
+            ) // 2
+            total = self.avg_total[tier] + self.evicted[tier]
+            if tier:
+                total += self.protected[tier - 1]
+            self.avg_total[tier] = total // 2
+            self.refaulted[tier] = 0
+            self.evicted[tier] = 0
+            if tier:
+                self.protected[tier - 1] = 0
+
+    def _ctrl_pos(self, tier: int, gain: int):
+        refaulted = self.avg_refaulted[tier] + self.refaulted[tier]
+        total = self.avg_total[tier] + self.evicted[tier]
+        if tier:
+            total += self.protected[tier - 1]
+        return refaulted, total, gain
+
+    def _get_tier_idx(self) -> int:
+        sp_refaulted, sp_total, sp_gain = self._ctrl_pos(0, 1)
+        tier = 1
+        while tier < MAX_NR_TIERS:
+            pv_refaulted, pv_total, pv_gain = self._ctrl_pos(tier, 2)
+            positive = (
+                pv_refaulted < MIN_LRU_BATCH
+                or pv_refaulted * (sp_total + MIN_LRU_BATCH) * sp_gain
+                <= (sp_refaulted + 1) * pv_total * pv_gain
+            )
+            if not positive:
+                break
+            tier += 1
+        return tier - 1
+
+    def _should_run_aging(self, max_seq: int) -> bool:
+        min_seq = self.min_seq
+        if min_seq + MIN_NR_GENS > max_seq:
+            return True
+        old = young = total = 0
+        for i in range(min(MAX_NR_GENS, max_seq - min_seq)):
+            seq = min_seq + i
+            size = self._nr_pages(seq % MAX_NR_GENS)
+            total += size
+            if seq == max_seq:
+                young += size
+            elif seq + MIN_NR_GENS == max_seq:
+                old += size
+        if min_seq + MIN_NR_GENS < max_seq:
+            return False
+        if young * MIN_NR_GENS > total:
+            return True
+        if old * (MIN_NR_GENS + 2) < total:
+            return True
+        return False
+
+    def _try_to_inc_min_seq(self) -> bool:
+        if self._nr_pages(self.min_seq % MAX_NR_GENS) > 4:
+            return False
+        self.min_seq += 1
+        self._reset_ctrl_pos(True)
+        return True
+
+    def _try_to_inc_max_seq(self) -> bool:
+        if self.max_seq - self.min_seq + 1 == MAX_NR_GENS:
+            if not self._try_to_inc_min_seq():
+                return False
+        self.max_seq += 1
+        return True
+
+    def folio_added(self, key):
+        min_seq, max_seq = self.min_seq, self.max_seq
+        # The metadata of a new folio never exists yet, so it is never active.
+        if min_seq + MIN_NR_GENS >= max_seq:
+            seq = min_seq
+        else:
+            seq = min_seq + 1
+        gen = seq % MAX_NR_GENS
+        self.metadata[key] = [1, gen]
+        self.nr_pages[gen] += 1
+        tier = self.ghost_map.pop(key, None)
+        if tier is not None:
+            self.refaulted[tier] += 1
+        lst = self.lists[gen]
+        lst[key] = None
+        lst.move_to_end(key, last=False)
+
+    def folio_accessed(self, key):
+        self.metadata[key][0] += 1
+
+    def folio_evicted(self, key):
+        accesses, gen = self.metadata.pop(key)
+        tier = _lru_tier_from_refs(accesses)
+        self.ghost_map[key] = tier
+        self.ghost_map.move_to_end(key)
+        if len(self.ghost_map) > MAX_NR_GHOST_ENTRIES:
+            self.ghost_map.popitem(last=False)
+        self.evicted[tier] += 1
+        self.nr_pages[gen] -= 1
+
+    def _iterate(
+        self, oldest_gen: int, next_gen: int, threshold: int, nr: int, victims
+    ):
+        oldest_list = self.lists[oldest_gen]
+        next_list = self.lists[next_gen]
+        for _ in range(len(oldest_list)):
+            if len(victims) == nr:
+                return
+            key = next(iter(oldest_list))
+            meta = self.metadata[key]
+            tier = _lru_tier_from_refs(meta[0])
+            if tier > threshold:
+                self.protected[tier - 1] += 1
+                self.nr_pages[oldest_gen] -= 1
+                self.nr_pages[next_gen] += 1
+                meta[1] = next_gen
+                del oldest_list[key]
+                next_list[key] = None
+            else:
+                del oldest_list[key]
+                victims.append(key)
+
+    def evict_folios(self, nr: int) -> List:
+        min_seq, max_seq = self.min_seq, self.max_seq
+        if self._should_run_aging(max_seq):
+            self._try_to_inc_max_seq()
+        if max_seq - min_seq > MIN_NR_GENS:
+            self._try_to_inc_min_seq()
+        oldest_gen = self.min_seq % MAX_NR_GENS
+        next_gen = (oldest_gen + 1) % MAX_NR_GENS
+        threshold = self._get_tier_idx()
+        victims = []
+        self._iterate(oldest_gen, next_gen, threshold, nr, victims)
+        if len(victims) < nr:
+            self._iterate(oldest_gen, next_gen, threshold, nr, victims)
+        return victims
+
+
+POLICIES = {
+    cls.name: cls
+    for cls in [
+        FifoPolicy,
+        MruPolicy,
+        SamplingPolicy,
+        S3FifoPolicy,
+        LhdPolicy,
+        MglruPolicy,
+    ]
+}
+
+
+def policy_loader_name(policy: str) -> str:
+    """Name of the loader binary a simulated policy corresponds to."""
+    return "cache_ext_%s.out" % policy
+
+
+def simulate(
+    policy: CachePolicy,
+    trace: Iterable,
+    evict_batch: int = DEFAULT_EVICT_BATCH,
+    mark_accessed_on_miss: bool = True,
+) -> Dict:
+    """Replay a trace against a policy and return hit/miss counts.
+
+    Like the kernel, a folio brought in by a miss is also marked accessed by
+    the read path, unless mark_accessed_on_miss is False.
+    """
+    resident = set()
+    cache_pages = policy.cache_pages
+    hits = misses = evictions = failed_evictions = 0
+    start = time()
+    for key in trace:
+        key = int(key)
+        if key in resident:
+            hits += 1
+            policy.folio_accessed(key)
+            continue
+        misses += 1
+        if len(resident) >= cache_pages:
+            victims = policy.evict_folios(evict_batch)
+            if not victims:
+                failed_evictions += 1
+            for victim in victims:
+                resident.discard(victim)
+                policy.folio_evicted(victim)
+            evictions += len(victims)
+        resident.add(key)
+        policy.folio_added(key)
+        if mark_accessed_on_miss:
+            policy.folio_accessed(key)
+    accesses = hits + misses
+    return {
+        "accesses": accesses,
+        "hits": hits,
+        "misses": misses,
+        "evictions": evictions,
+        "failed_evictions": failed_evictions,
+        "hit_ratio": hits / accesses if accesses else 0.0,
+        "miss_ratio": misses / accesses if accesses else 0.0,
+        "sim_runtime_sec": time() - start,
+    }
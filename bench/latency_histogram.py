@@ -0,0 +1,291 @@
+"""Mergeable, log-bucketed latency histograms (HDR-style).
+
+Values below 2 * SUB_BUCKETS are counted exactly. Above that, every power of
+two is split into SUB_BUCKETS linear sub-buckets, so a bucket is at most
+1 / SUB_BUCKETS (~3%) wider than its lower bound. Histograms with the same
+layout merge by adding counts, which gives exact cross-iteration percentiles
+(up to the bucket resolution), unlike averaging per-run percentiles.
+
+Histograms are stored sparsely in the results JSON:
+    {"sub_bucket_bits": 5, "buckets": [...], "counts": [...]}
+
+My-YCSB prints one line per op type and time window (the overall run is
+window "overall", other windows are identified by their start in seconds):
+    Run histogram: op=READ window=10.0 ns=1024:3,1056:40,...
+where each pair is a bucket lower bound in ns and its count. The pairs are
+re-bucketed on parsing, so the emitter only needs a layout at least as fine
+as this one.
+
+Open-loop runs (set_open_loop_workload) issue requests at a target rate on a
+fixed timeline, whether or not earlier requests have completed. My-YCSB then
+also prints the latencies measured from each request's intended start time,
+as ops INTENDED_<OP>, e.g.:
+    Run histogram: op=INTENDED_READ window=overall ns=...
+A closed loop only measures service times: a stalled request delays the ones
+behind it, which are then never measured as slow (coordinated omission). The
+intended-time latencies count that delay, and add_open_loop_results() reports
+them as the run's latencies.
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+LATENCY_HISTOGRAM_WINDOW_SEC = 10
+TAIL_PERCENTILES = {"p999": 99.9, "p9999": 99.99}
+# Open-loop runs achieving less of their target rate are saturated
+OPEN_LOOP_SATURATION_RATIO = 0.95
+# Latency results replaced by their intended-time values in open-loop runs
+OPEN_LOOP_LATENCY_PERCENTILES = {"p99": 99, "p999": 99.9, "p9999": 99.99}
+# My-YCSB op name prefix of the intended-time latencies, in lower case
+INTENDED_OP_PREFIX = "intended_"
+
+HISTOGRAM_LINE_RE = re.compile(
+    r"histogram: op=(?P<op>\w+) window=(?P<window>\S+) ns=(?P<buckets>\S*)"
+)
+
+
+def bucket_index(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.int64)
+    # Exponent of a float64 is the bit length, exact below 2**53
+    bit_length = np.frexp(values.astype(np.float64))[1].astype(np.int64)
+    shift = np.maximum(bit_length - (SUB_BUCKET_BITS + 1), 0)
+    return np.where(
+        values < 2 * SUB_BUCKETS, values, shift * SUB_BUCKETS + (values >> shift)
+    )
+
+
+def bucket_lower_bound(idxs: np.ndarray) -> np.ndarray:
+    idxs = np.asarray(idxs, dtype=np.int64)
+    shift = np.maximum(idxs // SUB_BUCKETS - 1, 0)
+    return (idxs - shift * SUB_BUCKETS) << shift
+
+
+def bucket_upper_bound(idxs: np.ndarray) -> np.ndarray:
+    return bucket_lower_bound(np.asarray(idxs, dtype=np.int64) + 1)
+
+
+class LatencyHistogram(object):
+    def __init__(self, counts: Optional[np.ndarray] = None):
+        if counts is None:
+            counts = np.zeros(0, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def _grow(self, size: int):
+        if size > len(self.counts):
+            self.counts = np.pad(self.counts, (0, size - len(self.counts)))
+
+    def record(self, value: int, count: int = 1):
+        self.record_many([value], [count])
+
+    def record_many(self, values: Iterable[int], counts: Iterable[int] = None):
+        values = np.asarray(values, dtype=np.int64)
+        if len(values) == 0:
+            return
+        if values.min() < 0:
+            raise Exception("Negative latency value: %d" % values.min())
+        if counts is None:
+            counts = np.ones(len(values), dtype=np.int64)
+        idxs = bucket_index(values)
+        self._grow(int(idxs.max()) + 1)
+        np.add.at(self.counts, idxs, np.asarray(counts, dtype=np.int64))
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        self._grow(len(other.counts))
+        self.counts[: len(other.counts)] += other.counts
+        return self
+
+    def __add__(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        return LatencyHistogram(self.counts.copy()).merge(other)
+
+    def total_count(self) -> int:
+        return int(self.counts.sum())
+
+    def mean(self) -> float:
+        total = self.total_count()
+        if total == 0:
+            return float("nan")
+        idxs = np.arange(len(self.counts))
+        midpoints = (bucket_lower_bound(idxs) + bucket_upper_bound(idxs) - 1) / 2
+        return float(np.dot(self.counts, midpoints) / total)
+
+    def percentiles(self, percentiles: Iterable[float]) -> np.ndarray:
+        """Upper bound of the bucket holding each percentile, i.e. a value at
+        most one bucket width above the true percentile."""
+        percentiles = np.asarray(list(percentiles), dtype=np.float64)
+        total = self.total_count()
+        if total == 0:
+            return np.full(len(percentiles), np.nan)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(percentiles / 100 * total), 1)
+        idxs = np.searchsorted(cumulative, ranks)
+        return (bucket_upper_bound(idxs) - 1).astype(np.float64)
+
+    def percentile(self, percentile: float) -> float:
+        return float(self.percentiles([percentile])[0])
+
+    def cdf(self):
+        """(latency, cumulative fraction) at the upper bound of every
+        non-empty bucket."""
+        idxs = np.nonzero(self.counts)[0]
+        fractions = np.cumsum(self.counts[idxs]) / max(self.total_count(), 1)
+        return bucket_upper_bound(idxs) - 1, fractions
+
+    def to_json(self) -> Dict:
+        idxs = np.nonzero(self.counts)[0]
+        return {
+            "sub_bucket_bits": SUB_BUCKET_BITS,
+            "buckets": idxs.tolist(),
+            "counts": self.counts[idxs].tolist(),
+        }
+
+    @staticmethod
+    def from_json(data: Dict) -> "LatencyHistogram":
+        if data["sub_bucket_bits"] != SUB_BUCKET_BITS:
+            raise Exception(
+                "Unsupported histogram layout: %d sub-bucket bits"
+                % data["sub_bucket_bits"]
+            )
+        histogram = LatencyHistogram()
+        if data["buckets"]:
+            histogram._grow(max(data["buckets"]) + 1)
+            histogram.counts[data["buckets"]] = data["counts"]
+        return histogram
+
+
+def merge_histograms(histograms: Iterable[LatencyHistogram]) -> LatencyHistogram:
+    merged = LatencyHistogram()
+    for histogram in histograms:
+        merged.merge(histogram)
+    return merged
+
+
+def parse_latency_histograms(stdout: str) -> Dict:
+    """Parse the My-YCSB histogram lines (see the module docstring) into
+    {op: {"overall": histogram JSON, "windows": [histogram JSON, ...]}}, with
+    op in lower case and windows sorted by their "start_sec". Warm-up lines
+    are skipped."""
+    histograms = {}
+    for line in stdout.splitlines():
+        if "Warm-Up" in line:
+            continue
+        match = HISTOGRAM_LINE_RE.search(line)
+        if match is None:
+            continue
+        histogram = LatencyHistogram()
+        pairs = [p.split(":") for p in match.group("buckets").split(",") if p]
+        if pairs:
+            values, counts = zip(*pairs)
+            histogram.record_many([int(v) for v in values], [int(c) for c in counts])
+        op_histograms = histograms.setdefault(
+            match.group("op").lower(), {"overall": None, "windows": []}
+        )
+        if match.group("window") == "overall":
+            op_histograms["overall"] = histogram.to_json()
+        else:
+            op_histograms["windows"].append(
+                {"start_sec": float(match.group("window")), **histogram.to_json()}
+            )
+    for op_histograms in histograms.values():
+        op_histograms["windows"].sort(key=lambda w: w["start_sec"])
+        if op_histograms["overall"] is None:
+            # Fall back to the sum of the windows
+            op_histograms["overall"] = merge_histograms(
+                LatencyHistogram.from_json(w) for w in op_histograms["windows"]
+            ).to_json()
+    return histograms
+
+
+def add_latency_histogram_results(results: Dict, stdout: str):
+    """Store the latency histograms of a run, if My-YCSB printed any, and
+    the tail percentiles (<op>_latency_p999, ...) derived from them."""
+    histograms = parse_latency_histograms(stdout)
+    if not histograms:
+        return
+    results["latency_histograms"] = histograms
+    for op, op_histograms in histograms.items():
+        histogram = LatencyHistogram.from_json(op_histograms["overall"])
+        if histogram.total_count() == 0:
+            continue
+        for name, percentile in TAIL_PERCENTILES.items():
+            results["%s_latency_%s" % (op, name)] = histogram.percentile(percentile)
+    for name in TAIL_PERCENTILES:
+        if "read_latency_" + name in results:
+            results["latency_" + name] = results["read_latency_" + name]
+
+
+def window_percentiles(op_histograms: Dict, percentile: float) -> List:
+    """(window start in seconds, percentile) of every window of an op."""
+    return [
+        (w["start_sec"], LatencyHistogram.from_json(w).percentile(percentile))
+        for w in op_histograms["windows"]
+    ]
+
+
+def set_open_loop_workload(bench_config: Dict, target_rate: int):
+    """Make a My-YCSB workload an open loop issuing target_rate requests per
+    second on a fixed timeline, measuring latencies from both the actual and
+    the intended start times. A target_rate of 0 keeps the closed loop."""
+    workload = bench_config["workload"]
+    if target_rate:
+        workload["target_rate"] = target_rate
+        workload["latency_measurement"] = "both"
+    else:
+        workload.pop("target_rate", None)
+        workload.pop("latency_measurement", None)
+
+
+def add_open_loop_results(results: Dict, target_rate: int):
+    """Record the offered and achieved rates of an open-loop run, and replace
+    the latencies of each op (<op>_latency_avg, <op>_latency_p99, ...) by its
+    intended-time latencies, corrected for coordinated omission. latency_*
+    follow the reads, as in closed-loop runs. The service times are kept as
+    service_<key>."""
+    achieved_rate = results.get("throughput_avg", 0.0)
+    results["offered_rate"] = target_rate
+    results["achieved_rate"] = achieved_rate
+    results["achieved_rate_ratio"] = achieved_rate / target_rate
+    results["saturated"] = results["achieved_rate_ratio"] < OPEN_LOOP_SATURATION_RATIO
+    if results["saturated"]:
+        log.warning(
+            "Open-loop run saturated: achieved %.0f of %d ops/sec",
+            achieved_rate,
+            target_rate,
+        )
+
+    histograms = {}
+    for op, op_histograms in results.get("latency_histograms", {}).items():
+        histogram = LatencyHistogram.from_json(op_histograms["overall"])
+        if histogram.total_count() > 0:
+            histograms[op] = histogram
+    ops = [op for op in histograms if not op.startswith(INTENDED_OP_PREFIX)]
+    if not ops:
+        raise Exception("No latency histograms in an open-loop run")
+    missing = [op for op in ops if INTENDED_OP_PREFIX + op not in histograms]
+    if missing:
+        raise Exception(
+            "No intended-time latencies for %s in an open-loop run" % ", ".join(missing)
+        )
+
+    names = ["avg"] + list(OPEN_LOOP_LATENCY_PERCENTILES)
+    for op in ops:
+        for name in names:
+            key = "%s_latency_%s" % (op, name)
+            if key in results:
+                results["service_" + key] = results[key]
+        histogram = histograms[INTENDED_OP_PREFIX + op]
+        results[op + "_latency_avg"] = histogram.mean()
+        for name, percentile in OPEN_LOOP_LATENCY_PERCENTILES.items():
+            results["%s_latency_%s" % (op, name)] = histogram.percentile(percentile)
+    if "read" in ops:
+        for name in names:
+            key = "latency_" + name
+            if key in results:
+                results["service_" + key] = results[key]
+            results[key] = results["read_" + key]
@@ -0,0 +1,166 @@
+"""Read the page cache access traces recorded by the policy loaders.
+
+A loader run with --page_trace (CacheExtPolicy(page_trace=...) or
+--page-trace-dir) writes a gzip stream of a 32 byte header and 24 byte
+records, see policies/cache_ext_trace.h:
+
+    timestamp_ns  u64  bpf_ktime_get_ns() of the event
+    ino           u64  inode number of the file
+    index         u32  page index in the file
+    op            u8   index in PAGE_TRACE_OPS
+    (3 bytes of padding)
+
+Records are written in per-CPU batches, so they are only ordered by timestamp
+after load_page_trace(). Page requests, i.e. the added (misses) and accessed
+(hits) events, can be written as a text trace of "timestamp ino:index" lines,
+e.g. for trace_mrc.py with --key-field 1.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import struct
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+PAGE_TRACE_MAGIC = b"CXPAGES\0"
+PAGE_TRACE_VERSION = 1
+PAGE_TRACE_SUFFIX = ".pgtrace.gz"
+
+# magic, version, record size, start timestamp
+HEADER_FORMAT = "<8sIIQ8x"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("timestamp_ns", "<u8"),
+        ("ino", "<u8"),
+        ("index", "<u4"),
+        ("op", "u1"),
+        ("pad", "V3"),
+    ]
+)
+
+PAGE_TRACE_OPS = ["added", "accessed", "evicted"]
+PAGE_TRACE_OP_CODES = {op: code for code, op in enumerate(PAGE_TRACE_OPS)}
+
+# Records decompressed at a time
+CHUNK_RECORDS = 1 << 20
+
+
+def _parse_header(data: bytes, path: str) -> Dict:
+    if len(data) < HEADER_SIZE:
+        raise Exception("Truncated page trace: %s" % path)
+    magic, version, record_size, start_ns = struct.unpack(HEADER_FORMAT, data)
+    if magic != PAGE_TRACE_MAGIC:
+        raise Exception("Not a page trace: %s" % path)
+    if version != PAGE_TRACE_VERSION or record_size != EVENT_DTYPE.itemsize:
+        raise Exception(
+            "Unsupported page trace version %d (record size %d): %s"
+            % (version, record_size, path)
+        )
+    return {"version": version, "record_size": record_size, "start_ns": start_ns}
+
+
+def iter_page_trace(path: str) -> Iterator[Tuple[Dict, np.ndarray]]:
+    """Yield (header, records) chunks of a page trace, in file order. A
+    truncated last record, e.g. of a loader that was killed, is dropped."""
+    chunk_bytes = CHUNK_RECORDS * EVENT_DTYPE.itemsize
+    with gzip.open(path, "rb") as f:
+        header = _parse_header(f.read(HEADER_SIZE), path)
+        pending = b""
+        while True:
+            try:
+                data = f.read(chunk_bytes)
+            except EOFError:
+                log.warning("Page trace %s is truncated", path)
+                data = b""
+            if not data:
+                break
+            pending += data
+            usable = len(pending) - len(pending) % EVENT_DTYPE.itemsize
+            if usable:
+                yield header, np.frombuffer(pending[:usable], dtype=EVENT_DTYPE)
+                pending = pending[usable:]
+
+
+def load_page_trace(path: str) -> Tuple[Dict, np.ndarray]:
+    """Header and records of a page trace, sorted by timestamp."""
+    header = None
+    chunks = []
+    for header, records in iter_page_trace(path):
+        chunks.append(records)
+    if header is None:
+        with gzip.open(path, "rb") as f:
+            header = _parse_header(f.read(HEADER_SIZE), path)
+    if not chunks:
+        return header, np.zeros(0, dtype=EVENT_DTYPE)
+    records = np.concatenate(chunks)
+    return header, records[np.argsort(records["timestamp_ns"], kind="stable")]
+
+
+def summarize_page_trace(header: Dict, records: np.ndarray) -> Dict:
+    """Event counts and footprint of a page trace."""
+    summary = {"events": len(records)}
+    for op, code in PAGE_TRACE_OP_CODES.items():
+        summary[op] = int(np.count_nonzero(records["op"] == code))
+    requests = summary["added"] + summary["accessed"]
+    summary["hit_ratio"] = summary["accessed"] / requests if requests else 0.0
+    pages = np.unique(
+        records["ino"].astype(np.uint64) << np.uint64(32)
+        | records["index"].astype(np.uint64)
+    )
+    summary["distinct_pages"] = len(pages)
+    summary["distinct_files"] = len(np.unique(records["ino"]))
+    duration = 0.0
+    if len(records):
+        first = min(int(records["timestamp_ns"][0]), header["start_ns"])
+        duration = (int(records["timestamp_ns"][-1]) - first) / 1e9
+    summary["duration_sec"] = duration
+    summary["events_per_sec"] = len(records) / duration if duration > 0 else 0.0
+    return summary
+
+
+def write_text_trace(records: np.ndarray, output_path: str):
+    """Write the page requests (added and accessed events) as text lines."""
+    requests = records[records["op"] != PAGE_TRACE_OP_CODES["evicted"]]
+    with open(output_path, "w") as out:
+        for start in range(0, len(requests), CHUNK_RECORDS):
+            chunk = requests[start : start + CHUNK_RECORDS]
+            out.writelines(
+                "%d %d:%d\n" % row
+                for row in zip(
+                    chunk["timestamp_ns"].tolist(),
+                    chunk["ino"].tolist(),
+                    chunk["index"].tolist(),
+                )
+            )
+    log.info("Wrote %d page requests to %s", len(requests), output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Summarize a page cache access trace recorded by a policy loader",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--trace", type=str, required=True, help="Page trace file")
+    parser.add_argument(
+        "--text-output",
+        type=str,
+        default="",
+        help="Also write the page requests as a text trace, for trace_mrc.py",
+    )
+    args = parser.parse_args()
+    header, records = load_page_trace(args.trace)
+    print(json.dumps(summarize_page_trace(header, records), indent=4))
+    if args.text_output:
+        write_text_trace(records, args.text_output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,288 @@
+"""One-pass LRU miss-ratio curve (MRC) generator for key-value traces.
+
+Stack distances are computed with a Fenwick tree over access timestamps, on a
+SHARDS-style spatially sampled subset of the keys: a key is sampled if
+hash(key) mod P < T, which keeps every access of the sampled keys, and
+distances are scaled by 1 / R, where R = T / P.
+
+The Twitter traces are read line by line in their original CSV format:
+    timestamp,key,key_size,value_size,client_id,operation,ttl
+Lines with a different layout are also accepted, as long as the key is at
+--key-field (whitespace or comma separated).
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+from array import array
+from time import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from bench_lib import format_bytes_str, load_json, save_json
+
+log = logging.getLogger(__name__)
+
+SHARDS_MODULUS = 1 << 24
+DEFAULT_SAMPLING_RATE = 0.01
+DEFAULT_MRC_POINTS = 200
+
+
+def key_hash(key: str) -> int:
+    """Stable 64-bit hash of a key, independent of PYTHONHASHSEED."""
+    return int.from_bytes(
+        hashlib.blake2b(key.encode(), digest_size=8).digest(), "little"
+    )
+
+
+def shards_threshold(sampling_rate: float) -> int:
+    if not 0 < sampling_rate <= 1:
+        raise Exception("Sampling rate must be in (0, 1]: %s" % sampling_rate)
+    return max(1, int(round(sampling_rate * SHARDS_MODULUS)))
+
+
+def is_sampled(key: str, threshold: int) -> bool:
+    return key_hash(key) % SHARDS_MODULUS < threshold
+
+
+def parse_trace_line(line: str, key_field: int = 1) -> Optional[Tuple[str, int]]:
+    """Return (key, object size) for a trace line, or None for blank lines.
+
+    The object size is key_size + value_size for the Twitter CSV format and 0
+    when the sizes are unknown.
+    """
+    if "," in line:
+        fields = line.rstrip("\n").split(",")
+    else:
+        fields = line.split()
+    if not fields or not fields[0]:
+        return None
+    if len(fields) <= key_field:
+        return fields[0], 0
+    size = 0
+    if len(fields) >= 4 and key_field == 1:
+        try:
+            size = int(fields[2]) + int(fields[3])
+        except ValueError:
+            pass
+    return fields[key_field], size
+
+
+def iter_trace(path: str, key_field: int = 1) -> Iterator[Tuple[str, int]]:
+    with open(path, "r") as f:
+        for line in f:
+            parsed = parse_trace_line(line, key_field)
+            if parsed is not None:
+                yield parsed
+
+
+class StackDistanceCounter:
+    """Computes LRU stack distances in O(log n) per access.
+
+    The tree holds a 1 at the timestamp of the last access of every key, so
+    the number of distinct keys accessed since a key's previous access is the
+    number of ones after that timestamp. Timestamps are compacted when the
+    tree fills up, so memory is proportional to the number of distinct keys.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        self.last_access = {}
+        self.now = 0
+
+    def _add(self, pos: int, delta: int):
+        tree = self.tree
+        capacity = self.capacity
+        while pos <= capacity:
+            tree[pos] += delta
+            pos += pos & -pos
+
+    def _prefix_sum(self, pos: int) -> int:
+        tree = self.tree
+        total = 0
+        while pos > 0:
+            total += tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def _compact(self):
+        keys = sorted(self.last_access, key=self.last_access.__getitem__)
+        self.capacity = max(self.capacity, 2 * len(keys))
+        tree = [0] * (self.capacity + 1)
+        for pos, key in enumerate(keys, 1):
+            self.last_access[key] = pos
+            tree[pos] = 1
+        # Build the Fenwick tree in O(n)
+        for pos in range(1, self.capacity + 1):
+            parent = pos + (pos & -pos)
+            if parent <= self.capacity:
+                tree[parent] += tree[pos]
+        self.tree = tree
+        self.now = len(keys)
+
+    def access(self, key) -> int:
+        """Record an access and return its stack distance, or -1 if cold."""
+        pos = self.last_access.get(key)
+        if pos is None:
+            distance = -1
+        else:
+            distance = len(self.last_access) - self._prefix_sum(pos)
+            self._add(pos, -1)
+        if self.now == self.capacity:
+            if pos is not None:
+                # Drop the stale timestamp before compacting
+                del self.last_access[key]
+            self._compact()
+        self.now += 1
+        self.last_access[key] = self.now
+        self._add(self.now, 1)
+        return distance
+
+
+def generate_mrc(
+    trace_path: str,
+    sampling_rate: float = DEFAULT_SAMPLING_RATE,
+    key_field: int = 1,
+    points: int = DEFAULT_MRC_POINTS,
+) -> Dict:
+    """Stream a trace once and return its LRU miss-ratio curve.
+
+    Cache sizes are reported in objects, in bytes (using the mean size of
+    the sampled objects) and as a percentage of the trace footprint, which is
+    comparable to cgroup_size_pct.
+    """
+    threshold = shards_threshold(sampling_rate)
+    sampling_rate = threshold / SHARDS_MODULUS
+    counter = StackDistanceCounter()
+    distances = array("q")
+    object_sizes = {}
+    accesses = 0
+    start = time()
+    for key, size in iter_trace(trace_path, key_field):
+        accesses += 1
+        if sampling_rate < 1 and not is_sampled(key, threshold):
+            continue
+        distances.append(counter.access(key))
+        if size:
+            object_sizes[key] = size
+    if not distances:
+        raise Exception("No sampled accesses in trace %s" % trace_path)
+
+    distances = np.frombuffer(distances, dtype=np.int64)
+    sampled_accesses = len(distances)
+    unique_objects = len(counter.last_access) / sampling_rate
+    avg_object_size = float(np.mean(list(object_sizes.values()))) if object_sizes else 0
+    hits_per_distance = np.bincount(distances[distances >= 0]).astype(np.float64)
+    # SHARDS_adj: credit the difference between the expected and the actual
+    # number of sampled accesses to the smallest stack distance.
+    expected_accesses = accesses * sampling_rate
+    if len(hits_per_distance):
+        hits_per_distance[0] += expected_accesses - sampled_accesses
+    cumulative_hits = np.concatenate(([0], np.cumsum(hits_per_distance)))
+
+    # Geometrically spaced cache sizes, in (unscaled) objects
+    cache_sizes = np.unique(
+        np.geomspace(1, max(unique_objects, 2), num=points).round().astype(np.int64)
+    )
+    sampled_sizes = np.minimum(
+        (cache_sizes * sampling_rate).astype(np.int64), len(cumulative_hits) - 1
+    )
+    miss_ratio = np.clip(1 - cumulative_hits[sampled_sizes] / expected_accesses, 0, 1)
+
+    mrc = {
+        "trace": os.path.basename(trace_path),
+        "sampling_rate": sampling_rate,
+        "accesses": accesses,
+        "sampled_accesses": sampled_accesses,
+        "unique_objects": unique_objects,
+        "avg_object_size": avg_object_size,
+        "footprint_bytes": unique_objects * avg_object_size,
+        "cache_sizes": cache_sizes.tolist(),
+        "cache_sizes_bytes": (cache_sizes * avg_object_size).tolist(),
+        "cache_size_pct": (cache_sizes / unique_objects * 100).tolist(),
+        "miss_ratio": miss_ratio.tolist(),
+        "runtime_sec": time() - start,
+    }
+    log.info(
+        "MRC of %s: %d accesses, %d sampled, ~%d objects (%s), %.1fs",
+        trace_path,
+        accesses,
+        sampled_accesses,
+        unique_objects,
+        format_bytes_str(int(mrc["footprint_bytes"])),
+        mrc["runtime_sec"],
+    )
+    return mrc
+
+
+def mrc_miss_ratio(mrc: Dict, cache_size_pct: float) -> float:
+    """Interpolate the miss ratio of an MRC at a percentage of the footprint."""
+    return float(np.interp(cache_size_pct, mrc["cache_size_pct"], mrc["miss_ratio"]))
+
+
+def mrc_file_for_results(results_file: str, trace_path: str) -> str:
+    """Path of the MRC of a trace, next to the results JSON file."""
+    results_dir = os.path.dirname(os.path.abspath(results_file))
+    results_name = os.path.splitext(os.path.basename(results_file))[0]
+    trace_name = os.path.splitext(os.path.basename(trace_path))[0]
+    return os.path.join(results_dir, "%s_mrc_%s.json" % (results_name, trace_name))
+
+
+def ensure_mrc(
+    results_file: str,
+    trace_path: str,
+    sampling_rate: float = DEFAULT_SAMPLING_RATE,
+    key_field: int = 1,
+) -> Dict:
+    """Load the MRC of a trace next to the results file, generating it once."""
+    mrc_file = mrc_file_for_results(results_file, trace_path)
+    if os.path.exists(mrc_file):
+        mrc = load_json(mrc_file)
+        if mrc["sampling_rate"] == shards_threshold(sampling_rate) / SHARDS_MODULUS:
+            log.info("Reusing MRC %s", mrc_file)
+            return mrc
+    mrc = generate_mrc(trace_path, sampling_rate, key_field)
+    save_json(mrc_file, mrc)
+    log.info("Wrote MRC to %s", mrc_file)
+    return mrc
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Generate the LRU miss-ratio curve of a trace",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--trace", type=str, required=True, help="Trace file")
+    parser.add_argument(
+        "--results-file",
+        type=str,
+        required=True,
+        help="Results JSON file. The MRC is written next to it.",
+    )
+    parser.add_argument(
+        "--sampling-rate",
+        type=float,
+        default=DEFAULT_SAMPLING_RATE,
+        help="SHARDS sampling rate. Use 1 for exact stack distances.",
+    )
+    parser.add_argument(
+        "--key-field",
+        type=int,
+        default=1,
+        help="Index of the key in each trace line",
+    )
+    args = parser.parse_args()
+    mrc_file = mrc_file_for_results(args.results_file, args.trace)
+    mrc = generate_mrc(args.trace, args.sampling_rate, args.key_field)
+    save_json(mrc_file, mrc)
+    log.info("Wrote MRC to %s", mrc_file)
+    for pct in [1, 5, 10, 20, 50]:
+        log.info("Cache size %d%%: miss ratio %.4f", pct, mrc_miss_ratio(mrc, pct))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
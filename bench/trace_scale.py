@@ -0,0 +1,170 @@
+"""Downscale a key-value trace by sampling its key space.
+
+A key is kept if trace_mrc.is_sampled(key) at rate R, with every access to
+it, so the scaled trace has ~R of the keys and requests of the original and,
+like a SHARDS sample, about the same miss-ratio curve as a function of the
+cache size relative to the footprint. Running it against a DB holding only
+the sampled keys, with a cgroup size proportional to that DB, is a ~1/R
+scale model of the full-size experiment.
+
+For a trace cluster17_bench.txt and R = 0.01, this writes next to the trace:
+    cluster17_bench_scale0.01.txt       the scaled trace
+    cluster17_bench_scale0.01_keys.txt  its distinct keys, one per line
+    cluster17_bench_scale0.01_mrc.json  MRCs of both traces and their error
+The key list is the input of utils/leveldb_subset.cc, which copies those keys
+from the full DB into a scaled DB. This assumes that the DB keys are the trace
+keys, as in the Twitter DBs.
+
+The scaled trace is rejected (non-zero exit) if its MRC differs from the
+original one by more than --tolerance, at any cache size in MRC_CHECK_PCTS.
+"""
+
+import argparse
+import logging
+import os
+from typing import Dict
+
+import numpy as np
+
+from bench_lib import save_json
+from trace_mrc import (
+    DEFAULT_SAMPLING_RATE,
+    SHARDS_MODULUS,
+    generate_mrc,
+    is_sampled,
+    mrc_miss_ratio,
+    parse_trace_line,
+    shards_threshold,
+)
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MRC_TOLERANCE = 0.05
+# Cache sizes, in % of the footprint, at which the MRCs are compared
+MRC_CHECK_PCTS = np.geomspace(1, 100, num=50)
+
+
+def scaled_trace_file(trace_path: str, scale: float) -> str:
+    name, ext = os.path.splitext(trace_path)
+    return "%s_scale%g%s" % (name, scale, ext)
+
+
+def scale_trace(
+    trace_path: str, output_path: str, scale: float, key_field: int = 1
+) -> Dict:
+    """Stream trace_path into output_path, keeping the accesses of the keys
+    sampled at rate scale. Returns statistics of both traces."""
+    threshold = shards_threshold(scale)
+    keys = set()
+    accesses = 0
+    sampled_accesses = 0
+    with open(trace_path, "r") as trace, open(output_path, "w") as out:
+        for line in trace:
+            parsed = parse_trace_line(line, key_field)
+            if parsed is None:
+                continue
+            accesses += 1
+            key = parsed[0]
+            if not is_sampled(key, threshold):
+                continue
+            out.write(line)
+            keys.add(key)
+            sampled_accesses += 1
+    keys_file = os.path.splitext(output_path)[0] + "_keys.txt"
+    with open(keys_file, "w") as f:
+        for key in sorted(keys):
+            f.write(key + "\n")
+    log.info(
+        "Scaled %s by %g: %d of %d accesses, %d keys",
+        trace_path,
+        scale,
+        sampled_accesses,
+        accesses,
+        len(keys),
+    )
+    return {
+        "scale": threshold / SHARDS_MODULUS,
+        "accesses": accesses,
+        "scaled_accesses": sampled_accesses,
+        "scaled_keys": len(keys),
+        "keys_file": keys_file,
+    }
+
+
+def mrc_error(mrc: Dict, scaled_mrc: Dict) -> float:
+    """Largest absolute miss ratio difference of two MRCs at the same cache
+    size relative to their footprints."""
+    return max(
+        abs(mrc_miss_ratio(mrc, pct) - mrc_miss_ratio(scaled_mrc, pct))
+        for pct in MRC_CHECK_PCTS
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Downscale a trace by key-space sampling and check its miss-ratio curve",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--trace", type=str, required=True, help="Trace file")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        required=True,
+        help="Fraction of the key space to keep, e.g. 0.01",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_MRC_TOLERANCE,
+        help="Maximum absolute miss ratio difference between the MRCs of the"
+        " original and the scaled trace",
+    )
+    parser.add_argument(
+        "--mrc-sampling-rate",
+        type=float,
+        default=DEFAULT_SAMPLING_RATE,
+        help="SHARDS sampling rate of the original trace's MRC. The scaled"
+        " trace's MRC is exact.",
+    )
+    parser.add_argument(
+        "--key-field",
+        type=int,
+        default=1,
+        help="Index of the key in each trace line",
+    )
+    args = parser.parse_args()
+    if not 0 < args.scale < 1:
+        raise Exception("Scale must be in (0, 1): %s" % args.scale)
+
+    output_path = scaled_trace_file(args.trace, args.scale)
+    report = scale_trace(args.trace, output_path, args.scale, args.key_field)
+    mrc = generate_mrc(args.trace, args.mrc_sampling_rate, args.key_field)
+    scaled_mrc = generate_mrc(output_path, 1, args.key_field)
+    report.update(
+        {
+            "trace": args.trace,
+            "scaled_trace": output_path,
+            "mrc": mrc,
+            "scaled_mrc": scaled_mrc,
+            "mrc_error": mrc_error(mrc, scaled_mrc),
+            "tolerance": args.tolerance,
+        }
+    )
+    report_file = os.path.splitext(output_path)[0] + "_mrc.json"
+    save_json(report_file, report)
+    log.info("Wrote the MRC report to %s", report_file)
+    if report["mrc_error"] > args.tolerance:
+        raise Exception(
+            "MRC of the scaled trace differs by %.4f (tolerance %.4f)"
+            % (report["mrc_error"], args.tolerance)
+        )
+    log.info(
+        "MRC of the scaled trace is within %.4f of the original (tolerance %.4f)",
+        report["mrc_error"],
+        args.tolerance,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,40 @@
+#!/bin/bash
+# Watch scope overhead: per-open and per-folio cost of matching watch_dir files
+set -eu -o pipefail
+
+if ! uname -r | grep -q "cache-ext"; then
+	echo "This script is intended to be run on a cache_ext kernel."
+	echo "Please switch to the cache_ext kernel and try again."
+	exit 1
+fi
+
+SCRIPT_PATH=$(realpath $0)
+BASE_DIR=$(realpath "$(dirname $SCRIPT_PATH)/../../")
+BENCH_PATH="$BASE_DIR/bench"
+POLICY_PATH="$BASE_DIR/policies"
+FIO_DIR=$(realpath "$BASE_DIR/../fio_dir")
+RESULTS_PATH="$BASE_DIR/results"
+
+ITERATIONS=3
+
+mkdir -p "$FIO_DIR"
+mkdir -p "$RESULTS_PATH"
+
+# Disable MGLRU
+if ! "$BASE_DIR/utils/disable-mglru.sh"; then
+	echo "Failed to disable MGLRU. Please check the script."
+	exit 1
+fi
+
+# File creations exercise the vfs_open hook, random reads the folio hooks
+python3 "$BENCH_PATH/bench_fio.py" \
+	--cpu 8 \
+	--target-dir "$FIO_DIR" \
+	--policy-loader "$POLICY_PATH/cache_ext_fifo.out" \
+	--workloads create,randread \
+	--watch-scopes path,sb,mount,dir \
+	--bpf-prog-stats \
+	--iterations "$ITERATIONS" \
+	--results-file "$RESULTS_PATH/watch_scope_overhead_results.json"
+
+echo "Watch scope overhead benchmark completed. Results saved to $RESULTS_PATH."
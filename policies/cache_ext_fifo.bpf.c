@@ -14,7 +14,7 @@ static inline bool is_folio_relevant(struct folio *folio) {
 	if (!folio || !folio->mapping || !folio->mapping->host)
 		return false;
 
-	return inode_in_watchlist(folio->mapping->host->i_ino);
+	return inode_in_watch_scope(folio->mapping->host);
 }
 
 s32 BPF_STRUCT_OPS_SLEEPABLE(fifo_init, struct mem_cgroup *memcg)
@@ -31,6 +31,8 @@ s32 BPF_STRUCT_OPS_SLEEPABLE(fifo_init, struct mem_cgroup *memcg)
 
 static int bpf_fifo_evict_cb(int idx, struct cache_ext_list_node *a)
 {
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
+
 	if (!folio_test_uptodate(a->folio) || !folio_test_lru(a->folio))
 		return CACHE_EXT_CONTINUE_ITER;
 
@@ -47,9 +49,12 @@ void BPF_STRUCT_OPS(fifo_evict_folios, struct cache_ext_eviction_ctx *eviction_c
 		bpf_printk("cache_ext: evict: Failed to iterate main_list\n");
 		return;
 	}
+	cache_ext_stat_evict(eviction_ctx);
 }
 
 void BPF_STRUCT_OPS(fifo_folio_evicted, struct folio *folio) {
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
 	// if (bpf_cache_ext_list_del(folio)) {
 	// 	bpf_printk("cache_ext: Failed to delete folio from list\n");
 	// 	return;
@@ -64,6 +69,17 @@ void BPF_STRUCT_OPS(fifo_folio_added, struct folio *folio) {
 		bpf_printk("cache_ext: added: Failed to add folio to main_list\n");
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
+}
+
+// FIFO ignores accesses, they are only counted and traced
+void BPF_STRUCT_OPS(fifo_folio_accessed, struct folio *folio) {
+	if (!is_folio_relevant(folio))
+		return;
+
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 }
 
 SEC(".struct_ops.link")
@@ -72,4 +88,5 @@ struct cache_ext_ops fifo_ops = {
 	.evict_folios = (void *)fifo_evict_folios,
 	.folio_evicted = (void *)fifo_folio_evicted,
 	.folio_added = (void *)fifo_folio_added,
+	.folio_accessed = (void *)fifo_folio_accessed,
 };
@@ -10,6 +10,9 @@
 #include <unistd.h>
 
 #include "dir_watcher.h"
+#include "cache_ext_stats.h"
+#include "cache_ext_trace.h"
+#include "cache_ext_regret.h"
 #include "cache_ext_fifo.skel.h"
 
 char *USAGE = "Usage: ./cache_ext_fifo --watch_dir <dir> --cgroup_path <path>\n";
@@ -24,6 +27,14 @@ static struct argp_option options[] = {
 	{ 0 },
 };
 
+// Adds --watch_scope, --page_trace and --regret_*
+static struct argp_child argp_children[] = {
+	{ &watch_scope_argp, 0, 0, 0 },
+	{ &page_trace_argp, 0, 0, 0 },
+	{ &eviction_regret_argp, 0, 0, 0 },
+	{ 0 },
+};
+
 static volatile sig_atomic_t exiting;
 
 static void sig_handler(int signo) {
@@ -47,7 +58,7 @@ static error_t parse_opt(int key, char *arg, struct argp_state *state)
 }
 
 static int parse_args(int argc, char **argv, struct cmdline_args *args) {
-	struct argp argp = { options, parse_opt, 0, 0 };
+	struct argp argp = { options, parse_opt, 0, 0, argp_children };
 	argp_parse(&argp, argc, argv, 0, 0, args);
 
 	if (args->watch_dir == NULL) {
@@ -97,6 +108,8 @@ int main(int argc, char **argv) {
 	struct sigaction sa;
 	char watch_dir_path[PATH_MAX];
 	int cgroup_fd = -1;
+	char stats_pin_path[PATH_MAX] = "";
+	struct page_trace_recorder page_trace = { 0 };
 	int ret = 1;
 
 	libbpf_set_strict_mode(LIBBPF_STRICT_ALL);
@@ -132,16 +145,61 @@ int main(int argc, char **argv) {
 	watch_dir_path_len_map(skel) = strlen(watch_dir_path);
 	strcpy(watch_dir_path_map(skel), watch_dir_path);
 
+	struct watch_scope scope;
+	if (watch_scope_init(watch_dir_path, watch_scope_mode, true, &scope)) {
+		perror("Failed to resolve watch_scope");
+		goto cleanup;
+	}
+	watch_scope_set_rodata(skel, &scope);
+
+	if (page_trace_set_rodata(skel)) {
+		fprintf(stderr, "Failed to size the page trace ring buffer\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	if (eviction_regret_set_rodata(skel)) {
+		fprintf(stderr, "Failed to size the regret ghost map\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	// FIFO only counts and traces accesses, don't make every access of an
+	// untraced run call into the policy (its accesses stat stays 0)
+	if (!skel->rodata->page_trace_enabled && !skel->rodata->regret_enabled)
+		skel->struct_ops.fifo_ops->folio_accessed = NULL;
+
+	// Walk watch_dir before loading, to size inode_watchlist after it
+	struct watch_dir_inodes watch_dir_inodes;
+	if (watch_dir_prepare(watch_dir_path, &scope, inode_watchlist_map(skel), &watch_dir_inodes)) {
+		perror("Failed to walk watch_dir");
+		goto cleanup;
+	}
+
 	if (cache_ext_fifo_bpf__load(skel)) {
 		perror("Failed to load BPF skeleton");
 		goto cleanup;
 	}
 
-	if (initialize_watch_dir_map(watch_dir_path, bpf_map__fd(inode_watchlist_map(skel)), true)) {
+	if (watch_dir_populate(bpf_map__fd(inode_watchlist_map(skel)), &watch_dir_inodes)) {
 		perror("Failed to initialize watch_dir map");
 		goto cleanup;
 	}
 
+	// Pin stats map
+	if (cache_ext_stats_pin(skel->maps.cache_ext_stats, args.cgroup_path,
+				stats_pin_path, sizeof(stats_pin_path))) {
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Record the page trace from before the policy sees the first folio
+	if (page_trace_start(&page_trace, skel->maps.page_trace_ringbuf,
+			     skel->maps.page_trace_batches)) {
+		ret = 1;
+		goto cleanup;
+	}
+
 	link = bpf_map__attach_cache_ext_ops(skel->maps.fifo_ops, cgroup_fd);
 	if (link == NULL) {
 		perror("Failed to attach cache_ext_ops to cgroup");
@@ -154,14 +212,23 @@ int main(int argc, char **argv) {
 		goto cleanup;
 	}
 
+	// Tell the benchmark that the policy is attached
+	printf("cache_ext: attached\n");
+	fflush(stdout);
+
 	// Wait for keyboard input
 	printf("Press any key to exit...\n");
 	getchar();
+	cache_ext_stats_print(skel->maps.cache_ext_stats);
+	eviction_regret_print(skel->maps.regret_hist);
 	ret = 0;
 
 cleanup:
+	cache_ext_stats_unpin(stats_pin_path);
 	close(cgroup_fd);
 	bpf_link__destroy(link);
+	// After detaching, so that no events are missed
+	page_trace_stop(&page_trace);
 	cache_ext_fifo_bpf__destroy(skel);
 	return ret;
 }
@@ -50,17 +50,12 @@ static inline bool is_scanning_pid() {
 #define MAX_PAGES (1 << 20)
 
 struct folio_metadata {
-	u64 accesses;
 	u64 last_access_time;
+	u32 accesses;
 	bool touched_by_scan;
 };
 
-struct {
-	__uint(type, BPF_MAP_TYPE_HASH);
-	__type(key, __u64);
-	__type(value, struct folio_metadata);
-	__uint(max_entries, 4000000);
-} folio_metadata_map SEC(".maps");
+DEFINE_FOLIO_METADATA_MAP(struct folio_metadata);
 
 struct {
 	__uint(type, BPF_MAP_TYPE_ARRAY);
@@ -142,7 +137,7 @@ inline bool is_folio_relevant(struct folio *folio)
 		// bpf_printk("folio not relevant because it's host is null\n");
 		return false;
 	}
-	bool res = inode_in_watchlist(folio->mapping->host->i_ino);
+	bool res = inode_in_watch_scope(folio->mapping->host);
 	// if (!res) {
 	// 	bpf_printk("folio not relevant because it's inode is not in watchlist, inode %llu\n",
 	// 		   folio->mapping->host->i_ino);
@@ -206,6 +201,8 @@ void BPF_STRUCT_OPS(mixed_folio_added, struct folio *folio)
     // Stats
 	update_stat(&STAT_TOTAL_PAGES, 1);
 	update_stat(&STAT_INSERTED_TOTAL_PAGES, 1);
+	cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
 	if (touched_by_scan) {
 		__sync_fetch_and_add(&scan_pages, 1);
 		//update_stat(&STAT_SCAN_PAGES, 1);
@@ -227,11 +224,14 @@ void BPF_STRUCT_OPS(mixed_folio_accessed, struct folio *folio)
 	if (!is_folio_relevant(folio)) {
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 	// TODO: Update folio metadata with other values we want to track
 	struct folio_metadata *meta;
 	u64 key = (u64)folio;
-	meta = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	meta = folio_metadata_lookup(&folio_metadata_map, key);
 	if (!meta) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
         // If metadata does not exist, try to add it
 		struct folio_metadata new_meta = { 0 };
 		int ret = bpf_map_update_elem(&folio_metadata_map, &key,
@@ -242,7 +242,7 @@ void BPF_STRUCT_OPS(mixed_folio_accessed, struct folio *folio)
 				ret);
 			return;
 		}
-		meta = bpf_map_lookup_elem(&folio_metadata_map, &key);
+		meta = folio_metadata_lookup(&folio_metadata_map, key);
 		if (meta == NULL) {
 			bpf_printk("cache_ext: Failed to get created folio metadata in accessed\n");
 			return;
@@ -278,6 +278,8 @@ void BPF_STRUCT_OPS(mixed_folio_evicted, struct folio *folio)
 {
 	dbg_printk(
 		"cache_ext: Hi from the mixed_folio_evicted hook! :D\n");
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
 	int ret = bpf_cache_ext_list_del(folio);
 	if (ret != 0) {
 		bpf_printk("cache_ext: Failed to delete folio from list: %d\n",
@@ -286,10 +288,11 @@ void BPF_STRUCT_OPS(mixed_folio_evicted, struct folio *folio)
 
 	u64 key = (u64)folio;
 	bool touched_by_scan = false;
-	struct folio_metadata *meta = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	struct folio_metadata *meta = folio_metadata_lookup(&folio_metadata_map, key);
 	if (meta) {
 		touched_by_scan = meta->touched_by_scan;
 	} else {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: Failed to get metadata for evicted folio\n");
 	}
 	bpf_map_delete_elem(&folio_metadata_map, &key);
@@ -331,8 +334,10 @@ static s64 bpf_lfu_score_fn(struct cache_ext_list_node *a)
 	s64 score = 0;
 	struct folio_metadata *meta_a;
 	u64 key_a = (u64)a->folio;
-	meta_a = bpf_map_lookup_elem(&folio_metadata_map, &key_a);
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
+	meta_a = folio_metadata_lookup(&folio_metadata_map, key_a);
 	if (!meta_a) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: Failed to get metadata\n");
 		return INT64_MAX;
 	}
@@ -378,6 +383,7 @@ void BPF_STRUCT_OPS(mixed_evict_folios,
 	};
 	bpf_cache_ext_list_sample(memcg, sampling_list, bpf_lfu_score_fn,
 				  &sampling_opts, eviction_ctx);
+	cache_ext_stat_evict(eviction_ctx);
 	if (eviction_ctx->nr_folios_to_evict != eviction_ctx->request_nr_folios_to_evict) {
 		bpf_printk("cache_ext: Failed to evict enough pages: %d/%d\n",
 			   eviction_ctx->nr_folios_to_evict,
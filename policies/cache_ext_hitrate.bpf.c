@@ -0,0 +1,62 @@
+#include "vmlinux.h"
+#include <bpf/bpf_helpers.h>
+#include <bpf/bpf_tracing.h>
+#include <bpf/bpf_core_read.h>
+
+#include "dir_watcher.bpf.h"
+#include "cache_ext_hitrate.h"
+
+char _license[] SEC("license") = "GPL";
+
+#define PAGE_MAPPING_ANON 0x1 /* linux: include/linux/page-flags.h */
+
+// The cgroup under test, filled by the loader
+struct {
+	__uint(type, BPF_MAP_TYPE_CGROUP_ARRAY);
+	__type(key, u32);
+	__type(value, u32);
+	__uint(max_entries, 1);
+} hitrate_cgroup SEC(".maps");
+
+struct {
+	__uint(type, BPF_MAP_TYPE_PERCPU_ARRAY);
+	__type(key, u32);
+	__type(value, u64);
+	__uint(max_entries, NR_HITRATE_COUNTERS);
+} hitrate_counters SEC(".maps");
+
+static inline bool is_mapping_relevant(struct address_space *mapping) {
+	if (!mapping || ((unsigned long)mapping & PAGE_MAPPING_ANON) ||
+	    !mapping->host)
+		return false;
+
+	// The task may be in a child of the cgroup, e.g. a cgexec'd benchmark
+	if (bpf_current_task_under_cgroup(&hitrate_cgroup, 0) != 1)
+		return false;
+
+	return inode_in_watch_scope(mapping->host);
+}
+
+static inline void hitrate_inc(enum hitrate_counter counter) {
+	u32 key = counter;
+	u64 *value = bpf_map_lookup_elem(&hitrate_counters, &key);
+
+	if (value)
+		(*value)++;
+}
+
+SEC("fentry/folio_mark_accessed")
+int BPF_PROG(hitrate_mark_accessed, struct folio *folio) {
+	if (is_mapping_relevant(folio->mapping))
+		hitrate_inc(HITRATE_ACCESSES);
+	return 0;
+}
+
+SEC("fexit/filemap_add_folio")
+int BPF_PROG(hitrate_add_folio, struct address_space *mapping,
+	     struct folio *folio, pgoff_t index, gfp_t gfp, int ret) {
+	// Another task may have added the folio first
+	if (ret == 0 && is_mapping_relevant(mapping))
+		hitrate_inc(HITRATE_MISSES);
+	return 0;
+}
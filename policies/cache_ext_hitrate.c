@@ -0,0 +1,261 @@
+#include <argp.h>
+#include <bpf/bpf.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <signal.h>
+#include <sys/stat.h>
+#include <sys/types.h>
+#include <time.h>
+#include <unistd.h>
+
+#include "dir_watcher.h"
+#include "cache_ext_hitrate.h"
+#include "cache_ext_hitrate.skel.h"
+
+#define DEFAULT_INTERVAL_MS 1000
+#define HITRATE_SAMPLE_PREFIX "cache_ext_hitrate: "
+#define HITRATE_STATS_PREFIX "cache_ext_hitrate_stats: "
+#define HITRATE_PROGS_PREFIX "cache_ext_hitrate_progs: "
+#define HITRATE_MAX_PROGS 16
+
+char *USAGE = "Usage: ./cache_ext_hitrate --watch_dir <dir> --cgroup_path <path>\n";
+struct cmdline_args {
+	char *watch_dir;
+	char *cgroup_path;
+	unsigned long interval_ms;
+};
+
+static struct argp_option options[] = {
+	{ "watch_dir", 'w', "DIR", 0, "Directory to watch" },
+	{ "cgroup_path", 'c', "PATH", 0, "Path to cgroup (e.g., /sys/fs/cgroup/cache_ext_test)" },
+	{ "interval_ms", 'i', "MS", 0, "Print the counters every MS milliseconds (default 1000)" },
+	{ 0 },
+};
+
+// Adds --watch_scope
+static struct argp_child argp_children[] = {
+	{ &watch_scope_argp, 0, 0, 0 },
+	{ 0 },
+};
+
+static volatile sig_atomic_t exiting;
+
+static void sig_handler(int signo) {
+	exiting = 1;
+}
+
+static error_t parse_opt(int key, char *arg, struct argp_state *state)
+{
+	struct cmdline_args *args = state->input;
+	char *end;
+
+	switch (key) {
+	case 'w':
+		args->watch_dir = arg;
+		break;
+	case 'c':
+		args->cgroup_path = arg;
+		break;
+	case 'i':
+		args->interval_ms = strtoul(arg, &end, 10);
+		if (*end || !args->interval_ms)
+			argp_error(state, "Invalid interval_ms: %s", arg);
+		break;
+	default:
+		return ARGP_ERR_UNKNOWN;
+	}
+	return 0;
+}
+
+static int parse_args(int argc, char **argv, struct cmdline_args *args) {
+	struct argp argp = { options, parse_opt, 0, 0, argp_children };
+	argp_parse(&argp, argc, argv, 0, 0, args);
+
+	if (args->watch_dir == NULL) {
+		fprintf(stderr, "Missing required argument: watch_dir\n");
+		return 1;
+	}
+
+	if (args->cgroup_path == NULL) {
+		fprintf(stderr, "Missing required argument: cgroup_path\n");
+		return 1;
+	}
+
+	return 0;
+}
+
+/*
+ * Validate watch_dir
+ *
+ * watch_dir_full_path must be able to hold PATH_MAX bytes.
+ */
+static int validate_watch_dir(const char *watch_dir, char *watch_dir_full_path) {
+	// Does watch_dir exist?
+	if (access(watch_dir, F_OK) == -1) {
+		fprintf(stderr, "Directory does not exist: %s\n", watch_dir);
+		return 1;
+	}
+
+	// Get full path of watch_dir
+	if (realpath(watch_dir, watch_dir_full_path) == NULL) {
+		perror("realpath");
+		return 1;
+	}
+
+	// BPF policy restriction
+	if (strlen(watch_dir_full_path) > 128) {
+		fprintf(stderr, "watch_dir path too long\n");
+		return 1;
+	}
+
+	return 0;
+}
+
+/*
+ * Print the ids of the monitor's programs as a JSON list, e.g.
+ *   cache_ext_hitrate_progs: [12, 13, 14]
+ * Its dir_watcher program has the same name as the policies' one, so the
+ * benchmark tells them apart by id in the BPF program stats.
+ */
+static int print_prog_ids(struct bpf_object *obj) {
+	struct bpf_program *prog;
+	struct bpf_prog_info info;
+	__u32 ids[HITRATE_MAX_PROGS];
+	__u32 info_len;
+	int nr_ids = 0;
+
+	bpf_object__for_each_program(prog, obj) {
+		if (nr_ids == HITRATE_MAX_PROGS) {
+			fprintf(stderr, "Too many BPF programs\n");
+			return -1;
+		}
+		memset(&info, 0, sizeof(info));
+		info_len = sizeof(info);
+		if (bpf_prog_get_info_by_fd(bpf_program__fd(prog), &info, &info_len)) {
+			perror("Failed to get BPF program info");
+			return -1;
+		}
+		ids[nr_ids++] = info.id;
+	}
+
+	printf(HITRATE_PROGS_PREFIX "[");
+	for (int i = 0; i < nr_ids; i++)
+		printf("%s%u", i ? ", " : "", ids[i]);
+	printf("]\n");
+	return 0;
+}
+
+static __u64 now_ms(void) {
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec * 1000ULL + ts.tv_nsec / 1000000;
+}
+
+int main(int argc, char **argv) {
+	struct cmdline_args args = { .interval_ms = DEFAULT_INTERVAL_MS };
+	struct cache_ext_hitrate_bpf *skel = NULL;
+	struct sigaction sa;
+	char watch_dir_path[PATH_MAX];
+	__u64 totals[NR_HITRATE_COUNTERS];
+	__u64 start_ms;
+	__u32 zero = 0;
+	int cgroup_fd = -1;
+	int ret = 1;
+
+	libbpf_set_strict_mode(LIBBPF_STRICT_ALL);
+
+	if (parse_args(argc, argv, &args))
+		return 1;
+
+	memset(&sa, 0, sizeof(sa));
+	sigemptyset(&sa.sa_mask);
+	sa.sa_handler = sig_handler;
+
+	// Install signal handler
+	if (sigaction(SIGINT, &sa, NULL) || sigaction(SIGTERM, &sa, NULL)) {
+		perror("Failed to set up signal handling");
+		return 1;
+	}
+
+	if (validate_watch_dir(args.watch_dir, watch_dir_path))
+		return 1;
+
+	cgroup_fd = open(args.cgroup_path, O_RDONLY);
+	if (cgroup_fd < 0) {
+		perror("Failed to open cgroup path");
+		return 1;
+	}
+
+	skel = cache_ext_hitrate_bpf__open();
+	if (!skel) {
+		perror("Failed to open BPF skeleton");
+		goto cleanup;
+	}
+
+	watch_dir_path_len_map(skel) = strlen(watch_dir_path);
+	strcpy(watch_dir_path_map(skel), watch_dir_path);
+
+	struct watch_scope scope;
+	if (watch_scope_init(watch_dir_path, watch_scope_mode, true, &scope)) {
+		perror("Failed to resolve watch_scope");
+		goto cleanup;
+	}
+	watch_scope_set_rodata(skel, &scope);
+
+	// Walk watch_dir before loading, to size inode_watchlist after it
+	struct watch_dir_inodes watch_dir_inodes;
+	if (watch_dir_prepare(watch_dir_path, &scope, inode_watchlist_map(skel), &watch_dir_inodes)) {
+		perror("Failed to walk watch_dir");
+		goto cleanup;
+	}
+
+	if (cache_ext_hitrate_bpf__load(skel)) {
+		perror("Failed to load BPF skeleton");
+		goto cleanup;
+	}
+
+	if (watch_dir_populate(bpf_map__fd(inode_watchlist_map(skel)), &watch_dir_inodes)) {
+		perror("Failed to initialize watch_dir map");
+		goto cleanup;
+	}
+
+	if (bpf_map_update_elem(bpf_map__fd(skel->maps.hitrate_cgroup), &zero,
+				&cgroup_fd, BPF_ANY)) {
+		perror("Failed to set the hitrate cgroup");
+		goto cleanup;
+	}
+
+	// Attaches the page cache probes and the dir_watcher
+	if (cache_ext_hitrate_bpf__attach(skel)) {
+		perror("Failed to attach BPF skeleton");
+		goto cleanup;
+	}
+
+	if (print_prog_ids(skel->obj))
+		goto cleanup;
+
+	// Same ready line as the policy loaders, for the benchmark
+	printf("cache_ext: attached\n");
+	fflush(stdout);
+
+	start_ms = now_ms();
+	while (!exiting) {
+		usleep(args.interval_ms * 1000);
+		if (hitrate_read(skel->maps.hitrate_counters, totals))
+			goto cleanup;
+		hitrate_print(HITRATE_SAMPLE_PREFIX, now_ms() - start_ms, totals);
+	}
+
+	if (hitrate_read(skel->maps.hitrate_counters, totals))
+		goto cleanup;
+	hitrate_print(HITRATE_STATS_PREFIX, now_ms() - start_ms, totals);
+	ret = 0;
+
+cleanup:
+	close(cgroup_fd);
+	cache_ext_hitrate_bpf__destroy(skel);
+	return ret;
+}
@@ -0,0 +1,87 @@
+#ifndef _CACHE_EXT_HITRATE_H
+#define _CACHE_EXT_HITRATE_H
+
+/*
+ * Page cache hit/miss counters of cache_ext_hitrate, a BPF monitor that runs
+ * next to any policy, or none (baseline runs). Like cachestat, it counts the
+ * page cache accesses (folio_mark_accessed) and the misses (filemap_add_folio)
+ * of the tasks of a cgroup on the files of a watch_dir. Hits are accesses -
+ * misses: a missed folio is marked accessed once it is read.
+ *
+ * This undercounts hits, so compare them between runs of the same workload
+ * rather than as absolute hit ratios:
+ * - filemap_read() only marks the first folio of each batch accessed, so a
+ *   read spanning several cached folios counts as one access.
+ * - Folios added by readahead count as misses whether they are read or not,
+ *   so an interval can have more misses than accesses.
+ */
+enum hitrate_counter {
+	HITRATE_ACCESSES,
+	HITRATE_MISSES,
+	NR_HITRATE_COUNTERS,
+};
+
+#ifndef __bpf__
+
+#include <stdio.h>
+#include <stdlib.h>
+
+#include <bpf/bpf.h>
+#include <bpf/libbpf.h>
+
+static const char *hitrate_counter_names[NR_HITRATE_COUNTERS] = {
+	[HITRATE_ACCESSES] = "accesses",
+	[HITRATE_MISSES] = "misses",
+};
+
+// Sum the per-CPU counters into totals. Returns 0 or -1.
+static int hitrate_read(struct bpf_map *map, __u64 totals[NR_HITRATE_COUNTERS])
+{
+	int nr_cpus = libbpf_num_possible_cpus();
+	int map_fd = bpf_map__fd(map);
+	__u64 *values;
+
+	if (nr_cpus < 0) {
+		fprintf(stderr, "Failed to get number of CPUs: %d\n", nr_cpus);
+		return -1;
+	}
+	values = calloc(nr_cpus, sizeof(*values));
+	if (!values) {
+		perror("Failed to allocate hitrate buffer");
+		return -1;
+	}
+
+	for (__u32 key = 0; key < NR_HITRATE_COUNTERS; key++) {
+		totals[key] = 0;
+		if (bpf_map_lookup_elem(map_fd, &key, values)) {
+			perror("Failed to read hitrate map");
+			free(values);
+			return -1;
+		}
+		for (int cpu = 0; cpu < nr_cpus; cpu++)
+			totals[key] += values[cpu];
+	}
+
+	free(values);
+	return 0;
+}
+
+/*
+ * Print the counters as a single JSON line, e.g. with prefix
+ * "cache_ext_hitrate: ":
+ *   cache_ext_hitrate: {"time_ms": 1000, "accesses": 1, "misses": 1}
+ */
+static void hitrate_print(const char *prefix, __u64 time_ms,
+			  const __u64 totals[NR_HITRATE_COUNTERS])
+{
+	printf("%s{\"time_ms\": %llu", prefix, (unsigned long long)time_ms);
+	for (int key = 0; key < NR_HITRATE_COUNTERS; key++)
+		printf(", \"%s\": %llu", hitrate_counter_names[key],
+		       (unsigned long long)totals[key]);
+	printf("}\n");
+	fflush(stdout);
+}
+
+#endif /* __bpf__ */
+
+#endif /* _CACHE_EXT_HITRATE_H */
@@ -9,7 +9,7 @@
 
 char _license[] SEC("license") = "GPL";
 
-static u64 next_reconfiguration = REQS_PER_RECONFIG;
+static u64 next_reconfiguration = REQS_PER_RECONFIG;  // Reset in lhd_init
 static u32 num_reconfigurations = 0;
 
 static u64 age_coarsening_shift = INITIAL_AGE_COARSENING_SHIFT;
@@ -36,12 +36,14 @@ static u64 num_objects = 0;
 #define INT64_MAX  (9223372036854775807LL)
 
 // We omit size, assume all folios are same size for now
+// Ages are below MAX_AGE (or equal, initially), so they fit in 16 bits
 struct folio_metadata {
 	u64 last_access_time;
-	u64 last_hit_age;
-	u64 last_last_hit_age;
 	u32 app;
+	u16 last_hit_age;
+	u16 last_last_hit_age;
 };
+_Static_assert(MAX_AGE <= U16_MAX, "LHD ages must fit folio_metadata");
 
 struct lhd_class {
 	u64 total_hits;
@@ -54,18 +56,17 @@ struct lhd_class {
 
 static struct lhd_class classes[NUM_CLASSES];
 
-struct {
-	__uint(type, BPF_MAP_TYPE_HASH);
-	__type(key, u64);
-	__type(value, struct folio_metadata);
-	__uint(max_entries, 4000000);
-} folio_metadata_map SEC(".maps");
+DEFINE_FOLIO_METADATA_MAP(struct folio_metadata);
 
 struct {
 	__uint(type, BPF_MAP_TYPE_RINGBUF);
 	__uint(max_entries, 4096);
 } events SEC(".maps");
 
+static inline u64 reconfig_interval(void) {
+	return cache_ext_param(CACHE_EXT_PARAM_RECONFIG_INTERVAL, REQS_PER_RECONFIG);
+}
+
 static inline long ewma_decay(u64 val) {
 	return (val * 9) / 10;
 }
@@ -78,12 +79,12 @@ static inline bool is_folio_relevant(struct folio *folio) {
 	if (!folio || !folio->mapping || !folio->mapping->host)
 		return false;
 
-	return inode_in_watchlist(folio->mapping->host->i_ino);
+	return inode_in_watch_scope(folio->mapping->host);
 }
 
 static inline struct folio_metadata *get_folio_metadata(struct folio *folio) {
 	u64 key = (u64)folio;
-	return bpf_map_lookup_elem(&folio_metadata_map, &key);
+	return folio_metadata_lookup(&folio_metadata_map, key);
 }
 
 static inline u32 hit_age_to_class(u64 hit_age) {
@@ -287,6 +288,9 @@ s32 BPF_STRUCT_OPS_SLEEPABLE(lhd_init, struct mem_cgroup *memcg) {
 	}
 	bpf_printk("cache_ext: Created lhd_list: %llu\n", lhd_list);
 
+	// The loader sets the parameters between load and attach
+	next_reconfiguration = reconfig_interval();
+
 	/*
 	 * BPF global variables are zero-initialized, so we only need to
 	 * initialize the hit densities.
@@ -305,6 +309,8 @@ s32 BPF_STRUCT_OPS_SLEEPABLE(lhd_init, struct mem_cgroup *memcg) {
 }
 
 static s64 bpf_lhd_score_fn(struct cache_ext_list_node *a) {
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
+
 	if (!folio_test_uptodate(a->folio) || !folio_test_lru(a->folio))
 		return INT64_MAX;
 
@@ -313,6 +319,7 @@ static s64 bpf_lhd_score_fn(struct cache_ext_list_node *a) {
 
 	struct folio_metadata *data = get_folio_metadata(a->folio);
 	if (!data) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: score_fn: Failed to get metadata\n");
 		return INT64_MAX;
 	}
@@ -324,13 +331,15 @@ void BPF_STRUCT_OPS(lhd_evict_folios, struct cache_ext_eviction_ctx *eviction_ct
 	       struct mem_cgroup *memcg)
 {
 	struct sampling_options opts = {
-		.sample_size = 16,
+		.sample_size = cache_ext_param(CACHE_EXT_PARAM_SAMPLE_SIZE,
+					       LHD_DEFAULT_SAMPLE_SIZE),
 	};
 
 	if (bpf_cache_ext_list_sample(memcg, lhd_list, bpf_lhd_score_fn, &opts, eviction_ctx)) {
 		bpf_printk("cache_ext: evict: Failed to sample\n");
 		return;
 	}
+	cache_ext_stat_evict(eviction_ctx);
 
 	/*
 	 * Yields the following verifier error:
@@ -370,9 +379,12 @@ void BPF_STRUCT_OPS(lhd_evict_folios, struct cache_ext_eviction_ctx *eviction_ct
 void BPF_STRUCT_OPS(lhd_folio_accessed, struct folio *folio) {
 	if (!is_folio_relevant(folio))
 		return;
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 
 	struct folio_metadata *data = get_folio_metadata(folio);
 	if (!data) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: accessed: Failed to get metadata\n");
 		return;
 	}
@@ -396,7 +408,7 @@ void BPF_STRUCT_OPS(lhd_folio_accessed, struct folio *folio) {
 	__sync_fetch_and_add(&timestamp, 1);
 
 	if (__sync_sub_and_fetch(&next_reconfiguration, 1) == 0) {
-		next_reconfiguration = REQS_PER_RECONFIG;
+		next_reconfiguration = reconfig_interval();
 		num_reconfigurations++;
 
 		// Submit reconfigure event to ring buffer
@@ -410,12 +422,15 @@ void BPF_STRUCT_OPS(lhd_folio_evicted, struct folio *folio) {
 	u64 age, hit_density, *evictions;
 	struct lhd_class *cls;
 
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
+
 	// if (bpf_cache_ext_list_del(folio)) {
 	// 	bpf_printk("cache_ext: Failed to delete folio from sampling_list\n");
 	// 	return;
 	// }
 
-	struct folio_metadata *data = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	struct folio_metadata *data = folio_metadata_lookup(&folio_metadata_map, key);
 	if (!data) {
 		//bpf_printk("cache_ext: evicted: Failed to get metadata\n");
 		return;
@@ -465,6 +480,8 @@ void BPF_STRUCT_OPS(lhd_folio_added, struct folio *folio) {
 		bpf_printk("cache_ext: added: Failed to create folio metadata\n");
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
 
 	// Track likely eviction candidates
 	// u64 hit_density = get_hit_density(&new_meta);
@@ -483,7 +500,7 @@ void BPF_STRUCT_OPS(lhd_folio_added, struct folio *folio) {
 	__sync_fetch_and_add(&num_objects, 1);
 
 	if (__sync_sub_and_fetch(&next_reconfiguration, 1) == 0) {
-		next_reconfiguration = REQS_PER_RECONFIG;
+		next_reconfiguration = reconfig_interval();
 		num_reconfigurations++;
 
 		// Submit reconfigure event to ring buffer
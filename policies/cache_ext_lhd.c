@@ -9,23 +9,45 @@
 #include <unistd.h>
 
 #include "dir_watcher.h"
+#include "cache_ext_stats.h"
+#include "cache_ext_trace.h"
+#include "cache_ext_regret.h"
+#include "cache_ext_params.h"
+#include "cache_ext_metadata.h"
 #include "cache_ext_lhd.bpf.h"
 #include "cache_ext_lhd.skel.h"
 
-char *USAGE = "Usage: ./cache_ext_lhd --watch_dir <dir> --cgroup_path <path>\n";
+char *USAGE = "Usage: ./cache_ext_lhd --watch_dir <dir> --cgroup_path <path> [--cgroup_size <size>]\n";
 struct cmdline_args {
 	char *watch_dir;
 	char *cgroup_path;
+	unsigned long cgroup_size;
 };
 
 static struct argp_option options[] = {
 	{ "watch_dir", 'w', "DIR", 0, "Directory to watch" },
 	{ "cgroup_path", 'c', "PATH", 0, "Path to cgroup (e.g., /sys/fs/cgroup/cache_ext_test)" },
+	{ "cgroup_size", 's', "SIZE", 0, "Size of the cgroup, to size the folio metadata map" },
 	{ 0 },
 };
 
 static long num_reconfigurations;
 
+// Parameters of this policy, see cache_ext_params.h
+static const __u64 param_defaults[NR_CACHE_EXT_PARAMS] = {
+	[CACHE_EXT_PARAM_SAMPLE_SIZE] = LHD_DEFAULT_SAMPLE_SIZE,
+	[CACHE_EXT_PARAM_RECONFIG_INTERVAL] = REQS_PER_RECONFIG,
+};
+
+// Adds --watch_scope, --param, --page_trace and --regret_*
+static struct argp_child argp_children[] = {
+	{ &watch_scope_argp, 0, 0, 0 },
+	{ &cache_ext_params_argp, 0, 0, 0 },
+	{ &page_trace_argp, 0, 0, 0 },
+	{ &eviction_regret_argp, 0, 0, 0 },
+	{ 0 },
+};
+
 static volatile sig_atomic_t exiting;
 
 static void sig_handler(int signo) {
@@ -42,6 +64,9 @@ static error_t parse_opt(int key, char *arg, struct argp_state *state)
 	case 'c':
 		args->cgroup_path = arg;
 		break;
+	case 's':
+		args->cgroup_size = strtoul(arg, NULL, 10);
+		break;
 	default:
 		return ARGP_ERR_UNKNOWN;
 	}
@@ -49,7 +74,7 @@ static error_t parse_opt(int key, char *arg, struct argp_state *state)
 }
 
 static int parse_args(int argc, char **argv, struct cmdline_args *args) {
-	struct argp argp = { options, parse_opt, 0, 0 };
+	struct argp argp = { options, parse_opt, 0, 0, argp_children };
 	argp_parse(&argp, argc, argv, 0, 0, args);
 
 	if (args->watch_dir == NULL) {
@@ -119,6 +144,9 @@ int main(int argc, char **argv) {
 	char watch_dir_path[PATH_MAX];
 	int reconfigure_prog_fd;
 	int cgroup_fd = -1;
+	char stats_pin_path[PATH_MAX] = "";
+	struct page_trace_recorder page_trace = { 0 };
+	char params_pin_path[PATH_MAX] = "";
 	int ret = 1;
 
 	libbpf_set_strict_mode(LIBBPF_STRICT_ALL);
@@ -155,16 +183,72 @@ int main(int argc, char **argv) {
 	watch_dir_path_len_map(skel) = strlen(watch_dir_path);
 	strcpy(watch_dir_path_map(skel), watch_dir_path);
 
+	// Size the folio metadata after the cgroup, instead of for the largest one
+	if (folio_metadata_set_size(skel->maps.folio_metadata_map, args.cgroup_size)) {
+		fprintf(stderr, "Failed to size folio_metadata_map\n");
+		goto cleanup;
+	}
+
+	struct watch_scope scope;
+	if (watch_scope_init(watch_dir_path, watch_scope_mode, false, &scope)) {
+		perror("Failed to resolve watch_scope");
+		goto cleanup;
+	}
+	watch_scope_set_rodata(skel, &scope);
+
+	if (page_trace_set_rodata(skel)) {
+		fprintf(stderr, "Failed to size the page trace ring buffer\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	if (eviction_regret_set_rodata(skel)) {
+		fprintf(stderr, "Failed to size the regret ghost map\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Walk watch_dir before loading, to size inode_watchlist after it
+	struct watch_dir_inodes watch_dir_inodes;
+	if (watch_dir_prepare(watch_dir_path, &scope, inode_watchlist_map(skel), &watch_dir_inodes)) {
+		perror("Failed to walk watch_dir");
+		goto cleanup;
+	}
+
 	if (cache_ext_lhd_bpf__load(skel)) {
 		perror("Failed to load BPF skeleton");
 		goto cleanup;
 	}
 
-	if (initialize_watch_dir_map(watch_dir_path, bpf_map__fd(inode_watchlist_map(skel)), false)) {
+	if (watch_dir_populate(bpf_map__fd(inode_watchlist_map(skel)), &watch_dir_inodes)) {
 		perror("Failed to initialize watch_dir map");
 		goto cleanup;
 	}
 
+	folio_metadata_print(skel->maps.folio_metadata_map);
+
+	// Set the policy parameters and pin them, so that they can be tuned at runtime
+	if (cache_ext_params_init(skel->maps.cache_ext_params, param_defaults) ||
+	    cache_ext_params_pin(skel->maps.cache_ext_params, args.cgroup_path,
+				 params_pin_path, sizeof(params_pin_path))) {
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Pin stats map
+	if (cache_ext_stats_pin(skel->maps.cache_ext_stats, args.cgroup_path,
+				stats_pin_path, sizeof(stats_pin_path))) {
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Record the page trace from before the policy sees the first folio
+	if (page_trace_start(&page_trace, skel->maps.page_trace_ringbuf,
+			     skel->maps.page_trace_batches)) {
+		ret = 1;
+		goto cleanup;
+	}
+
 	// Get fd of reconfigure program
 	reconfigure_prog_fd = bpf_program__fd(skel->progs.reconfigure);
 
@@ -186,6 +270,10 @@ int main(int argc, char **argv) {
 		goto cleanup;
 	}
 
+	// Tell the benchmark that the policy is attached
+	printf("cache_ext: attached\n");
+	fflush(stdout);
+
 	while (!exiting) {
 		ret = ring_buffer__poll(events, -1); // infinite timeout
 		
@@ -202,11 +290,17 @@ int main(int argc, char **argv) {
 	}
 
 	printf("Number of reconfigurations: %ld\n", num_reconfigurations);
+	cache_ext_stats_print(skel->maps.cache_ext_stats);
+	eviction_regret_print(skel->maps.regret_hist);
 
 cleanup:
+	cache_ext_stats_unpin(stats_pin_path);
+	cache_ext_map_unpin(params_pin_path);
 	close(cgroup_fd);
 	ring_buffer__free(events);
 	bpf_link__destroy(link);
+	// After detaching, so that no events are missed
+	page_trace_stop(&page_trace);
 	cache_ext_lhd_bpf__destroy(skel);
 	return ret;
 }
@@ -1,6 +1,7 @@
 #ifndef _CACHE_EXT_LIB_BPF_H
 #define _CACHE_EXT_LIB_BPF_H 1
 
+#define U16_MAX		((u16)~0U)
 #define U32_MAX		((u32)~0U)
 #define U64_MAX		((u64)~0ULL)
 #define S64_MAX		((s64)(U64_MAX >> 1))
@@ -93,6 +94,297 @@ int bpf_cache_ext_list_sample(struct mem_cgroup *memcg, u64 list,
 			      struct cache_ext_eviction_ctx *ctx) __ksym;
 u64 bpf_cache_ext_ds_registry_new_list(struct mem_cgroup *memcg) __ksym;
 
+// Policy stats, read back by the loaders (see cache_ext_stats.h)
+
+#include "cache_ext_stats.h"
+
+struct {
+	__uint(type, BPF_MAP_TYPE_PERCPU_ARRAY);
+	__type(key, u32);
+	__type(value, u64);
+	__uint(max_entries, NR_CACHE_EXT_STATS);
+} cache_ext_stats SEC(".maps");
+
+static __always_inline void cache_ext_stat_add(enum cache_ext_stat stat, u64 delta)
+{
+	u32 key = stat;
+	u64 *counter = bpf_map_lookup_elem(&cache_ext_stats, &key);
+	if (counter)
+		*counter += delta;
+}
+
+#define cache_ext_stat_inc(stat) cache_ext_stat_add(stat, 1)
+
+// Count an evict_folios call, after the policy has filled the eviction ctx
+static __always_inline void
+cache_ext_stat_evict(struct cache_ext_eviction_ctx *eviction_ctx)
+{
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICT_CALLS);
+	cache_ext_stat_add(CACHE_EXT_STAT_EVICT_REQUESTED,
+			   eviction_ctx->request_nr_folios_to_evict);
+	cache_ext_stat_add(CACHE_EXT_STAT_EVICT_SELECTED,
+			   eviction_ctx->nr_folios_to_evict);
+}
+
+// Policy parameters, written by the loaders (see cache_ext_params.h)
+
+#include "cache_ext_params.h"
+
+struct {
+	__uint(type, BPF_MAP_TYPE_ARRAY);
+	__type(key, u32);
+	__type(value, u64);
+	__uint(max_entries, NR_CACHE_EXT_PARAMS);
+} cache_ext_params SEC(".maps");
+
+/*
+ * Current value of a parameter. It is read on every use, so that updates of
+ * the pinned map apply without reloading the policy. Unset parameters, e.g.
+ * of policies loaded by cache_ext_policyd, fall back to default_value.
+ */
+static __always_inline u64 cache_ext_param(enum cache_ext_param param,
+					   u64 default_value)
+{
+	u32 key = param;
+	u64 *value = bpf_map_lookup_elem(&cache_ext_params, &key);
+
+	if (!value || !*value)
+		return default_value;
+	return *value;
+}
+
+// Page cache access trace, written by the loaders (see cache_ext_trace.h)
+
+#include "cache_ext_trace.h"
+
+// Set by the loaders with --page_trace
+const volatile bool page_trace_enabled = false;
+
+struct {
+	__uint(type, BPF_MAP_TYPE_RINGBUF);
+	__uint(max_entries, 4096);	// Resized by the loaders when tracing
+} page_trace_ringbuf SEC(".maps");
+
+struct {
+	__uint(type, BPF_MAP_TYPE_PERCPU_ARRAY);
+	__type(key, u32);
+	__type(value, struct page_trace_batch);
+	__uint(max_entries, 1);
+} page_trace_batches SEC(".maps");
+
+/*
+ * Record a folio event in the trace. Events are buffered per CPU and sent
+ * PAGE_TRACE_BATCH at a time, without a wakeup: the loader polls.
+ */
+static __always_inline void page_trace_record(struct folio *folio,
+					      enum page_trace_op op)
+{
+	struct page_trace_batch *batch;
+	struct page_trace_event *event;
+	u32 key = 0, nr;
+
+	if (!page_trace_enabled)
+		return;
+
+	batch = bpf_map_lookup_elem(&page_trace_batches, &key);
+	if (!batch)
+		return;
+	nr = batch->nr;
+	if (nr >= PAGE_TRACE_BATCH)
+		nr = 0;
+
+	event = &batch->events[nr];
+	event->timestamp_ns = bpf_ktime_get_ns();
+	event->ino = folio->mapping->host->i_ino;
+	event->index = folio->index;
+	event->op = op;
+	if (++nr < PAGE_TRACE_BATCH) {
+		batch->nr = nr;
+		return;
+	}
+
+	batch->nr = 0;
+	if (bpf_ringbuf_output(&page_trace_ringbuf, batch->events,
+			       sizeof(batch->events), BPF_RB_NO_WAKEUP)) {
+		cache_ext_stat_add(CACHE_EXT_STAT_TRACE_DROPS, PAGE_TRACE_BATCH);
+		return;
+	}
+	cache_ext_stat_add(CACHE_EXT_STAT_TRACE_EVENTS, PAGE_TRACE_BATCH);
+}
+
+// Eviction regret accounting (see cache_ext_regret.h)
+
+#include "cache_ext_regret.h"
+
+// Set by the loaders with --regret_ghost_entries and --regret_window_*
+const volatile bool regret_enabled = false;
+const volatile u64 regret_window_requests = 0;
+const volatile u64 regret_window_ns = 0;
+
+// Page requests (insertions and accesses) so far, the clock of reuse distances
+static u64 regret_request_clock;
+
+struct {
+	__uint(type, BPF_MAP_TYPE_LRU_HASH);
+	__type(key, struct regret_ghost_key);
+	__type(value, struct regret_ghost);
+	// Resized by the loaders when enabled. A common LRU, so that the map
+	// holds the last max_entries evictions of all CPUs: a per-CPU LRU would
+	// split it between the CPUs, and forget the evictions of a CPU that
+	// reclaims more than its share.
+	__uint(max_entries, 1);
+} regret_ghost_map SEC(".maps");
+
+struct {
+	__uint(type, BPF_MAP_TYPE_PERCPU_ARRAY);
+	__type(key, u32);
+	__type(value, u64);
+	__uint(max_entries, NR_REGRET_HISTS * REGRET_HIST_BUCKETS);
+} regret_hist SEC(".maps");
+
+// floor(log2(value)), 0 for 0. BPF has no count leading zeros instruction.
+static __always_inline u32 regret_log2(u64 value)
+{
+	u32 log = 0;
+
+	if (value >> 32) {
+		value >>= 32;
+		log += 32;
+	}
+	if (value >> 16) {
+		value >>= 16;
+		log += 16;
+	}
+	if (value >> 8) {
+		value >>= 8;
+		log += 8;
+	}
+	if (value >> 4) {
+		value >>= 4;
+		log += 4;
+	}
+	if (value >> 2) {
+		value >>= 2;
+		log += 2;
+	}
+	if (value >> 1)
+		log += 1;
+	return log;
+}
+
+static __always_inline void regret_hist_add(enum regret_hist hist, u64 value)
+{
+	u32 bucket = regret_log2(value);
+	u32 key;
+	u64 *count;
+
+	if (bucket >= REGRET_HIST_BUCKETS)
+		bucket = REGRET_HIST_BUCKETS - 1;
+	key = hist * REGRET_HIST_BUCKETS + bucket;
+	count = bpf_map_lookup_elem(&regret_hist, &key);
+	if (count)
+		*count += 1;
+}
+
+/*
+ * Remember evicted folios in the ghost map, and account the folios added again
+ * while their ghost entry is still there as refaults, by reuse distance.
+ */
+static __always_inline void eviction_regret_record(struct folio *folio,
+						   enum page_trace_op op)
+{
+	struct regret_ghost_key key = {
+		.address_space = (u64)folio->mapping->host,
+		.offset = folio->index,
+	};
+	struct regret_ghost *ghost;
+	u64 request, distance, elapsed_ns;
+
+	if (!regret_enabled)
+		return;
+
+	if (op == PAGE_TRACE_EVICTED) {
+		struct regret_ghost new_ghost = {
+			.evict_ns = bpf_ktime_get_ns(),
+			.evict_request = READ_ONCE(regret_request_clock),
+		};
+
+		bpf_map_update_elem(&regret_ghost_map, &key, &new_ghost, BPF_ANY);
+		return;
+	}
+
+	request = __sync_fetch_and_add(&regret_request_clock, 1);
+	if (op != PAGE_TRACE_ADDED)
+		return;
+
+	ghost = bpf_map_lookup_elem(&regret_ghost_map, &key);
+	if (!ghost)
+		return;
+	distance = request - ghost->evict_request;
+	elapsed_ns = bpf_ktime_get_ns() - ghost->evict_ns;
+	bpf_map_delete_elem(&regret_ghost_map, &key);
+
+	cache_ext_stat_inc(CACHE_EXT_STAT_REFAULTS);
+	if (distance <= regret_window_requests)
+		cache_ext_stat_inc(CACHE_EXT_STAT_REFAULTS_REQUEST_WINDOW);
+	if (elapsed_ns <= regret_window_ns)
+		cache_ext_stat_inc(CACHE_EXT_STAT_REFAULTS_TIME_WINDOW);
+	regret_hist_add(REGRET_HIST_REQUESTS, distance);
+	regret_hist_add(REGRET_HIST_TIME_US, elapsed_ns / 1000);
+}
+
+/*
+ * Called by the policies' folio hooks next to their insertions, accesses and
+ * evictions stats, for the page trace and the regret accounting.
+ */
+static __always_inline void cache_ext_folio_event(struct folio *folio,
+						  enum page_trace_op op)
+{
+	eviction_regret_record(folio, op);
+	page_trace_record(folio, op);
+}
+
+// Per-folio metadata
+
+/*
+ * Policies keep their per-folio state in a hash map keyed by folio address,
+ * declared with DEFINE_FOLIO_METADATA_MAP(). There is no folio local storage,
+ * and the cache_ext kernel predates BPF arenas, so this is a preallocated hash
+ * map. FOLIO_METADATA_MAX_ENTRIES only fits the largest cgroups: the loaders
+ * size the map after --cgroup_size instead (cache_ext_metadata.h), as a cgroup
+ * of N pages holds at most N folios. Values should be small fixed-layout
+ * structs, hash map values are rounded up to 8 bytes.
+ */
+#define FOLIO_METADATA_MAX_ENTRIES 4000000
+// One in FOLIO_METADATA_TIMING_INTERVAL lookups of each CPU is timed
+#define FOLIO_METADATA_TIMING_INTERVAL 64
+
+#define DEFINE_FOLIO_METADATA_MAP(value_type)			\
+	struct {						\
+		__uint(type, BPF_MAP_TYPE_HASH);		\
+		__type(key, u64);				\
+		__type(value, value_type);			\
+		__uint(max_entries, FOLIO_METADATA_MAX_ENTRIES);	\
+	} folio_metadata_map SEC(".maps")
+
+// Look up the metadata of the folio at address key, sampling lookup latency
+static __always_inline void *folio_metadata_lookup(void *map, u64 key)
+{
+	u32 stat = CACHE_EXT_STAT_METADATA_LOOKUPS;
+	u64 *lookups, start;
+	void *meta;
+
+	lookups = bpf_map_lookup_elem(&cache_ext_stats, &stat);
+	if (!lookups || (*lookups)++ % FOLIO_METADATA_TIMING_INTERVAL)
+		return bpf_map_lookup_elem(map, &key);
+
+	start = bpf_ktime_get_ns();
+	meta = bpf_map_lookup_elem(map, &key);
+	cache_ext_stat_add(CACHE_EXT_STAT_METADATA_LOOKUP_NS, bpf_ktime_get_ns() - start);
+	cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_LOOKUP_SAMPLES);
+	return meta;
+}
+
 #define BITS_PER_LONG 64
 #define BIT_MASK(nr)		(UL(1) << ((nr) % BITS_PER_LONG))
 #define BIT_WORD(nr)		((nr) / BITS_PER_LONG)
@@ -0,0 +1,74 @@
+#ifndef _CACHE_EXT_METADATA_H
+#define _CACHE_EXT_METADATA_H
+
+/*
+ * Sizing and footprint of the per-folio metadata map of the policies
+ * (DEFINE_FOLIO_METADATA_MAP in cache_ext_lib.bpf.h).
+ */
+
+#include <errno.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <unistd.h>
+
+#include <bpf/bpf.h>
+#include <bpf/libbpf.h>
+
+// Room for folios being added while others are evicted
+#define FOLIO_METADATA_HEADROOM_PCT 25
+#define FOLIO_METADATA_MIN_ENTRIES 16384
+#define FOLIO_METADATA_STATS_PREFIX "folio_metadata_stats: "
+
+/*
+ * Size the map after the cgroup: one entry per page of cgroup_size, plus
+ * FOLIO_METADATA_HEADROOM_PCT. Keeps the compile-time size if cgroup_size is 0.
+ * Must be called before the BPF object is loaded.
+ */
+static int folio_metadata_set_size(struct bpf_map *map, unsigned long cgroup_size)
+{
+	unsigned long entries;
+
+	if (!cgroup_size)
+		return 0;
+	entries = cgroup_size / getpagesize();
+	entries += entries * FOLIO_METADATA_HEADROOM_PCT / 100;
+	if (entries < FOLIO_METADATA_MIN_ENTRIES)
+		entries = FOLIO_METADATA_MIN_ENTRIES;
+	if (entries > UINT32_MAX)
+		return -E2BIG;
+	return bpf_map__set_max_entries(map, entries);
+}
+
+// Kernel memory charged for a loaded map, from its fdinfo
+static long long bpf_map_memlock(int map_fd)
+{
+	char path[64], line[128];
+	long long memlock = -1;
+	FILE *f;
+
+	snprintf(path, sizeof(path), "/proc/self/fdinfo/%d", map_fd);
+	f = fopen(path, "r");
+	if (!f)
+		return -1;
+	while (fgets(line, sizeof(line), f)) {
+		if (sscanf(line, "memlock: %lld", &memlock) == 1)
+			break;
+	}
+	fclose(f);
+	return memlock;
+}
+
+/*
+ * Print the size of the loaded map as a single JSON line:
+ *   folio_metadata_stats: {"max_entries": 1, "value_size": 8, ...}
+ */
+static void folio_metadata_print(struct bpf_map *map)
+{
+	printf(FOLIO_METADATA_STATS_PREFIX
+	       "{\"max_entries\": %u, \"value_size\": %u, \"memlock_bytes\": %lld}\n",
+	       bpf_map__max_entries(map), bpf_map__value_size(map),
+	       bpf_map_memlock(bpf_map__fd(map)));
+	fflush(stdout);
+}
+
+#endif /* _CACHE_EXT_METADATA_H */
@@ -32,7 +32,6 @@ char _license[] SEC("license") = "GPL";
 // Maps //
 //////////
 
-#define MAX_NR_FOLIOS 4000000
 #define MAX_NR_GHOST_ENTRIES 400000
 
 struct folio_metadata {
@@ -40,12 +39,7 @@ struct folio_metadata {
 	s64 gen;
 };
 
-struct {
-	__uint(type, BPF_MAP_TYPE_HASH);
-	__type(key, __u64);
-	__type(value, struct folio_metadata);
-	__uint(max_entries, MAX_NR_FOLIOS);
-} folio_metadata_map SEC(".maps");
+DEFINE_FOLIO_METADATA_MAP(struct folio_metadata);
 
 //////////////////
 // Ghost Enties //
@@ -375,8 +369,9 @@ static inline void folio_inc_refs(struct folio *folio)
 	struct folio_metadata *metadata;
 	__u64 key = (__u64)folio;
 
-	metadata = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	metadata = folio_metadata_lookup(&folio_metadata_map, key);
 	if (!metadata) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk(
 			"cache_ext: Tried to inc refs but folio not found in map.\n");
 		return;
@@ -389,7 +384,7 @@ static inline int folio_lru_refs(struct folio *folio)
 	struct folio_metadata *metadata;
 	__u64 key = (__u64)folio;
 
-	metadata = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	metadata = folio_metadata_lookup(&folio_metadata_map, key);
 	if (!metadata)
 		return -1;
 
@@ -687,7 +682,7 @@ inline bool is_folio_relevant(struct folio *folio)
 	if (folio->mapping->host == NULL) {
 		return false;
 	}
-	bool res = inode_in_watchlist(folio->mapping->host->i_ino);
+	bool res = inode_in_watch_scope(folio->mapping->host);
 	return res;
 }
 
@@ -721,6 +716,7 @@ static int mglru_iter_fn(int idx, struct cache_ext_list_node *a)
 
 	struct mglru_global_metadata *lrugen;
 	int key__ = 0;
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
 	lrugen = bpf_map_lookup_elem(&mglru_global_metadata_map, &key__);
 	if (!lrugen) {
 		bpf_printk(
@@ -738,8 +734,9 @@ static int mglru_iter_fn(int idx, struct cache_ext_list_node *a)
 	// Get folio metadata
 	__u64 key = (__u64)a->folio;
 	struct folio_metadata *meta =
-		bpf_map_lookup_elem(&folio_metadata_map, &key);
+		folio_metadata_lookup(&folio_metadata_map, key);
 	if (!meta) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: iter_fn: Failed to get metadata\n");
 		// TODO: Maybe we should evict it instead?
 		return CACHE_EXT_EVICT_NODE;
@@ -859,6 +856,7 @@ void BPF_STRUCT_OPS(mglru_evict_folios, struct cache_ext_eviction_ctx *eviction_
 	s64 failed_evicted = max(0, eviction_ctx->request_nr_folios_to_evict - eviction_ctx->nr_folios_to_evict);
 	__sync_fetch_and_add(&lrugen->failed_evicted, failed_evicted);
 	__sync_fetch_and_add(&lrugen->success_evicted, success_evicted);
+	cache_ext_stat_evict(eviction_ctx);
 	if (eviction_ctx->nr_folios_to_evict < eviction_ctx->request_nr_folios_to_evict) {
 		bpf_printk("cache_ext: Failed to evict requested number of folios: %d/%d. Used list idx %d, list ptr: %p. Iter reached: %d\n",
 				eviction_ctx->nr_folios_to_evict,
@@ -874,7 +872,10 @@ void BPF_STRUCT_OPS(mglru_folio_added, struct folio *folio)
 	if (!is_folio_relevant(folio)) {
 		return;
 	}
-	lru_gen_add_folio(folio);
+	if (lru_gen_add_folio(folio)) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+		cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
+	}
 }
 
 void BPF_STRUCT_OPS(mglru_folio_accessed, struct folio *folio)
@@ -882,6 +883,8 @@ void BPF_STRUCT_OPS(mglru_folio_accessed, struct folio *folio)
 	if (!is_folio_relevant(folio)) {
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 	folio_inc_refs(folio);
 }
 
@@ -890,13 +893,16 @@ void BPF_STRUCT_OPS(mglru_folio_evicted, struct folio *folio)
 	if (!is_folio_relevant(folio)) {
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
 	DEFINE_LRUGEN_void;
 	// Remove tracked metadata
 	struct folio_metadata *metadata;
 	__u64 key = (__u64)folio;
 
-	metadata = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	metadata = folio_metadata_lookup(&folio_metadata_map, key);
 	if (!metadata) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk(
 			"cache_ext: Tried to delete folio metadata but not found in map.\n");
 		return;
@@ -30,7 +30,7 @@ inline bool is_folio_relevant(struct folio *folio)
 	if (folio->mapping->host == NULL) {
 		return false;
 	}
-	bool res = inode_in_watchlist(folio->mapping->host->i_ino);
+	bool res = inode_in_watch_scope(folio->mapping->host);
 	return res;
 }
 
@@ -60,6 +60,8 @@ void BPF_STRUCT_OPS(mru_folio_added, struct folio *folio)
 		bpf_printk("cache_ext: Failed to add folio to mru_list\n");
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
 	dbg_printk("cache_ext: Added folio to mru_list\n");
 }
 
@@ -71,6 +73,8 @@ void BPF_STRUCT_OPS(mru_folio_accessed, struct folio *folio)
 	if (!is_folio_relevant(folio)) {
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 
 	ret = bpf_cache_ext_list_move(mru_list, folio, false);
 	if (ret != 0) {
@@ -84,11 +88,14 @@ void BPF_STRUCT_OPS(mru_folio_accessed, struct folio *folio)
 void BPF_STRUCT_OPS(mru_folio_evicted, struct folio *folio)
 {
 	dbg_printk("cache_ext: Hi from the mru_folio_evicted hook! :D\n");
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
 	bpf_cache_ext_list_del(folio);
 }
 
 static int iterate_mru(int idx, struct cache_ext_list_node *node)
 {
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
 	if ((idx < 200) && (!folio_test_uptodate(node->folio) || !folio_test_lru(node->folio))) {
 		return CACHE_EXT_CONTINUE_ITER;
 	}
@@ -101,6 +108,7 @@ void BPF_STRUCT_OPS(mru_evict_folios, struct cache_ext_eviction_ctx *eviction_ct
 	dbg_printk("cache_ext: Hi from the mru_evict_folios hook! :D\n");
 	int ret = bpf_cache_ext_list_iterate(memcg, mru_list, iterate_mru,
 					     eviction_ctx);
+	cache_ext_stat_evict(eviction_ctx);
 	// Check that the right amount of folios were evicted
 	if (ret < 0) {
 		bpf_printk("cache_ext: Failed to evict folios\n");
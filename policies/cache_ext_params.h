@@ -0,0 +1,140 @@
+#ifndef _CACHE_EXT_PARAMS_H
+#define _CACHE_EXT_PARAMS_H
+
+/*
+ * Runtime-tunable policy parameters, shared by the BPF policies
+ * (cache_ext_lib.bpf.h) and their loaders. The values live in an array map
+ * that the loaders fill in and pin, and that the policies read on every use,
+ * so a parameter can be changed while the policy is attached:
+ *
+ *   bpftool map update pinned /sys/fs/bpf/cache_ext/params_<cgroup name> \
+ *           key <index as 4 bytes> value <value as 8 bytes>
+ *
+ * A value of 0 means the policy default. Parameters that size BPF arrays, e.g.
+ * LHD's MAX_AGE and NUM_CLASSES, cannot change after load and stay constants.
+ */
+enum cache_ext_param {
+	CACHE_EXT_PARAM_SAMPLE_SIZE,		// Folios sampled per eviction
+	CACHE_EXT_PARAM_RECONFIG_INTERVAL,	// LHD: accesses between reconfigurations
+	CACHE_EXT_PARAM_SMALL_QUEUE_DIVISOR,	// S3-FIFO: small queue is cache_size / this
+	NR_CACHE_EXT_PARAMS,
+};
+
+// Defaults, used until a parameter is set
+#define LHD_DEFAULT_SAMPLE_SIZE 16
+#define SAMPLING_DEFAULT_SAMPLE_SIZE 20
+#define S3FIFO_DEFAULT_SAMPLE_SIZE 10
+#define S3FIFO_DEFAULT_SMALL_QUEUE_DIVISOR 15
+
+#ifndef __bpf__
+
+#include <argp.h>
+#include <errno.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <bpf/bpf.h>
+#include <bpf/libbpf.h>
+
+#include "cache_ext_stats.h"
+
+static const char *cache_ext_param_names[NR_CACHE_EXT_PARAMS] = {
+	[CACHE_EXT_PARAM_SAMPLE_SIZE] = "sample_size",
+	[CACHE_EXT_PARAM_RECONFIG_INTERVAL] = "reconfig_interval",
+	[CACHE_EXT_PARAM_SMALL_QUEUE_DIVISOR] = "small_queue_divisor",
+};
+
+// Set by --param, see cache_ext_params_argp
+static __u64 cache_ext_param_overrides[NR_CACHE_EXT_PARAMS];
+
+#define CACHE_EXT_PARAM_OPT_KEY 0x1001
+
+static error_t cache_ext_params_parse_opt(int key, char *arg,
+					  struct argp_state *state)
+{
+	char *value, *end;
+
+	if (key != CACHE_EXT_PARAM_OPT_KEY)
+		return ARGP_ERR_UNKNOWN;
+
+	value = strchr(arg, '=');
+	if (!value)
+		argp_error(state, "Invalid param, expected NAME=VALUE: %s", arg);
+	*value++ = '\0';
+	for (int i = 0; i < NR_CACHE_EXT_PARAMS; i++) {
+		if (strcmp(arg, cache_ext_param_names[i]))
+			continue;
+		errno = 0;
+		cache_ext_param_overrides[i] = strtoull(value, &end, 0);
+		if (errno || end == value || *end || !cache_ext_param_overrides[i])
+			argp_error(state, "Invalid value for param %s: %s", arg,
+				   value);
+		return 0;
+	}
+	argp_error(state, "Unknown param: %s", arg);
+	return 0;
+}
+
+static struct argp_option cache_ext_params_options[] = {
+	{ "param", CACHE_EXT_PARAM_OPT_KEY, "NAME=VALUE", 0,
+	  "Set a policy parameter, e.g. sample_size=32 (repeatable)" },
+	{ 0 },
+};
+
+static struct argp cache_ext_params_argp = { cache_ext_params_options,
+					     cache_ext_params_parse_opt, 0, 0 };
+
+/*
+ * Write the parameters a policy supports, i.e. the non-zero entries of
+ * defaults, overridden by --param, to its params map, and print them as a
+ * single JSON line, so that the benchmark can record and update them:
+ *   cache_ext_params: {"sample_size": {"index": 0, "value": 16}, ...}
+ */
+static int cache_ext_params_init(struct bpf_map *map,
+				 const __u64 defaults[NR_CACHE_EXT_PARAMS])
+{
+	int map_fd = bpf_map__fd(map);
+	bool first = true;
+
+	for (__u32 key = 0; key < NR_CACHE_EXT_PARAMS; key++) {
+		if (cache_ext_param_overrides[key] && !defaults[key]) {
+			fprintf(stderr, "Param not supported by this policy: %s\n",
+				cache_ext_param_names[key]);
+			return -1;
+		}
+	}
+
+	printf("cache_ext_params: {");
+	for (__u32 key = 0; key < NR_CACHE_EXT_PARAMS; key++) {
+		__u64 value = cache_ext_param_overrides[key] ?: defaults[key];
+
+		if (!defaults[key])
+			continue;
+		if (bpf_map_update_elem(map_fd, &key, &value, BPF_ANY)) {
+			perror("Failed to write params map");
+			printf("}\n");
+			return -1;
+		}
+		printf("%s\"%s\": {\"index\": %u, \"value\": %llu}",
+		       first ? "" : ", ", cache_ext_param_names[key], key,
+		       (unsigned long long)value);
+		first = false;
+	}
+	printf("}\n");
+	fflush(stdout);
+	return 0;
+}
+
+// Pin the params map at /sys/fs/bpf/cache_ext/params_<cgroup name>
+static int cache_ext_params_pin(struct bpf_map *map, const char *cgroup_path,
+				char *pin_path, size_t pin_path_len)
+{
+	return cache_ext_map_pin(map, "params", cgroup_path, pin_path,
+				 pin_path_len);
+}
+
+#endif /* __bpf__ */
+
+#endif /* _CACHE_EXT_PARAMS_H */
@@ -0,0 +1,702 @@
+/*
+ * cache_ext policy daemon.
+ *
+ * Attaches and detaches cache_ext policies to cgroups on request, so that a
+ * benchmark does not start a loader process for every run, and knows exactly
+ * when the policy is attached. Policies are loaded from
+ * <policy_dir>/<policy>.bpf.o.
+ *
+ * Requests are single lines on a unix stream socket, one per connection, and
+ * get a single line reply starting with "OK" or "ERR <message>":
+ *
+ *   ATTACH policy=<name> cgroup=<path> watch_dir=<dir> [cgroup_size=<bytes>]
+ *          [recursive=<0|1>] [scope=<path|sb|mount|dir>]
+ *   DETACH cgroup=<path>   -> OK cache_ext_stats: {...}
+ *   STATS cgroup=<path>    -> OK cache_ext_stats: {...}
+ *   PING
+ *
+ * Every ATTACH opens and loads the policy again and DETACH unloads it, like a
+ * loader run: the policy starts without the state (globals, metadata and ghost
+ * maps, lists) of an earlier run, and its inode_watchlist holds the current
+ * inodes of watch_dir, which change when a benchmark resets its database
+ * between runs. Policies with a userspace component (a ring buffer, e.g. LHD)
+ * still need their own loader.
+ *
+ * The socket is only accessible to root, or to the members of --group.
+ */
+#define _GNU_SOURCE
+#include <argp.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <grp.h>
+#include <libgen.h>
+#include <limits.h>
+#include <signal.h>
+#include <stdarg.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+#include <bpf/bpf.h>
+#include <bpf/btf.h>
+#include <bpf/libbpf.h>
+
+#include "dir_watcher.h"
+#include "cache_ext_stats.h"
+#include "cache_ext_metadata.h"
+
+#define DEFAULT_SOCKET_PATH "/run/cache_ext_policyd.sock"
+#define SCAN_PIDS_PIN_PATH CACHE_EXT_BPFFS_DIR "/scan_pids"
+#define CGROUP_FS_PREFIX "/sys/fs/cgroup/"
+#define WATCH_DIR_PATH_MAX 128 // BPF_PATH_MAX in dir_watcher.bpf.h
+#define MAX_POLICIES 16
+#define MAX_PROG_LINKS 16
+#define MAX_REQUEST_LEN (4 * PATH_MAX)
+#define REQUEST_TIMEOUT_SEC 5
+
+// A policy loaded for, and attached to, a single cgroup
+struct policy {
+	bool loaded;
+	char name[NAME_MAX + 1];
+	char watch_dir[PATH_MAX];
+	unsigned long cgroup_size;
+	bool recursive;
+	enum watch_scope_mode scope;
+	struct bpf_object *obj;
+
+	char cgroup_path[PATH_MAX];
+	int cgroup_fd;
+	struct bpf_link *ops_link;
+	struct bpf_link *prog_links[MAX_PROG_LINKS];
+	int nr_prog_links;
+	char stats_pin_path[PATH_MAX];
+	bool scan_pids_pinned;
+};
+
+struct cmdline_args {
+	char *socket_path;
+	char *policy_dir;
+	char *group;
+};
+
+static struct argp_option options[] = {
+	{ "socket", 's', "PATH", 0, "Control socket path (default: " DEFAULT_SOCKET_PATH ")" },
+	{ "policy_dir", 'p', "DIR", 0, "Directory of the *.bpf.o policies (default: the daemon's directory)" },
+	{ "group", 'g', "GROUP", 0, "Let the members of GROUP use the socket (default: root only)" },
+	{ 0 },
+};
+
+static struct policy policies[MAX_POLICIES];
+static char policy_dir[PATH_MAX];
+
+static volatile sig_atomic_t exiting;
+
+static void sig_handler(int signo) {
+	exiting = 1;
+}
+
+static error_t parse_opt(int key, char *arg, struct argp_state *state)
+{
+	struct cmdline_args *args = state->input;
+	switch (key) {
+	case 's':
+		args->socket_path = arg;
+		break;
+	case 'p':
+		args->policy_dir = arg;
+		break;
+	case 'g':
+		args->group = arg;
+		break;
+	default:
+		return ARGP_ERR_UNKNOWN;
+	}
+	return 0;
+}
+
+static void reply(int fd, const char *fmt, ...)
+{
+	va_list ap;
+
+	va_start(ap, fmt);
+	vdprintf(fd, fmt, ap);
+	va_end(ap);
+	dprintf(fd, "\n");
+}
+
+static bool is_rodata_map(struct bpf_map *map)
+{
+	const char *name = bpf_map__name(map);
+	size_t len = strlen(name);
+
+	return bpf_map__is_internal(map) && len >= strlen(".rodata") &&
+	       !strcmp(name + len - strlen(".rodata"), ".rodata");
+}
+
+/*
+ * Set a `const volatile` global of a policy before it is loaded. This is what
+ * the loaders do through skel->rodata, using the BTF of the object instead.
+ */
+static int set_rodata_var(struct bpf_object *obj, const char *var_name,
+			  const void *value, size_t size)
+{
+	struct btf *btf = bpf_object__btf(obj);
+	const struct btf_var_secinfo *vsi;
+	const struct btf_type *sec;
+	struct bpf_map *map;
+	size_t map_size;
+	char *data;
+	int sec_id;
+
+	bpf_object__for_each_map(map, obj) {
+		if (is_rodata_map(map))
+			break;
+	}
+	if (!map || !btf)
+		return -ENOENT;
+
+	sec_id = btf__find_by_name_kind(btf, ".rodata", BTF_KIND_DATASEC);
+	if (sec_id < 0)
+		return -ENOENT;
+	sec = btf__type_by_id(btf, sec_id);
+	data = bpf_map__initial_value(map, &map_size);
+	if (!data)
+		return -ENOENT;
+
+	vsi = btf_var_secinfos(sec);
+	for (int i = 0; i < btf_vlen(sec); i++, vsi++) {
+		const struct btf_type *var = btf__type_by_id(btf, vsi->type);
+
+		if (strcmp(btf__name_by_offset(btf, var->name_off), var_name))
+			continue;
+		if (size > vsi->size || vsi->offset + vsi->size > map_size)
+			return -EINVAL;
+		memset(data + vsi->offset, 0, vsi->size);
+		memcpy(data + vsi->offset, value, size);
+		return 0;
+	}
+	return -ENOENT;
+}
+
+static void policy_unload(struct policy *p)
+{
+	bpf_object__close(p->obj);
+	memset(p, 0, sizeof(*p));
+}
+
+static int policy_load(struct policy *p, char *err, size_t err_len)
+{
+	size_t watch_dir_len = strlen(p->watch_dir);
+	struct watch_dir_inodes inodes;
+	struct watch_scope scope;
+	char obj_path[PATH_MAX];
+	struct bpf_map *map;
+
+	snprintf(obj_path, sizeof(obj_path), "%s/%s.bpf.o", policy_dir, p->name);
+	p->obj = bpf_object__open_file(obj_path, NULL);
+	if (!p->obj) {
+		snprintf(err, err_len, "Failed to open %s: %s", obj_path, strerror(errno));
+		return -1;
+	}
+
+	/*
+	 * The daemon does not consume ring buffers. Every policy has the page
+	 * trace one (cache_ext_lib.bpf.h), which stays unused here since the
+	 * daemon never sets page_trace_enabled.
+	 */
+	bpf_object__for_each_map(map, p->obj) {
+		if (bpf_map__type(map) == BPF_MAP_TYPE_RINGBUF &&
+		    strcmp(bpf_map__name(map), "page_trace_ringbuf")) {
+			snprintf(err, err_len, "%s needs its own loader (ring buffer %s)",
+				 p->name, bpf_map__name(map));
+			goto fail;
+		}
+	}
+
+	if (set_rodata_var(p->obj, "watch_dir_path", p->watch_dir, watch_dir_len + 1) ||
+	    set_rodata_var(p->obj, "watch_dir_path_len", &watch_dir_len,
+			   sizeof(watch_dir_len))) {
+		snprintf(err, err_len, "Failed to set watch_dir of %s", p->name);
+		goto fail;
+	}
+
+	// Policies sized after the cgroup (S3-FIFO), see cache_ext_s3fifo.c
+	if (p->cgroup_size) {
+		size_t cache_size = p->cgroup_size / getpagesize();
+
+		if (!set_rodata_var(p->obj, "cache_size", &cache_size, sizeof(cache_size))) {
+			map = bpf_object__find_map_by_name(p->obj, "ghost_map");
+			if (map && bpf_map__set_max_entries(map, cache_size)) {
+				snprintf(err, err_len, "Failed to resize ghost_map");
+				goto fail;
+			}
+		}
+		map = bpf_object__find_map_by_name(p->obj, "folio_metadata_map");
+		if (map && folio_metadata_set_size(map, p->cgroup_size)) {
+			snprintf(err, err_len, "Failed to resize folio_metadata_map");
+			goto fail;
+		}
+	}
+
+	map = bpf_object__find_map_by_name(p->obj, "inode_watchlist");
+	if (!map) {
+		snprintf(err, err_len, "%s has no inode_watchlist map", p->name);
+		goto fail;
+	}
+	if (watch_scope_init(p->watch_dir, p->scope, p->recursive, &scope)) {
+		snprintf(err, err_len, "Failed to resolve watch_scope: %s", strerror(errno));
+		goto fail;
+	}
+	if (set_rodata_var(p->obj, "watch_scope", &scope.mode, sizeof(__u32)) ||
+	    set_rodata_var(p->obj, "watch_dir_recursive", &scope.recursive,
+			   sizeof(scope.recursive)) ||
+	    set_rodata_var(p->obj, "watch_dev", &scope.dev, sizeof(scope.dev)) ||
+	    set_rodata_var(p->obj, "watch_mnt_id", &scope.mnt_id, sizeof(scope.mnt_id)) ||
+	    set_rodata_var(p->obj, "watch_dir_ino", &scope.dir_ino, sizeof(scope.dir_ino))) {
+		snprintf(err, err_len, "Failed to set watch_scope of %s", p->name);
+		goto fail;
+	}
+
+	// Walk watch_dir before loading, to size inode_watchlist after it
+	if (watch_dir_prepare(p->watch_dir, &scope, map, &inodes)) {
+		snprintf(err, err_len, "Failed to walk watch_dir: %s", strerror(errno));
+		goto fail;
+	}
+
+	if (bpf_object__load(p->obj)) {
+		snprintf(err, err_len, "Failed to load %s: %s", obj_path, strerror(errno));
+		watch_dir_inodes_free(&inodes);
+		goto fail;
+	}
+
+	if (watch_dir_populate(bpf_map__fd(map), &inodes)) {
+		snprintf(err, err_len, "Failed to initialize watch_dir map");
+		goto fail;
+	}
+
+	p->loaded = true;
+	return 0;
+
+fail:
+	policy_unload(p);
+	return -1;
+}
+
+static void policy_detach(struct policy *p)
+{
+	for (int i = 0; i < p->nr_prog_links; i++)
+		bpf_link__destroy(p->prog_links[i]);
+	p->nr_prog_links = 0;
+	bpf_link__destroy(p->ops_link);
+	p->ops_link = NULL;
+
+	cache_ext_stats_unpin(p->stats_pin_path);
+	p->stats_pin_path[0] = '\0';
+	if (p->scan_pids_pinned &&
+	    bpf_map__unpin(bpf_object__find_map_by_name(p->obj, "scan_pids"),
+			   SCAN_PIDS_PIN_PATH))
+		perror("Failed to unpin scan_pids map");
+	p->scan_pids_pinned = false;
+
+	if (p->cgroup_path[0])
+		close(p->cgroup_fd);
+	p->cgroup_path[0] = '\0';
+}
+
+static int policy_attach(struct policy *p, const char *cgroup_path, char *err,
+			 size_t err_len)
+{
+	struct bpf_map *map, *ops_map = NULL;
+	struct bpf_program *prog;
+
+	p->cgroup_fd = open(cgroup_path, O_RDONLY);
+	if (p->cgroup_fd < 0) {
+		snprintf(err, err_len, "Failed to open %s: %s", cgroup_path, strerror(errno));
+		return -1;
+	}
+	snprintf(p->cgroup_path, sizeof(p->cgroup_path), "%s", cgroup_path);
+
+	bpf_object__for_each_map(map, p->obj) {
+		if (bpf_map__type(map) == BPF_MAP_TYPE_STRUCT_OPS)
+			ops_map = map;
+	}
+	if (!ops_map) {
+		snprintf(err, err_len, "%s has no cache_ext_ops", p->name);
+		goto fail;
+	}
+
+	map = bpf_object__find_map_by_name(p->obj, "cache_ext_stats");
+	if (map && (cache_ext_stats_reset(map) ||
+		    cache_ext_stats_pin(map, cgroup_path, p->stats_pin_path,
+					sizeof(p->stats_pin_path)))) {
+		snprintf(err, err_len, "Failed to set up the stats map");
+		goto fail;
+	}
+
+	map = bpf_object__find_map_by_name(p->obj, "scan_pids");
+	if (map) {
+		// My-YCSB looks the map up by its path, so it is one per host
+		for (int i = 0; i < MAX_POLICIES; i++) {
+			if (policies[i].scan_pids_pinned) {
+				snprintf(err, err_len, "scan_pids is already pinned for %s",
+					 policies[i].cgroup_path);
+				goto fail;
+			}
+		}
+		// Remove a stale pin left by a loader that was killed
+		unlink(SCAN_PIDS_PIN_PATH);
+		if (bpf_map__pin(map, SCAN_PIDS_PIN_PATH)) {
+			snprintf(err, err_len, "Failed to pin scan_pids map");
+			goto fail;
+		}
+		p->scan_pids_pinned = true;
+	}
+
+	p->ops_link = bpf_map__attach_cache_ext_ops(ops_map, p->cgroup_fd);
+	if (!p->ops_link) {
+		snprintf(err, err_len, "Failed to attach cache_ext_ops to %s: %s",
+			 cgroup_path, strerror(errno));
+		goto fail;
+	}
+
+	// Same as the skeleton attach of the loaders (dir_watcher probes)
+	bpf_object__for_each_program(prog, p->obj) {
+		struct bpf_link *link;
+
+		if (bpf_program__type(prog) == BPF_PROG_TYPE_STRUCT_OPS ||
+		    !bpf_program__autoattach(prog))
+			continue;
+		link = bpf_program__attach(prog);
+		if (!link && errno == EOPNOTSUPP)
+			continue;
+		if (!link || p->nr_prog_links == MAX_PROG_LINKS) {
+			bpf_link__destroy(link);
+			snprintf(err, err_len, "Failed to attach %s",
+				 bpf_program__name(prog));
+			goto fail;
+		}
+		p->prog_links[p->nr_prog_links++] = link;
+	}
+	return 0;
+
+fail:
+	policy_detach(p);
+	return -1;
+}
+
+static struct policy *find_attached(const char *cgroup_path)
+{
+	for (int i = 0; i < MAX_POLICIES; i++) {
+		if (policies[i].loaded && !strcmp(policies[i].cgroup_path, cgroup_path))
+			return &policies[i];
+	}
+	return NULL;
+}
+
+static struct policy *find_free_slot(void)
+{
+	for (int i = 0; i < MAX_POLICIES; i++) {
+		if (!policies[i].loaded)
+			return &policies[i];
+	}
+	return NULL;
+}
+
+static bool valid_policy_name(const char *name)
+{
+	if (!name || !name[0] || strlen(name) > NAME_MAX)
+		return false;
+	for (const char *c = name; *c; c++) {
+		if (!(*c == '_' || (*c >= 'a' && *c <= 'z') ||
+		      (*c >= 'A' && *c <= 'Z') || (*c >= '0' && *c <= '9')))
+			return false;
+	}
+	return true;
+}
+
+static bool valid_cgroup_path(const char *path)
+{
+	return path && !strncmp(path, CGROUP_FS_PREFIX, strlen(CGROUP_FS_PREFIX)) &&
+	       !strstr(path, "..") && strlen(path) < PATH_MAX;
+}
+
+static void reply_stats(int fd, struct policy *p)
+{
+	struct bpf_map *map = bpf_object__find_map_by_name(p->obj, "cache_ext_stats");
+	char *buf = NULL;
+	size_t len = 0;
+	FILE *f;
+
+	if (!map) {
+		reply(fd, "OK");
+		return;
+	}
+	f = open_memstream(&buf, &len);
+	if (!f) {
+		reply(fd, "ERR Failed to allocate stats buffer");
+		return;
+	}
+	if (cache_ext_stats_fprint(f, map)) {
+		fclose(f);
+		free(buf);
+		reply(fd, "ERR Failed to read stats map");
+		return;
+	}
+	fclose(f);
+	// The stats line already ends with a newline
+	dprintf(fd, "OK %s", buf);
+	free(buf);
+}
+
+static void handle_attach(int fd, const char *name, const char *cgroup_path,
+			  const char *watch_dir, unsigned long cgroup_size,
+			  bool recursive, enum watch_scope_mode scope)
+{
+	char watch_dir_path[PATH_MAX];
+	char err[PATH_MAX + 128];
+	struct policy *p;
+
+	if (!valid_policy_name(name) || !valid_cgroup_path(cgroup_path) || !watch_dir) {
+		reply(fd, "ERR Invalid ATTACH arguments");
+		return;
+	}
+	if (!realpath(watch_dir, watch_dir_path)) {
+		reply(fd, "ERR Invalid watch_dir %s: %s", watch_dir, strerror(errno));
+		return;
+	}
+	if (strlen(watch_dir_path) >= WATCH_DIR_PATH_MAX) {
+		reply(fd, "ERR watch_dir path too long");
+		return;
+	}
+	if (find_attached(cgroup_path)) {
+		reply(fd, "ERR A policy is already attached to %s", cgroup_path);
+		return;
+	}
+
+	p = find_free_slot();
+	if (!p) {
+		reply(fd, "ERR Too many attached policies");
+		return;
+	}
+	snprintf(p->name, sizeof(p->name), "%s", name);
+	snprintf(p->watch_dir, sizeof(p->watch_dir), "%s", watch_dir_path);
+	p->cgroup_size = cgroup_size;
+	p->recursive = recursive;
+	p->scope = scope;
+	if (policy_load(p, err, sizeof(err))) {
+		reply(fd, "ERR %s", err);
+		return;
+	}
+
+	if (policy_attach(p, cgroup_path, err, sizeof(err))) {
+		policy_unload(p);
+		reply(fd, "ERR %s", err);
+		return;
+	}
+	fprintf(stderr, "Attached %s to %s\n", name, cgroup_path);
+	reply(fd, "OK attached");
+}
+
+static void handle_request(int fd, char *request)
+{
+	char *name = NULL, *cgroup_path = NULL, *watch_dir = NULL;
+	unsigned long cgroup_size = 0;
+	bool recursive = true;
+	enum watch_scope_mode scope = WATCH_SCOPE_PATH;
+	char *saveptr, *token, *command;
+	struct policy *p;
+
+	command = strtok_r(request, " \t\r\n", &saveptr);
+	if (!command) {
+		reply(fd, "ERR Empty request");
+		return;
+	}
+	while ((token = strtok_r(NULL, " \t\r\n", &saveptr))) {
+		char *value = strchr(token, '=');
+
+		if (!value) {
+			reply(fd, "ERR Invalid argument: %s", token);
+			return;
+		}
+		*value++ = '\0';
+		if (!strcmp(token, "policy"))
+			name = value;
+		else if (!strcmp(token, "cgroup"))
+			cgroup_path = value;
+		else if (!strcmp(token, "watch_dir"))
+			watch_dir = value;
+		else if (!strcmp(token, "cgroup_size"))
+			cgroup_size = strtoul(value, NULL, 10);
+		else if (!strcmp(token, "recursive"))
+			recursive = strcmp(value, "0");
+		else if (!strcmp(token, "scope")) {
+			if (watch_scope_parse(value, &scope)) {
+				reply(fd, "ERR Invalid scope: %s", value);
+				return;
+			}
+		} else {
+			reply(fd, "ERR Unknown argument: %s", token);
+			return;
+		}
+	}
+
+	if (!strcmp(command, "PING")) {
+		reply(fd, "OK");
+	} else if (!strcmp(command, "ATTACH")) {
+		handle_attach(fd, name, cgroup_path, watch_dir, cgroup_size, recursive,
+			      scope);
+	} else if (!strcmp(command, "DETACH") || !strcmp(command, "STATS")) {
+		p = cgroup_path ? find_attached(cgroup_path) : NULL;
+		if (!p) {
+			reply(fd, "ERR No policy attached to %s", cgroup_path);
+			return;
+		}
+		if (!strcmp(command, "DETACH")) {
+			// Stop the policy before reading its final stats
+			bpf_link__destroy(p->ops_link);
+			p->ops_link = NULL;
+			reply_stats(fd, p);
+			policy_detach(p);
+			fprintf(stderr, "Detached %s from %s\n", p->name, cgroup_path);
+			policy_unload(p);
+		} else {
+			reply_stats(fd, p);
+		}
+	} else {
+		reply(fd, "ERR Unknown command: %s", command);
+	}
+}
+
+static int read_request(int fd, char *request, size_t len)
+{
+	size_t pos = 0;
+	ssize_t n;
+
+	while (pos < len - 1) {
+		n = read(fd, request + pos, len - 1 - pos);
+		if (n <= 0)
+			return -1;
+		pos += n;
+		if (memchr(request, '\n', pos))
+			break;
+	}
+	request[pos] = '\0';
+	return 0;
+}
+
+static int listen_socket(const char *socket_path, const char *group)
+{
+	struct sockaddr_un addr = { .sun_family = AF_UNIX };
+	struct group *gr = NULL;
+	int fd;
+
+	if (group) {
+		gr = getgrnam(group);
+		if (!gr) {
+			fprintf(stderr, "Unknown group: %s\n", group);
+			return -1;
+		}
+	}
+
+	if (strlen(socket_path) >= sizeof(addr.sun_path)) {
+		fprintf(stderr, "Socket path too long: %s\n", socket_path);
+		return -1;
+	}
+	strcpy(addr.sun_path, socket_path);
+
+	fd = socket(AF_UNIX, SOCK_STREAM | SOCK_CLOEXEC, 0);
+	if (fd < 0) {
+		perror("Failed to create socket");
+		return -1;
+	}
+	unlink(socket_path);
+	if (bind(fd, (struct sockaddr *)&addr, sizeof(addr))) {
+		perror("Failed to bind socket");
+		close(fd);
+		return -1;
+	}
+	// Requests attach policies to any cgroup, so only root and --group
+	// (e.g. the group of the benchmark user) may connect
+	if ((gr && chown(socket_path, -1, gr->gr_gid)) ||
+	    chmod(socket_path, gr ? 0660 : 0600) || listen(fd, 8)) {
+		perror("Failed to listen on socket");
+		close(fd);
+		return -1;
+	}
+	return fd;
+}
+
+int main(int argc, char **argv) {
+	struct cmdline_args args = { .socket_path = DEFAULT_SOCKET_PATH };
+	struct argp argp = { options, parse_opt, 0, 0 };
+	struct timeval timeout = { .tv_sec = REQUEST_TIMEOUT_SEC };
+	char request[MAX_REQUEST_LEN];
+	char exe_path[PATH_MAX];
+	struct sigaction sa;
+	int listen_fd, fd;
+
+	libbpf_set_strict_mode(LIBBPF_STRICT_ALL);
+
+	argp_parse(&argp, argc, argv, 0, 0, &args);
+
+	if (!args.policy_dir) {
+		if (!realpath("/proc/self/exe", exe_path)) {
+			perror("realpath");
+			return 1;
+		}
+		args.policy_dir = dirname(exe_path);
+	}
+	if (!realpath(args.policy_dir, policy_dir)) {
+		fprintf(stderr, "Invalid policy_dir %s: %s\n", args.policy_dir,
+			strerror(errno));
+		return 1;
+	}
+
+	// No SA_RESTART, so that accept() returns on SIGINT/SIGTERM
+	memset(&sa, 0, sizeof(sa));
+	sigemptyset(&sa.sa_mask);
+	sa.sa_handler = sig_handler;
+	if (sigaction(SIGINT, &sa, NULL) || sigaction(SIGTERM, &sa, NULL)) {
+		perror("Failed to set up signal handling");
+		return 1;
+	}
+	signal(SIGPIPE, SIG_IGN);
+
+	listen_fd = listen_socket(args.socket_path, args.group);
+	if (listen_fd < 0)
+		return 1;
+
+	printf("cache_ext_policyd: listening on %s, policies in %s\n",
+	       args.socket_path, policy_dir);
+	fflush(stdout);
+
+	while (!exiting) {
+		fd = accept4(listen_fd, NULL, NULL, SOCK_CLOEXEC);
+		if (fd < 0) {
+			if (errno != EINTR)
+				perror("accept");
+			continue;
+		}
+		// Don't let a stuck client block the other requests
+		setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof(timeout));
+		if (!read_request(fd, request, sizeof(request)))
+			handle_request(fd, request);
+		close(fd);
+	}
+
+	for (int i = 0; i < MAX_POLICIES; i++) {
+		if (!policies[i].loaded)
+			continue;
+		policy_detach(&policies[i]);
+		policy_unload(&policies[i]);
+	}
+	close(listen_fd);
+	unlink(args.socket_path);
+	return 0;
+}
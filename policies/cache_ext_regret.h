@@ -0,0 +1,176 @@
+#ifndef _CACHE_EXT_REGRET_H
+#define _CACHE_EXT_REGRET_H
+
+/*
+ * Eviction regret accounting, independent of the policy: every eviction is
+ * remembered in a bounded ghost LRU map, keyed like the ghost maps of the
+ * s3fifo and mglru policies, and a folio added again while its ghost entry is
+ * still there is a refault. Its reuse distance, in page requests (insertions
+ * and accesses) and in time since the eviction, goes into log2 histograms, so
+ * that the eviction quality of policies can be compared directly: the fewer
+ * short-distance refaults, the better the evictions.
+ *
+ * Enabled with --regret_ghost_entries in the loaders, see
+ * eviction_regret_record() in cache_ext_lib.bpf.h.
+ */
+
+#ifndef __bpf__
+#include <linux/types.h>
+#endif
+
+// Bucket i counts the distances d with 2^i <= d < 2^(i + 1), bucket 0 d <= 1
+#define REGRET_HIST_BUCKETS 40
+
+enum regret_hist {
+	REGRET_HIST_REQUESTS,	// Page requests between eviction and refault
+	REGRET_HIST_TIME_US,	// Microseconds between eviction and refault
+	NR_REGRET_HISTS,
+};
+
+struct regret_ghost_key {
+	__u64 address_space;
+	__u64 offset;
+};
+
+struct regret_ghost {
+	__u64 evict_ns;
+	__u64 evict_request;	// Value of the request clock at eviction
+};
+
+#ifndef __bpf__
+
+#include <argp.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include <bpf/bpf.h>
+#include <bpf/libbpf.h>
+
+#define DEFAULT_REGRET_WINDOW_SEC 10
+
+static const char *regret_hist_names[NR_REGRET_HISTS] = {
+	[REGRET_HIST_REQUESTS] = "request_distance_hist",
+	[REGRET_HIST_TIME_US] = "time_us_hist",
+};
+
+// Set by --regret_ghost_entries and --regret_window_*, see eviction_regret_argp
+static unsigned long regret_ghost_entries;
+static unsigned long regret_window_requests;
+static unsigned long regret_window_sec = DEFAULT_REGRET_WINDOW_SEC;
+
+#define REGRET_GHOST_ENTRIES_OPT_KEY 0x1004
+#define REGRET_WINDOW_REQUESTS_OPT_KEY 0x1005
+#define REGRET_WINDOW_SEC_OPT_KEY 0x1006
+
+static error_t eviction_regret_parse_opt(int key, char *arg,
+					 struct argp_state *state)
+{
+	unsigned long value;
+	char *end;
+
+	if (key != REGRET_GHOST_ENTRIES_OPT_KEY &&
+	    key != REGRET_WINDOW_REQUESTS_OPT_KEY &&
+	    key != REGRET_WINDOW_SEC_OPT_KEY)
+		return ARGP_ERR_UNKNOWN;
+
+	value = strtoul(arg, &end, 10);
+	if (*end)
+		argp_error(state, "Invalid number: %s", arg);
+	if (key == REGRET_GHOST_ENTRIES_OPT_KEY)
+		regret_ghost_entries = value;
+	else if (key == REGRET_WINDOW_REQUESTS_OPT_KEY)
+		regret_window_requests = value;
+	else
+		regret_window_sec = value;
+	return 0;
+}
+
+static struct argp_option eviction_regret_options[] = {
+	{ "regret_ghost_entries", REGRET_GHOST_ENTRIES_OPT_KEY, "N", 0,
+	  "Track refaults of the last N evicted pages (default 0, disabled)" },
+	{ "regret_window_requests", REGRET_WINDOW_REQUESTS_OPT_KEY, "N", 0,
+	  "Count refaults within N page requests (default regret_ghost_entries)" },
+	{ "regret_window_sec", REGRET_WINDOW_SEC_OPT_KEY, "SEC", 0,
+	  "Count refaults within SEC seconds (default 10)" },
+	{ 0 },
+};
+
+static struct argp eviction_regret_argp = { eviction_regret_options,
+					    eviction_regret_parse_opt, 0, 0 };
+
+/*
+ * Enable regret accounting in the policy and size its ghost map, before
+ * loading it. The ghost map is left at a single entry otherwise.
+ */
+#define eviction_regret_set_rodata(skel)					\
+	({									\
+		int __ret = 0;							\
+		if (!regret_window_requests)					\
+			regret_window_requests = regret_ghost_entries;		\
+		(skel)->rodata->regret_enabled = regret_ghost_entries != 0;	\
+		(skel)->rodata->regret_window_requests = regret_window_requests; \
+		(skel)->rodata->regret_window_ns =				\
+			regret_window_sec * 1000000000ULL;			\
+		if (regret_ghost_entries)					\
+			__ret = bpf_map__set_max_entries(			\
+				(skel)->maps.regret_ghost_map,			\
+				regret_ghost_entries);				\
+		__ret;								\
+	})
+
+/*
+ * Sum the per-CPU histograms and print them as a single JSON line:
+ *   eviction_regret_stats: {"ghost_entries": 1, ..., "time_us_hist": [...]}
+ * The refault counts are in the policy stats (cache_ext_stats.h).
+ */
+static int eviction_regret_print(struct bpf_map *hist_map)
+{
+	int nr_cpus = libbpf_num_possible_cpus();
+	int map_fd = bpf_map__fd(hist_map);
+	__u64 *values;
+
+	if (!regret_ghost_entries)
+		return 0;
+	if (nr_cpus < 0) {
+		fprintf(stderr, "Failed to get number of CPUs: %d\n", nr_cpus);
+		return -1;
+	}
+	values = calloc(nr_cpus, sizeof(*values));
+	if (!values) {
+		perror("Failed to allocate regret buffer");
+		return -1;
+	}
+
+	printf("eviction_regret_stats: {\"ghost_entries\": %lu, "
+	       "\"window_requests\": %lu, \"window_sec\": %lu",
+	       regret_ghost_entries, regret_window_requests, regret_window_sec);
+	for (int hist = 0; hist < NR_REGRET_HISTS; hist++) {
+		printf(", \"%s\": [", regret_hist_names[hist]);
+		for (__u32 bucket = 0; bucket < REGRET_HIST_BUCKETS; bucket++) {
+			__u32 key = hist * REGRET_HIST_BUCKETS + bucket;
+			__u64 total = 0;
+
+			if (bpf_map_lookup_elem(map_fd, &key, values)) {
+				perror("Failed to read regret histogram");
+				free(values);
+				printf("]}\n");
+				return -1;
+			}
+			for (int cpu = 0; cpu < nr_cpus; cpu++)
+				total += values[cpu];
+			printf("%s%llu", bucket ? ", " : "",
+			       (unsigned long long)total);
+		}
+		printf("]");
+	}
+	printf("}\n");
+	fflush(stdout);
+
+	free(values);
+	return 0;
+}
+
+#endif /* __bpf__ */
+
+#endif /* _CACHE_EXT_REGRET_H */
@@ -28,12 +28,7 @@ struct ghost_entry {
 	u64 offset;
 };
 
-struct {
-	__uint(type, BPF_MAP_TYPE_HASH);
-	__type(key, u64);
-	__type(value, struct folio_metadata);
-	__uint(max_entries, 4000000);
-} folio_metadata_map SEC(".maps");
+DEFINE_FOLIO_METADATA_MAP(struct folio_metadata);
 
 struct {
 	__uint(type, BPF_MAP_TYPE_LRU_HASH);
@@ -57,12 +52,12 @@ static inline bool is_folio_relevant(struct folio *folio) {
 	if (!folio || !folio->mapping || !folio->mapping->host)
 		return false;
 
-	return inode_in_watchlist(folio->mapping->host->i_ino);
+	return inode_in_watch_scope(folio->mapping->host);
 }
 
 static inline struct folio_metadata *get_folio_metadata(struct folio *folio) {
 	u64 key = (u64)folio;
-	return bpf_map_lookup_elem(&folio_metadata_map, &key);
+	return folio_metadata_lookup(&folio_metadata_map, key);
 }
 
 /*
@@ -99,6 +94,8 @@ s32 BPF_STRUCT_OPS_SLEEPABLE(s3fifo_init, struct mem_cgroup *memcg)
 }
 
 static s64 bpf_s3fifo_score_main_fn(struct cache_ext_list_node *a) {
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
+
 	if (!folio_test_uptodate(a->folio) || !folio_test_lru(a->folio))
 		return INT64_MAX;
 
@@ -107,6 +104,7 @@ static s64 bpf_s3fifo_score_main_fn(struct cache_ext_list_node *a) {
 
 	struct folio_metadata *data = get_folio_metadata(a->folio);
 	if (!data) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: score_fn: Failed to get metadata\n");
 		return INT64_MAX;
 	}
@@ -120,6 +118,8 @@ static s64 bpf_s3fifo_score_main_fn(struct cache_ext_list_node *a) {
 
 static int bpf_s3fifo_score_small_fn(int idx, struct cache_ext_list_node *a)
 {
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
+
 	if (!folio_test_uptodate(a->folio) || !folio_test_lru(a->folio))
 		return CACHE_EXT_CONTINUE_ITER;
 
@@ -128,6 +128,7 @@ static int bpf_s3fifo_score_small_fn(int idx, struct cache_ext_list_node *a)
 
 	struct folio_metadata *data = get_folio_metadata(a->folio);
 	if (!data) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: score_fn: Failed to get metadata\n");
 		return CACHE_EXT_CONTINUE_ITER;
 	}
@@ -150,7 +151,8 @@ static void evict_main(struct cache_ext_eviction_ctx *eviction_ctx, struct mem_c
 	 */
 
 	struct sampling_options opts = {
-		.sample_size = 10,
+		.sample_size = cache_ext_param(CACHE_EXT_PARAM_SAMPLE_SIZE,
+					       S3FIFO_DEFAULT_SAMPLE_SIZE),
 	};
 
 	if (bpf_cache_ext_list_sample(memcg, main_list, bpf_s3fifo_score_main_fn, &opts,
@@ -166,6 +168,8 @@ static void evict_main(struct cache_ext_eviction_ctx *eviction_ctx, struct mem_c
 #define MAIN_ITER_FN(id) 								\
 static int bpf_s3fifo_score_main_iter_fn_##id(int idx, struct cache_ext_list_node *a) 	\
 { 											\
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS); 					\
+ 											\
 	if (!folio_test_uptodate(a->folio) || !folio_test_lru(a->folio)) 		\
 		return CACHE_EXT_CONTINUE_ITER; 					\
  											\
@@ -174,6 +178,7 @@ static int bpf_s3fifo_score_main_iter_fn_##id(int idx, struct cache_ext_list_nod
  											\
 	struct folio_metadata *data = get_folio_metadata(a->folio); 			\
 	if (!data) { 									\
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES); 			\
 		bpf_printk("cache_ext: score_fn: Failed to get metadata\n"); 		\
 		return CACHE_EXT_CONTINUE_ITER; 					\
 	} 										\
@@ -275,18 +280,26 @@ void BPF_STRUCT_OPS(s3fifo_evict_folios, struct cache_ext_eviction_ctx *eviction
 {
 	// bpf_printk("cache_ext: evict_folios: main_list_size: %lld, small_list_size: %lld, cache_size: %lld\n",
 	// 	   main_list_size, small_list_size, cache_size);
-	if (small_list_size >= cache_size / 15 || main_list_size <= 2 * small_list_size)
+	u64 small_queue_divisor = cache_ext_param(CACHE_EXT_PARAM_SMALL_QUEUE_DIVISOR,
+						  S3FIFO_DEFAULT_SMALL_QUEUE_DIVISOR);
+
+	if (small_list_size >= cache_size / small_queue_divisor ||
+	    main_list_size <= 2 * small_list_size)
 		evict_small(eviction_ctx, memcg);
 	else
 		evict_main_iter(eviction_ctx, memcg);
+	cache_ext_stat_evict(eviction_ctx);
 }
 
 void BPF_STRUCT_OPS(s3fifo_folio_accessed, struct folio *folio) {
 	if (!is_folio_relevant(folio))
 		return;
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 
 	struct folio_metadata *data = get_folio_metadata(folio);
 	if (!data) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: accessed: Failed to get metadata\n");
 		return;
 	}
@@ -300,6 +313,9 @@ void BPF_STRUCT_OPS(s3fifo_folio_evicted, struct folio *folio) {
 	u64 key = (u64)folio;
 	u8 ghost_val = 0;
 
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
+
 	// if (bpf_cache_ext_list_del(folio)) {
 	// 	bpf_printk("cache_ext: Failed to delete folio from sampling_list\n");
 	// 	return;
@@ -367,6 +383,8 @@ void BPF_STRUCT_OPS(s3fifo_folio_added, struct folio *folio) {
 		bpf_printk("cache_ext: added: Failed to create folio metadata\n");
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
 }
 
 SEC(".struct_ops.link")
@@ -37,12 +37,7 @@ struct folio_metadata {
 	u64 accesses;
 };
 
-struct {
-	__uint(type, BPF_MAP_TYPE_HASH);
-	__type(key, __u64);
-	__type(value, struct folio_metadata);
-	__uint(max_entries, 4000000);
-} folio_metadata_map SEC(".maps");
+DEFINE_FOLIO_METADATA_MAP(struct folio_metadata);
 
 __u64 sampling_list;
 
@@ -98,7 +93,7 @@ inline bool is_folio_relevant(struct folio *folio)
 		// bpf_printk("folio not relevant because it's host is null\n");
 		return false;
 	}
-	bool res = inode_in_watchlist(folio->mapping->host->i_ino);
+	bool res = inode_in_watch_scope(folio->mapping->host);
 	// if (!res) {
 	// 	bpf_printk("folio not relevant because it's inode is not in watchlist, inode %llu\n",
 	// 		   folio->mapping->host->i_ino);
@@ -138,6 +133,8 @@ void BPF_STRUCT_OPS(sampling_folio_added, struct folio *folio)
 	dbg_printk("cache_ext: Added folio to sampling_list\n");
 
 	update_stat(&STAT_TOTAL_PAGES, 1);
+	cache_ext_stat_inc(CACHE_EXT_STAT_INSERTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_ADDED);
 
 	// Create folio metadata
 	u64 key = (u64)folio;
@@ -150,11 +147,14 @@ void BPF_STRUCT_OPS(sampling_folio_accessed, struct folio *folio)
 	if (!is_folio_relevant(folio)) {
 		return;
 	}
+	cache_ext_stat_inc(CACHE_EXT_STAT_ACCESSES);
+	cache_ext_folio_event(folio, PAGE_TRACE_ACCESSED);
 	// TODO: Update folio metadata with other values we want to track
 	struct folio_metadata *meta;
 	u64 key = (u64)folio;
-	meta = bpf_map_lookup_elem(&folio_metadata_map, &key);
+	meta = folio_metadata_lookup(&folio_metadata_map, key);
 	if (!meta) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		struct folio_metadata new_meta = { 0 };
 		int ret = bpf_map_update_elem(&folio_metadata_map, &key,
 					      &new_meta, BPF_ANY);
@@ -164,7 +164,7 @@ void BPF_STRUCT_OPS(sampling_folio_accessed, struct folio *folio)
 				ret);
 			return;
 		}
-		meta = bpf_map_lookup_elem(&folio_metadata_map, &key);
+		meta = folio_metadata_lookup(&folio_metadata_map, key);
 		if (meta == NULL) {
 			bpf_printk("cache_ext: Failed to get created folio metadata in accessed\n");
 			return;
@@ -186,6 +186,8 @@ void BPF_STRUCT_OPS(sampling_folio_evicted, struct folio *folio)
 	bpf_map_delete_elem(&folio_metadata_map, &key);
 	update_stat(&STAT_TOTAL_PAGES, -1);
 	update_stat(&STAT_EVICTED_TOTAL_PAGES, 1);
+	cache_ext_stat_inc(CACHE_EXT_STAT_EVICTIONS);
+	cache_ext_folio_event(folio, PAGE_TRACE_EVICTED);
 
 }
 
@@ -216,8 +218,10 @@ static s64 bpf_lfu_score_fn(struct cache_ext_list_node *a)
 	s64 score = 0;
 	struct folio_metadata *meta_a;
 	u64 key_a = (u64)a->folio;
-	meta_a = bpf_map_lookup_elem(&folio_metadata_map, &key_a);
+	cache_ext_stat_inc(CACHE_EXT_STAT_ITERATIONS);
+	meta_a = folio_metadata_lookup(&folio_metadata_map, key_a);
 	if (!meta_a) {
+		cache_ext_stat_inc(CACHE_EXT_STAT_METADATA_MISSES);
 		bpf_printk("cache_ext: Failed to get metadata\n");
 		return INT64_MAX;
 	}
@@ -248,10 +252,12 @@ void BPF_STRUCT_OPS(sampling_evict_folios,
 		"cache_ext: Hi from the sampling_evict_folios hook! :D\n");
 
 	struct sampling_options sampling_opts = {
-		.sample_size = 20,
+		.sample_size = cache_ext_param(CACHE_EXT_PARAM_SAMPLE_SIZE,
+					       SAMPLING_DEFAULT_SAMPLE_SIZE),
 	};
 	bpf_cache_ext_list_sample(memcg, sampling_list, bpf_lfu_score_fn,
 				  &sampling_opts, eviction_ctx);
+	cache_ext_stat_evict(eviction_ctx);
 	dbg_printk("cache_ext: Evicting %d pages (%d requested)\n",
 			   eviction_ctx->nr_folios_to_evict,
 			   eviction_ctx->request_nr_folios_to_evict);
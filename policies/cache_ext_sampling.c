@@ -2,6 +2,7 @@
 #include <bpf/bpf.h>
 #include <fcntl.h>
 #include <limits.h>
+#include <signal.h>
 #include <stdio.h>
 #include <string.h>
 #include <sys/stat.h>
@@ -12,19 +13,47 @@
 
 #include "cache_ext_sampling.skel.h"
 #include "dir_watcher.h"
+#include "cache_ext_stats.h"
+#include "cache_ext_trace.h"
+#include "cache_ext_regret.h"
+#include "cache_ext_params.h"
+#include "cache_ext_metadata.h"
 
-char *USAGE = "Usage: ./cache_ext_sampling --watch_dir <dir> --cgroup_path <path>\n";
+char *USAGE = "Usage: ./cache_ext_sampling --watch_dir <dir> --cgroup_path <path> [--cgroup_size <size>]\n";
 struct cmdline_args {
 	char *watch_dir;
 	char *cgroup_path;
+	unsigned long cgroup_size;
 };
 
 static struct argp_option options[] = { { "watch_dir", 'w', "DIR", 0,
 					  "Directory to watch" },
 					{ "cgroup_path", 'c', "PATH", 0,
 					  "Path to cgroup (e.g., /sys/fs/cgroup/cache_ext_test)" },
+					{ "cgroup_size", 's', "SIZE", 0,
+					  "Size of the cgroup, to size the folio metadata map" },
 					{ 0 } };
 
+// Parameters of this policy, see cache_ext_params.h
+static const __u64 param_defaults[NR_CACHE_EXT_PARAMS] = {
+	[CACHE_EXT_PARAM_SAMPLE_SIZE] = SAMPLING_DEFAULT_SAMPLE_SIZE,
+};
+
+// Adds --watch_scope, --param, --page_trace and --regret_*
+static struct argp_child argp_children[] = {
+	{ &watch_scope_argp, 0, 0, 0 },
+	{ &cache_ext_params_argp, 0, 0, 0 },
+	{ &page_trace_argp, 0, 0, 0 },
+	{ &eviction_regret_argp, 0, 0, 0 },
+	{ 0 },
+};
+
+static volatile sig_atomic_t exiting;
+
+static void sig_handler(int signo) {
+	exiting = 1;
+}
+
 static error_t parse_opt(int key, char *arg, struct argp_state *state)
 {
 	struct cmdline_args *args = state->input;
@@ -35,6 +64,9 @@ static error_t parse_opt(int key, char *arg, struct argp_state *state)
 	case 'c':
 		args->cgroup_path = arg;
 		break;
+	case 's':
+		args->cgroup_size = strtoul(arg, NULL, 10);
+		break;
 	default:
 		return ARGP_ERR_UNKNOWN;
 	}
@@ -47,13 +79,27 @@ int main(int argc, char **argv)
 	struct cache_ext_sampling_bpf *skel = NULL;
 	struct bpf_link *link = NULL;
 	int cgroup_fd = -1;
+	char stats_pin_path[PATH_MAX] = "";
+	struct page_trace_recorder page_trace = { 0 };
+	char params_pin_path[PATH_MAX] = "";
 	libbpf_set_strict_mode(LIBBPF_STRICT_ALL);
 
 	// Parse command line arguments
 	struct cmdline_args args = { 0 };
-	struct argp argp = { options, parse_opt, 0, 0 };
+	struct argp argp = { options, parse_opt, 0, 0, argp_children };
 	argp_parse(&argp, argc, argv, 0, 0, &args);
 
+	// Install signal handler. SIGINT interrupts the wait below, so that the
+	// policy stats are printed before exiting.
+	struct sigaction sa;
+	memset(&sa, 0, sizeof(sa));
+	sigemptyset(&sa.sa_mask);
+	sa.sa_handler = sig_handler;
+	if (sigaction(SIGINT, &sa, NULL)) {
+		perror("Failed to set up signal handling");
+		return 1;
+	}
+
 	// Validate arguments
 	if (args.watch_dir == NULL) {
 		fprintf(stderr, "Missing required argument: watch_dir\n");
@@ -103,6 +149,41 @@ int main(int argc, char **argv)
 	skel->rodata->watch_dir_path_len = strlen(watch_dir_full_path);
 	strcpy(skel->rodata->watch_dir_path, watch_dir_full_path);
 
+	// Size the folio metadata after the cgroup, instead of for the largest one
+	if (folio_metadata_set_size(skel->maps.folio_metadata_map, args.cgroup_size)) {
+		fprintf(stderr, "Failed to size folio_metadata_map\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	struct watch_scope scope;
+	if (watch_scope_init(watch_dir_full_path, watch_scope_mode, true, &scope)) {
+		perror("Failed to resolve watch_scope");
+		ret = 1;
+		goto cleanup;
+	}
+	watch_scope_set_rodata(skel, &scope);
+
+	if (page_trace_set_rodata(skel)) {
+		fprintf(stderr, "Failed to size the page trace ring buffer\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	if (eviction_regret_set_rodata(skel)) {
+		fprintf(stderr, "Failed to size the regret ghost map\n");
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Walk watch_dir before loading, to size inode_watchlist after it
+	struct watch_dir_inodes watch_dir_inodes;
+	if (watch_dir_prepare(watch_dir_full_path, &scope, skel->maps.inode_watchlist, &watch_dir_inodes)) {
+		perror("Failed to walk watch_dir");
+		ret = 1;
+		goto cleanup;
+	}
+
 	// Load programs
 	ret = cache_ext_sampling_bpf__load(skel);
 	if (ret) {
@@ -111,13 +192,36 @@ int main(int argc, char **argv)
 	}
 
 	// Initialize inode_watchlist map
-	ret = initialize_watch_dir_map(
-	    args.watch_dir, bpf_map__fd(skel->maps.inode_watchlist), true);
+	ret = watch_dir_populate(bpf_map__fd(skel->maps.inode_watchlist), &watch_dir_inodes);
 	if (ret) {
 		perror("Failed to initialize inode watchlist map");
 		goto cleanup;
 	}
 
+	folio_metadata_print(skel->maps.folio_metadata_map);
+
+	// Set the policy parameters and pin them, so that they can be tuned at runtime
+	if (cache_ext_params_init(skel->maps.cache_ext_params, param_defaults) ||
+	    cache_ext_params_pin(skel->maps.cache_ext_params, args.cgroup_path,
+				 params_pin_path, sizeof(params_pin_path))) {
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Pin stats map
+	if (cache_ext_stats_pin(skel->maps.cache_ext_stats, args.cgroup_path,
+				stats_pin_path, sizeof(stats_pin_path))) {
+		ret = 1;
+		goto cleanup;
+	}
+
+	// Record the page trace from before the policy sees the first folio
+	if (page_trace_start(&page_trace, skel->maps.page_trace_ringbuf,
+			     skel->maps.page_trace_batches)) {
+		ret = 1;
+		goto cleanup;
+	}
+
 	// Attach cache_ext_ops to the specific cgroup
 	link = bpf_map__attach_cache_ext_ops(skel->maps.sampling_ops, cgroup_fd);
 	if (link == NULL) {
@@ -132,13 +236,23 @@ int main(int argc, char **argv)
 		goto cleanup;
 	}
 
+	// Tell the benchmark that the policy is attached
+	printf("cache_ext: attached\n");
+	fflush(stdout);
+
 	// Wait for keyboard input
 	printf("Press any key to exit...\n");
 	getchar();
+	cache_ext_stats_print(skel->maps.cache_ext_stats);
+	eviction_regret_print(skel->maps.regret_hist);
 
 cleanup:
+	cache_ext_stats_unpin(stats_pin_path);
+	cache_ext_map_unpin(params_pin_path);
 	close(cgroup_fd);
 	bpf_link__destroy(link);
+	// After detaching, so that no events are missed
+	page_trace_stop(&page_trace);
 	cache_ext_sampling_bpf__destroy(skel);
 	return 0;
 }
@@ -0,0 +1,190 @@
+#ifndef _CACHE_EXT_STATS_H
+#define _CACHE_EXT_STATS_H
+
+/*
+ * Policy stats counters, shared by the BPF policies (cache_ext_lib.bpf.h) and
+ * their loaders. The counters live in a per-CPU array map, so incrementing
+ * them is a lookup and a non-atomic add.
+ */
+enum cache_ext_stat {
+	CACHE_EXT_STAT_INSERTIONS,	// Folios added to a policy list
+	CACHE_EXT_STAT_ACCESSES,	// folio_accessed calls on watched folios
+	CACHE_EXT_STAT_EVICTIONS,	// folio_evicted calls
+	CACHE_EXT_STAT_EVICT_CALLS,	// evict_folios calls
+	CACHE_EXT_STAT_EVICT_REQUESTED,	// Folios requested by evict_folios
+	CACHE_EXT_STAT_EVICT_SELECTED,	// Folios selected by evict_folios
+	CACHE_EXT_STAT_ITERATIONS,	// Iterate/sample callback invocations
+	CACHE_EXT_STAT_METADATA_MISSES,	// Failed folio metadata lookups
+	CACHE_EXT_STAT_METADATA_LOOKUPS,	// folio_metadata_lookup() calls
+	CACHE_EXT_STAT_METADATA_LOOKUP_SAMPLES,	// Timed lookups, a sample of them
+	CACHE_EXT_STAT_METADATA_LOOKUP_NS,	// Total time of the timed lookups
+	CACHE_EXT_STAT_TRACE_EVENTS,	// Page trace events sent to the loader
+	CACHE_EXT_STAT_TRACE_DROPS,	// Page trace events lost, ring buffer full
+	CACHE_EXT_STAT_REFAULTS,	// Folios added again while in the regret ghost map
+	CACHE_EXT_STAT_REFAULTS_REQUEST_WINDOW,	// Of which within regret_window_requests
+	CACHE_EXT_STAT_REFAULTS_TIME_WINDOW,	// Of which within regret_window_sec
+	NR_CACHE_EXT_STATS,
+};
+
+#ifndef __bpf__
+
+#include <errno.h>
+#include <libgen.h>
+#include <limits.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <bpf/bpf.h>
+#include <bpf/libbpf.h>
+
+#define CACHE_EXT_BPFFS_DIR "/sys/fs/bpf/cache_ext"
+
+static const char *cache_ext_stat_names[NR_CACHE_EXT_STATS] = {
+	[CACHE_EXT_STAT_INSERTIONS] = "insertions",
+	[CACHE_EXT_STAT_ACCESSES] = "accesses",
+	[CACHE_EXT_STAT_EVICTIONS] = "evictions",
+	[CACHE_EXT_STAT_EVICT_CALLS] = "evict_calls",
+	[CACHE_EXT_STAT_EVICT_REQUESTED] = "evict_requested",
+	[CACHE_EXT_STAT_EVICT_SELECTED] = "evict_selected",
+	[CACHE_EXT_STAT_ITERATIONS] = "iterations",
+	[CACHE_EXT_STAT_METADATA_MISSES] = "metadata_misses",
+	[CACHE_EXT_STAT_METADATA_LOOKUPS] = "metadata_lookups",
+	[CACHE_EXT_STAT_METADATA_LOOKUP_SAMPLES] = "metadata_lookup_samples",
+	[CACHE_EXT_STAT_METADATA_LOOKUP_NS] = "metadata_lookup_ns",
+	[CACHE_EXT_STAT_TRACE_EVENTS] = "trace_events",
+	[CACHE_EXT_STAT_TRACE_DROPS] = "trace_drops",
+	[CACHE_EXT_STAT_REFAULTS] = "refaults",
+	[CACHE_EXT_STAT_REFAULTS_REQUEST_WINDOW] = "refaults_request_window",
+	[CACHE_EXT_STAT_REFAULTS_TIME_WINDOW] = "refaults_time_window",
+};
+
+/*
+ * Pin a policy map at /sys/fs/bpf/cache_ext/<name>_<cgroup name>, so that it
+ * can be read or updated (e.g. with bpftool) while the policy is running.
+ */
+static int cache_ext_map_pin(struct bpf_map *map, const char *name,
+			     const char *cgroup_path, char *pin_path,
+			     size_t pin_path_len)
+{
+	char cgroup_path_copy[PATH_MAX];
+
+	if (mkdir(CACHE_EXT_BPFFS_DIR, 0700) && errno != EEXIST) {
+		perror("Failed to create " CACHE_EXT_BPFFS_DIR);
+		return -1;
+	}
+
+	snprintf(cgroup_path_copy, sizeof(cgroup_path_copy), "%s", cgroup_path);
+	snprintf(pin_path, pin_path_len, "%s/%s_%s", CACHE_EXT_BPFFS_DIR, name,
+		 basename(cgroup_path_copy));
+
+	// Remove a stale pin left by a loader that was killed
+	unlink(pin_path);
+	if (bpf_map__pin(map, pin_path)) {
+		fprintf(stderr, "Failed to pin %s map: %s\n", name,
+			strerror(errno));
+		return -1;
+	}
+	return 0;
+}
+
+static void cache_ext_map_unpin(const char *pin_path)
+{
+	if (pin_path[0] && unlink(pin_path))
+		fprintf(stderr, "Failed to unpin %s: %s\n", pin_path,
+			strerror(errno));
+}
+
+// Pin the stats map at /sys/fs/bpf/cache_ext/stats_<cgroup name>
+static int cache_ext_stats_pin(struct bpf_map *map, const char *cgroup_path,
+			       char *pin_path, size_t pin_path_len)
+{
+	return cache_ext_map_pin(map, "stats", cgroup_path, pin_path,
+				 pin_path_len);
+}
+
+static void cache_ext_stats_unpin(const char *pin_path)
+{
+	cache_ext_map_unpin(pin_path);
+}
+
+/*
+ * Sum the per-CPU counters and print them as a single JSON line:
+ *   cache_ext_stats: {"insertions": 1, ...}
+ */
+static int cache_ext_stats_fprint(FILE *f, struct bpf_map *map)
+{
+	int nr_cpus = libbpf_num_possible_cpus();
+	int map_fd = bpf_map__fd(map);
+	__u64 *values;
+
+	if (nr_cpus < 0) {
+		fprintf(stderr, "Failed to get number of CPUs: %d\n", nr_cpus);
+		return -1;
+	}
+
+	values = calloc(nr_cpus, sizeof(*values));
+	if (!values) {
+		perror("Failed to allocate stats buffer");
+		return -1;
+	}
+
+	fprintf(f, "cache_ext_stats: {");
+	for (__u32 key = 0; key < NR_CACHE_EXT_STATS; key++) {
+		__u64 total = 0;
+
+		if (bpf_map_lookup_elem(map_fd, &key, values)) {
+			perror("Failed to read stats map");
+			free(values);
+			fprintf(f, "}\n");
+			return -1;
+		}
+		for (int cpu = 0; cpu < nr_cpus; cpu++)
+			total += values[cpu];
+		fprintf(f, "%s\"%s\": %llu", key ? ", " : "",
+			cache_ext_stat_names[key], (unsigned long long)total);
+	}
+	fprintf(f, "}\n");
+	fflush(f);
+
+	free(values);
+	return 0;
+}
+
+static int cache_ext_stats_print(struct bpf_map *map)
+{
+	return cache_ext_stats_fprint(stdout, map);
+}
+
+// Zero the counters, e.g. before reattaching an already loaded policy
+static int cache_ext_stats_reset(struct bpf_map *map)
+{
+	int nr_cpus = libbpf_num_possible_cpus();
+	int map_fd = bpf_map__fd(map);
+	__u64 *zeros;
+	int ret = 0;
+
+	if (nr_cpus < 0)
+		return -1;
+
+	zeros = calloc(nr_cpus, sizeof(*zeros));
+	if (!zeros)
+		return -1;
+
+	for (__u32 key = 0; key < NR_CACHE_EXT_STATS; key++) {
+		if (bpf_map_update_elem(map_fd, &key, zeros, BPF_EXIST)) {
+			perror("Failed to reset stats map");
+			ret = -1;
+			break;
+		}
+	}
+
+	free(zeros);
+	return ret;
+}
+
+#endif /* __bpf__ */
+
+#endif /* _CACHE_EXT_STATS_H */
@@ -0,0 +1,291 @@
+#ifndef _CACHE_EXT_TRACE_H
+#define _CACHE_EXT_TRACE_H
+
+/*
+ * Page cache access trace, recorded by the policies' folio hooks
+ * (page_trace_record() in cache_ext_lib.bpf.h) and written by their loaders
+ * with --page_trace. Events are batched per CPU and sent through a BPF ring
+ * buffer, PAGE_TRACE_BATCH at a time and without waking up the loader, which
+ * polls the ring buffer from a thread. A full ring buffer drops the batch and
+ * counts it in the trace_drops stat, it never slows down the page cache.
+ *
+ * The trace file is a gzip stream of a struct page_trace_header followed by
+ * struct page_trace_event records, all little endian. Records are ordered per
+ * CPU batch, not globally, so readers should sort them by timestamp
+ * (bench/page_trace.py does).
+ */
+
+#ifndef __bpf__
+#include <linux/types.h>
+#endif
+
+#define PAGE_TRACE_MAGIC "CXPAGES\0"
+#define PAGE_TRACE_VERSION 1
+#define PAGE_TRACE_BATCH 32
+// Ring buffer size if --page_trace_buffer is not given, in MiB
+#define PAGE_TRACE_DEFAULT_BUFFER_MB 64
+
+enum page_trace_op {
+	PAGE_TRACE_ADDED,
+	PAGE_TRACE_ACCESSED,
+	PAGE_TRACE_EVICTED,
+};
+
+struct page_trace_event {
+	__u64 timestamp_ns;	// bpf_ktime_get_ns()
+	__u64 ino;
+	__u32 index;		// Page index in the file
+	__u8 op;		// enum page_trace_op
+	__u8 pad[3];
+};
+
+struct page_trace_batch {
+	__u32 nr;
+	__u32 pad;
+	struct page_trace_event events[PAGE_TRACE_BATCH];
+};
+
+#ifndef __bpf__
+
+#include <argp.h>
+#include <errno.h>
+#include <pthread.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <time.h>
+#include <unistd.h>
+#include <zlib.h>
+
+#include <bpf/bpf.h>
+#include <bpf/libbpf.h>
+
+_Static_assert(sizeof(struct page_trace_event) == 24,
+	       "page trace event must be 24 bytes");
+
+struct page_trace_header {
+	char magic[8];
+	__u32 version;
+	__u32 record_size;
+	__u64 start_ns;		// bpf_ktime_get_ns() when recording started
+	__u8 padding[8];
+};
+
+_Static_assert(sizeof(struct page_trace_header) == 32,
+	       "page trace header must be 32 bytes");
+
+// How often the recorder thread drains the ring buffer
+#define PAGE_TRACE_POLL_US 5000
+#define PAGE_TRACE_GZ_BUFFER (1 << 20)
+
+// Set by --page_trace and --page_trace_buffer, see page_trace_argp
+static const char *page_trace_path;
+static unsigned long page_trace_buffer_mb = PAGE_TRACE_DEFAULT_BUFFER_MB;
+
+#define PAGE_TRACE_OPT_KEY 0x1002
+#define PAGE_TRACE_BUFFER_OPT_KEY 0x1003
+
+static error_t page_trace_parse_opt(int key, char *arg, struct argp_state *state)
+{
+	char *end;
+
+	switch (key) {
+	case PAGE_TRACE_OPT_KEY:
+		page_trace_path = arg;
+		break;
+	case PAGE_TRACE_BUFFER_OPT_KEY:
+		page_trace_buffer_mb = strtoul(arg, &end, 10);
+		// Ring buffer sizes are a power of 2 number of pages
+		if (*end || !page_trace_buffer_mb ||
+		    page_trace_buffer_mb & (page_trace_buffer_mb - 1))
+			argp_error(state, "Invalid page_trace_buffer: %s", arg);
+		break;
+	default:
+		return ARGP_ERR_UNKNOWN;
+	}
+	return 0;
+}
+
+static struct argp_option page_trace_options[] = {
+	{ "page_trace", PAGE_TRACE_OPT_KEY, "FILE", 0,
+	  "Record the page cache accesses into a gzipped binary trace" },
+	{ "page_trace_buffer", PAGE_TRACE_BUFFER_OPT_KEY, "MB", 0,
+	  "Size of the trace ring buffer, a power of 2 (default 64)" },
+	{ 0 },
+};
+
+static struct argp page_trace_argp = { page_trace_options,
+				       page_trace_parse_opt, 0, 0 };
+
+/*
+ * Enable recording in the policy and size its ring buffer, before loading it.
+ * The ring buffer is left at its minimal size otherwise.
+ */
+#define page_trace_set_rodata(skel)						\
+	({									\
+		int __ret = 0;							\
+		(skel)->rodata->page_trace_enabled = page_trace_path != NULL;	\
+		if (page_trace_path)						\
+			__ret = bpf_map__set_max_entries(			\
+				(skel)->maps.page_trace_ringbuf,		\
+				page_trace_buffer_mb << 20);			\
+		__ret;								\
+	})
+
+struct page_trace_recorder {
+	struct ring_buffer *ringbuf;
+	struct bpf_map *batches;
+	gzFile out;
+	pthread_t thread;
+	bool running;
+	volatile bool stopping;
+	bool failed;
+	__u64 events;
+};
+
+static int page_trace_write(void *ctx, void *data, size_t size)
+{
+	struct page_trace_recorder *rec = ctx;
+
+	if (gzwrite(rec->out, data, size) != (int)size) {
+		rec->failed = true;
+		return -EIO;
+	}
+	rec->events += size / sizeof(struct page_trace_event);
+	return 0;
+}
+
+static void *page_trace_thread(void *arg)
+{
+	struct page_trace_recorder *rec = arg;
+	int nr;
+
+	while (!rec->stopping && !rec->failed) {
+		nr = ring_buffer__consume(rec->ringbuf);
+		if (nr < 0) {
+			rec->failed = true;
+			break;
+		}
+		// Batches are submitted without wakeups, so poll
+		if (!nr)
+			usleep(PAGE_TRACE_POLL_US);
+	}
+	return NULL;
+}
+
+/*
+ * Start writing the trace to page_trace_path, if set. Call after loading the
+ * policy, before attaching it. Returns 0 or -1.
+ */
+static int page_trace_start(struct page_trace_recorder *rec,
+			    struct bpf_map *ringbuf, struct bpf_map *batches)
+{
+	struct page_trace_header header = {
+		.magic = PAGE_TRACE_MAGIC,
+		.version = PAGE_TRACE_VERSION,
+		.record_size = sizeof(struct page_trace_event),
+	};
+	struct timespec ts;
+
+	memset(rec, 0, sizeof(*rec));
+	if (!page_trace_path)
+		return 0;
+
+	// Level 1: the trace is written at up to millions of events per second
+	rec->out = gzopen(page_trace_path, "wb1");
+	if (!rec->out) {
+		fprintf(stderr, "Failed to open page trace %s: %s\n",
+			page_trace_path, strerror(errno));
+		return -1;
+	}
+	gzbuffer(rec->out, PAGE_TRACE_GZ_BUFFER);
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	header.start_ns = ts.tv_sec * 1000000000ULL + ts.tv_nsec;
+	if (gzwrite(rec->out, &header, sizeof(header)) != sizeof(header)) {
+		fprintf(stderr, "Failed to write page trace header\n");
+		goto err;
+	}
+
+	rec->batches = batches;
+	rec->ringbuf = ring_buffer__new(bpf_map__fd(ringbuf), page_trace_write,
+					rec, NULL);
+	if (!rec->ringbuf) {
+		perror("Failed to create page trace ring buffer");
+		goto err;
+	}
+	if (pthread_create(&rec->thread, NULL, page_trace_thread, rec)) {
+		perror("Failed to start page trace thread");
+		goto err;
+	}
+	rec->running = true;
+	return 0;
+
+err:
+	ring_buffer__free(rec->ringbuf);
+	rec->ringbuf = NULL;
+	gzclose(rec->out);
+	rec->out = NULL;
+	return -1;
+}
+
+// Write the events of the per-CPU batches that are not full yet
+static void page_trace_flush_batches(struct page_trace_recorder *rec)
+{
+	int nr_cpus = libbpf_num_possible_cpus();
+	struct page_trace_batch *batches;
+	__u32 key = 0;
+
+	if (nr_cpus < 0)
+		return;
+	batches = calloc(nr_cpus, sizeof(*batches));
+	if (!batches)
+		return;
+	if (bpf_map_lookup_elem(bpf_map__fd(rec->batches), &key, batches)) {
+		perror("Failed to read page trace batches");
+		free(batches);
+		return;
+	}
+	for (int cpu = 0; cpu < nr_cpus; cpu++) {
+		__u32 nr = batches[cpu].nr;
+
+		if (nr > PAGE_TRACE_BATCH)
+			nr = PAGE_TRACE_BATCH;
+		if (nr)
+			page_trace_write(rec, batches[cpu].events,
+					 nr * sizeof(struct page_trace_event));
+	}
+	free(batches);
+}
+
+/*
+ * Drain the ring buffer and close the trace, after detaching the policy, and
+ * print a single JSON line for the benchmark:
+ *   page_trace_stats: {"events": 1, "file_bytes": 1, "failed": 0}
+ */
+static void page_trace_stop(struct page_trace_recorder *rec)
+{
+	struct stat st;
+
+	if (!rec->running)
+		return;
+	rec->stopping = true;
+	pthread_join(rec->thread, NULL);
+	if (!rec->failed && ring_buffer__consume(rec->ringbuf) >= 0)
+		page_trace_flush_batches(rec);
+	ring_buffer__free(rec->ringbuf);
+	if (gzclose(rec->out) != Z_OK || stat(page_trace_path, &st))
+		rec->failed = true;
+	rec->running = false;
+
+	printf("page_trace_stats: {\"events\": %llu, \"file_bytes\": %lld, "
+	       "\"failed\": %d}\n",
+	       (unsigned long long)rec->events,
+	       rec->failed ? 0LL : (long long)st.st_size, rec->failed);
+	fflush(stdout);
+}
+
+#endif /* __bpf__ */
+
+#endif /* _CACHE_EXT_TRACE_H */
@@ -13,12 +13,45 @@
 #define unlikely(x) __builtin_expect(!!(x), 0)
 #endif
 
+#ifndef container_of
+#define container_of(ptr, type, member) \
+	((type *)((void *)(ptr) - __builtin_offsetof(type, member)))
+#endif
+
 #define FMODE_CREATED 0x100000 /* linux: include/linux/fs.h */
 #define BPF_PATH_MAX 128
 
+/*
+ * How files are matched, set by the loader (--watch_scope, see dir_watcher.h):
+ *
+ *	WATCH_SCOPE_PATH	created files whose path starts with watch_dir_path
+ *				(bpf_d_path + string compare on every creation)
+ *	WATCH_SCOPE_SB		every file of the filesystem of watch_dir, by
+ *				superblock device. No inode_watchlist at all.
+ *	WATCH_SCOPE_MOUNT	created files on the mount of watch_dir
+ *	WATCH_SCOPE_DIR		created files with watch_dir_ino as an ancestor
+ *				(parent only if !watch_dir_recursive)
+ *
+ * The last two only replace the path work on file creation. Folios are still
+ * matched with an inode_watchlist lookup, as an inode does not know its mount
+ * or its (possibly many) parent directories.
+ */
+#define WATCH_SCOPE_PATH 0
+#define WATCH_SCOPE_SB 1
+#define WATCH_SCOPE_MOUNT 2
+#define WATCH_SCOPE_DIR 3
+// Ancestors checked by WATCH_SCOPE_DIR, each a constant-time inode compare
+#define WATCH_SCOPE_MAX_DEPTH 16
+
 // Read-only variable, filled by loader
 const volatile char watch_dir_path[BPF_PATH_MAX] = {0};
 const volatile size_t watch_dir_path_len = 0;
+const volatile u32 watch_scope = WATCH_SCOPE_PATH;
+const volatile bool watch_dir_recursive = true;
+// Kernel dev_t of the filesystem of watch_dir (all scopes but path)
+const volatile u32 watch_dev = 0;
+const volatile int watch_mnt_id = 0;
+const volatile u64 watch_dir_ino = 0;
 
 struct {
     __uint(type, BPF_MAP_TYPE_HASH);
@@ -37,6 +70,13 @@ static inline bool inode_in_watchlist(u64 inode_no) {
     return false;
 };
 
+// Whether folios of inode belong to the watched files
+static inline bool inode_in_watch_scope(struct inode *inode) {
+    if (watch_scope == WATCH_SCOPE_SB)
+        return inode->i_sb->s_dev == watch_dev;
+    return inode_in_watchlist(inode->i_ino);
+}
+
 static inline int strncmp(const char *s1, const volatile char *s2, int n) {
 	while (n && *s1 && (*s1 == *s2)) {
 		++s1;
@@ -50,6 +90,28 @@ static inline int strncmp(const char *s1, const volatile char *s2, int n) {
 	return *s1 - *s2;
 }
 
+// File creation check of the mount and dir scopes, without path strings
+static inline bool file_in_watch_scope(struct path *path, struct file *file) {
+    if (BPF_CORE_READ(file, f_inode, i_sb, s_dev) != watch_dev) return false;
+
+    if (watch_scope == WATCH_SCOPE_MOUNT) {
+        struct mount *mnt = container_of(BPF_CORE_READ(path, mnt),
+                                         struct mount, mnt);
+        return BPF_CORE_READ(mnt, mnt_id) == watch_mnt_id;
+    }
+
+    struct dentry *dentry = BPF_CORE_READ(path, dentry);
+    int max_depth = watch_dir_recursive ? WATCH_SCOPE_MAX_DEPTH : 1;
+    for (int i = 0; i < WATCH_SCOPE_MAX_DEPTH && i < max_depth; i++) {
+        struct dentry *parent = BPF_CORE_READ(dentry, d_parent);
+        // Reached the root of the filesystem
+        if (parent == dentry) return false;
+        dentry = parent;
+        if (BPF_CORE_READ(dentry, d_inode, i_ino) == watch_dir_ino) return true;
+    }
+    return false;
+}
+
 // Use a fexit probe to track file opens
 SEC("fexit/vfs_open")
 int BPF_PROG(vfs_open_exit, struct path *path, struct file *file, long ret) {
@@ -59,14 +121,10 @@ int BPF_PROG(vfs_open_exit, struct path *path, struct file *file, long ret) {
     // If file was not created, return
     if (!(file->f_mode & FMODE_CREATED)) return 0;
 
-    // {0} required due to verifier bug in Linux 6.6.8 compared to 6.6.14
-    char filepath[BPF_PATH_MAX] = {0};
-    long err;
-    if ((err = bpf_d_path(path, filepath, sizeof(filepath))) < 0) {
-        bpf_printk("Failed to get file path: %ld\n", err);
-        return 0;
-    }
+    // Every file of the filesystem matches, nothing to track
+    if (watch_scope == WATCH_SCOPE_SB) return 0;
 
+    long err;
     u64 inode_no = file->f_inode->i_ino;
 
     // Check if inode was previously inode_watchlisted - means it was previously
@@ -83,11 +141,22 @@ int BPF_PROG(vfs_open_exit, struct path *path, struct file *file, long ret) {
     }
 
     // Check if file is in our desired directory tree
-    if (unlikely(!watch_dir_path_len)) {
-        bpf_printk("watch_dir_path_len is 0!!\n");
-        return 0;
+    if (watch_scope != WATCH_SCOPE_PATH) {
+        if (!file_in_watch_scope(path, file)) return 0;
+    } else {
+        if (unlikely(!watch_dir_path_len)) {
+            bpf_printk("watch_dir_path_len is 0!!\n");
+            return 0;
+        }
+        // {0} required due to verifier bug in Linux 6.6.8 compared to 6.6.14
+        char filepath[BPF_PATH_MAX] = {0};
+        if ((err = bpf_d_path(path, filepath, sizeof(filepath))) < 0) {
+            bpf_printk("Failed to get file path: %ld\n", err);
+            return 0;
+        }
+        if (strncmp(filepath, watch_dir_path, watch_dir_path_len) != 0)
+            return 0;
     }
-    if (strncmp(filepath, watch_dir_path, watch_dir_path_len) != 0) return 0;
 
     // Add inode to inode_watchlist
     u8 zero = 0;
@@ -4,13 +4,18 @@
 #include <argp.h>
 #include <dirent.h>
 #include <errno.h>
+#include <fcntl.h>
+#include <pthread.h>
 #include <signal.h>
 #include <stdbool.h>
 #include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/stat.h>
+#include <sys/sysmacros.h>
 #include <sys/types.h>
+#include <time.h>
 #include <unistd.h>
 
 #include <bpf/bpf.h>
@@ -20,65 +25,453 @@
 #define watch_dir_path_map(skel)		((skel)->rodata->watch_dir_path)
 #define watch_dir_path_len_map(skel)	((skel)->rodata->watch_dir_path_len)
 
-int initialize_watch_dir_map(const char *path, int watch_dir_map_fd, bool recursive) {
-	int ret;
-	DIR *dir;
+/*
+ * How the policy matches files, see dir_watcher.bpf.h. The default, path,
+ * compares the path of every created file with watch_dir. The others match
+ * by filesystem (sb), mount or ancestor directory inode (dir), without path
+ * strings. sb also needs no inode_watchlist, and thus no walk.
+ */
+enum watch_scope_mode {
+	WATCH_SCOPE_PATH,
+	WATCH_SCOPE_SB,
+	WATCH_SCOPE_MOUNT,
+	WATCH_SCOPE_DIR,
+	NR_WATCH_SCOPES,
+};
+
+static const char *const watch_scope_names[NR_WATCH_SCOPES] = {
+	[WATCH_SCOPE_PATH] = "path",
+	[WATCH_SCOPE_SB] = "sb",
+	[WATCH_SCOPE_MOUNT] = "mount",
+	[WATCH_SCOPE_DIR] = "dir",
+};
+
+struct watch_scope {
+	enum watch_scope_mode mode;
+	bool recursive;
+	// Kernel encoding of the dev_t of watch_dir's filesystem (MKDEV)
+	__u32 dev;
+	int mnt_id;
+	__u64 dir_ino;
+};
+
+// Set by --watch_scope, a child of the loaders' argp (watch_scope_argp)
+static enum watch_scope_mode watch_scope_mode = WATCH_SCOPE_PATH;
+
+#define WATCH_SCOPE_OPT_KEY 0x1000
+
+static int watch_scope_parse(const char *name, enum watch_scope_mode *mode)
+{
+	for (int i = 0; i < NR_WATCH_SCOPES; i++) {
+		if (!strcmp(name, watch_scope_names[i])) {
+			*mode = i;
+			return 0;
+		}
+	}
+	return -EINVAL;
+}
+
+static error_t watch_scope_parse_opt(int key, char *arg, struct argp_state *state)
+{
+	if (key != WATCH_SCOPE_OPT_KEY)
+		return ARGP_ERR_UNKNOWN;
+	if (watch_scope_parse(arg, &watch_scope_mode))
+		argp_error(state, "Invalid watch_scope: %s", arg);
+	return 0;
+}
+
+static struct argp_option watch_scope_options[] = {
+	{ "watch_scope", WATCH_SCOPE_OPT_KEY, "SCOPE", 0,
+	  "How files are matched: path (default), sb, mount or dir" },
+	{ 0 },
+};
+
+static struct argp watch_scope_argp = { watch_scope_options, watch_scope_parse_opt, 0, 0 };
+
+static int watch_scope_mnt_id(const char *path, int *mnt_id)
+{
+	char fdinfo[64], line[256];
+	int fd, ret = -ENOENT;
+	FILE *f;
+
+	fd = open(path, O_RDONLY | O_DIRECTORY);
+	if (fd < 0)
+		return -errno;
+	snprintf(fdinfo, sizeof(fdinfo), "/proc/self/fdinfo/%d", fd);
+	f = fopen(fdinfo, "r");
+	if (!f) {
+		ret = -errno;
+		close(fd);
+		return ret;
+	}
+	while (fgets(line, sizeof(line), f)) {
+		if (sscanf(line, "mnt_id: %d", mnt_id) == 1) {
+			ret = 0;
+			break;
+		}
+	}
+	fclose(f);
+	close(fd);
+	return ret;
+}
+
+// Resolve the identifiers the BPF side matches in the given mode
+static int watch_scope_init(const char *path, enum watch_scope_mode mode,
+			    bool recursive, struct watch_scope *scope)
+{
+	struct stat st;
+
+	memset(scope, 0, sizeof(*scope));
+	scope->mode = mode;
+	scope->recursive = recursive;
+	if (stat(path, &st))
+		return -errno;
+	scope->dev = (major(st.st_dev) << 20) | minor(st.st_dev);
+	scope->dir_ino = st.st_ino;
+	if (mode == WATCH_SCOPE_MOUNT) {
+		int ret = watch_scope_mnt_id(path, &scope->mnt_id);
+
+		if (ret) {
+			errno = -ret;
+			return ret;
+		}
+	}
+	return 0;
+}
+
+#define watch_scope_set_rodata(skel, scope)					\
+	do {									\
+		(skel)->rodata->watch_scope = (scope)->mode;			\
+		(skel)->rodata->watch_dir_recursive = (scope)->recursive;	\
+		(skel)->rodata->watch_dev = (scope)->dev;			\
+		(skel)->rodata->watch_mnt_id = (scope)->mnt_id;			\
+		(skel)->rodata->watch_dir_ino = (scope)->dir_ino;		\
+	} while (0)
+
+/*
+ * The inode_watchlist map is filled in two steps around loading the policy:
+ *
+ *	watch_dir_prepare()	walks watch_dir with WATCH_DIR_WALK_THREADS
+ *				threads and sizes the map after its file count
+ *				(before the BPF object is loaded)
+ *	watch_dir_populate()	inserts the inodes with batched map updates
+ *				(after it is loaded) and prints load statistics
+ *
+ * Hidden entries (including .git) are skipped. Subdirectories are only
+ * walked, and their inodes only added, when recursive.
+ */
+#define WATCH_DIR_WALK_THREADS 8
+#define WATCH_DIR_UPDATE_BATCH 4096
+// Room for files created in watch_dir after the walk
+#define WATCH_DIR_HEADROOM_PCT 25
+#define WATCH_DIR_STATS_PREFIX "watch_dir_stats: "
+
+struct watch_dir_inodes {
+	enum watch_scope_mode scope;
+	__u64 *inodes;
+	size_t nr;
+	size_t cap;
+	size_t nr_dirs;
+	int nr_threads;
+	__u32 max_entries;
+	double walk_sec;
+	double update_sec;
+};
+
+struct watch_dir_walk {
+	pthread_mutex_t lock;
+	pthread_cond_t cond;
+	// Directories left to walk
+	char **queue;
+	size_t queue_len;
+	size_t queue_cap;
+	// Threads walking a directory
+	int busy;
+	int err;
+	bool recursive;
+	struct watch_dir_inodes *out;
+};
+
+static double watch_dir_now(void)
+{
+	struct timespec ts;
+
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static int watch_dir_append(__u64 **inodes, size_t *nr, size_t *cap,
+			    const __u64 *src, size_t nr_src)
+{
+	if (*nr + nr_src > *cap) {
+		size_t new_cap = *cap ? *cap : 1024;
+		__u64 *new_inodes;
+
+		while (new_cap < *nr + nr_src)
+			new_cap *= 2;
+		new_inodes = realloc(*inodes, new_cap * sizeof(**inodes));
+		if (!new_inodes)
+			return -ENOMEM;
+		*inodes = new_inodes;
+		*cap = new_cap;
+	}
+	memcpy(*inodes + *nr, src, nr_src * sizeof(*src));
+	*nr += nr_src;
+	return 0;
+}
+
+// Called with walk->lock held
+static int watch_dir_enqueue(struct watch_dir_walk *walk, char *path)
+{
+	if (walk->queue_len == walk->queue_cap) {
+		size_t new_cap = walk->queue_cap ? 2 * walk->queue_cap : 64;
+		char **new_queue = realloc(walk->queue, new_cap * sizeof(*new_queue));
+
+		if (!new_queue)
+			return -ENOMEM;
+		walk->queue = new_queue;
+		walk->queue_cap = new_cap;
+	}
+	walk->queue[walk->queue_len++] = path;
+	pthread_cond_signal(&walk->cond);
+	return 0;
+}
+
+static int watch_dir_scan(struct watch_dir_walk *walk, const char *path)
+{
+	__u64 *inodes = NULL;
+	size_t nr = 0, cap = 0;
 	struct dirent *ent;
+	int ret = 0;
+	DIR *dir;
 
 	dir = opendir(path);
 	if (dir == NULL) {
-		perror("Error opening directory");
-		return errno;
+		fprintf(stderr, "opendir: %s: %s\n", strerror(errno), path);
+		return -errno;
 	}
 
 	while ((ent = readdir(dir)) != NULL) {
-		if (strncmp(ent->d_name, ".", 1) == 0 || strncmp(ent->d_name, "..", 2) == 0)
-			continue;
+		bool is_dir = ent->d_type == DT_DIR;
+		__u64 ino = ent->d_ino;
 
-		if (strcmp(ent->d_name, ".git") == 0)
+		if (ent->d_name[0] == '.')
 			continue;
 
-		char *filename = ent->d_name;
-		char *filepath = (char *)malloc(strlen(path) + strlen(filename) + 2);
-		sprintf(filepath, "%s/%s", path, filename);
+		// Follow symlinks and resolve unknown types like stat() would
+		if (ent->d_type == DT_UNKNOWN || ent->d_type == DT_LNK) {
+			struct stat sb;
 
-		// Check if dir
-		struct stat sb;
-		if (stat(filepath, &sb) == -1) {
-			fprintf(stderr, "stat: %s: %s\n", strerror(errno), filepath);
-			free(filepath);
-			return -1;
+			if (fstatat(dirfd(dir), ent->d_name, &sb, 0) == -1) {
+				fprintf(stderr, "stat: %s: %s/%s\n", strerror(errno),
+					path, ent->d_name);
+				ret = -errno;
+				break;
+			}
+			is_dir = S_ISDIR(sb.st_mode);
 		}
-		if (S_ISDIR(sb.st_mode)) {
-			if (!recursive) {
-				free(filepath);
+
+		if (is_dir) {
+			char *subdir;
+
+			if (!walk->recursive)
 				continue;
+			subdir = malloc(strlen(path) + strlen(ent->d_name) + 2);
+			if (!subdir) {
+				ret = -ENOMEM;
+				break;
 			}
-
-			// Recurse for nested directories
-			ret = initialize_watch_dir_map(filepath, watch_dir_map_fd, recursive);
-			if (ret < 0) {
-				closedir(dir);
-				free(filepath);
-				return ret;
+			sprintf(subdir, "%s/%s", path, ent->d_name);
+			pthread_mutex_lock(&walk->lock);
+			ret = watch_dir_enqueue(walk, subdir);
+			pthread_mutex_unlock(&walk->lock);
+			if (ret) {
+				free(subdir);
+				break;
 			}
 		}
-		free(filepath);
 
-		__u8 zero = 0;
+		ret = watch_dir_append(&inodes, &nr, &cap, &ino, 1);
+		if (ret)
+			break;
+	}
+	closedir(dir);
+
+	// Merge the inodes of the whole directory at once, to keep the lock cold
+	pthread_mutex_lock(&walk->lock);
+	if (!ret)
+		ret = watch_dir_append(&walk->out->inodes, &walk->out->nr,
+				       &walk->out->cap, inodes, nr);
+	walk->out->nr_dirs++;
+	pthread_mutex_unlock(&walk->lock);
+	free(inodes);
+	return ret;
+}
+
+static void *watch_dir_worker(void *arg)
+{
+	struct watch_dir_walk *walk = arg;
+	char *path;
+	int ret;
+
+	pthread_mutex_lock(&walk->lock);
+	for (;;) {
+		while (!walk->queue_len && walk->busy && !walk->err)
+			pthread_cond_wait(&walk->cond, &walk->lock);
+		// Done once no directory is queued or being walked
+		if (!walk->queue_len || walk->err)
+			break;
+		path = walk->queue[--walk->queue_len];
+		walk->busy++;
+		pthread_mutex_unlock(&walk->lock);
+
+		ret = watch_dir_scan(walk, path);
+		free(path);
+
+		pthread_mutex_lock(&walk->lock);
+		walk->busy--;
+		if (ret && !walk->err)
+			walk->err = ret;
+		if (!walk->busy || walk->err)
+			pthread_cond_broadcast(&walk->cond);
+	}
+	pthread_cond_broadcast(&walk->cond);
+	pthread_mutex_unlock(&walk->lock);
+	return NULL;
+}
+
+static void watch_dir_inodes_free(struct watch_dir_inodes *inodes)
+{
+	free(inodes->inodes);
+	memset(inodes, 0, sizeof(*inodes));
+}
+
+/*
+ * Collect the inodes under path and, if map is not NULL, grow its max_entries
+ * to fit them. Must be called before the BPF object is loaded. The sb scope
+ * has nothing to collect, and its map is shrunk to a single entry.
+ */
+static int watch_dir_prepare(const char *path, const struct watch_scope *scope,
+			     struct bpf_map *map, struct watch_dir_inodes *inodes)
+{
+	struct watch_dir_walk walk = {
+		.lock = PTHREAD_MUTEX_INITIALIZER,
+		.cond = PTHREAD_COND_INITIALIZER,
+		.recursive = scope->recursive,
+		.out = inodes,
+	};
+	pthread_t threads[WATCH_DIR_WALK_THREADS];
+	int nr_threads = scope->recursive ? WATCH_DIR_WALK_THREADS : 1;
+	double start = watch_dir_now();
+	char *root;
+	size_t needed;
 
-		// fprintf(stderr, "Adding inode %lu to watch_dir map\n", ent->d_ino);
-		ret = bpf_map_update_elem(watch_dir_map_fd, &ent->d_ino, &zero, 0);
+	memset(inodes, 0, sizeof(*inodes));
+	inodes->scope = scope->mode;
+	if (scope->mode == WATCH_SCOPE_SB) {
+		if (map && bpf_map__set_max_entries(map, 1))
+			return -EINVAL;
+		inodes->max_entries = 1;
+		return 0;
+	}
+
+	root = strdup(path);
+	if (!root || watch_dir_enqueue(&walk, root)) {
+		free(root);
+		return -ENOMEM;
+	}
+
+	for (int i = 0; i < nr_threads; i++) {
+		if (pthread_create(&threads[i], NULL, watch_dir_worker, &walk)) {
+			// Walk with the threads that could be created
+			nr_threads = i;
+			break;
+		}
+	}
+	if (!nr_threads)
+		watch_dir_worker(&walk);
+	for (int i = 0; i < nr_threads; i++)
+		pthread_join(threads[i], NULL);
+
+	for (size_t i = 0; i < walk.queue_len; i++)
+		free(walk.queue[i]);
+	free(walk.queue);
+	inodes->nr_threads = nr_threads ? nr_threads : 1;
+	inodes->walk_sec = watch_dir_now() - start;
+	if (walk.err) {
+		watch_dir_inodes_free(inodes);
+		errno = -walk.err;
+		return walk.err;
+	}
+
+	if (!map)
+		return 0;
+	inodes->max_entries = bpf_map__max_entries(map);
+	needed = inodes->nr + inodes->nr * WATCH_DIR_HEADROOM_PCT / 100;
+	if (needed > inodes->max_entries) {
+		if (needed > UINT32_MAX || bpf_map__set_max_entries(map, needed)) {
+			fprintf(stderr, "Failed to resize %s to %zu entries\n",
+				bpf_map__name(map), needed);
+			watch_dir_inodes_free(inodes);
+			errno = E2BIG;
+			return -E2BIG;
+		}
+		inodes->max_entries = needed;
+	}
+	return 0;
+}
+
+/*
+ * Insert the inodes collected by watch_dir_prepare() into the loaded map, print
+ * the load statistics and free the inodes.
+ */
+static int watch_dir_populate(int watch_dir_map_fd, struct watch_dir_inodes *inodes)
+{
+	static const __u8 zeros[WATCH_DIR_UPDATE_BATCH];
+	LIBBPF_OPTS(bpf_map_batch_opts, opts, .elem_flags = BPF_ANY);
+	double start = watch_dir_now();
+	int ret = 0;
+
+	for (size_t i = 0; i < inodes->nr;) {
+		__u32 count = inodes->nr - i < WATCH_DIR_UPDATE_BATCH ?
+				      inodes->nr - i : WATCH_DIR_UPDATE_BATCH;
+
+		ret = bpf_map_update_batch(watch_dir_map_fd, inodes->inodes + i,
+					   zeros, &count, &opts);
 		if (ret) {
 			perror("Failed to update watch_dir map");
-			closedir(dir);
-			return -1;
+			break;
 		}
+		i += count;
 	}
+	inodes->update_sec = watch_dir_now() - start;
 
-	closedir(dir);
+	if (!ret)
+		printf(WATCH_DIR_STATS_PREFIX
+		       "{\"scope\": \"%s\", \"inodes\": %zu, \"dirs\": %zu,"
+		       " \"threads\": %d, \"max_entries\": %u, \"walk_sec\": %.3f,"
+		       " \"update_sec\": %.3f}\n",
+		       watch_scope_names[inodes->scope], inodes->nr, inodes->nr_dirs,
+		       inodes->nr_threads, inodes->max_entries, inodes->walk_sec,
+		       inodes->update_sec);
+	fflush(stdout);
+	watch_dir_inodes_free(inodes);
+	return ret;
+}
 
-	return 0;
+/*
+ * Walk and insert in one go, for callers that load the BPF object first. The
+ * map keeps its compile-time max_entries.
+ */
+int initialize_watch_dir_map(const char *path, int watch_dir_map_fd, bool recursive) {
+	struct watch_scope scope = { .mode = WATCH_SCOPE_PATH, .recursive = recursive };
+	struct watch_dir_inodes inodes;
+	int ret;
+
+	ret = watch_dir_prepare(path, &scope, NULL, &inodes);
+	if (ret)
+		return ret;
+	return watch_dir_populate(watch_dir_map_fd, &inodes);
 }
 
 #endif /* _DIR_WATCHER_H */
@@ -0,0 +1,103 @@
+// Copy a subset of the keys of a LevelDB DB into a new DB, e.g. the keys of a
+// trace downscaled with bench/trace_scale.py.
+//
+// Build (after ./install_leveldb.sh):
+//	g++ -O2 -o leveldb_subset leveldb_subset.cc -lleveldb -lsnappy -lpthread
+// Usage:
+//	./leveldb_subset <source db> <dest db> <keys file>
+//
+// The keys file has one key per line. Keys missing from the source DB are
+// counted and skipped. The destination DB is compacted at the end, so its
+// size and layout resemble a freshly loaded DB.
+
+#include <cstdio>
+#include <fstream>
+#include <iostream>
+#include <string>
+
+#include <leveldb/db.h>
+#include <leveldb/write_batch.h>
+
+static const size_t BATCH_SIZE = 1000;
+
+int main(int argc, char **argv)
+{
+	if (argc != 4) {
+		std::cerr << "Usage: " << argv[0]
+			  << " <source db> <dest db> <keys file>" << std::endl;
+		return 1;
+	}
+
+	leveldb::DB *src, *dst;
+	leveldb::Options src_options;
+	leveldb::Status status = leveldb::DB::Open(src_options, argv[1], &src);
+	if (!status.ok()) {
+		std::cerr << "Failed to open " << argv[1] << ": "
+			  << status.ToString() << std::endl;
+		return 1;
+	}
+	leveldb::Options dst_options;
+	dst_options.create_if_missing = true;
+	dst_options.error_if_exists = true;
+	status = leveldb::DB::Open(dst_options, argv[2], &dst);
+	if (!status.ok()) {
+		std::cerr << "Failed to create " << argv[2] << ": "
+			  << status.ToString() << std::endl;
+		delete src;
+		return 1;
+	}
+
+	std::ifstream keys(argv[3]);
+	if (!keys) {
+		std::cerr << "Failed to open " << argv[3] << std::endl;
+		delete dst;
+		delete src;
+		return 1;
+	}
+
+	leveldb::ReadOptions read_options;
+	// Do not pollute the block cache with a one-pass scan
+	read_options.fill_cache = false;
+	leveldb::WriteBatch batch;
+	size_t copied = 0, missing = 0;
+	std::string key, value;
+	bool failed = false;
+	while (!failed && std::getline(keys, key)) {
+		if (key.empty())
+			continue;
+		status = src->Get(read_options, key, &value);
+		if (status.IsNotFound()) {
+			missing++;
+			continue;
+		}
+		if (!status.ok()) {
+			std::cerr << "Failed to read " << key << ": "
+				  << status.ToString() << std::endl;
+			failed = true;
+			break;
+		}
+		batch.Put(key, value);
+		if (++copied % BATCH_SIZE == 0) {
+			status = dst->Write(leveldb::WriteOptions(), &batch);
+			batch.Clear();
+			failed = !status.ok();
+		}
+	}
+	if (!failed) {
+		status = dst->Write(leveldb::WriteOptions(), &batch);
+		failed = !status.ok();
+	}
+	if (failed) {
+		std::cerr << "Failed to copy keys: " << status.ToString()
+			  << std::endl;
+		delete dst;
+		delete src;
+		return 1;
+	}
+	dst->CompactRange(nullptr, nullptr);
+
+	printf("Copied %zu keys, %zu missing\n", copied, missing);
+	delete dst;
+	delete src;
+	return 0;
+}